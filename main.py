@@ -9,6 +9,7 @@ Copyright (c) 2023-2025 by Hmily, All Rights Reserved.
 Function: Record live stream video.
 """
 import asyncio
+import atexit
 import os
 import sys
 import builtins
@@ -20,18 +21,29 @@ import datetime
 import re
 import shutil
 import random
-import uuid
 from pathlib import Path
 import urllib.parse
 import urllib.request
 from urllib.error import URLError, HTTPError
 from typing import Any
-import configparser
-from src import spider, stream
+from src import js_signer
 from src.proxy import ProxyDetector
 from src.utils import logger
 from src import utils
 from src.danmu_recorder import create_douyin_danmu_recorder
+from src.danmu_hub import hub as danmu_hub
+from src.http_clients.async_http import close_client_pool
+from src.hls_recorder import HLSRecorder, HLSUnsupportedError, parse_headers
+from src.flv_recorder import FlvRecorder
+from src.process_supervisor import supervisor as ffmpeg_supervisor
+from src.segment_manifest import segment_files, segment_list_args
+from src.postprocess import PostProcessQueue, PRIORITY_ENCODE, PRIORITY_REMUX, PRIORITY_SCRIPT, lower_priority
+from src.engine import MonitorEngine, RoomState, run_coroutine
+from src.config import ConfigLoader
+from src.url_config import UrlConfigWatcher, replace_in_lines
+from src.platforms import ProbeContext, registry as platform_registry
+from src.scheduler import PollScheduler
+from src.rate_limit import RateLimiter
 from msg_push import (
     dingtalk, xizhi, tg_bot, send_email, bark, ntfy, pushplus
 )
@@ -47,36 +59,37 @@ platforms = ("\n国内站点：抖音|快手|虎牙|斗鱼|YY|B站|小红书|big
 
 recording = set()
 error_count = 0
-pre_max_request = 10
 max_request_lock = threading.Lock()
 error_window = []
 error_window_size = 10
-error_threshold = 5
 monitoring = 0
-running_list = []
+running_list = set()
 url_tuples_list = []
-url_comments = []
-text_no_repeat_url = []
+url_comments = frozenset()
 create_var = locals()
 first_start = True
 exit_recording = False
 need_update_line_list = []
 first_run = True
-not_record_list = []
+not_record_list = set()
 start_display_time = datetime.datetime.now()
 global_proxy = False
 recording_time_list = {}
 danmu_recorders = {}  # 存储弹幕录制器实例
 danmu_info = {}  # 存储弹幕录制信息
+danmu_signer_warmed = False  # 弹幕签名上下文是否已经预热
+monitor_engine = None  # 异步监测引擎，启用后所有直播间在同一个事件循环中监测
+poll_scheduler = PollScheduler()  # 统一调度所有直播间的检测时间
+rate_limiter = RateLimiter()  # 按平台限制检测速率和并发数
 script_path = os.path.split(os.path.realpath(sys.argv[0]))[0]
 config_file = f'{script_path}/config/config.ini'
 url_config_file = f'{script_path}/config/URL_config.ini'
 backup_dir = f'{script_path}/backup_config'
+postprocess_queue = PostProcessQueue(f'{script_path}/config/postprocess_queue.json')  # 转码和自定义脚本任务
 text_encoding = 'utf-8-sig'
 rstr = r"[\/\\\:\*\？?\"\<\>\|&#.。,， ~！· ]"
 default_path = f'{script_path}/downloads'
 os.makedirs(default_path, exist_ok=True)
-file_update_lock = threading.Lock()
 os_type = os.name
 clear_command = "cls" if os_type == 'nt' else "clear"
 color_obj = utils.Color()
@@ -84,10 +97,15 @@ os.environ['PATH'] = ffmpeg_path + os.pathsep + current_env_path
 
 
 def signal_handler(_signal, _frame):
+    # 同时通知所有ffmpeg和内置录制结束录制，等待文件完整写入
+    ffmpeg_supervisor.stop_all(timeout=10)
+    close_client_pool()
     sys.exit(0)
 
 
 signal.signal(signal.SIGTERM, signal_handler)
+# 正常退出(包括Ctrl+C)时关闭连接池中的HTTP客户端
+atexit.register(close_client_pool)
 
 
 def display_info() -> None:
@@ -100,7 +118,9 @@ def display_info() -> None:
             if Path(sys.executable).name != 'pythonw.exe':
                 os.system(clear_command)
             print(f"\r共监测{monitoring}个直播中", end=" | ")
-            print(f"同一时间访问网络的线程数: {max_request}", end=" | ")
+            print(f"每个平台同一时间访问网络的线程数: {max_request}", end=" | ")
+            if monitor_engine:
+                print(f"异步监测引擎任务数: {monitor_engine.room_count}", end=" | ")
             print(f"是否开启代理录制: {'是' if use_proxy else '否'}", end=" | ")
             if split_video_by_time:
                 print(f"录制分段开启: {split_time}秒", end=" | ")
@@ -133,53 +153,22 @@ def display_info() -> None:
                 # print('\n本软件已运行：'+str(now_time - start_display_time).split('.')[0])
                 print("x" * 60)
                 start_display_time = now_time
+
+            host_status = rate_limiter.status()
+            if host_status:
+                print("\r平台检测并发: " + " | ".join(host_status))
+            queue_status = postprocess_queue.status()
+            if any(queue_status[key] for key in ('pending', 'running', 'completed', 'failed')):
+                print(f"\r后处理队列: 等待{queue_status['pending']} | 处理中{queue_status['running']} | "
+                      f"已完成{queue_status['completed']} | 失败{queue_status['failed']} | "
+                      f"最近1小时完成{queue_status['last_hour']}个, 平均{queue_status['average_seconds']:.0f}秒")
+            if poll_scheduler.queued:
+                upcoming = " | ".join(f"{name} {int(eta)}秒" for name, eta in poll_scheduler.upcoming(5))
+                print(f"\r等待检测的直播间数: {poll_scheduler.queued} | 即将检测: {upcoming}")
         except Exception as e:
             logger.error(f"错误信息: {e} 发生错误的行数: {e.__traceback__.tb_lineno}")
 
 
-def update_file(file_path: str, old_str: str, new_str: str, start_str: str = None) -> str | None:
-    if old_str == new_str and start_str is None:
-        return old_str
-    with file_update_lock:
-        file_data = []
-        with open(file_path, "r", encoding=text_encoding) as f:
-            try:
-                for text_line in f:
-                    if old_str in text_line:
-                        text_line = text_line.replace(old_str, new_str)
-                        if start_str:
-                            text_line = f'{start_str}{text_line}'
-                    if text_line not in file_data:
-                        file_data.append(text_line)
-            except RuntimeError as e:
-                logger.error(f"错误信息: {e} 发生错误的行数: {e.__traceback__.tb_lineno}")
-                if ini_URL_content:
-                    with open(file_path, "w", encoding=text_encoding) as f2:
-                        f2.write(ini_URL_content)
-                    return old_str
-        if file_data:
-            with open(file_path, "w", encoding=text_encoding) as f:
-                f.write(''.join(file_data))
-        return new_str
-
-
-def delete_line(file_path: str, del_line: str, delete_all: bool = False) -> None:
-    with file_update_lock:
-        with open(file_path, 'r+', encoding=text_encoding) as f:
-            lines = f.readlines()
-            f.seek(0)
-            f.truncate()
-            skip_line = False
-            for txt_line in lines:
-                if del_line in txt_line:
-                    if delete_all or not skip_line:
-                        skip_line = True
-                        continue
-                else:
-                    skip_line = False
-                f.write(txt_line)
-
-
 def get_startup_info(system_type: str):
     if system_type == 'nt':
         startup_info = subprocess.STARTUPINFO()
@@ -189,88 +178,64 @@ def get_startup_info(system_type: str):
     return startup_info
 
 
-def segment_video(converts_file_path: str, segment_save_file_path: str, segment_format: str, segment_time: str,
-                  is_original_delete: bool = True) -> None:
-    try:
-        if os.path.exists(converts_file_path) and os.path.getsize(converts_file_path) > 0:
+def converts_mp4(converts_file_path: str, is_original_delete: bool = True, to_h264: bool = False) -> None:
+    """由后处理队列调用，转码失败时抛出异常，由队列重试"""
+    if os.path.exists(converts_file_path) and os.path.getsize(converts_file_path) > 0:
+        if to_h264:
+            color_obj.print_colored("正在转码为MP4格式并重新编码为h264\n", color_obj.YELLOW)
             ffmpeg_command = [
-                "ffmpeg",
-                "-i", converts_file_path,
+                "ffmpeg", "-y", "-i", converts_file_path,
+                "-c:v", "libx264",
+                "-preset", "veryfast",
+                "-crf", "23",
+                "-vf", "format=yuv420p",
+                "-c:a", "copy",
+                "-f", "mp4", converts_file_path.rsplit('.', maxsplit=1)[0] + ".mp4",
+            ]
+        else:
+            color_obj.print_colored("正在转码为MP4格式\n", color_obj.YELLOW)
+            ffmpeg_command = [
+                "ffmpeg", "-y", "-i", converts_file_path,
                 "-c:v", "copy",
                 "-c:a", "copy",
-                "-map", "0",
-                "-f", "segment",
-                "-segment_time", segment_time,
-                "-segment_format", segment_format,
-                "-reset_timestamps", "1",
-                "-movflags", "+frag_keyframe+empty_moov",
-                segment_save_file_path,
+                "-f", "mp4", converts_file_path.rsplit('.', maxsplit=1)[0] + ".mp4",
             ]
-            _output = subprocess.check_output(
-                ffmpeg_command, stderr=subprocess.STDOUT, startupinfo=get_startup_info(os_type)
-            )
-            if is_original_delete:
-                time.sleep(1)
-                if os.path.exists(converts_file_path):
-                    os.remove(converts_file_path)
-    except subprocess.CalledProcessError as e:
-        logger.error(f'Error occurred during conversion: {e}')
-    except Exception as e:
-        logger.error(f'An unknown error occurred: {e}')
+        ffmpeg_command, popen_kwargs = lower_priority(ffmpeg_command)
+        _output = subprocess.check_output(
+            ffmpeg_command, stdin=subprocess.DEVNULL, stderr=subprocess.STDOUT,
+            startupinfo=get_startup_info(os_type), **popen_kwargs
+        )
+        if is_original_delete:
+            time.sleep(1)
+            if os.path.exists(converts_file_path):
+                os.remove(converts_file_path)
 
 
-def converts_mp4(converts_file_path: str, is_original_delete: bool = True) -> None:
-    try:
-        if os.path.exists(converts_file_path) and os.path.getsize(converts_file_path) > 0:
-            if converts_to_h264:
-                color_obj.print_colored("正在转码为MP4格式并重新编码为h264\n", color_obj.YELLOW)
-                ffmpeg_command = [
-                    "ffmpeg", "-i", converts_file_path,
-                    "-c:v", "libx264",
-                    "-preset", "veryfast",
-                    "-crf", "23",
-                    "-vf", "format=yuv420p",
-                    "-c:a", "copy",
-                    "-f", "mp4", converts_file_path.rsplit('.', maxsplit=1)[0] + ".mp4",
-                ]
-            else:
-                color_obj.print_colored("正在转码为MP4格式\n", color_obj.YELLOW)
-                ffmpeg_command = [
-                    "ffmpeg", "-i", converts_file_path,
-                    "-c:v", "copy",
-                    "-c:a", "copy",
-                    "-f", "mp4", converts_file_path.rsplit('.', maxsplit=1)[0] + ".mp4",
-                ]
-            _output = subprocess.check_output(
-                ffmpeg_command, stderr=subprocess.STDOUT, startupinfo=get_startup_info(os_type)
-            )
-            if is_original_delete:
-                time.sleep(1)
-                if os.path.exists(converts_file_path):
-                    os.remove(converts_file_path)
-    except subprocess.CalledProcessError as e:
-        logger.error(f'Error occurred during conversion: {e}')
-    except Exception as e:
-        logger.error(f'An unknown error occurred: {e}')
+def converts_m4a(converts_file_path: str, is_original_delete: bool = True) -> None:
+    """由后处理队列调用，转码失败时抛出异常，由队列重试"""
+    if os.path.exists(converts_file_path) and os.path.getsize(converts_file_path) > 0:
+        ffmpeg_command, popen_kwargs = lower_priority([
+            "ffmpeg", "-i", converts_file_path,
+            "-y", "-vn",
+            "-c:a", "aac", "-bsf:a", "aac_adtstoasc", "-ab", "320k",
+            converts_file_path.rsplit('.', maxsplit=1)[0] + ".m4a",
+        ])
+        _output = subprocess.check_output(
+            ffmpeg_command, stdin=subprocess.DEVNULL, stderr=subprocess.STDOUT,
+            startupinfo=get_startup_info(os_type), **popen_kwargs
+        )
+        if is_original_delete:
+            time.sleep(1)
+            if os.path.exists(converts_file_path):
+                os.remove(converts_file_path)
 
 
-def converts_m4a(converts_file_path: str, is_original_delete: bool = True) -> None:
-    try:
-        if os.path.exists(converts_file_path) and os.path.getsize(converts_file_path) > 0:
-            _output = subprocess.check_output([
-                "ffmpeg", "-i", converts_file_path,
-                "-n", "-vn",
-                "-c:a", "aac", "-bsf:a", "aac_adtstoasc", "-ab", "320k",
-                converts_file_path.rsplit('.', maxsplit=1)[0] + ".m4a",
-            ], stderr=subprocess.STDOUT, startupinfo=get_startup_info(os_type))
-            if is_original_delete:
-                time.sleep(1)
-                if os.path.exists(converts_file_path):
-                    os.remove(converts_file_path)
-    except subprocess.CalledProcessError as e:
-        logger.error(f'Error occurred during conversion: {e}')
-    except Exception as e:
-        logger.error(f'An unknown error occurred: {e}')
+def submit_converts_mp4(file_path: str) -> int:
+    """把转码任务加入后处理队列，重新编码为h264的任务排在直接转封装之后"""
+    return postprocess_queue.submit(
+        'converts_mp4', priority=PRIORITY_ENCODE if converts_to_h264 else PRIORITY_REMUX,
+        converts_file_path=file_path, is_original_delete=delete_origin_file, to_h264=converts_to_h264
+    )
 
 
 def generate_subtitles(record_name: str, ass_filename: str, sub_format: str = 'srt') -> None:
@@ -298,33 +263,15 @@ def generate_subtitles(record_name: str, ass_filename: str, sub_format: str = 's
         re_datatime = today.strftime('%Y-%m-%d %H:%M:%S')
 
 
-def adjust_max_request() -> None:
-    global max_request, error_count, pre_max_request, error_window
-    preset = max_request
-
+def update_error_window() -> None:
+    global error_count
     while True:
         time.sleep(5)
         with max_request_lock:
-            if error_window:
-                error_rate = sum(error_window) / len(error_window)
-            else:
-                error_rate = 0
-
-            if error_rate > error_threshold:
-                max_request = max(1, max_request - 1)
-            elif error_rate < error_threshold / 2 and max_request < preset:
-                max_request += 1
-            else:
-                pass
-
-            if pre_max_request != max_request:
-                pre_max_request = max_request
-                print(f"\r同一时间访问网络的线程数动态改为 {max_request}")
-
-        error_window.append(error_count)
-        if len(error_window) > error_window_size:
-            error_window.pop(0)
-        error_count = 0
+            error_window.append(error_count)
+            if len(error_window) > error_window_size:
+                error_window.pop(0)
+            error_count = 0
 
 
 def push_message(record_name: str, live_url: str, content: str) -> None:
@@ -376,6 +323,16 @@ def run_script(command: str) -> None:
         logger.error('Please add `#!/bin/bash` at the beginning of your bash script file.')
 
 
+def warm_up_danmu_signer() -> None:
+    """预先加载webmssdk.js签名上下文，避免直播间开播后才加载脚本导致连接弹幕服务器变慢"""
+    try:
+        start = time.perf_counter()
+        js_signer.warm_up('webmssdk', '', '', func='get_sign_with_ua')
+        logger.info(f'弹幕签名上下文预热完成，耗时{time.perf_counter() - start:.2f}秒')
+    except Exception as e:
+        logger.warning(f'弹幕签名上下文预热失败，将在首次录制弹幕时重试: {e}')
+
+
 def clear_record_info(record_name: str, record_url: str) -> None:
     global monitoring
     recording.discard(record_name)
@@ -397,18 +354,14 @@ def clear_record_info(record_name: str, record_url: str) -> None:
         del danmu_info[record_url]
     
     if record_url in url_comments and record_url in running_list:
-        running_list.remove(record_url)
+        running_list.discard(record_url)
         monitoring -= 1
         color_obj.print_colored(f"[{record_name}]已经从录制列表中移除\n", color_obj.YELLOW)
+        # 退出时已被取消注释的直播间需要重新启动
+        url_config_watcher.requeue(record_url)
 
 
-def check_subprocess(record_name: str, record_url: str, ffmpeg_command: list, save_type: str,
-                     script_command: str | None = None) -> bool:
-    save_file_path = ffmpeg_command[-1]
-    process = subprocess.Popen(
-        ffmpeg_command, stdin=subprocess.PIPE, stderr=subprocess.STDOUT, startupinfo=get_startup_info(os_type)
-    )
-
+def start_subtitles(record_name: str, save_file_path: str, save_type: str) -> None:
     subs_file_path = save_file_path.rsplit('.', maxsplit=1)[0]
     subs_thread_name = f'subs_{Path(subs_file_path).name}'
     if create_time_file and not split_video_by_time and '音频' not in save_type:
@@ -418,33 +371,71 @@ def check_subprocess(record_name: str, record_url: str, ffmpeg_command: list, sa
         create_var[subs_thread_name].daemon = True
         create_var[subs_thread_name].start()
 
-    while process.poll() is None:
-        if record_url in url_comments or exit_recording:
-            color_obj.print_colored(f"[{record_name}]录制时已被注释,本条线程将会退出", color_obj.YELLOW)
-            clear_record_info(record_name, record_url)
-            # process.terminate()
-            if os.name == 'nt':
-                if process.stdin:
-                    process.stdin.write(b'q')
-                    process.stdin.close()
-            else:
-                process.send_signal(signal.SIGINT)
-            process.wait()
-            return True
-        time.sleep(1)
 
-    return_code = process.returncode
+def check_subprocess(record_name: str, record_url: str, ffmpeg_command: list, save_type: str,
+                     script_command: str | None = None) -> bool:
+    save_file_path = ffmpeg_command[-1]
+    process = subprocess.Popen(
+        ffmpeg_command, stdin=subprocess.PIPE, stderr=subprocess.STDOUT, startupinfo=get_startup_info(os_type)
+    )
+    supervised = ffmpeg_supervisor.register(record_url, process)
+    start_subtitles(record_name, save_file_path, save_type)
+    if record_url in url_comments or exit_recording:
+        supervised.stop()
+
+    # 进程退出或被主循环停止时立即返回，不再每秒检查一次
+    return_code = supervised.wait()
+    if supervised.stop_requested:
+        color_obj.print_colored(f"[{record_name}]录制时已被注释,本条线程将会退出", color_obj.YELLOW)
+        clear_record_info(record_name, record_url)
+        return True
+
+    return finish_record(record_name, save_file_path, save_type, return_code, script_command)
+
+
+def check_hls_record(record_name: str, record_url: str, hls_url: str, save_file_path: str, save_type: str,
+                     headers: dict, proxy_address: str | None, timeout: float,
+                     script_command: str | None = None) -> bool | None:
+    """使用内置HLS录制保存TS文件，播放列表无法直接拼接时返回None，由调用方改用ffmpeg录制"""
+    recorder = HLSRecorder(
+        hls_url, save_file_path, headers=headers, proxy_addr=proxy_address,
+        segment_time=int(split_time) if split_video_by_time else None, timeout=timeout,
+        should_stop=lambda: record_url in url_comments or exit_recording
+    )
+    try:
+        run_coroutine(recorder.open())
+    except HLSUnsupportedError as e:
+        logger.info(f'{record_name} 无法使用内置HLS录制，改用ffmpeg录制: {e}')
+        return None
+    start_subtitles(record_name, save_file_path, save_type)
+
+    # 与ffmpeg进程一样由监督器停止，注释直播间或退出程序时不必等到下一次检查
+    supervised = ffmpeg_supervisor.track(record_url, recorder.stop)
+    return_code = 1
+    try:
+        return_code = run_coroutine(recorder.run())
+    except (HLSUnsupportedError, OSError) as e:
+        logger.error(f'{record_name} 内置HLS录制出错: {e}')
+    finally:
+        supervised.finish(return_code)
+    if recorder.stopped and not recorder.error:
+        color_obj.print_colored(f"[{record_name}]录制时已被注释,本条线程将会退出", color_obj.YELLOW)
+        clear_record_info(record_name, record_url)
+        return True
+    return finish_record(record_name, save_file_path, save_type, return_code, script_command)
+
+
+def finish_record(record_name: str, save_file_path: str, save_type: str, return_code: int,
+                  script_command: str | None = None) -> bool:
     stop_time = time.strftime('%Y-%m-%d %H:%M:%S')
     if return_code == 0:
+        convert_jobs = []
         if converts_to_mp4 and save_type == 'TS':
             if split_video_by_time:
-                file_paths = utils.get_file_paths(os.path.dirname(save_file_path))
-                prefix = os.path.basename(save_file_path).rsplit('_', maxsplit=1)[0]
-                for path in file_paths:
-                    if prefix in path:
-                        threading.Thread(target=converts_mp4, args=(path, delete_origin_file)).start()
+                for path in segment_files(save_file_path):
+                    convert_jobs.append(submit_converts_mp4(path))
             else:
-                threading.Thread(target=converts_mp4, args=(save_file_path, delete_origin_file)).start()
+                convert_jobs.append(submit_converts_mp4(save_file_path))
         print(f"\n{record_name} {stop_time} 直播录制完成\n")
         
         # 停止弹幕录制（录制成功完成时）
@@ -476,8 +467,8 @@ def check_subprocess(record_name: str, record_url: str, ffmpeg_command: list, sa
                     f'converts_to_mp4:{converts_to_mp4}'
                 ]
             script_command = script_command.strip() + ' ' + ' '.join(params)
-            run_script(script_command)
-            logger.debug("脚本命令执行结束!")
+            # 脚本在本次录制的转码完成后由后处理队列执行，不阻塞录制线程
+            postprocess_queue.submit('script', priority=PRIORITY_SCRIPT, after=convert_jobs, command=script_command)
 
     else:
         color_obj.print_colored(f"\n{record_name} {stop_time} 直播录制出错,返回码: {return_code}\n", color_obj.RED)
@@ -517,1166 +508,814 @@ def get_quality_code(qn):
     return QUALITY_MAPPING.get(qn)
 
 
-def start_record(url_data: tuple, count_variable: int = -1) -> None:
+def get_proxy_address(record_url: str) -> str | None:
+    proxy_address = proxy_addr
+    if proxy_addr:
+        proxy_address = None
+        for platform in enable_proxy_platform_list:
+            if platform and platform.strip() in record_url:
+                proxy_address = proxy_addr
+                break
+
+    if not proxy_address:
+        if extra_enable_proxy_platform_list:
+            for pt in extra_enable_proxy_platform_list:
+                if pt and pt.strip() in record_url:
+                    proxy_address = proxy_addr_bak or None
+    return proxy_address
+
+
+def create_room_state(url_data: tuple, count_variable: int) -> RoomState:
+    record_quality_zh, record_url, anchor_name = url_data
+    return RoomState(
+        url_data=url_data,
+        count_variable=count_variable,
+        record_quality_zh=record_quality_zh,
+        record_quality=get_quality_code(record_quality_zh),
+        record_url=record_url,
+        anchor_name=anchor_name,
+        proxy_address=get_proxy_address(record_url),
+        live_domain='/'.join(record_url.split('/')[0:3]),
+        platform=platform_registry.match(record_url),
+    )
+
+
+async def fetch_port_info(room: RoomState) -> tuple[str, dict | None, str]:
+    """根据直播间地址获取直播间数据，返回(平台名称, 直播间数据, 新的直播间地址)，不支持的地址返回的数据为None"""
+    platform = room.platform
+    if platform is None:
+        return '未知平台', None, ''
+
+    if platform.requires_proxy and not (global_proxy or room.proxy_address):
+        logger.error(f"错误信息: 网络异常，请检查本网络是否能正常访问{platform.name}平台")
+        return platform.name, {}, ''
+
+    ctx = ProbeContext(
+        url=room.record_url,
+        quality=room.record_quality,
+        proxy_addr=room.proxy_address,
+        cookies=platform_cookies.get(platform.cookie_key, ''),
+        accounts=platform_accounts
+    )
+    port_info = await platform.resolver(ctx)
+    if port_info:
+        poll_scheduler.record(room.record_url, port_info.get('is_live'))
+    for section, key, value in ctx.config_updates:
+        utils.update_config(file_path=config_file, section=section, key=key, new_value=value)
+
+    # 预备弹幕录制信息（如果启用且抖音在支持列表中）
+    if (platform.name == '抖音直播' and enable_danmu_recording and '抖音' in danmu_platforms_list and
+            port_info and port_info.get('is_live')):
+        # 从URL中提取房间ID
+        url_match = re.search(r'live\.douyin\.com/(\d+)', room.record_url)
+        if url_match:
+            danmu_room_id = url_match.group(1)
+
+            # 使用record_url作为临时键存储弹幕录制信息
+            danmu_info[room.record_url] = {
+                'room_id': danmu_room_id,
+                'platform': '抖音',
+                'anchor_name': room.anchor_name,
+                'cookies': dy_cookie
+            }
+            logger.info(f'检测到抖音直播，准备启动 {room.anchor_name} 的弹幕录制')
+
+    return platform.name, port_info, ctx.new_record_url
+
+
+def handle_port_info(room: RoomState, platform: str, port_info: dict, new_record_url: str = '') -> bool:
+    """处理一次检测结果，直播中时开始录制（阻塞至录制结束）。返回True表示该直播间的监测应当退出"""
     global error_count
+    url_data = room.url_data
+    count_variable = room.count_variable
+    record_url = room.record_url
+    record_quality_zh = room.record_quality_zh
+    proxy_address = room.proxy_address
+    live_domain = room.live_domain
+    anchor_name = room.anchor_name
+
+    if anchor_name:
+        if '主播:' in anchor_name:
+            anchor_split: list = anchor_name.split('主播:')
+            if len(anchor_split) > 1 and anchor_split[1].strip():
+                anchor_name = anchor_split[1].strip()
+            else:
+                anchor_name = port_info.get("anchor_name", '')
+    else:
+        anchor_name = port_info.get("anchor_name", '')
+    room.anchor_name = anchor_name
 
-    while True:
-        try:
-            record_finished = False
-            run_once = False
-            start_pushed = False
-            new_record_url = ''
-            count_time = time.time()
-            retry = 0
-            record_quality_zh, record_url, anchor_name = url_data
-            record_quality = get_quality_code(record_quality_zh)
-            proxy_address = proxy_addr
-            platform = '未知平台'
-            live_domain = '/'.join(record_url.split('/')[0:3])
-
-            if proxy_addr:
-                proxy_address = None
-                for platform in enable_proxy_platform_list:
-                    if platform and platform.strip() in record_url:
-                        proxy_address = proxy_addr
-                        break
-
-            if not proxy_address:
-                if extra_enable_proxy_platform_list:
-                    for pt in extra_enable_proxy_platform_list:
-                        if pt and pt.strip() in record_url:
-                            proxy_address = proxy_addr_bak or None
-
-            # print(f'\r代理地址:{proxy_address}')
-            # print(f'\r全局代理:{global_proxy}')
-            while True:
-                try:
-                    port_info = []
-                    if record_url.find("douyin.com/") > -1:
-                        platform = '抖音直播'
-                        with semaphore:
-                            if 'v.douyin.com' not in record_url and '/user/' not in record_url:
-                                json_data = asyncio.run(spider.get_douyin_stream_data(
-                                    url=record_url,
-                                    proxy_addr=proxy_address,
-                                    cookies=dy_cookie))
-                            else:
-                                json_data = asyncio.run(spider.get_douyin_app_stream_data(
-                                    url=record_url,
-                                    proxy_addr=proxy_address,
-                                    cookies=dy_cookie))
-                            port_info = asyncio.run(
-                                stream.get_douyin_stream_url(json_data, record_quality, proxy_address))
-                            
-                            # 预备弹幕录制信息（如果启用且抖音在支持列表中）
-                            if (enable_danmu_recording and '抖音' in danmu_platforms_list and
-                                json_data and json_data.get('status') == 2):
-                                # 从URL中提取房间ID
-                                import re
-                                url_match = re.search(r'live\.douyin\.com/(\d+)', record_url)
-                                if url_match:
-                                    danmu_room_id = url_match.group(1)
-                                    
-                                    # 使用record_url作为临时键存储弹幕录制信息
-                                    danmu_info[record_url] = {
-                                        'room_id': danmu_room_id,
-                                        'platform': '抖音',
-                                        'anchor_name': anchor_name,
-                                        'cookies': dy_cookie
-                                    }
-                                    logger.info(f'检测到抖音直播，准备启动 {anchor_name} 的弹幕录制')
-
-                    elif record_url.find("https://www.tiktok.com/") > -1:
-                        platform = 'TikTok直播'
-                        with semaphore:
-                            if global_proxy or proxy_address:
-                                json_data = asyncio.run(spider.get_tiktok_stream_data(
-                                    url=record_url,
-                                    proxy_addr=proxy_address,
-                                    cookies=tiktok_cookie))
-                                port_info = asyncio.run(
-                                    stream.get_tiktok_stream_url(json_data, record_quality, proxy_address))
-                            else:
-                                logger.error("错误信息: 网络异常，请检查网络是否能正常访问TikTok平台")
-
-                    elif record_url.find("https://live.kuaishou.com/") > -1:
-                        platform = '快手直播'
-                        with semaphore:
-                            json_data = asyncio.run(spider.get_kuaishou_stream_data(
-                                url=record_url,
-                                proxy_addr=proxy_address,
-                                cookies=ks_cookie))
-                            port_info = asyncio.run(stream.get_kuaishou_stream_url(json_data, record_quality))
-
-                    elif record_url.find("https://www.huya.com/") > -1:
-                        platform = '虎牙直播'
-                        with semaphore:
-                            if record_quality not in ['OD', 'BD', 'UHD']:
-                                json_data = asyncio.run(spider.get_huya_stream_data(
-                                    url=record_url,
-                                    proxy_addr=proxy_address,
-                                    cookies=hy_cookie))
-                                port_info = asyncio.run(stream.get_huya_stream_url(json_data, record_quality))
-                            else:
-                                port_info = asyncio.run(spider.get_huya_app_stream_url(
-                                    url=record_url,
-                                    proxy_addr=proxy_address,
-                                    cookies=hy_cookie
-                                ))
-
-                    elif record_url.find("https://www.douyu.com/") > -1:
-                        platform = '斗鱼直播'
-                        with semaphore:
-                            json_data = asyncio.run(spider.get_douyu_info_data(
-                                url=record_url, proxy_addr=proxy_address, cookies=douyu_cookie))
-                            port_info = asyncio.run(stream.get_douyu_stream_url(
-                                json_data, video_quality=record_quality, cookies=douyu_cookie, proxy_addr=proxy_address
-                            ))
-
-                    elif record_url.find("https://www.yy.com/") > -1:
-                        platform = 'YY直播'
-                        with semaphore:
-                            json_data = asyncio.run(spider.get_yy_stream_data(
-                                url=record_url, proxy_addr=proxy_address, cookies=yy_cookie))
-                            port_info = asyncio.run(stream.get_yy_stream_url(json_data))
-
-                    elif record_url.find("https://live.bilibili.com/") > -1:
-                        platform = 'B站直播'
-                        with semaphore:
-                            json_data = asyncio.run(spider.get_bilibili_room_info(
-                                url=record_url, proxy_addr=proxy_address, cookies=bili_cookie))
-                            port_info = asyncio.run(stream.get_bilibili_stream_url(
-                                json_data, video_quality=record_quality, cookies=bili_cookie, proxy_addr=proxy_address))
-
-                    elif record_url.find("http://xhslink.com/") > -1 or \
-                            record_url.find("https://www.xiaohongshu.com/") > -1:
-                        platform = '小红书直播'
-                        with semaphore:
-                            port_info = asyncio.run(spider.get_xhs_stream_url(
-                                record_url, proxy_addr=proxy_address, cookies=xhs_cookie))
-                            retry += 1
-
-                    elif record_url.find("https://www.bigo.tv/") > -1 or record_url.find("slink.bigovideo.tv/") > -1:
-                        platform = 'Bigo直播'
-                        with semaphore:
-                            port_info = asyncio.run(spider.get_bigo_stream_url(
-                                record_url, proxy_addr=proxy_address, cookies=bigo_cookie))
-
-                    elif record_url.find("https://app.blued.cn/") > -1:
-                        platform = 'Blued直播'
-                        with semaphore:
-                            port_info = asyncio.run(spider.get_blued_stream_url(
-                                record_url, proxy_addr=proxy_address, cookies=blued_cookie))
-
-                    elif record_url.find("sooplive.co.kr/") > -1:
-                        platform = 'SOOP'
-                        with semaphore:
-                            if global_proxy or proxy_address:
-                                json_data = asyncio.run(spider.get_sooplive_stream_data(
-                                    url=record_url, proxy_addr=proxy_address,
-                                    cookies=sooplive_cookie,
-                                    username=sooplive_username,
-                                    password=sooplive_password
-                                ))
-                                if json_data and json_data.get('new_cookies'):
-                                    utils.update_config(
-                                        config_file, 'Cookie', 'sooplive_cookie', json_data['new_cookies']
-                                    )
-                                port_info = asyncio.run(stream.get_stream_url(json_data, record_quality, spec=True))
-                            else:
-                                logger.error("错误信息: 网络异常，请检查本网络是否能正常访问SOOP平台")
-
-                    elif record_url.find("cc.163.com/") > -1:
-                        platform = '网易CC直播'
-                        with semaphore:
-                            json_data = asyncio.run(spider.get_netease_stream_data(
-                                url=record_url, cookies=netease_cookie))
-                            port_info = asyncio.run(stream.get_netease_stream_url(json_data, record_quality))
-
-                    elif record_url.find("qiandurebo.com/") > -1:
-                        platform = '千度热播'
-                        with semaphore:
-                            port_info = asyncio.run(spider.get_qiandurebo_stream_data(
-                                url=record_url, proxy_addr=proxy_address, cookies=qiandurebo_cookie))
-
-                    elif record_url.find("www.pandalive.co.kr/") > -1:
-                        platform = 'PandaTV'
-                        with semaphore:
-                            if global_proxy or proxy_address:
-                                json_data = asyncio.run(spider.get_pandatv_stream_data(
-                                    url=record_url,
-                                    proxy_addr=proxy_address,
-                                    cookies=pandatv_cookie
-                                ))
-                                port_info = asyncio.run(stream.get_stream_url(json_data, record_quality, spec=True))
-                            else:
-                                logger.error("错误信息: 网络异常，请检查本网络是否能正常访问PandaTV直播平台")
-
-                    elif record_url.find("fm.missevan.com/") > -1:
-                        platform = '猫耳FM直播'
-                        with semaphore:
-                            port_info = asyncio.run(spider.get_maoerfm_stream_url(
-                                url=record_url, proxy_addr=proxy_address, cookies=maoerfm_cookie))
-
-                    elif record_url.find("www.winktv.co.kr/") > -1:
-                        platform = 'WinkTV'
-                        with semaphore:
-                            if global_proxy or proxy_address:
-                                json_data = asyncio.run(spider.get_winktv_stream_data(
-                                    url=record_url,
-                                    proxy_addr=proxy_address,
-                                    cookies=winktv_cookie))
-                                port_info = asyncio.run(stream.get_stream_url(json_data, record_quality, spec=True))
-                            else:
-                                logger.error("错误信息: 网络异常，请检查本网络是否能正常访问WinkTV直播平台")
-
-                    elif record_url.find("www.flextv.co.kr/") > -1 or record_url.find("www.ttinglive.com/") > -1:
-                        platform = 'FlexTV'
-                        with semaphore:
-                            if global_proxy or proxy_address:
-                                json_data = asyncio.run(spider.get_flextv_stream_data(
-                                    url=record_url,
-                                    proxy_addr=proxy_address,
-                                    cookies=flextv_cookie,
-                                    username=flextv_username,
-                                    password=flextv_password
-                                ))
-                                if json_data and json_data.get('new_cookies'):
-                                    utils.update_config(
-                                        config_file, 'Cookie', 'flextv_cookie', json_data['new_cookies']
-                                    )
-                                port_info = asyncio.run(stream.get_stream_url(json_data, record_quality, spec=True))
-                            else:
-                                logger.error("错误信息: 网络异常，请检查本网络是否能正常访问FlexTV直播平台")
-
-                    elif record_url.find("look.163.com/") > -1:
-                        platform = 'Look直播'
-                        with semaphore:
-                            port_info = asyncio.run(spider.get_looklive_stream_url(
-                                url=record_url, proxy_addr=proxy_address, cookies=look_cookie
-                            ))
-
-                    elif record_url.find("www.popkontv.com/") > -1:
-                        platform = 'PopkonTV'
-                        with semaphore:
-                            if global_proxy or proxy_address:
-                                port_info = asyncio.run(spider.get_popkontv_stream_url(
-                                    url=record_url,
-                                    proxy_addr=proxy_address,
-                                    access_token=popkontv_access_token,
-                                    username=popkontv_username,
-                                    password=popkontv_password,
-                                    partner_code=popkontv_partner_code
-                                ))
-                                if port_info and port_info.get('new_token'):
-                                    utils.update_config(
-                                        file_path=config_file, section='Authorization', key='popkontv_token',
-                                        new_value=port_info['new_token']
-                                    )
+    if not port_info.get("anchor_name", ''):
+        print(f'序号{count_variable} 网址内容获取失败,进行重试中...获取失败的地址是:{url_data}')
+        with max_request_lock:
+            error_count += 1
+            error_window.append(1)
+    else:
+        anchor_name = clean_name(anchor_name)
+        room.anchor_name = anchor_name
+        record_name = f'序号{count_variable} {anchor_name}'
 
-                            else:
-                                logger.error("错误信息: 网络异常，请检查本网络是否能正常访问PopkonTV直播平台")
-
-                    elif record_url.find("twitcasting.tv/") > -1:
-                        platform = 'TwitCasting'
-                        with semaphore:
-                            json_data = asyncio.run(spider.get_twitcasting_stream_url(
-                                url=record_url,
-                                proxy_addr=proxy_address,
-                                cookies=twitcasting_cookie,
-                                account_type=twitcasting_account_type,
-                                username=twitcasting_username,
-                                password=twitcasting_password
-                            ))
-                            port_info = asyncio.run(stream.get_stream_url(json_data, record_quality, spec=False))
-
-                            if port_info and port_info.get('new_cookies'):
-                                utils.update_config(
-                                    file_path=config_file, section='Cookie', key='twitcasting_cookie',
-                                    new_value=port_info['new_cookies']
-                                )
+        if record_url in url_comments:
+            print(f"[{anchor_name}]已被注释,本条线程将会退出")
+            clear_record_info(record_name, record_url)
+            return True
 
-                    elif record_url.find("live.baidu.com/") > -1:
-                        platform = '百度直播'
-                        with semaphore:
-                            json_data = asyncio.run(spider.get_baidu_stream_data(
-                                url=record_url,
-                                proxy_addr=proxy_address,
-                                cookies=baidu_cookie))
-                            port_info = asyncio.run(stream.get_stream_url(json_data, record_quality))
-
-                    elif record_url.find("weibo.com/") > -1:
-                        platform = '微博直播'
-                        with semaphore:
-                            json_data = asyncio.run(spider.get_weibo_stream_data(
-                                url=record_url, proxy_addr=proxy_address, cookies=weibo_cookie))
-                            port_info = asyncio.run(stream.get_stream_url(
-                                json_data, record_quality, hls_extra_key='m3u8_url'))
-
-                    elif record_url.find("kugou.com/") > -1:
-                        platform = '酷狗直播'
-                        with semaphore:
-                            port_info = asyncio.run(spider.get_kugou_stream_url(
-                                url=record_url, proxy_addr=proxy_address, cookies=kugou_cookie))
-
-                    elif record_url.find("www.twitch.tv/") > -1:
-                        platform = 'TwitchTV'
-                        with semaphore:
-                            if global_proxy or proxy_address:
-                                json_data = asyncio.run(spider.get_twitchtv_stream_data(
-                                    url=record_url,
-                                    proxy_addr=proxy_address,
-                                    cookies=twitch_cookie
-                                ))
-                                port_info = asyncio.run(stream.get_stream_url(json_data, record_quality, spec=True))
-                            else:
-                                logger.error("错误信息: 网络异常，请检查本网络是否能正常访问TwitchTV直播平台")
-
-                    elif record_url.find("www.liveme.com/") > -1:
-                        if global_proxy or proxy_address:
-                            platform = 'LiveMe'
-                            with semaphore:
-                                port_info = asyncio.run(spider.get_liveme_stream_url(
-                                    url=record_url, proxy_addr=proxy_address, cookies=liveme_cookie))
+        if not url_data[-1] and room.run_once is False:
+            if new_record_url:
+                need_update_line_list.append(
+                    f'{record_url}|{new_record_url},主播: {anchor_name.strip()}')
+                not_record_list.add(new_record_url)
+                # 改写后旧地址从文件中消失，视为改名，本条监测继续运行
+                url_config_watcher.rename(record_url, new_record_url)
+            else:
+                need_update_line_list.append(f'{record_url}|{record_url},主播: {anchor_name.strip()}')
+            room.run_once = True
+
+        push_at = datetime.datetime.today().strftime('%Y-%m-%d %H:%M:%S')
+        if port_info['is_live'] is False:
+            print(f"\r{record_name} 等待直播... ")
+
+            if room.start_pushed:
+                if over_show_push:
+                    push_content = "直播间状态更新：[直播间名称] 直播已结束！时间：[时间]"
+                    if over_push_message_text:
+                        push_content = over_push_message_text
+
+                    push_content = (push_content.replace('[直播间名称]', record_name).
+                                    replace('[时间]', push_at))
+                    threading.Thread(
+                        target=push_message,
+                        args=(record_name, record_url, push_content.replace(r'\n', '\n')),
+                        daemon=True
+                    ).start()
+                room.start_pushed = False
+
+        else:
+            content = f"\r{record_name} 正在直播中..."
+            print(content)
+
+            if live_status_push and not room.start_pushed:
+                if begin_show_push:
+                    push_content = "直播间状态更新：[直播间名称] 正在直播中，时间：[时间]"
+                    if begin_push_message_text:
+                        push_content = begin_push_message_text
+
+                    push_content = (push_content.replace('[直播间名称]', record_name).
+                                    replace('[时间]', push_at))
+                    threading.Thread(
+                        target=push_message,
+                        args=(record_name, record_url, push_content.replace(r'\n', '\n')),
+                        daemon=True
+                    ).start()
+                room.start_pushed = True
+
+            if disable_record:
+                room.next_delay = push_check_seconds
+                return False
+
+            real_url = port_info.get('record_url')
+            full_path = f'{default_path}/{platform}'
+            if real_url:
+                now = datetime.datetime.today().strftime("%Y-%m-%d_%H-%M-%S")
+                live_title = port_info.get('title')
+                title_in_name = ''
+                if live_title:
+                    live_title = clean_name(live_title)
+                    title_in_name = live_title + '_' if filename_by_title else ''
+
+                try:
+                    if len(video_save_path) > 0:
+                        if not video_save_path.endswith(('/', '\\')):
+                            full_path = f'{video_save_path}/{platform}'
                         else:
-                            logger.error("错误信息: 网络异常，请检查本网络是否能正常访问LiveMe直播平台")
-
-                    elif record_url.find("www.huajiao.com/") > -1:
-                        platform = '花椒直播'
-                        with semaphore:
-                            port_info = asyncio.run(spider.get_huajiao_stream_url(
-                                url=record_url, proxy_addr=proxy_address, cookies=huajiao_cookie))
-
-                    elif record_url.find("7u66.com/") > -1:
-                        platform = '流星直播'
-                        with semaphore:
-                            port_info = asyncio.run(spider.get_liuxing_stream_url(
-                                url=record_url, proxy_addr=proxy_address, cookies=liuxing_cookie))
-
-                    elif record_url.find("showroom-live.com/") > -1:
-                        platform = 'ShowRoom'
-                        with semaphore:
-                            json_data = asyncio.run(spider.get_showroom_stream_data(
-                                url=record_url, proxy_addr=proxy_address, cookies=showroom_cookie))
-                            port_info = asyncio.run(stream.get_stream_url(json_data, record_quality, spec=True))
-
-                    elif record_url.find("live.acfun.cn/") > -1 or record_url.find("m.acfun.cn/") > -1:
-                        platform = 'Acfun'
-                        with semaphore:
-                            json_data = asyncio.run(spider.get_acfun_stream_data(
-                                url=record_url, proxy_addr=proxy_address, cookies=acfun_cookie))
-                            port_info = asyncio.run(stream.get_stream_url(
-                                json_data, record_quality, url_type='flv', flv_extra_key='url'))
-
-                    elif record_url.find("live.tlclw.com/") > -1:
-                        platform = '畅聊直播'
-                        with semaphore:
-                            port_info = asyncio.run(spider.get_changliao_stream_url(
-                                url=record_url, proxy_addr=proxy_address, cookies=changliao_cookie))
-
-                    elif record_url.find("ybw1666.com/") > -1:
-                        platform = '音播直播'
-                        with semaphore:
-                            port_info = asyncio.run(spider.get_yinbo_stream_url(
-                                url=record_url, proxy_addr=proxy_address, cookies=yinbo_cookie))
-
-                    elif record_url.find("www.inke.cn/") > -1:
-                        platform = '映客直播'
-                        with semaphore:
-                            port_info = asyncio.run(spider.get_yingke_stream_url(
-                                url=record_url, proxy_addr=proxy_address, cookies=yingke_cookie))
-
-                    elif record_url.find("www.zhihu.com/") > -1:
-                        platform = '知乎直播'
-                        with semaphore:
-                            port_info = asyncio.run(spider.get_zhihu_stream_url(
-                                url=record_url, proxy_addr=proxy_address, cookies=zhihu_cookie))
-
-                    elif record_url.find("chzzk.naver.com/") > -1:
-                        platform = 'CHZZK'
-                        with semaphore:
-                            json_data = asyncio.run(spider.get_chzzk_stream_data(
-                                url=record_url, proxy_addr=proxy_address, cookies=chzzk_cookie))
-                            port_info = asyncio.run(stream.get_stream_url(json_data, record_quality, spec=True))
-
-                    elif record_url.find("www.haixiutv.com/") > -1:
-                        platform = '嗨秀直播'
-                        with semaphore:
-                            port_info = asyncio.run(spider.get_haixiu_stream_url(
-                                url=record_url, proxy_addr=proxy_address, cookies=haixiu_cookie))
-
-                    elif record_url.find("vvxqiu.com/") > -1:
-                        platform = 'VV星球'
-                        with semaphore:
-                            port_info = asyncio.run(spider.get_vvxqiu_stream_url(
-                                url=record_url, proxy_addr=proxy_address, cookies=vvxqiu_cookie))
-
-                    elif record_url.find("17.live/") > -1:
-                        platform = '17Live'
-                        with semaphore:
-                            port_info = asyncio.run(spider.get_17live_stream_url(
-                                url=record_url, proxy_addr=proxy_address, cookies=yiqilive_cookie))
-
-                    elif record_url.find("www.lang.live/") > -1:
-                        platform = '浪Live'
-                        with semaphore:
-                            port_info = asyncio.run(spider.get_langlive_stream_url(
-                                url=record_url, proxy_addr=proxy_address, cookies=langlive_cookie))
-
-                    elif record_url.find("m.pp.weimipopo.com/") > -1:
-                        platform = '漂漂直播'
-                        with semaphore:
-                            port_info = asyncio.run(spider.get_pplive_stream_url(
-                                url=record_url, proxy_addr=proxy_address, cookies=pplive_cookie))
-
-                    elif record_url.find(".6.cn/") > -1:
-                        platform = '六间房直播'
-                        with semaphore:
-                            port_info = asyncio.run(spider.get_6room_stream_url(
-                                url=record_url, proxy_addr=proxy_address, cookies=six_room_cookie))
-
-                    elif record_url.find("lehaitv.com/") > -1:
-                        platform = '乐嗨直播'
-                        with semaphore:
-                            port_info = asyncio.run(spider.get_haixiu_stream_url(
-                                url=record_url, proxy_addr=proxy_address, cookies=lehaitv_cookie))
-
-                    elif record_url.find("h.catshow168.com/") > -1:
-                        platform = '花猫直播'
-                        with semaphore:
-                            port_info = asyncio.run(spider.get_pplive_stream_url(
-                                url=record_url, proxy_addr=proxy_address, cookies=huamao_cookie))
-
-                    elif record_url.find("live.shopee") > -1 or record_url.find("shp.ee/") > -1:
-                        platform = 'shopee'
-                        with semaphore:
-                            port_info = asyncio.run(spider.get_shopee_stream_url(
-                                url=record_url, proxy_addr=proxy_address, cookies=shopee_cookie))
-                            if port_info.get('uid'):
-                                new_record_url = record_url.split('?')[0] + '?' + str(port_info['uid'])
-
-                    elif record_url.find("www.youtube.com/") > -1 or record_url.find("youtu.be/") > -1:
-                        platform = 'Youtube'
-                        with semaphore:
-                            json_data = asyncio.run(spider.get_youtube_stream_url(
-                                url=record_url, proxy_addr=proxy_address, cookies=youtube_cookie))
-                            port_info = asyncio.run(stream.get_stream_url(json_data, record_quality, spec=True))
-
-                    elif record_url.find("tb.cn") > -1:
-                        platform = '淘宝直播'
-                        with semaphore:
-                            json_data = asyncio.run(spider.get_taobao_stream_url(
-                                url=record_url, proxy_addr=proxy_address, cookies=taobao_cookie))
-                            port_info = asyncio.run(stream.get_stream_url(
-                                json_data, record_quality,
-                                url_type='all', hls_extra_key='hlsUrl', flv_extra_key='flvUrl'
-                            ))
-
-                    elif record_url.find("3.cn") > -1 or record_url.find("m.jd.com") > -1:
-                        platform = '京东直播'
-                        with semaphore:
-                            port_info = asyncio.run(spider.get_jd_stream_url(
-                                url=record_url, proxy_addr=proxy_address, cookies=jd_cookie))
-
-                    elif record_url.find("faceit.com/") > -1:
-                        platform = 'faceit'
-                        with semaphore:
-                            if global_proxy or proxy_address:
-                                with semaphore:
-                                    json_data = asyncio.run(spider.get_faceit_stream_data(
-                                        url=record_url, proxy_addr=proxy_address, cookies=faceit_cookie))
-                                    port_info = asyncio.run(stream.get_stream_url(json_data, record_quality, spec=True))
-                            else:
-                                logger.error("错误信息: 网络异常，请检查本网络是否能正常访问faceit直播平台")
-
-                    elif record_url.find("www.miguvideo.com") > -1 or record_url.find("m.miguvideo.com") > -1:
-                        platform = '咪咕直播'
-                        with semaphore:
-                            port_info = asyncio.run(spider.get_migu_stream_url(
-                                url=record_url, proxy_addr=proxy_address, cookies=migu_cookie))
-
-                    elif record_url.find("show.lailianjie.com") > -1:
-                        platform = '连接直播'
-                        with semaphore:
-                            port_info = asyncio.run(spider.get_lianjie_stream_url(
-                                url=record_url, proxy_addr=proxy_address, cookies=lianjie_cookie))
-
-                    elif record_url.find("www.imkktv.com") > -1:
-                        platform = '来秀直播'
-                        with semaphore:
-                            port_info = asyncio.run(spider.get_laixiu_stream_url(
-                                url=record_url, proxy_addr=proxy_address, cookies=laixiu_cookie))
-
-                    elif record_url.find("www.picarto.tv") > -1:
-                        platform = 'Picarto'
-                        with semaphore:
-                            port_info = asyncio.run(spider.get_picarto_stream_url(
-                                url=record_url, proxy_addr=proxy_address, cookies=picarto_cookie))
-
-                    elif record_url.find(".m3u8") > -1 or record_url.find(".flv") > -1:
-                        platform = '自定义录制直播'
-                        port_info = {
-                            "anchor_name": platform + '_' + str(uuid.uuid4())[:8],
-                            "is_live": True,
-                            "record_url": record_url,
-                        }
-                        if '.flv' in record_url:
-                            port_info['flv_url'] = record_url
+                            full_path = f'{video_save_path}{platform}'
+
+                    full_path = full_path.replace("\\", '/')
+                    if folder_by_author:
+                        full_path = f'{full_path}/{anchor_name}'
+                    if folder_by_time:
+                        full_path = f'{full_path}/{now[:10]}'
+                    if folder_by_title and port_info.get('title'):
+                        if folder_by_time:
+                            full_path = f'{full_path}/{live_title}_{anchor_name}'
                         else:
-                            port_info['m3u8_url'] = record_url
+                            full_path = f'{full_path}/{now[:10]}_{live_title}'
+                    if not os.path.exists(full_path):
+                        os.makedirs(full_path)
+                except Exception as e:
+                    logger.error(f"错误信息: {e} 发生错误的行数: {e.__traceback__.tb_lineno}")
 
+                if platform != '自定义录制直播':
+                    if enable_https_recording and real_url.startswith("http://"):
+                        real_url = real_url.replace("http://", "https://")
+
+                    if room.platform.force_http:
+                        real_url = real_url.replace("https://", "http://")
+
+                user_agent = ("Mozilla/5.0 (Linux; Android 11; SAMSUNG SM-G973U) AppleWebKit/537.36 ("
+                              "KHTML, like Gecko) SamsungBrowser/14.2 Chrome/87.0.4280.141 Mobile "
+                              "Safari/537.36")
+
+                rw_timeout = "15000000"
+                analyzeduration = "20000000"
+                probesize = "10000000"
+                bufsize = "8000k"
+                max_muxing_queue_size = "1024"
+                if room.platform.overseas:
+                    rw_timeout = "50000000"
+                    analyzeduration = "40000000"
+                    probesize = "20000000"
+                    bufsize = "15000k"
+                    max_muxing_queue_size = "2048"
+
+                ffmpeg_command = [
+                    'ffmpeg', "-y",
+                    "-v", "verbose",
+                    "-rw_timeout", rw_timeout,
+                    "-loglevel", "error",
+                    "-hide_banner",
+                    "-user_agent", user_agent,
+                    "-protocol_whitelist", "rtmp,crypto,file,http,https,tcp,tls,udp,rtp,httpproxy",
+                    "-thread_queue_size", "1024",
+                    "-analyzeduration", analyzeduration,
+                    "-probesize", probesize,
+                    "-fflags", "+discardcorrupt",
+                    "-re", "-i", real_url,
+                    "-bufsize", bufsize,
+                    "-sn", "-dn",
+                    "-reconnect_delay_max", "60",
+                    "-reconnect_streamed", "-reconnect_at_eof",
+                    "-max_muxing_queue_size", max_muxing_queue_size,
+                    "-correct_ts_overflow", "1",
+                    "-avoid_negative_ts", "1"
+                ]
+
+                headers = room.platform.get_ffmpeg_headers(live_domain)
+                if headers:
+                    ffmpeg_command.insert(11, "-headers")
+                    ffmpeg_command.insert(12, headers)
+
+                if proxy_address:
+                    ffmpeg_command.insert(1, "-http_proxy")
+                    ffmpeg_command.insert(2, proxy_address)
+
+                # 内置HLS/FLV录制使用与ffmpeg相同的请求头和超时时间
+                record_headers = {'User-Agent': user_agent, **parse_headers(headers)}
+                record_timeout = int(rw_timeout) / 1000000
+
+                recording.add(record_name)
+                start_record_time = datetime.datetime.now()
+                recording_time_list[record_name] = [start_record_time, record_quality_zh]
+                rec_info = f"\r{anchor_name} 准备开始录制视频: {full_path}"
+
+                # 启动弹幕录制
+                if record_url in danmu_info and record_name not in danmu_recorders:
+                    try:
+                        danmu_data = danmu_info[record_url]
+                        logger.info(f'正在启动 {danmu_data["anchor_name"]} 的弹幕录制')
+
+                        # 确保输出目录存在
+                        if not os.path.exists(full_path):
+                            os.makedirs(full_path, exist_ok=True)
+
+                        danmu_recorder = create_douyin_danmu_recorder(
+                            room_id=danmu_data['room_id'],
+                            room_name=danmu_data['anchor_name'],
+                            output_dir=full_path,  # 传入目录路径
+                            cookies=danmu_data['cookies'],
+                            # sqlite格式可用python -m src.danmu_store导出为XML/ASS，
+                            # raw格式只保存原始数据，之后用python -m src.danmu_capture解码
+                            file_format=danmu_file_format.strip().lower(),
+                            max_retry=danmu_max_retry
+                        )
+                        danmu_recorders[record_name] = danmu_recorder
+
+                        # 将键从record_url更新为record_name
+                        danmu_info[record_name] = danmu_info.pop(record_url)
+
+                        # 在共享的弹幕事件循环中启动弹幕录制
+                        def on_danmu_done(future):
+                            if not future.cancelled() and future.exception():
+                                logger.error(f'弹幕录制启动失败: {future.exception()}')
+
+                        danmu_hub.submit(danmu_recorder.start(
+                            enable_segment=danmu_follow_video_segment and split_video_by_time,
+                            segment_time=int(split_time) if split_video_by_time else 1800
+                        )).add_done_callback(on_danmu_done)
+                        logger.info(f'已启动 {danmu_data["anchor_name"]} 的弹幕录制')
+                    except Exception as e:
+                        logger.error(f'弹幕录制启动失败: {e}')
+                if show_url:
+                    re_plat = ('WinkTV', 'PandaTV', 'ShowRoom', 'CHZZK', 'Youtube')
+                    if platform in re_plat:
+                        logger.info(f"{platform} | {anchor_name} | 直播源地址: {port_info['m3u8_url']}")
                     else:
-                        logger.error(f'{record_url} {platform}直播地址')
-                        return
+                        logger.info(
+                            f"{platform} | {anchor_name} | 直播源地址: {real_url}")
+
+                only_flv_record = room.platform.only_flv
+                if only_flv_record:
+                    logger.debug(f"提示: {platform} 将强制使用FLV格式录制")
 
-                    if anchor_name:
-                        if '主播:' in anchor_name:
-                            anchor_split: list = anchor_name.split('主播:')
-                            if len(anchor_split) > 1 and anchor_split[1].strip():
-                                anchor_name = anchor_split[1].strip()
+                only_audio_record = room.platform.only_audio
+
+                if only_audio_record:
+                    try:
+                        now = time.strftime("%Y-%m-%d_%H-%M-%S", time.localtime())
+                        extension = "mp3" if "m4a" not in video_save_type.lower () else "m4a"
+                        name_format = "_%03d" if split_video_by_time else ""
+                        save_file_path = (f"{full_path}/{anchor_name}_{title_in_name}{now}"
+                                          f"{name_format}.{extension}")
+
+                        if split_video_by_time:
+                            print(f'\r{anchor_name} 准备开始录制音频: {save_file_path}')
+
+                            # 设置弹幕录制器的视频文件名（音频分段模式）
+                            if record_name in danmu_recorders:
+                                try:
+                                    base_filename = f"{anchor_name}_{title_in_name}{now}_000.{extension}"
+                                    danmu_recorders[record_name].set_video_filename(base_filename)
+                                except Exception as e:
+                                    logger.error(f'设置弹幕文件名失败: {e}')
+
+                            if "MP3" in video_save_type:
+                                command = [
+                                    "-map", "0:a",
+                                    "-c:a", "libmp3lame",
+                                    "-ab", "320k",
+                                    "-f", "segment",
+                                    "-segment_time", split_time,
+                                    "-reset_timestamps", "1",
+                                    *segment_list_args(save_file_path),
+                                    save_file_path,
+                                ]
                             else:
-                                anchor_name = port_info.get("anchor_name", '')
-                    else:
-                        anchor_name = port_info.get("anchor_name", '')
+                                command = [
+                                    "-map", "0:a",
+                                    "-c:a", "aac",
+                                    "-bsf:a", "aac_adtstoasc",
+                                    "-ab", "320k",
+                                    "-f", "segment",
+                                    "-segment_time", split_time,
+                                    "-segment_format", 'mpegts',
+                                    "-reset_timestamps", "1",
+                                    *segment_list_args(save_file_path),
+                                    save_file_path,
+                                ]
+
+                        else:
+                            # 设置弹幕录制器的视频文件名（音频非分段模式）
+                            if record_name in danmu_recorders:
+                                try:
+                                    filename = f"{anchor_name}_{title_in_name}{now}.{extension}"
+                                    danmu_recorders[record_name].set_video_filename(filename)
+                                except Exception as e:
+                                    logger.error(f'设置弹幕文件名失败: {e}')
+
+                            if "MP3" in video_save_type:
+                                command = [
+                                    "-map", "0:a",
+                                    "-c:a", "libmp3lame",
+                                    "-ab", "320k",
+                                    save_file_path,
+                                ]
 
-                    if not port_info.get("anchor_name", ''):
-                        print(f'序号{count_variable} 网址内容获取失败,进行重试中...获取失败的地址是:{url_data}')
+                            else:
+                                command = [
+                                    "-map", "0:a",
+                                    "-c:a", "aac",
+                                    "-bsf:a", "aac_adtstoasc",
+                                    "-ab", "320k",
+                                    "-movflags", "+faststart",
+                                    save_file_path,
+                                ]
+
+                        ffmpeg_command.extend(command)
+                        comment_end = check_subprocess(
+                            record_name,
+                            record_url,
+                            ffmpeg_command,
+                            video_save_type,
+                            custom_script
+                        )
+                        if comment_end:
+                            return True
+
+                    except subprocess.CalledProcessError as e:
+                        logger.error(f"错误信息: {e} 发生错误的行数: {e.__traceback__.tb_lineno}")
                         with max_request_lock:
                             error_count += 1
                             error_window.append(1)
-                    else:
-                        anchor_name = clean_name(anchor_name)
-                        record_name = f'序号{count_variable} {anchor_name}'
-
-                        if record_url in url_comments:
-                            print(f"[{anchor_name}]已被注释,本条线程将会退出")
-                            clear_record_info(record_name, record_url)
-                            return
-
-                        if not url_data[-1] and run_once is False:
-                            if new_record_url:
-                                need_update_line_list.append(
-                                    f'{record_url}|{new_record_url},主播: {anchor_name.strip()}')
-                                not_record_list.append(new_record_url)
+
+                if video_save_type == "FLV" or only_flv_record:
+                    filename = anchor_name + f'_{title_in_name}' + now + '.flv'
+                    save_file_path = f'{full_path}/{filename}'
+                    print(f'{rec_info}/{filename}')
+
+                    # 设置弹幕录制器的视频文件名
+                    if record_name in danmu_recorders:
+                        try:
+                            danmu_recorders[record_name].set_video_filename(filename)
+                        except Exception as e:
+                            logger.error(f'设置弹幕文件名失败: {e}')
+
+                    subs_file_path = save_file_path.rsplit('.', maxsplit=1)[0]
+                    subs_thread_name = f'subs_{Path(subs_file_path).name}'
+                    if create_time_file:
+                        create_var[subs_thread_name] = threading.Thread(
+                            target=generate_subtitles, args=(record_name, subs_file_path)
+                        )
+                        create_var[subs_thread_name].daemon = True
+                        create_var[subs_thread_name].start()
+
+                    flv_file_paths = []
+                    flv_stopped = False
+                    try:
+                        flv_url = port_info.get('flv_url')
+                        if flv_url:
+                            flv_recorder = FlvRecorder(
+                                flv_url,
+                                f"{full_path}/{anchor_name}_{title_in_name}{now}_%03d.flv"
+                                if split_video_by_time else save_file_path,
+                                headers=record_headers, proxy_addr=proxy_address,
+                                segment_time=int(split_time) if split_video_by_time else None,
+                                timeout=record_timeout,
+                                should_stop=lambda: record_url in url_comments or exit_recording
+                            )
+                            supervised = ffmpeg_supervisor.track(record_url, flv_recorder.stop)
+                            try:
+                                flv_recorder.run()
+                            finally:
+                                flv_file_paths = flv_recorder.file_paths
+                                supervised.finish(0 if flv_recorder.tags else 1)
+                            room.record_finished = True
+                            if flv_recorder.stopped:
+                                flv_stopped = True
+                                color_obj.print_colored(f"[{record_name}]录制时已被注释,本条线程将会退出",
+                                                        color_obj.YELLOW)
+                                clear_record_info(record_name, record_url)
                             else:
-                                need_update_line_list.append(f'{record_url}|{record_url},主播: {anchor_name.strip()}')
-                            run_once = True
-
-                        push_at = datetime.datetime.today().strftime('%Y-%m-%d %H:%M:%S')
-                        if port_info['is_live'] is False:
-                            print(f"\r{record_name} 等待直播... ")
-
-                            if start_pushed:
-                                if over_show_push:
-                                    push_content = "直播间状态更新：[直播间名称] 直播已结束！时间：[时间]"
-                                    if over_push_message_text:
-                                        push_content = over_push_message_text
-
-                                    push_content = (push_content.replace('[直播间名称]', record_name).
-                                                    replace('[时间]', push_at))
-                                    threading.Thread(
-                                        target=push_message,
-                                        args=(record_name, record_url, push_content.replace(r'\n', '\n')),
-                                        daemon=True
-                                    ).start()
-                                start_pushed = False
+                                recording.discard(record_name)
+                                print(
+                                    f"\n{anchor_name} {time.strftime('%Y-%m-%d %H:%M:%S')} 直播录制完成\n")
+                        else:
+                            logger.debug("未找到FLV直播流，跳过录制")
+                    except Exception as e:
+                        clear_record_info(record_name, record_url)
+                        color_obj.print_colored(
+                            f"\n{anchor_name} {time.strftime('%Y-%m-%d %H:%M:%S')} 直播录制出错,请检查网络\n",
+                            color_obj.RED)
+                        logger.error(f"错误信息: {e} 发生错误的行数: {e.__traceback__.tb_lineno}")
+                        with max_request_lock:
+                            error_count += 1
+                            error_window.append(1)
+
+                    try:
+                        # 分段录制时已经在关键帧处直接写入各个分段文件
+                        if converts_to_mp4:
+                            for path in flv_file_paths:
+                                submit_converts_mp4(path)
+                    except Exception as e:
+                        logger.error(f"转码失败: {e} ")
+                    if flv_stopped:
+                        return True
+
+                elif video_save_type == "MKV":
+                    filename = anchor_name + f'_{title_in_name}' + now + ".mkv"
+                    print(f'{rec_info}/{filename}')
+                    save_file_path = full_path + '/' + filename
+
+                    # 设置弹幕录制器的视频文件名
+                    if record_name in danmu_recorders:
+                        try:
+                            danmu_recorders[record_name].set_video_filename(filename)
+                        except Exception as e:
+                            logger.error(f'设置弹幕文件名失败: {e}')
+
+                    try:
+                        if split_video_by_time:
+                            now = time.strftime("%Y-%m-%d_%H-%M-%S", time.localtime())
+                            save_file_path = f"{full_path}/{anchor_name}_{title_in_name}{now}_%03d.mkv"
+                            command = [
+                                "-flags", "global_header",
+                                "-c:v", "copy",
+                                "-c:a", "aac",
+                                "-map", "0",
+                                "-f", "segment",
+                                "-segment_time", split_time,
+                                "-segment_format", "matroska",
+                                "-reset_timestamps", "1",
+                                *segment_list_args(save_file_path),
+                                save_file_path,
+                            ]
 
                         else:
-                            content = f"\r{record_name} 正在直播中..."
-                            print(content)
-
-                            if live_status_push and not start_pushed:
-                                if begin_show_push:
-                                    push_content = "直播间状态更新：[直播间名称] 正在直播中，时间：[时间]"
-                                    if begin_push_message_text:
-                                        push_content = begin_push_message_text
-
-                                    push_content = (push_content.replace('[直播间名称]', record_name).
-                                                    replace('[时间]', push_at))
-                                    threading.Thread(
-                                        target=push_message,
-                                        args=(record_name, record_url, push_content.replace(r'\n', '\n')),
-                                        daemon=True
-                                    ).start()
-                                start_pushed = True
-
-                            if disable_record:
-                                time.sleep(push_check_seconds)
-                                continue
-
-                            real_url = port_info.get('record_url')
-                            full_path = f'{default_path}/{platform}'
-                            if real_url:
-                                now = datetime.datetime.today().strftime("%Y-%m-%d_%H-%M-%S")
-                                live_title = port_info.get('title')
-                                title_in_name = ''
-                                if live_title:
-                                    live_title = clean_name(live_title)
-                                    title_in_name = live_title + '_' if filename_by_title else ''
+                            command = [
+                                "-flags", "global_header",
+                                "-map", "0",
+                                "-c:v", "copy",
+                                "-c:a", "copy",
+                                "-f", "matroska",
+                                "{path}".format(path=save_file_path),
+                            ]
+                        ffmpeg_command.extend(command)
+
+                        comment_end = check_subprocess(
+                            record_name,
+                            record_url,
+                            ffmpeg_command,
+                            video_save_type,
+                            custom_script
+                        )
+                        if comment_end:
+                            return True
+
+                    except subprocess.CalledProcessError as e:
+                        logger.error(f"错误信息: {e} 发生错误的行数: {e.__traceback__.tb_lineno}")
+                        with max_request_lock:
+                            error_count += 1
+                            error_window.append(1)
 
+                elif video_save_type == "MP4":
+                    filename = anchor_name + f'_{title_in_name}' + now + ".mp4"
+                    print(f'{rec_info}/{filename}')
+                    save_file_path = full_path + '/' + filename
+
+                    # 设置弹幕录制器的视频文件名
+                    if record_name in danmu_recorders:
+                        try:
+                            danmu_recorders[record_name].set_video_filename(filename)
+                        except Exception as e:
+                            logger.error(f'设置弹幕文件名失败: {e}')
+
+                    try:
+                        if split_video_by_time:
+                            now = time.strftime("%Y-%m-%d_%H-%M-%S", time.localtime())
+                            save_file_path = f"{full_path}/{anchor_name}_{title_in_name}{now}_%03d.mp4"
+
+                            # 设置弹幕录制器的视频文件名（分段模式）
+                            if record_name in danmu_recorders:
                                 try:
-                                    if len(video_save_path) > 0:
-                                        if not video_save_path.endswith(('/', '\\')):
-                                            full_path = f'{video_save_path}/{platform}'
-                                        else:
-                                            full_path = f'{video_save_path}{platform}'
-
-                                    full_path = full_path.replace("\\", '/')
-                                    if folder_by_author:
-                                        full_path = f'{full_path}/{anchor_name}'
-                                    if folder_by_time:
-                                        full_path = f'{full_path}/{now[:10]}'
-                                    if folder_by_title and port_info.get('title'):
-                                        if folder_by_time:
-                                            full_path = f'{full_path}/{live_title}_{anchor_name}'
-                                        else:
-                                            full_path = f'{full_path}/{now[:10]}_{live_title}'
-                                    if not os.path.exists(full_path):
-                                        os.makedirs(full_path)
+                                    base_filename = f"{anchor_name}_{title_in_name}{now}_000.mp4"
+                                    danmu_recorders[record_name].set_video_filename(base_filename)
                                 except Exception as e:
-                                    logger.error(f"错误信息: {e} 发生错误的行数: {e.__traceback__.tb_lineno}")
-
-                                if platform != '自定义录制直播':
-                                    if enable_https_recording and real_url.startswith("http://"):
-                                        real_url = real_url.replace("http://", "https://")
-
-                                    http_record_list = ['shopee']
-                                    if platform in http_record_list:
-                                        real_url = real_url.replace("https://", "http://")
-
-                                user_agent = ("Mozilla/5.0 (Linux; Android 11; SAMSUNG SM-G973U) AppleWebKit/537.36 ("
-                                              "KHTML, like Gecko) SamsungBrowser/14.2 Chrome/87.0.4280.141 Mobile "
-                                              "Safari/537.36")
-
-                                rw_timeout = "15000000"
-                                analyzeduration = "20000000"
-                                probesize = "10000000"
-                                bufsize = "8000k"
-                                max_muxing_queue_size = "1024"
-                                for pt_host in overseas_platform_host:
-                                    if pt_host in record_url:
-                                        rw_timeout = "50000000"
-                                        analyzeduration = "40000000"
-                                        probesize = "20000000"
-                                        bufsize = "15000k"
-                                        max_muxing_queue_size = "2048"
-                                        break
-
-                                ffmpeg_command = [
-                                    'ffmpeg', "-y",
-                                    "-v", "verbose",
-                                    "-rw_timeout", rw_timeout,
-                                    "-loglevel", "error",
-                                    "-hide_banner",
-                                    "-user_agent", user_agent,
-                                    "-protocol_whitelist", "rtmp,crypto,file,http,https,tcp,tls,udp,rtp,httpproxy",
-                                    "-thread_queue_size", "1024",
-                                    "-analyzeduration", analyzeduration,
-                                    "-probesize", probesize,
-                                    "-fflags", "+discardcorrupt",
-                                    "-re", "-i", real_url,
-                                    "-bufsize", bufsize,
-                                    "-sn", "-dn",
-                                    "-reconnect_delay_max", "60",
-                                    "-reconnect_streamed", "-reconnect_at_eof",
-                                    "-max_muxing_queue_size", max_muxing_queue_size,
-                                    "-correct_ts_overflow", "1",
-                                    "-avoid_negative_ts", "1"
-                                ]
+                                    logger.error(f'设置弹幕文件名失败: {e}')
+                            command = [
+                                "-c:v", "copy",
+                                "-c:a", "aac",
+                                "-map", "0",
+                                "-f", "segment",
+                                "-segment_time", split_time,
+                                "-segment_format", "mp4",
+                                "-reset_timestamps", "1",
+                                "-movflags", "+frag_keyframe+empty_moov",
+                                *segment_list_args(save_file_path),
+                                save_file_path,
+                            ]
+
+                        else:
+                            command = [
+                                "-map", "0",
+                                "-c:v", "copy",
+                                "-c:a", "copy",
+                                "-f", "mp4",
+                                save_file_path,
+                            ]
+
+                        ffmpeg_command.extend(command)
+                        comment_end = check_subprocess(
+                            record_name,
+                            record_url,
+                            ffmpeg_command,
+                            video_save_type,
+                            custom_script
+                        )
+                        if comment_end:
+                            return True
+
+                    except subprocess.CalledProcessError as e:
+                        logger.error(f"错误信息: {e} 发生错误的行数: {e.__traceback__.tb_lineno}")
+                        with max_request_lock:
+                            error_count += 1
+                            error_window.append(1)
+
+                else:
+                    if split_video_by_time:
+                        now = time.strftime("%Y-%m-%d_%H-%M-%S", time.localtime())
+                        filename = anchor_name + f'_{title_in_name}' + now + ".ts"
+                        print(f'{rec_info}/{filename}')
+
+                        # 设置弹幕录制器的视频文件名（分段模式）
+                        if record_name in danmu_recorders:
+                            try:
+                                base_filename = f"{anchor_name}_{title_in_name}{now}_000.ts"
+                                danmu_recorders[record_name].set_video_filename(base_filename)
+                            except Exception as e:
+                                logger.error(f'设置弹幕文件名失败: {e}')
+
+                        try:
+                            save_file_path = f"{full_path}/{anchor_name}_{title_in_name}{now}_%03d.ts"
+                            command = [
+                                "-c:v", "copy",
+                                "-c:a", "copy",
+                                "-map", "0",
+                                "-f", "segment",
+                                "-segment_time", split_time,
+                                "-segment_format", 'mpegts',
+                                "-reset_timestamps", "1",
+                                *segment_list_args(save_file_path),
+                                save_file_path,
+                            ]
+
+                            comment_end = None
+                            if native_hls_record and '.m3u8' in real_url:
+                                comment_end = check_hls_record(
+                                    record_name, record_url, real_url, save_file_path, video_save_type,
+                                    record_headers, proxy_address, record_timeout, custom_script
+                                )
+                            if comment_end is None:
+                                ffmpeg_command.extend(command)
+                                comment_end = check_subprocess(
+                                    record_name,
+                                    record_url,
+                                    ffmpeg_command,
+                                    video_save_type,
+                                    custom_script
+                                )
+                            if comment_end:
+                                if converts_to_mp4:
+                                    for path in segment_files(save_file_path):
+                                        submit_converts_mp4(path)
+                                return True
+
+                        except subprocess.CalledProcessError as e:
+                            logger.error(
+                                f"错误信息: {e} 发生错误的行数: {e.__traceback__.tb_lineno}")
+                            with max_request_lock:
+                                error_count += 1
+                                error_window.append(1)
+
+                    else:
+                        filename = anchor_name + f'_{title_in_name}' + now + ".ts"
+                        print(f'{rec_info}/{filename}')
+                        save_file_path = full_path + '/' + filename
+
+                        # 设置弹幕录制器的视频文件名
+                        if record_name in danmu_recorders:
+                            try:
+                                danmu_recorders[record_name].set_video_filename(filename)
+                            except Exception as e:
+                                logger.error(f'设置弹幕文件名失败: {e}')
+
+                        try:
+                            command = [
+                                "-c:v", "copy",
+                                "-c:a", "copy",
+                                "-map", "0",
+                                "-f", "mpegts",
+                                save_file_path,
+                            ]
+
+                            comment_end = None
+                            if native_hls_record and '.m3u8' in real_url:
+                                comment_end = check_hls_record(
+                                    record_name, record_url, real_url, save_file_path, video_save_type,
+                                    record_headers, proxy_address, record_timeout, custom_script
+                                )
+                            if comment_end is None:
+                                ffmpeg_command.extend(command)
+                                comment_end = check_subprocess(
+                                    record_name,
+                                    record_url,
+                                    ffmpeg_command,
+                                    video_save_type,
+                                    custom_script
+                                )
+                            if comment_end:
+                                submit_converts_mp4(save_file_path)
+                                return True
+
+                        except subprocess.CalledProcessError as e:
+                            logger.error(f"错误信息: {e} 发生错误的行数: {e.__traceback__.tb_lineno}")
+                            with max_request_lock:
+                                error_count += 1
+                                error_window.append(1)
+
+                room.count_time = time.time()
+    return False
+
+
+def get_next_delay(room: RoomState) -> int:
+    if room.next_delay is not None:
+        x, room.next_delay = room.next_delay, None
+        return x
+
+    num = random.randint(-5, 5) + int(poll_scheduler.next_interval(room.record_url))
+    if num < 0:
+        num = 0
+    x = num
+
+    if error_count > 20:
+        x = x + 60
+        color_obj.print_colored("\r瞬时错误太多,延迟加60秒", color_obj.YELLOW)
+
+    # 这里是.如果录制结束后,循环时间会暂时变成30s后检测一遍. 这样一定程度上防止主播卡顿造成少录
+    # 当30秒过后检测一遍后. 会回归正常设置的循环秒数
+    if room.record_finished:
+        count_time_end = time.time() - room.count_time
+        if count_time_end < 60:
+            x = 30
+        room.record_finished = False
+
+    else:
+        x = num
+    return x
+
+
+def get_rate_limit_key(room: RoomState) -> str:
+    return room.platform.name if room.platform else room.live_domain
 
-                                record_headers = {
-                                    'PandaTV': 'origin:https://www.pandalive.co.kr',
-                                    'WinkTV': 'origin:https://www.winktv.co.kr',
-                                    'PopkonTV': 'origin:https://www.popkontv.com',
-                                    'FlexTV': 'origin:https://www.flextv.co.kr',
-                                    '千度热播': 'referer:https://qiandurebo.com',
-                                    '17Live': 'referer:https://17.live/en/live/6302408',
-                                    '浪Live': 'referer:https://www.lang.live',
-                                    'shopee': f'origin:{live_domain}',
-                                    'Blued直播': 'referer:https://app.blued.cn'
-                                }
-
-                                headers = record_headers.get(platform)
-                                if headers:
-                                    ffmpeg_command.insert(11, "-headers")
-                                    ffmpeg_command.insert(12, headers)
-
-                                if proxy_address:
-                                    ffmpeg_command.insert(1, "-http_proxy")
-                                    ffmpeg_command.insert(2, proxy_address)
-
-                                recording.add(record_name)
-                                start_record_time = datetime.datetime.now()
-                                recording_time_list[record_name] = [start_record_time, record_quality_zh]
-                                rec_info = f"\r{anchor_name} 准备开始录制视频: {full_path}"
-                                
-                                # 启动弹幕录制
-                                if record_url in danmu_info and record_name not in danmu_recorders:
-                                    try:
-                                        danmu_data = danmu_info[record_url]
-                                        logger.info(f'正在启动 {danmu_data["anchor_name"]} 的弹幕录制')
-                                        
-                                        # 确保输出目录存在
-                                        if not os.path.exists(full_path):
-                                            os.makedirs(full_path, exist_ok=True)
-                                        
-                                        danmu_recorder = create_douyin_danmu_recorder(
-                                            room_id=danmu_data['room_id'],
-                                            room_name=danmu_data['anchor_name'],
-                                            output_dir=full_path,  # 传入目录路径
-                                            cookies=danmu_data['cookies']
-                                        )
-                                        danmu_recorders[record_name] = danmu_recorder
-                                        
-                                        # 将键从record_url更新为record_name
-                                        danmu_info[record_name] = danmu_info.pop(record_url)
-                                        
-                                        # 异步启动弹幕录制
-                                        def start_danmu_recording():
-                                            try:
-                                                asyncio.run(danmu_recorder.start(
-                                                    enable_segment=danmu_follow_video_segment and split_video_by_time,
-                                                    segment_time=int(split_time) if split_video_by_time else 1800
-                                                ))
-                                            except Exception as e:
-                                                logger.error(f'弹幕录制启动失败: {e}')
-                                        
-                                        danmu_thread = threading.Thread(target=start_danmu_recording, daemon=True)
-                                        danmu_thread.start()
-                                        logger.info(f'已启动 {danmu_data["anchor_name"]} 的弹幕录制')
-                                    except Exception as e:
-                                        logger.error(f'弹幕录制启动失败: {e}')
-                                if show_url:
-                                    re_plat = ('WinkTV', 'PandaTV', 'ShowRoom', 'CHZZK', 'Youtube')
-                                    if platform in re_plat:
-                                        logger.info(f"{platform} | {anchor_name} | 直播源地址: {port_info['m3u8_url']}")
-                                    else:
-                                        logger.info(
-                                            f"{platform} | {anchor_name} | 直播源地址: {real_url}")
-
-                                only_flv_record = False
-                                only_flv_platform_list = ['shopee', '花椒直播']
-                                if platform in only_flv_platform_list:
-                                    logger.debug(f"提示: {platform} 将强制使用FLV格式录制")
-                                    only_flv_record = True
-
-                                only_audio_record = False
-                                only_audio_platform_list = ['猫耳FM直播', 'Look直播']
-                                if platform in only_audio_platform_list:
-                                    only_audio_record = True
-
-                                if only_audio_record:
-                                    try:
-                                        now = time.strftime("%Y-%m-%d_%H-%M-%S", time.localtime())
-                                        extension = "mp3" if "m4a" not in video_save_type.lower () else "m4a"
-                                        name_format = "_%03d" if split_video_by_time else ""
-                                        save_file_path = (f"{full_path}/{anchor_name}_{title_in_name}{now}"
-                                                          f"{name_format}.{extension}")
-
-                                        if split_video_by_time:
-                                            print(f'\r{anchor_name} 准备开始录制音频: {save_file_path}')
-                                            
-                                            # 设置弹幕录制器的视频文件名（音频分段模式）
-                                            if record_name in danmu_recorders:
-                                                try:
-                                                    base_filename = f"{anchor_name}_{title_in_name}{now}_000.{extension}"
-                                                    danmu_recorders[record_name].set_video_filename(base_filename)
-                                                except Exception as e:
-                                                    logger.error(f'设置弹幕文件名失败: {e}')
-
-                                            if "MP3" in video_save_type:
-                                                command = [
-                                                    "-map", "0:a",
-                                                    "-c:a", "libmp3lame",
-                                                    "-ab", "320k",
-                                                    "-f", "segment",
-                                                    "-segment_time", split_time,
-                                                    "-reset_timestamps", "1",
-                                                    save_file_path,
-                                                ]
-                                            else:
-                                                command = [
-                                                    "-map", "0:a",
-                                                    "-c:a", "aac",
-                                                    "-bsf:a", "aac_adtstoasc",
-                                                    "-ab", "320k",
-                                                    "-f", "segment",
-                                                    "-segment_time", split_time,
-                                                    "-segment_format", 'mpegts',
-                                                    "-reset_timestamps", "1",
-                                                    save_file_path,
-                                                ]
-
-                                        else:
-                                            # 设置弹幕录制器的视频文件名（音频非分段模式）
-                                            if record_name in danmu_recorders:
-                                                try:
-                                                    filename = f"{anchor_name}_{title_in_name}{now}.{extension}"
-                                                    danmu_recorders[record_name].set_video_filename(filename)
-                                                except Exception as e:
-                                                    logger.error(f'设置弹幕文件名失败: {e}')
-                                            
-                                            if "MP3" in video_save_type:
-                                                command = [
-                                                    "-map", "0:a",
-                                                    "-c:a", "libmp3lame",
-                                                    "-ab", "320k",
-                                                    save_file_path,
-                                                ]
-
-                                            else:
-                                                command = [
-                                                    "-map", "0:a",
-                                                    "-c:a", "aac",
-                                                    "-bsf:a", "aac_adtstoasc",
-                                                    "-ab", "320k",
-                                                    "-movflags", "+faststart",
-                                                    save_file_path,
-                                                ]
-
-                                        ffmpeg_command.extend(command)
-                                        comment_end = check_subprocess(
-                                            record_name,
-                                            record_url,
-                                            ffmpeg_command,
-                                            video_save_type,
-                                            custom_script
-                                        )
-                                        if comment_end:
-                                            return
-
-                                    except subprocess.CalledProcessError as e:
-                                        logger.error(f"错误信息: {e} 发生错误的行数: {e.__traceback__.tb_lineno}")
-                                        with max_request_lock:
-                                            error_count += 1
-                                            error_window.append(1)
-
-                                if video_save_type == "FLV" or only_flv_record:
-                                    filename = anchor_name + f'_{title_in_name}' + now + '.flv'
-                                    save_file_path = f'{full_path}/{filename}'
-                                    print(f'{rec_info}/{filename}')
-                                    
-                                    # 设置弹幕录制器的视频文件名
-                                    if record_name in danmu_recorders:
-                                        try:
-                                            danmu_recorders[record_name].set_video_filename(filename)
-                                        except Exception as e:
-                                            logger.error(f'设置弹幕文件名失败: {e}')
-
-                                    subs_file_path = save_file_path.rsplit('.', maxsplit=1)[0]
-                                    subs_thread_name = f'subs_{Path(subs_file_path).name}'
-                                    if create_time_file:
-                                        create_var[subs_thread_name] = threading.Thread(
-                                            target=generate_subtitles, args=(record_name, subs_file_path)
-                                        )
-                                        create_var[subs_thread_name].daemon = True
-                                        create_var[subs_thread_name].start()
-
-                                    try:
-                                        flv_url = port_info.get('flv_url')
-                                        if flv_url:
-                                            _filepath, _ = urllib.request.urlretrieve(flv_url, save_file_path)
-                                            record_finished = True
-                                            recording.discard(record_name)
-                                            print(
-                                                f"\n{anchor_name} {time.strftime('%Y-%m-%d %H:%M:%S')} 直播录制完成\n")
-                                        else:
-                                            logger.debug("未找到FLV直播流，跳过录制")
-                                    except Exception as e:
-                                        clear_record_info(record_name, record_url)
-                                        color_obj.print_colored(
-                                            f"\n{anchor_name} {time.strftime('%Y-%m-%d %H:%M:%S')} 直播录制出错,请检查网络\n",
-                                            color_obj.RED)
-                                        logger.error(f"错误信息: {e} 发生错误的行数: {e.__traceback__.tb_lineno}")
-                                        with max_request_lock:
-                                            error_count += 1
-                                            error_window.append(1)
-
-                                    try:
-                                        if converts_to_mp4:
-                                            seg_file_path = f"{full_path}/{anchor_name}_{title_in_name}{now}_%03d.mp4"
-                                            if split_video_by_time:
-                                                segment_video(
-                                                    save_file_path, seg_file_path,
-                                                    segment_format='mp4', segment_time=split_time,
-                                                    is_original_delete=delete_origin_file
-                                                )
-                                            else:
-                                                threading.Thread(
-                                                    target=converts_mp4,
-                                                    args=(save_file_path, delete_origin_file)
-                                                ).start()
-
-                                        else:
-                                            seg_file_path = f"{full_path}/{anchor_name}_{title_in_name}{now}_%03d.flv"
-                                            if split_video_by_time:
-                                                segment_video(
-                                                    save_file_path, seg_file_path,
-                                                    segment_format='flv', segment_time=split_time,
-                                                    is_original_delete=delete_origin_file
-                                                )
-                                    except Exception as e:
-                                        logger.error(f"转码失败: {e} ")
-
-                                elif video_save_type == "MKV":
-                                    filename = anchor_name + f'_{title_in_name}' + now + ".mkv"
-                                    print(f'{rec_info}/{filename}')
-                                    save_file_path = full_path + '/' + filename
-                                    
-                                    # 设置弹幕录制器的视频文件名
-                                    if record_name in danmu_recorders:
-                                        try:
-                                            danmu_recorders[record_name].set_video_filename(filename)
-                                        except Exception as e:
-                                            logger.error(f'设置弹幕文件名失败: {e}')
-
-                                    try:
-                                        if split_video_by_time:
-                                            now = time.strftime("%Y-%m-%d_%H-%M-%S", time.localtime())
-                                            save_file_path = f"{full_path}/{anchor_name}_{title_in_name}{now}_%03d.mkv"
-                                            command = [
-                                                "-flags", "global_header",
-                                                "-c:v", "copy",
-                                                "-c:a", "aac",
-                                                "-map", "0",
-                                                "-f", "segment",
-                                                "-segment_time", split_time,
-                                                "-segment_format", "matroska",
-                                                "-reset_timestamps", "1",
-                                                save_file_path,
-                                            ]
-
-                                        else:
-                                            command = [
-                                                "-flags", "global_header",
-                                                "-map", "0",
-                                                "-c:v", "copy",
-                                                "-c:a", "copy",
-                                                "-f", "matroska",
-                                                "{path}".format(path=save_file_path),
-                                            ]
-                                        ffmpeg_command.extend(command)
-
-                                        comment_end = check_subprocess(
-                                            record_name,
-                                            record_url,
-                                            ffmpeg_command,
-                                            video_save_type,
-                                            custom_script
-                                        )
-                                        if comment_end:
-                                            return
-
-                                    except subprocess.CalledProcessError as e:
-                                        logger.error(f"错误信息: {e} 发生错误的行数: {e.__traceback__.tb_lineno}")
-                                        with max_request_lock:
-                                            error_count += 1
-                                            error_window.append(1)
-
-                                elif video_save_type == "MP4":
-                                    filename = anchor_name + f'_{title_in_name}' + now + ".mp4"
-                                    print(f'{rec_info}/{filename}')
-                                    save_file_path = full_path + '/' + filename
-                                    
-                                    # 设置弹幕录制器的视频文件名
-                                    if record_name in danmu_recorders:
-                                        try:
-                                            danmu_recorders[record_name].set_video_filename(filename)
-                                        except Exception as e:
-                                            logger.error(f'设置弹幕文件名失败: {e}')
-
-                                    try:
-                                        if split_video_by_time:
-                                            now = time.strftime("%Y-%m-%d_%H-%M-%S", time.localtime())
-                                            save_file_path = f"{full_path}/{anchor_name}_{title_in_name}{now}_%03d.mp4"
-                                            
-                                            # 设置弹幕录制器的视频文件名（分段模式）
-                                            if record_name in danmu_recorders:
-                                                try:
-                                                    base_filename = f"{anchor_name}_{title_in_name}{now}_000.mp4"
-                                                    danmu_recorders[record_name].set_video_filename(base_filename)
-                                                except Exception as e:
-                                                    logger.error(f'设置弹幕文件名失败: {e}')
-                                            command = [
-                                                "-c:v", "copy",
-                                                "-c:a", "aac",
-                                                "-map", "0",
-                                                "-f", "segment",
-                                                "-segment_time", split_time,
-                                                "-segment_format", "mp4",
-                                                "-reset_timestamps", "1",
-                                                "-movflags", "+frag_keyframe+empty_moov",
-                                                save_file_path,
-                                            ]
-
-                                        else:
-                                            command = [
-                                                "-map", "0",
-                                                "-c:v", "copy",
-                                                "-c:a", "copy",
-                                                "-f", "mp4",
-                                                save_file_path,
-                                            ]
-
-                                        ffmpeg_command.extend(command)
-                                        comment_end = check_subprocess(
-                                            record_name,
-                                            record_url,
-                                            ffmpeg_command,
-                                            video_save_type,
-                                            custom_script
-                                        )
-                                        if comment_end:
-                                            return
-
-                                    except subprocess.CalledProcessError as e:
-                                        logger.error(f"错误信息: {e} 发生错误的行数: {e.__traceback__.tb_lineno}")
-                                        with max_request_lock:
-                                            error_count += 1
-                                            error_window.append(1)
-
-                                else:
-                                    if split_video_by_time:
-                                        now = time.strftime("%Y-%m-%d_%H-%M-%S", time.localtime())
-                                        filename = anchor_name + f'_{title_in_name}' + now + ".ts"
-                                        print(f'{rec_info}/{filename}')
-                                        
-                                        # 设置弹幕录制器的视频文件名（分段模式）
-                                        if record_name in danmu_recorders:
-                                            try:
-                                                base_filename = f"{anchor_name}_{title_in_name}{now}_000.ts"
-                                                danmu_recorders[record_name].set_video_filename(base_filename)
-                                            except Exception as e:
-                                                logger.error(f'设置弹幕文件名失败: {e}')
-
-                                        try:
-                                            save_file_path = f"{full_path}/{anchor_name}_{title_in_name}{now}_%03d.ts"
-                                            command = [
-                                                "-c:v", "copy",
-                                                "-c:a", "copy",
-                                                "-map", "0",
-                                                "-f", "segment",
-                                                "-segment_time", split_time,
-                                                "-segment_format", 'mpegts',
-                                                "-reset_timestamps", "1",
-                                                save_file_path,
-                                            ]
-
-                                            ffmpeg_command.extend(command)
-                                            comment_end = check_subprocess(
-                                                record_name,
-                                                record_url,
-                                                ffmpeg_command,
-                                                video_save_type,
-                                                custom_script
-                                            )
-                                            if comment_end:
-                                                if converts_to_mp4:
-                                                    file_paths = utils.get_file_paths(os.path.dirname(save_file_path))
-                                                    prefix = os.path.basename(save_file_path).rsplit('_', maxsplit=1)[0]
-                                                    for path in file_paths:
-                                                        if prefix in path:
-                                                            try:
-                                                                threading.Thread(
-                                                                    target=converts_mp4,
-                                                                    args=(path, delete_origin_file)
-                                                                ).start()
-                                                            except subprocess.CalledProcessError as e:
-                                                                logger.error(f"转码失败: {e} ")
-                                                return
-
-                                        except subprocess.CalledProcessError as e:
-                                            logger.error(
-                                                f"错误信息: {e} 发生错误的行数: {e.__traceback__.tb_lineno}")
-                                            with max_request_lock:
-                                                error_count += 1
-                                                error_window.append(1)
-
-                                    else:
-                                        filename = anchor_name + f'_{title_in_name}' + now + ".ts"
-                                        print(f'{rec_info}/{filename}')
-                                        save_file_path = full_path + '/' + filename
-                                        
-                                        # 设置弹幕录制器的视频文件名
-                                        if record_name in danmu_recorders:
-                                            try:
-                                                danmu_recorders[record_name].set_video_filename(filename)
-                                            except Exception as e:
-                                                logger.error(f'设置弹幕文件名失败: {e}')
-
-                                        try:
-                                            command = [
-                                                "-c:v", "copy",
-                                                "-c:a", "copy",
-                                                "-map", "0",
-                                                "-f", "mpegts",
-                                                save_file_path,
-                                            ]
-
-                                            ffmpeg_command.extend(command)
-                                            comment_end = check_subprocess(
-                                                record_name,
-                                                record_url,
-                                                ffmpeg_command,
-                                                video_save_type,
-                                                custom_script
-                                            )
-                                            if comment_end:
-                                                threading.Thread(
-                                                    target=converts_mp4, args=(save_file_path, delete_origin_file)
-                                                ).start()
-                                                return
-
-                                        except subprocess.CalledProcessError as e:
-                                            logger.error(f"错误信息: {e} 发生错误的行数: {e.__traceback__.tb_lineno}")
-                                            with max_request_lock:
-                                                error_count += 1
-                                                error_window.append(1)
-
-                                count_time = time.time()
 
+def record_error() -> None:
+    global error_count
+    with max_request_lock:
+        error_count += 1
+        error_window.append(1)
+
+
+def start_record(url_data: tuple, count_variable: int = -1) -> None:
+    while True:
+        try:
+            room = create_room_state(url_data, count_variable)
+            poll_scheduler.wait(room.record_url, 0)
+            while True:
+                try:
+                    with rate_limiter.slot(get_rate_limit_key(room)) as probe:
+                        platform, port_info, new_record_url = run_coroutine(fetch_port_info(room))
+                        probe.ok = bool(port_info and port_info.get('anchor_name'))
+                    if port_info is None:
+                        logger.error(f'{room.record_url} {platform}直播地址')
+                        return
+                    if handle_port_info(room, platform, port_info, new_record_url):
+                        return
                 except Exception as e:
                     logger.error(f"错误信息: {e} 发生错误的行数: {e.__traceback__.tb_lineno}")
-                    with max_request_lock:
-                        error_count += 1
-                        error_window.append(1)
-
-                num = random.randint(-5, 5) + delay_default
-                if num < 0:
-                    num = 0
-                x = num
-
-                if error_count > 20:
-                    x = x + 60
-                    color_obj.print_colored("\r瞬时错误太多,延迟加60秒", color_obj.YELLOW)
-
-                # 这里是.如果录制结束后,循环时间会暂时变成30s后检测一遍. 这样一定程度上防止主播卡顿造成少录
-                # 当30秒过后检测一遍后. 会回归正常设置的循环秒数
-                if record_finished:
-                    count_time_end = time.time() - count_time
-                    if count_time_end < 60:
-                        x = 30
-                    record_finished = False
+                    record_error()
 
-                else:
-                    x = num
-
-                # 这里是正常循环
-                while x:
-                    x = x - 1
-                    if loop_time:
-                        print(f'\r{anchor_name}循环等待{x}秒 ', end="")
-                    time.sleep(1)
+                # 这里是正常循环，等待调度器按检测间隔唤醒
+                x = get_next_delay(room)
+                if loop_time:
+                    print(f'\r{room.anchor_name}循环等待{x}秒 ', end="")
+                poll_scheduler.wait(room.record_url, x, room.anchor_name)
                 if loop_time:
                     print('\r检测直播间中...', end="")
         except Exception as e:
             logger.error(f"错误信息: {e} 发生错误的行数: {e.__traceback__.tb_lineno}")
-            with max_request_lock:
-                error_count += 1
-                error_window.append(1)
+            record_error()
             time.sleep(2)
 
 
+async def monitor_room(url_data: tuple, count_variable: int = -1) -> None:
+    """start_record的异步版本，由MonitorEngine在单个事件循环中调度，录制过程在线程池中执行"""
+    while True:
+        try:
+            room = create_room_state(url_data, count_variable)
+            await poll_scheduler.wait_async(room.record_url, 0)
+            while True:
+                try:
+                    async with rate_limiter.slot_async(get_rate_limit_key(room)) as probe:
+                        platform, port_info, new_record_url = await fetch_port_info(room)
+                        probe.ok = bool(port_info and port_info.get('anchor_name'))
+                    if port_info is None:
+                        logger.error(f'{room.record_url} {platform}直播地址')
+                        return
+                    if port_info.get('is_live'):
+                        exit_room = await monitor_engine.run_blocking(
+                            handle_port_info, room, platform, port_info, new_record_url)
+                    else:
+                        exit_room = handle_port_info(room, platform, port_info, new_record_url)
+                    if exit_room:
+                        return
+                except Exception as e:
+                    logger.error(f"错误信息: {e} 发生错误的行数: {e.__traceback__.tb_lineno}")
+                    record_error()
+
+                x = get_next_delay(room)
+                if loop_time:
+                    print(f'\r{room.anchor_name}循环等待{x}秒 ', end="")
+                await poll_scheduler.wait_async(room.record_url, x, room.anchor_name)
+                if loop_time:
+                    print('\r检测直播间中...', end="")
+        except asyncio.CancelledError:
+            # 直播间被删除或注释时由主循环取消，与检测到注释后退出时一样清理
+            clear_record_info(f'序号{room.count_variable} {room.anchor_name}', room.record_url)
+            raise
+        except Exception as e:
+            logger.error(f"错误信息: {e} 发生错误的行数: {e.__traceback__.tb_lineno}")
+            record_error()
+            await asyncio.sleep(2)
+
+
 def backup_file(file_path: str, backup_dir_path: str, limit_counts: int = 6) -> None:
     try:
         if not os.path.exists(backup_dir_path):
@@ -1758,37 +1397,19 @@ os.makedirs(os.path.dirname(config_file), exist_ok=True)
 t3 = threading.Thread(target=backup_file_start, args=(), daemon=True)
 t3.start()
 utils.remove_duplicate_lines(url_config_file)
+url_config_watcher = UrlConfigWatcher(url_config_file, encoding=text_encoding)
 
 
-def read_config_value(config_parser: configparser.RawConfigParser, section: str, option: str, default_value: Any) \
-        -> Any:
-    try:
+def read_config_value(config_loader: ConfigLoader, section: str, option: str, default_value: Any) -> Any:
+    return config_loader.get(section, option, default_value)
 
-        config_parser.read(config_file, encoding=text_encoding)
-        if '录制设置' not in config_parser.sections():
-            config_parser.add_section('录制设置')
-        if '推送配置' not in config_parser.sections():
-            config_parser.add_section('推送配置')
-        if 'Cookie' not in config_parser.sections():
-            config_parser.add_section('Cookie')
-        if 'Authorization' not in config_parser.sections():
-            config_parser.add_section('Authorization')
-        if '账号密码' not in config_parser.sections():
-            config_parser.add_section('账号密码')
-        if '弹幕录制设置' not in config_parser.sections():
-            config_parser.add_section('弹幕录制设置')
-        return config_parser.get(section, option)
-    except (configparser.NoSectionError, configparser.NoOptionError):
-        config_parser.set(section, option, str(default_value))
-        with open(config_file, 'w', encoding=text_encoding) as f:
-            config_parser.write(f)
-        return default_value
-
-
-options = {"是": True, "否": False}
-config = configparser.RawConfigParser()
+
+config = ConfigLoader(
+    config_file, encoding=text_encoding,
+    sections=('录制设置', '推送配置', 'Cookie', 'Authorization', '账号密码', '弹幕录制设置')
+)
 language = read_config_value(config, '录制设置', 'language(zh_cn/en)', "zh_cn")
-skip_proxy_check = options.get(read_config_value(config, '录制设置', '是否跳过代理检测(是/否)', "否"), False)
+skip_proxy_check = config.get_bool('录制设置', '是否跳过代理检测(是/否)', False)
 if language and 'en' not in language.lower():
     from i18n import translated_print
 
@@ -1821,45 +1442,47 @@ while True:
             with open(config_file, 'w', encoding=text_encoding) as file:
                 pass
 
-        ini_URL_content = ''
-        if os.path.isfile(url_config_file):
-            with open(url_config_file, 'r', encoding=text_encoding) as file:
-                ini_URL_content = file.read().strip()
-
-        if not ini_URL_content.strip():
+        if url_config_watcher.changed() and not ''.join(url_config_watcher.read_lines()).strip():
             input_url = input('请输入要录制的主播直播间网址（尽量使用PC网页端的直播间地址）:\n')
             with open(url_config_file, 'w', encoding=text_encoding) as file:
                 file.write(input_url)
     except OSError as err:
         logger.error(f"发生 I/O 错误: {err}")
 
+    config.reload()
     video_save_path = read_config_value(config, '录制设置', '直播保存路径(不填则默认)', "")
-    folder_by_author = options.get(read_config_value(config, '录制设置', '保存文件夹是否以作者区分', "是"), False)
-    folder_by_time = options.get(read_config_value(config, '录制设置', '保存文件夹是否以时间区分', "否"), False)
-    folder_by_title = options.get(read_config_value(config, '录制设置', '保存文件夹是否以标题区分', "否"), False)
-    filename_by_title = options.get(read_config_value(config, '录制设置', '保存文件名是否包含标题', "否"), False)
-    clean_emoji = options.get(read_config_value(config, '录制设置', '是否去除名称中的表情符号', "是"), True)
+    folder_by_author = config.get_bool('录制设置', '保存文件夹是否以作者区分', True)
+    folder_by_time = config.get_bool('录制设置', '保存文件夹是否以时间区分', False)
+    folder_by_title = config.get_bool('录制设置', '保存文件夹是否以标题区分', False)
+    filename_by_title = config.get_bool('录制设置', '保存文件名是否包含标题', False)
+    clean_emoji = config.get_bool('录制设置', '是否去除名称中的表情符号', True)
     video_save_type = read_config_value(config, '录制设置', '视频保存格式ts|mkv|flv|mp4|mp3音频|m4a音频', "ts")
     video_record_quality = read_config_value(config, '录制设置', '原画|超清|高清|标清|流畅', "原画")
-    use_proxy = options.get(read_config_value(config, '录制设置', '是否使用代理ip(是/否)', "是"), False)
+    use_proxy = config.get_bool('录制设置', '是否使用代理ip(是/否)', True)
     proxy_addr_bak = read_config_value(config, '录制设置', '代理地址', "")
     proxy_addr = None if not use_proxy else proxy_addr_bak
-    max_request = int(read_config_value(config, '录制设置', '同一时间访问网络的线程数', 3))
-    semaphore = threading.Semaphore(max_request)
-    delay_default = int(read_config_value(config, '录制设置', '循环时间(秒)', 120))
-    local_delay_default = int(read_config_value(config, '录制设置', '排队读取网址时间(秒)', 0))
-    loop_time = options.get(read_config_value(config, '录制设置', '是否显示循环秒数', "否"), False)
-    show_url = options.get(read_config_value(config, '录制设置', '是否显示直播源地址', "否"), False)
-    split_video_by_time = options.get(read_config_value(config, '录制设置', '分段录制是否开启', "否"), False)
-    enable_https_recording = options.get(read_config_value(config, '录制设置', '是否强制启用https录制', "否"), False)
-    disk_space_limit = float(read_config_value(config, '录制设置', '录制空间剩余阈值(gb)', 1.0))
+    max_request = config.get_int('录制设置', '同一时间访问网络的线程数', 3)
+    max_probe_rate = config.get_float('录制设置', '每个平台每秒最多检测数(0为不限制)', 0)
+    rate_limiter.configure(max_request, max_probe_rate, burst=max_request)
+    use_async_engine = config.get_bool('录制设置', '是否启用异步监测引擎(是/否)', False)
+    delay_default = config.get_int('录制设置', '循环时间(秒)', 120)
+    local_delay_default = config.get_int('录制设置', '排队读取网址时间(秒)', 0)
+    loop_time = config.get_bool('录制设置', '是否显示循环秒数', False)
+    adaptive_poll = config.get_bool('录制设置', '是否启用自适应检测间隔(是/否)', False)
+    max_probes_per_second = config.get_float('录制设置', '每秒最多检测直播间数(0为不限制)', 0)
+    show_url = config.get_bool('录制设置', '是否显示直播源地址', False)
+    split_video_by_time = config.get_bool('录制设置', '分段录制是否开启', False)
+    native_hls_record = config.get_bool('录制设置', '是否使用内置HLS录制ts(是/否)', False)
+    enable_https_recording = config.get_bool('录制设置', '是否强制启用https录制', False)
+    disk_space_limit = config.get_float('录制设置', '录制空间剩余阈值(gb)', 1.0)
     split_time = str(read_config_value(config, '录制设置', '视频分段时间(秒)', 1800))
-    converts_to_mp4 = options.get(read_config_value(config, '录制设置', '录制完成后自动转为mp4格式', "否"), False)
-    converts_to_h264 = options.get(read_config_value(config, '录制设置', 'mp4格式重新编码为h264', "否"), False)
-    delete_origin_file = options.get(read_config_value(config, '录制设置', '追加格式后删除原文件', "否"), False)
-    create_time_file = options.get(read_config_value(config, '录制设置', '生成时间字幕文件', "否"), False)
-    is_run_script = options.get(read_config_value(config, '录制设置', '是否录制完成后执行自定义脚本', "否"), False)
+    converts_to_mp4 = config.get_bool('录制设置', '录制完成后自动转为mp4格式', False)
+    converts_to_h264 = config.get_bool('录制设置', 'mp4格式重新编码为h264', False)
+    delete_origin_file = config.get_bool('录制设置', '追加格式后删除原文件', False)
+    create_time_file = config.get_bool('录制设置', '生成时间字幕文件', False)
+    is_run_script = config.get_bool('录制设置', '是否录制完成后执行自定义脚本', False)
     custom_script = read_config_value(config, '录制设置', '自定义脚本执行命令', "") if is_run_script else None
+    postprocess_workers = config.get_int('录制设置', '同时执行的转码任务数(0为自动)', 0)
     enable_proxy_platform = read_config_value(
         config, '录制设置', '使用代理录制的平台(逗号分隔)',
         'tiktok, soop, pandalive, winktv, flextv, popkontv, twitch, liveme, showroom, chzzk, shopee, shp, youtu, faceit'
@@ -1874,11 +1497,11 @@ while True:
     bark_msg_level = read_config_value(config, '推送配置', 'bark推送中断级别', "active")
     bark_msg_ring = read_config_value(config, '推送配置', 'bark推送铃声', "bell")
     dingtalk_phone_num = read_config_value(config, '推送配置', '钉钉通知@对象(填手机号)', "")
-    dingtalk_is_atall = options.get(read_config_value(config, '推送配置', '钉钉通知@全体(是/否)', "否"), False)
+    dingtalk_is_atall = config.get_bool('推送配置', '钉钉通知@全体(是/否)', False)
     tg_token = read_config_value(config, '推送配置', 'tgapi令牌', "")
     tg_chat_id = read_config_value(config, '推送配置', 'tg聊天id(个人或者群组id)', "")
     email_host = read_config_value(config, '推送配置', 'SMTP邮件服务器', "")
-    open_smtp_ssl = options.get(read_config_value(config, '推送配置', '是否使用SMTP服务SSL加密(是/否)', "是"), True)
+    open_smtp_ssl = config.get_bool('推送配置', '是否使用SMTP服务SSL加密(是/否)', True)
     smtp_port = read_config_value(config, '推送配置', 'SMTP邮件服务器端口', "")
     login_email = read_config_value(config, '推送配置', '邮箱登录账号', "")
     email_password = read_config_value(config, '推送配置', '发件人密码(授权码)', "")
@@ -1892,10 +1515,10 @@ while True:
     push_message_title = read_config_value(config, '推送配置', '自定义推送标题', "直播间状态更新通知")
     begin_push_message_text = read_config_value(config, '推送配置', '自定义开播推送内容', "")
     over_push_message_text = read_config_value(config, '推送配置', '自定义关播推送内容', "")
-    disable_record = options.get(read_config_value(config, '推送配置', '只推送通知不录制(是/否)', "否"), False)
-    push_check_seconds = int(read_config_value(config, '推送配置', '直播推送检测频率(秒)', 1800))
-    begin_show_push = options.get(read_config_value(config, '推送配置', '开播推送开启(是/否)', "是"), True)
-    over_show_push = options.get(read_config_value(config, '推送配置', '关播推送开启(是/否)', "否"), False)
+    disable_record = config.get_bool('推送配置', '只推送通知不录制(是/否)', False)
+    push_check_seconds = config.get_int('推送配置', '直播推送检测频率(秒)', 1800)
+    begin_show_push = config.get_bool('推送配置', '开播推送开启(是/否)', True)
+    over_show_push = config.get_bool('推送配置', '关播推送开启(是/否)', False)
     sooplive_username = read_config_value(config, '账号密码', 'sooplive账号', '')
     sooplive_password = read_config_value(config, '账号密码', 'sooplive密码', '')
     flextv_username = read_config_value(config, '账号密码', 'flextv账号', '')
@@ -1907,67 +1530,42 @@ while True:
     twitcasting_username = read_config_value(config, '账号密码', 'twitcasting账号', '')
     twitcasting_password = read_config_value(config, '账号密码', 'twitcasting密码', '')
     popkontv_access_token = read_config_value(config, 'Authorization', 'popkontv_token', '')
-    dy_cookie = read_config_value(config, 'Cookie', '抖音cookie', '')
-    ks_cookie = read_config_value(config, 'Cookie', '快手cookie', '')
-    tiktok_cookie = read_config_value(config, 'Cookie', 'tiktok_cookie', '')
-    hy_cookie = read_config_value(config, 'Cookie', '虎牙cookie', '')
-    douyu_cookie = read_config_value(config, 'Cookie', '斗鱼cookie', '')
-    yy_cookie = read_config_value(config, 'Cookie', 'yy_cookie', '')
-    bili_cookie = read_config_value(config, 'Cookie', 'B站cookie', '')
-    xhs_cookie = read_config_value(config, 'Cookie', '小红书cookie', '')
-    bigo_cookie = read_config_value(config, 'Cookie', 'bigo_cookie', '')
-    blued_cookie = read_config_value(config, 'Cookie', 'blued_cookie', '')
-    sooplive_cookie = read_config_value(config, 'Cookie', 'sooplive_cookie', '')
-    netease_cookie = read_config_value(config, 'Cookie', 'netease_cookie', '')
-    qiandurebo_cookie = read_config_value(config, 'Cookie', '千度热播_cookie', '')
-    pandatv_cookie = read_config_value(config, 'Cookie', 'pandatv_cookie', '')
-    maoerfm_cookie = read_config_value(config, 'Cookie', '猫耳fm_cookie', '')
-    winktv_cookie = read_config_value(config, 'Cookie', 'winktv_cookie', '')
-    flextv_cookie = read_config_value(config, 'Cookie', 'flextv_cookie', '')
-    look_cookie = read_config_value(config, 'Cookie', 'look_cookie', '')
-    twitcasting_cookie = read_config_value(config, 'Cookie', 'twitcasting_cookie', '')
-    baidu_cookie = read_config_value(config, 'Cookie', 'baidu_cookie', '')
-    weibo_cookie = read_config_value(config, 'Cookie', 'weibo_cookie', '')
-    kugou_cookie = read_config_value(config, 'Cookie', 'kugou_cookie', '')
-    twitch_cookie = read_config_value(config, 'Cookie', 'twitch_cookie', '')
-    liveme_cookie = read_config_value(config, 'Cookie', 'liveme_cookie', '')
-    huajiao_cookie = read_config_value(config, 'Cookie', 'huajiao_cookie', '')
-    liuxing_cookie = read_config_value(config, 'Cookie', 'liuxing_cookie', '')
-    showroom_cookie = read_config_value(config, 'Cookie', 'showroom_cookie', '')
-    acfun_cookie = read_config_value(config, 'Cookie', 'acfun_cookie', '')
-    changliao_cookie = read_config_value(config, 'Cookie', 'changliao_cookie', '')
-    yinbo_cookie = read_config_value(config, 'Cookie', 'yinbo_cookie', '')
-    yingke_cookie = read_config_value(config, 'Cookie', 'yingke_cookie', '')
-    zhihu_cookie = read_config_value(config, 'Cookie', 'zhihu_cookie', '')
-    chzzk_cookie = read_config_value(config, 'Cookie', 'chzzk_cookie', '')
-    haixiu_cookie = read_config_value(config, 'Cookie', 'haixiu_cookie', '')
-    vvxqiu_cookie = read_config_value(config, 'Cookie', 'vvxqiu_cookie', '')
-    yiqilive_cookie = read_config_value(config, 'Cookie', '17live_cookie', '')
-    langlive_cookie = read_config_value(config, 'Cookie', 'langlive_cookie', '')
-    pplive_cookie = read_config_value(config, 'Cookie', 'pplive_cookie', '')
-    six_room_cookie = read_config_value(config, 'Cookie', '6room_cookie', '')
-    lehaitv_cookie = read_config_value(config, 'Cookie', 'lehaitv_cookie', '')
-    huamao_cookie = read_config_value(config, 'Cookie', 'huamao_cookie', '')
-    shopee_cookie = read_config_value(config, 'Cookie', 'shopee_cookie', '')
-    youtube_cookie = read_config_value(config, 'Cookie', 'youtube_cookie', '')
-    taobao_cookie = read_config_value(config, 'Cookie', 'taobao_cookie', '')
-    jd_cookie = read_config_value(config, 'Cookie', 'jd_cookie', '')
-    faceit_cookie = read_config_value(config, 'Cookie', 'faceit_cookie', '')
-    migu_cookie = read_config_value(config, 'Cookie', 'migu_cookie', '')
-    lianjie_cookie = read_config_value(config, 'Cookie', 'lianjie_cookie', '')
-    laixiu_cookie = read_config_value(config, 'Cookie', 'laixiu_cookie', '')
+    platform_accounts = {
+        'sooplive_username': sooplive_username,
+        'sooplive_password': sooplive_password,
+        'flextv_username': flextv_username,
+        'flextv_password': flextv_password,
+        'popkontv_username': popkontv_username,
+        'popkontv_password': popkontv_password,
+        'popkontv_partner_code': popkontv_partner_code,
+        'popkontv_access_token': popkontv_access_token,
+        'twitcasting_account_type': twitcasting_account_type,
+        'twitcasting_username': twitcasting_username,
+        'twitcasting_password': twitcasting_password
+    }
+    platform_cookies = {
+        p.cookie_key: read_config_value(config, 'Cookie', p.cookie_key, '')
+        for p in platform_registry.platforms if p.cookie_key
+    }
+    dy_cookie = platform_cookies['抖音cookie']
     
     # 弹幕录制配置
-    enable_danmu_recording = options.get(read_config_value(config, '弹幕录制设置', '是否启用弹幕录制', "是"), True)
+    enable_danmu_recording = config.get_bool('弹幕录制设置', '是否启用弹幕录制', True)
     danmu_recording_platforms = read_config_value(config, '弹幕录制设置', '弹幕录制平台(逗号分隔)', "抖音")
     danmu_file_format = read_config_value(config, '弹幕录制设置', '弹幕文件保存格式', "xml")
-    danmu_follow_video_segment = options.get(read_config_value(config, '弹幕录制设置', '弹幕录制是否跟随视频分段', "是"), True)
-    danmu_max_retry = int(read_config_value(config, '弹幕录制设置', '弹幕录制重连次数', 3))
-    danmu_heartbeat_interval = int(read_config_value(config, '弹幕录制设置', '弹幕录制心跳间隔(秒)', 30))
+    danmu_follow_video_segment = config.get_bool('弹幕录制设置', '弹幕录制是否跟随视频分段', True)
+    danmu_max_retry = config.get_int('弹幕录制设置', '弹幕录制重连次数', 3)
+    danmu_heartbeat_interval = config.get_int('弹幕录制设置', '弹幕录制心跳间隔(秒)', 30)
+    danmu_sign_pool_size = config.get_int('弹幕录制设置', '弹幕签名上下文数量', 2)
     
     # 解析弹幕录制平台列表
     danmu_platforms_list = [p.strip() for p in danmu_recording_platforms.replace('，', ',').split(',') if p.strip()] if danmu_recording_platforms else []
-    picarto_cookie = read_config_value(config, 'Cookie', 'picarto_cookie', '')
+    js_signer.set_pool_size('webmssdk', danmu_sign_pool_size)
+    danmu_hub.set_heartbeat_interval(danmu_heartbeat_interval)
+    if enable_danmu_recording and '抖音' in danmu_platforms_list and not danmu_signer_warmed:
+        danmu_signer_warmed = True
+        threading.Thread(target=warm_up_danmu_signer, name='danmu-signer-warm-up', daemon=True).start()
+    config.flush()
 
     video_save_type_list = ("FLV", "MKV", "TS", "MP4", "MP3音频", "M4A音频")
     if video_save_type and video_save_type.upper() in video_save_type_list:
@@ -1978,6 +1576,7 @@ while True:
     check_path = video_save_path or default_path
     if utils.check_disk_capacity(check_path, show=first_run) < disk_space_limit:
         exit_recording = True
+        ffmpeg_supervisor.stop_all()
         if not recording:
             logger.warning(f"Disk space remaining is below {disk_space_limit} GB. "
                            f"Exiting program due to the disk space limit being reached.")
@@ -1990,19 +1589,24 @@ while True:
 
 
     try:
-        url_comments, line_list, url_line_list = [[] for _ in range(3)]
-        with (open(url_config_file, "r", encoding=text_encoding, errors='ignore') as file):
-            for origin_line in file:
-                if origin_line in line_list:
-                    delete_line(url_config_file, origin_line)
-                line_list.append(origin_line)
+        url_lines = None
+        original_lines = url_config_watcher.poll()
+        if original_lines is not None:
+            url_lines, url_tuples_list, comment_urls, seen_lines, seen_urls = [], [], set(), set(), set()
+            for origin_line in original_lines:
                 line = origin_line.strip()
+                if line and line in seen_lines:
+                    continue
+                seen_lines.add(line)
                 if len(line) < 18:
+                    url_lines.append(origin_line)
                     continue
 
                 line_spilt = line.split('主播: ')
                 if len(line_spilt) > 2:
-                    line = update_file(url_config_file, line, f'{line_spilt[0]}主播: {line_spilt[-1]}')
+                    new_line = f'{line_spilt[0]}主播: {line_spilt[-1]}'
+                    origin_line = origin_line.replace(line, new_line)
+                    line = new_line
 
                 is_comment_line = line.startswith("#")
                 if is_comment_line:
@@ -2029,169 +1633,112 @@ while True:
                 if quality not in ("原画", "蓝光", "超清", "高清", "标清", "流畅"):
                     quality = '原画'
 
-                if url not in url_line_list:
-                    url_line_list.append(url)
-                else:
-                    delete_line(url_config_file, origin_line)
-
                 url = 'https://' + url if '://' not in url else url
                 url_host = url.split('/')[2]
+                url_platform = platform_registry.match(url)
 
-                platform_host = [
-                    'live.douyin.com',
-                    'v.douyin.com',
-                    'www.douyin.com',
-                    'live.kuaishou.com',
-                    'www.huya.com',
-                    'www.douyu.com',
-                    'www.yy.com',
-                    'live.bilibili.com',
-                    'www.redelight.cn',
-                    'www.xiaohongshu.com',
-                    'xhslink.com',
-                    'www.bigo.tv',
-                    'slink.bigovideo.tv',
-                    'app.blued.cn',
-                    'cc.163.com',
-                    'qiandurebo.com',
-                    'fm.missevan.com',
-                    'look.163.com',
-                    'twitcasting.tv',
-                    'live.baidu.com',
-                    'weibo.com',
-                    'fanxing.kugou.com',
-                    'fanxing2.kugou.com',
-                    'mfanxing.kugou.com',
-                    'www.huajiao.com',
-                    'www.7u66.com',
-                    'wap.7u66.com',
-                    'live.acfun.cn',
-                    'm.acfun.cn',
-                    'live.tlclw.com',
-                    'wap.tlclw.com',
-                    'live.ybw1666.com',
-                    'wap.ybw1666.com',
-                    'www.inke.cn',
-                    'www.zhihu.com',
-                    'www.haixiutv.com',
-                    "h5webcdnp.vvxqiu.com",
-                    "17.live",
-                    'www.lang.live',
-                    "m.pp.weimipopo.com",
-                    "v.6.cn",
-                    "m.6.cn",
-                    'www.lehaitv.com',
-                    'h.catshow168.com',
-                    'e.tb.cn',
-                    'huodong.m.taobao.com',
-                    '3.cn',
-                    'eco.m.jd.com',
-                    'www.miguvideo.com',
-                    'm.miguvideo.com',
-                    'show.lailianjie.com',
-                    'www.imkktv.com',
-                    'www.picarto.tv'
-                ]
-                overseas_platform_host = [
-                    'www.tiktok.com',
-                    'play.sooplive.co.kr',
-                    'm.sooplive.co.kr',
-                    'www.pandalive.co.kr',
-                    'www.winktv.co.kr',
-                    'www.flextv.co.kr',
-                    'www.ttinglive.com',
-                    'www.popkontv.com',
-                    'www.twitch.tv',
-                    'www.liveme.com',
-                    'www.showroom-live.com',
-                    'chzzk.naver.com',
-                    'm.chzzk.naver.com',
-                    'live.shopee.',
-                    '.shp.ee',
-                    'www.youtube.com',
-                    'youtu.be',
-                    'www.faceit.com'
-                ]
-
-                platform_host.extend(overseas_platform_host)
-                clean_url_host_list = (
-                    "live.douyin.com",
-                    "live.bilibili.com",
-                    "www.huajiao.com",
-                    "www.zhihu.com",
-                    "www.huya.com",
-                    "chzzk.naver.com",
-                    "www.liveme.com",
-                    "www.haixiutv.com",
-                    "v.6.cn",
-                    "m.6.cn",
-                    'www.lehaitv.com'
-                )
-
-                if 'live.shopee.' in url_host or '.shp.ee' in url_host:
-                    url_host = 'live.shopee.' if 'live.shopee.' in url_host else '.shp.ee'
-
-                if url_host in platform_host or any(ext in url for ext in (".flv", ".m3u8")):
-                    if url_host in clean_url_host_list:
-                        url = update_file(url_config_file, old_str=url, new_str=url.split('?')[0])
+                if url_platform:
+                    if url_host in url_platform.clean_url_hosts:
+                        origin_line = origin_line.replace(url, url.split('?')[0])
+                        url = url.split('?')[0]
 
                     if 'xiaohongshu' in url:
                         host_id = re.search('&host_id=(.*?)(?=&|$)', url)
                         if host_id:
                             new_url = url.split('?')[0] + f'?host_id={host_id.group(1)}'
-                            url = update_file(url_config_file, old_str=url, new_str=new_url)
+                            origin_line = origin_line.replace(url, new_url)
+                            url = new_url
 
-                    url_comments = [i for i in url_comments if url not in i]
+                    if url in seen_urls:
+                        continue
+                    seen_urls.add(url)
                     if is_comment_line:
-                        url_comments.append(url)
+                        comment_urls.add(url)
                     else:
-                        new_line = (quality, url, name)
-                        url_tuples_list.append(new_line)
-                else:
-                    if not origin_line.startswith('#'):
-                        color_obj.print_colored(f"\r{origin_line.strip()} 本行包含未知链接.此条跳过", color_obj.YELLOW)
-                        update_file(url_config_file, old_str=origin_line, new_str=origin_line, start_str='#')
-
-        while len(need_update_line_list):
-            a = need_update_line_list.pop()
-            replace_words = a.split('|')
-            if replace_words[0] != replace_words[1]:
-                if replace_words[1].startswith("#"):
-                    start_with = '#'
-                    new_word = replace_words[1][1:]
-                else:
-                    start_with = None
-                    new_word = replace_words[1]
-                update_file(url_config_file, old_str=replace_words[0], new_str=new_word, start_str=start_with)
-
-        text_no_repeat_url = list(set(url_tuples_list))
-
-        if len(text_no_repeat_url) > 0:
-            for url_tuple in text_no_repeat_url:
-                monitoring = len(running_list)
-
-                if url_tuple[1] in not_record_list:
-                    continue
-
-                if url_tuple[1] not in running_list:
-                    print(f"\r{'新增' if not first_start else '传入'}地址: {url_tuple[1]}")
-                    monitoring += 1
-                    args = [url_tuple, monitoring]
-                    create_var[f'thread_{monitoring}'] = threading.Thread(target=start_record, args=args)
-                    create_var[f'thread_{monitoring}'].daemon = True
-                    create_var[f'thread_{monitoring}'].start()
-                    running_list.append(url_tuple[1])
-                    time.sleep(local_delay_default)
-        url_tuples_list = []
+                        url_tuples_list.append((quality, url, name))
+                elif not origin_line.startswith('#'):
+                    color_obj.print_colored(f"\r{origin_line.strip()} 本行包含未知链接.此条跳过", color_obj.YELLOW)
+                    origin_line = f'#{origin_line}'
+                url_lines.append(origin_line)
+
+            url_config_diff = url_config_watcher.diff(url_tuples_list, comment_urls)
+            url_comments = url_config_watcher.stopped_urls
+            ffmpeg_supervisor.stop_keys(url_comments)
+            for removed_url in url_config_diff.removed:
+                if removed_url in running_list:
+                    print(f"\r移除地址: {removed_url}")
+            if monitor_engine:
+                # 直接取消等待中的检测任务，不必等到下一次检测才发现被删除或注释
+                for stopped_url in url_comments:
+                    if stopped_url in running_list:
+                        monitor_engine.remove_room(stopped_url)
+
+        if need_update_line_list:
+            if url_lines is None:
+                original_lines = url_config_watcher.read_lines()
+                url_lines = list(original_lines)
+            while need_update_line_list:
+                a = need_update_line_list.pop()
+                replace_words = a.split('|')
+                if replace_words[0] != replace_words[1]:
+                    if replace_words[1].startswith("#"):
+                        start_with = '#'
+                        new_word = replace_words[1][1:]
+                    else:
+                        start_with = None
+                        new_word = replace_words[1]
+                    url_lines = replace_in_lines(url_lines, replace_words[0], new_word, start_with)
+
+        if url_lines is not None and url_lines != original_lines:
+            # 所有改动合并为一次原子写入，写入后文件状态变化，下一轮会重新解析
+            url_config_watcher.write_lines(url_lines)
+
+        poll_scheduler.base_interval = delay_default
+        poll_scheduler.min_interval = min(30, delay_default)
+        poll_scheduler.max_interval = max(1800, delay_default)
+        poll_scheduler.adaptive = adaptive_poll
+        poll_scheduler.probes_per_second = max_probes_per_second
+
+        # 只处理新增或等待重新启动的直播间，启动失败的直播间留在pending中下一轮重试
+        for url_tuple in url_config_watcher.pending_entries():
+            monitoring = len(running_list)
+
+            # 仍在运行的监测退出时会通过requeue重新放入pending
+            if url_tuple[1] in not_record_list or url_tuple[1] in running_list:
+                url_config_watcher.mark_started(url_tuple[1])
+                continue
+
+            print(f"\r{'新增' if not first_start else '传入'}地址: {url_tuple[1]}")
+            monitoring += 1
+            if use_async_engine:
+                if monitor_engine is None:
+                    monitor_engine = MonitorEngine()
+                    monitor_engine.start()
+                monitor_engine.add_room(
+                    url_tuple[1], lambda args=(url_tuple, monitoring): monitor_room(*args))
+            else:
+                args = [url_tuple, monitoring]
+                create_var[f'thread_{monitoring}'] = threading.Thread(target=start_record, args=args)
+                create_var[f'thread_{monitoring}'].daemon = True
+                create_var[f'thread_{monitoring}'].start()
+            running_list.add(url_tuple[1])
+            url_config_watcher.mark_started(url_tuple[1])
+            time.sleep(local_delay_default)
         first_start = False
 
     except Exception as err:
+        # 本轮解析可能只进行了一半，下一轮重新解析
+        url_config_watcher.invalidate()
         logger.error(f"错误信息: {err} 发生错误的行数: {err.__traceback__.tb_lineno}")
 
     if first_run:
+        postprocess_queue.register('converts_mp4', converts_mp4)
+        postprocess_queue.register('converts_m4a', converts_m4a)
+        postprocess_queue.register('script', run_script)
+        postprocess_queue.start(postprocess_workers)
         t = threading.Thread(target=display_info, args=(), daemon=True)
         t.start()
-        t2 = threading.Thread(target=adjust_max_request, args=(), daemon=True)
+        t2 = threading.Thread(target=update_error_window, args=(), daemon=True)
         t2.start()
         first_run = False
 
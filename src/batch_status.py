@@ -0,0 +1,108 @@
+# -*- encoding: utf-8 -*-
+
+"""
+Function: Shared cache that coalesces per-room live status probes into batched platform requests.
+"""
+import asyncio
+import threading
+import time
+from abc import ABC, abstractmethod
+from typing import Any, Hashable
+
+OptionalStr = str | None
+
+
+class BatchStatusCache(ABC):
+    """
+    批量状态查询缓存
+
+    每个直播间检测时调用get，需要查询时把其他最近被检测、结果即将过期且使用同一代理的直播间一起放进一次请求，
+    结果在max_age秒内被其他直播间的检测复用，每轮检测的请求数约为直播间数/batch_size。
+    同一直播间已在查询中时等待其结果；批量接口失败后retry_after秒内get直接返回None，由调用方逐个查询。
+    子类实现fetch_batch，返回以key为键的查询结果。
+    """
+
+    def __init__(self, batch_size: int = 50, max_age: float = 10.0, watch_ttl: float = 3600.0,
+                 timeout: float = 10.0, retry_after: float = 600.0):
+        self.batch_size = max(1, batch_size)
+        self.max_age = max_age
+        self.watch_ttl = watch_ttl  # 超过该时间没有被检测的直播间不再顺带查询
+        self.timeout = timeout
+        self.retry_after = retry_after  # 批量接口失败后暂停使用的秒数
+        self.requests = 0
+        self._status: dict[Hashable, tuple[Any, float]] = {}  # key -> (状态, 查询时间)
+        self._watched: dict[Hashable, tuple[float, OptionalStr]] = {}  # key -> (最近一次检测时间, 代理地址)
+        self._live: dict[Hashable, bool] = {}  # key -> 上一次检测是否在直播
+        self._in_flight: set = set()
+        self._disabled_until = 0.0
+        self._lock = threading.Lock()
+
+    @abstractmethod
+    async def fetch_batch(self, keys: list, proxy_addr: OptionalStr, headers: dict) -> dict | None:
+        """查询keys中所有直播间的状态，返回以key为键的结果，接口不可用时返回None"""
+
+    def _take_batch(self, key: Hashable, proxy_addr: OptionalStr, now: float) -> list | None:
+        """当前直播间需要查询时返回本次要一起查询的key，已有其他检测在查询时返回None"""
+        with self._lock:
+            if key in self._in_flight:
+                return None
+            batch = [key]
+            candidates = []
+            for other, (last_seen, other_proxy) in self._watched.items():
+                if (other == key or other in self._in_flight or other_proxy != proxy_addr
+                        or now - last_seen > self.watch_ttl):
+                    continue
+                fetched = self._status.get(other, (None, 0.0))[1]
+                if now - fetched >= self.max_age / 2:
+                    candidates.append((fetched, other))
+            candidates.sort(key=lambda i: i[0])
+            batch.extend(other for _, other in candidates[:self.batch_size - 1])
+            self._in_flight.update(batch)
+            return batch
+
+    async def _fetch(self, batch: list, proxy_addr: OptionalStr, headers: dict) -> dict | None:
+        try:
+            self.requests += 1
+            results = await self.fetch_batch(batch, proxy_addr, headers)
+        except Exception:
+            results = None
+        finally:
+            with self._lock:
+                self._in_flight.difference_update(batch)
+        now = time.monotonic()
+        if not isinstance(results, dict):
+            self._disabled_until = now + self.retry_after
+            return None
+        with self._lock:
+            # 不在结果中的直播间同样缓存为None，等待中的检测不会再为它单独发出请求
+            for key in batch:
+                self._status[key] = (results.get(key), now)
+        return results
+
+    async def get(self, key: Hashable, proxy_addr: OptionalStr, headers: dict) -> Any:
+        """返回该直播间的批量查询结果，批量接口不可用时返回None"""
+        if time.monotonic() < self._disabled_until:
+            return None
+        deadline = time.monotonic() + self.timeout
+        while True:
+            now = time.monotonic()
+            with self._lock:
+                self._watched[key] = (now, proxy_addr)
+                cached = self._status.get(key)
+            if cached and now - cached[1] < self.max_age:
+                return cached[0]
+            batch = self._take_batch(key, proxy_addr, now)
+            if batch:
+                results = await self._fetch(batch, proxy_addr, headers)
+                return None if results is None else results.get(key)
+            # 其他直播间的检测正在查询该直播间，等待其结果
+            if now > deadline:
+                return None
+            await asyncio.sleep(0.05)
+
+    def went_live(self, key: Hashable, is_live: bool) -> bool:
+        """记录检测结果，返回是否由未开播变为开播"""
+        with self._lock:
+            was_live = self._live.get(key, False)
+            self._live[key] = is_live
+        return is_live and not was_live
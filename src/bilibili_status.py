@@ -0,0 +1,99 @@
+# -*- encoding: utf-8 -*-
+
+"""
+Function: Batched Bilibili live status lookup with cached room_id -> uid mapping and anchor metadata.
+"""
+import json
+import time
+import urllib.parse
+
+from .batch_status import BatchStatusCache
+from .http_clients.async_http import async_req
+
+OptionalStr = str | None
+
+
+class BilibiliStatusCache(BatchStatusCache):
+    """
+    B站直播间状态批量查询
+
+    直播间号到uid的映射按uid_ttl缓存，直播状态通过get_status_info_by_uids一次查询多个主播，
+    标题和主播名随状态一起返回。主播名只在缓存过期或由未开播变为开播时重新获取。
+    """
+
+    ROOM_INIT_API = 'https://api.live.bilibili.com/room/v1/Room/room_init?id={room_id}'
+    STATUS_API = 'https://api.live.bilibili.com/room/v1/Room/get_status_info_by_uids'
+    MASTER_INFO_API = 'https://api.live.bilibili.com/live_user/v1/Master/info?uid={uid}'
+
+    def __init__(self, uid_ttl: float = 86400.0, name_ttl: float = 3600.0, **kwargs):
+        super().__init__(**kwargs)
+        self.uid_ttl = uid_ttl
+        self.name_ttl = name_ttl
+        self._uids: dict[str, tuple[int, float]] = {}  # 直播间号 -> (uid, 过期时间)
+        self._names: dict[int, tuple[str, float]] = {}  # uid -> (主播名, 过期时间)
+
+    async def _get_json(self, url: str, proxy_addr: OptionalStr, headers: dict) -> dict | None:
+        json_str = await async_req(url, proxy_addr=proxy_addr, headers=headers)
+        try:
+            json_data = json.loads(json_str)
+        except (TypeError, ValueError):
+            return None
+        if not isinstance(json_data, dict) or json_data.get('code') != 0:
+            return None
+        return json_data.get('data')
+
+    async def room_init(self, room_id: str, proxy_addr: OptionalStr, headers: dict) -> dict | None:
+        data = await self._get_json(self.ROOM_INIT_API.format(room_id=room_id), proxy_addr, headers)
+        if data and data.get('uid'):
+            with self._lock:
+                self._uids[room_id] = (int(data['uid']), time.monotonic() + self.uid_ttl)
+        return data
+
+    async def get_uid(self, room_id: str, proxy_addr: OptionalStr, headers: dict) -> int | None:
+        cached = self._uids.get(room_id)
+        if cached and cached[1] > time.monotonic():
+            return cached[0]
+        data = await self.room_init(room_id, proxy_addr, headers)
+        return int(data['uid']) if data and data.get('uid') else None
+
+    async def fetch_batch(self, keys: list, proxy_addr: OptionalStr, headers: dict) -> dict | None:
+        query = urllib.parse.urlencode([('uids[]', uid) for uid in keys])
+        data = await self._get_json(f'{self.STATUS_API}?{query}', proxy_addr, headers)
+        if not isinstance(data, dict):
+            return None
+        results = {uid: data[str(uid)] for uid in keys if str(uid) in data}
+        expires = time.monotonic() + self.name_ttl
+        with self._lock:
+            for uid, info in results.items():
+                if info.get('uname'):
+                    self._names[uid] = (info['uname'], expires)
+        return results
+
+    async def get_status(self, room_id: str, proxy_addr: OptionalStr, headers: dict) -> dict | None:
+        """返回get_status_info_by_uids中该主播的信息，批量接口不可用时返回None"""
+        if time.monotonic() < self._disabled_until:
+            return None
+        uid = await self.get_uid(room_id, proxy_addr, headers)
+        if uid is None:
+            return None
+        return await self.get(uid, proxy_addr, headers)
+
+    def get_cached_name(self, uid: int) -> str | None:
+        cached = self._names.get(uid)
+        if cached and cached[1] > time.monotonic():
+            return cached[0]
+        return None
+
+    async def get_anchor_name(self, uid: int, proxy_addr: OptionalStr, headers: dict,
+                              refresh: bool = False) -> str:
+        name = None if refresh else self.get_cached_name(uid)
+        if name is None:
+            data = await self._get_json(self.MASTER_INFO_API.format(uid=uid), proxy_addr, headers)
+            name = data['info']['uname'] if data else ''
+            if name:
+                with self._lock:
+                    self._names[uid] = (name, time.monotonic() + self.name_ttl)
+        return name
+
+
+status_cache = BilibiliStatusCache()
@@ -0,0 +1,148 @@
+# -*- encoding: utf-8 -*-
+
+"""
+Function: Load config.ini once into an immutable snapshot and reload it only when the file changes.
+"""
+import configparser
+import os
+import shutil
+import tempfile
+import threading
+from dataclasses import dataclass, field
+from pathlib import Path
+from types import MappingProxyType
+from typing import Any, Mapping
+
+TRUE_VALUES = ("是", "true", "yes", "1")
+FALSE_VALUES = ("否", "false", "no", "0")
+
+
+def to_bool(value: Any, default: bool) -> bool:
+    """是/否(及true/false等)转换为布尔值，无法识别时返回default"""
+    value = str(value).strip().lower()
+    if value in TRUE_VALUES:
+        return True
+    if value in FALSE_VALUES:
+        return False
+    return default
+
+
+def to_int(value: Any, default: int) -> int:
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return default
+
+
+def to_float(value: Any, default: float) -> float:
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return default
+
+
+@dataclass(frozen=True)
+class ConfigSnapshot:
+    """config.ini某一时刻的只读快照"""
+    mtime_ns: int = 0
+    size: int = -1
+    sections: Mapping[str, Mapping[str, str]] = field(default_factory=lambda: MappingProxyType({}))
+
+    @staticmethod
+    def optionxform(option: str) -> str:
+        # 与RawConfigParser的默认行为保持一致，键名不区分大小写
+        return option.lower()
+
+    def get(self, section: str, option: str, default: Any = None) -> Any:
+        return self.sections.get(section, {}).get(self.optionxform(option), default)
+
+
+class ConfigLoader:
+    """
+    配置文件加载器
+
+    配置文件只在修改时间或大小发生变化时才重新解析；缺失的配置项会先记录下来，
+    调用flush()时一次性补全并以原子替换的方式写回文件。
+    """
+
+    def __init__(self, file_path: str | Path, encoding: str = 'utf-8-sig', sections: tuple = ()):
+        self.file_path = str(file_path)
+        self.encoding = encoding
+        self.required_sections = sections
+        self.snapshot = ConfigSnapshot()
+        self._missing: dict[tuple[str, str], str] = {}
+        self._lock = threading.Lock()
+
+    def _stat(self) -> tuple[int, int]:
+        try:
+            st = os.stat(self.file_path)
+            return st.st_mtime_ns, st.st_size
+        except FileNotFoundError:
+            return 0, -1
+
+    def _parse(self) -> configparser.RawConfigParser:
+        parser = configparser.RawConfigParser()
+        parser.read(self.file_path, encoding=self.encoding)
+        return parser
+
+    def reload(self) -> bool:
+        """文件有变化时重新解析，返回是否重新加载"""
+        mtime_ns, size = self._stat()
+        if (mtime_ns, size) == (self.snapshot.mtime_ns, self.snapshot.size):
+            return False
+        parser = self._parse()
+        sections = {name: MappingProxyType(dict(parser.items(name, raw=True))) for name in parser.sections()}
+        self.snapshot = ConfigSnapshot(mtime_ns, size, MappingProxyType(sections))
+        return True
+
+    def get(self, section: str, option: str, default: Any) -> Any:
+        if self.snapshot.size < 0:
+            self.reload()
+        value = self.snapshot.get(section, option)
+        if value is None:
+            with self._lock:
+                self._missing.setdefault((section, option), str(default))
+            return default
+        return value
+
+    def get_bool(self, section: str, option: str, default: bool) -> bool:
+        """布尔配置项，缺失时以是/否写回默认值"""
+        return to_bool(self.get(section, option, '是' if default else '否'), default)
+
+    def get_int(self, section: str, option: str, default: int) -> int:
+        return to_int(self.get(section, option, default), default)
+
+    def get_float(self, section: str, option: str, default: float) -> float:
+        return to_float(self.get(section, option, default), default)
+
+    def flush(self) -> None:
+        """将缺失的配置项和必需的配置节一次性写回配置文件"""
+        with self._lock:
+            missing, self._missing = self._missing, {}
+        sections = self.snapshot.sections
+        if not missing and all(i in sections for i in self.required_sections):
+            return
+
+        parser = self._parse()
+        for section in self.required_sections:
+            if not parser.has_section(section):
+                parser.add_section(section)
+        for (section, option), value in missing.items():
+            if not parser.has_section(section):
+                parser.add_section(section)
+            if not parser.has_option(section, option):
+                parser.set(section, option, value)
+
+        directory = os.path.dirname(os.path.abspath(self.file_path))
+        fd, tmp_path = tempfile.mkstemp(prefix='.config_', suffix='.tmp', dir=directory)
+        try:
+            with os.fdopen(fd, 'w', encoding=self.encoding) as f:
+                parser.write(f)
+            if os.path.exists(self.file_path):
+                shutil.copymode(self.file_path, tmp_path)
+            os.replace(tmp_path, self.file_path)
+        except Exception:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        self.reload()
@@ -0,0 +1,244 @@
+# -*- encoding: utf-8 -*-
+
+"""
+Function: Append-only raw danmu frame log and an offline batch decoder to XML/ASS/JSONL/SQLite.
+"""
+import argparse
+import json
+import os
+import sqlite3
+import struct
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
+from pathlib import Path
+from typing import BinaryIO, Iterator
+
+from .danmu_store import DanmuStore
+from .danmu_writer import DanmuAssWriter, DanmuXmlWriter
+from .douyin_protobuf import DanmuDecoder
+
+CAPTURE_SUFFIX = '.dmraw'
+MAGIC = b'DMRAW\x01'
+_HEADER = struct.Struct('<d')  # 文件对应的录制开始时间
+_RECORD = struct.Struct('<dI')  # 接收时间、帧长度
+_META_FLAG = 0x80000000  # 长度的最高位表示该记录是JSON格式的元数据(如连接中断)，不是弹幕帧
+FORMATS = ('xml', 'ass', 'jsonl', 'db')
+DEFAULT_FORMATS = ('xml', 'ass', 'jsonl')
+
+
+class CaptureFormatError(Exception):
+    """文件不是原始弹幕数据"""
+
+
+class DanmuFrameWriter:
+    """
+    原始弹幕帧写入
+
+    WebSocket收到的二进制消息不做任何解析，以(接收时间, 长度)为前缀追加写入文件，
+    文件头记录该文件对应的录制开始时间，解码时据此计算弹幕在视频中的位置。
+    连接中断等元数据以JSON记录写在相应的位置。
+    与DanmuXmlWriter相同，消息先缓存在内存中，满flush_count条或超过flush_interval秒时一次写入。
+    """
+
+    def __init__(self, file_path: str | Path, start_time: float, flush_interval: float = 1.0,
+                 flush_count: int = 100):
+        self.file_path = Path(file_path)
+        self.start_time = start_time
+        self.flush_interval = flush_interval
+        self.flush_count = max(1, flush_count)
+        self.count = 0
+        self._buffer: list[bytes] = []
+        self._last_flush = time.monotonic()
+        self._lock = threading.Lock()
+        self._file = open(self.file_path, 'ab', buffering=0)
+        if self._file.tell() == 0:
+            self._file.write(MAGIC + _HEADER.pack(start_time))
+
+    @property
+    def closed(self) -> bool:
+        return self._file.closed
+
+    def write_frame(self, timestamp: float, frame: bytes) -> None:
+        with self._lock:
+            if self._file.closed:
+                return
+            self._buffer.append(_RECORD.pack(timestamp, len(frame)))
+            self._buffer.append(frame)
+            self.count += 1
+            if len(self._buffer) >= self.flush_count * 2 or time.monotonic() - self._last_flush >= self.flush_interval:
+                self._flush()
+
+    def write_gap(self, second: float, timestamp: float, duration: float, attempts: int,
+                  resumed: bool = True) -> None:
+        """记录弹幕连接断开的时间段，参数与DanmuXmlWriter.write_gap相同"""
+        data = json.dumps({'type': 'gap', 'duration': duration, 'attempts': attempts, 'resumed': resumed}).encode()
+        with self._lock:
+            if self._file.closed:
+                return
+            self._buffer.append(_RECORD.pack(timestamp, len(data) | _META_FLAG))
+            self._buffer.append(data)
+            self._flush()
+
+    def flush_if_due(self) -> None:
+        with self._lock:
+            if self._buffer and time.monotonic() - self._last_flush >= self.flush_interval:
+                self._flush()
+
+    def flush(self) -> None:
+        with self._lock:
+            self._flush()
+
+    def _flush(self) -> None:
+        self._last_flush = time.monotonic()
+        if not self._buffer or self._file.closed:
+            return
+        data = b''.join(self._buffer)
+        self._buffer.clear()
+        self._file.write(data)
+
+    def close(self) -> None:
+        with self._lock:
+            if self._file.closed:
+                return
+            try:
+                self._flush()
+            finally:
+                self._file.close()
+
+
+def _read_header(f: BinaryIO) -> float:
+    header = f.read(len(MAGIC) + _HEADER.size)
+    if len(header) < len(MAGIC) + _HEADER.size or not header.startswith(MAGIC):
+        raise CaptureFormatError(f'not a danmu capture file: {getattr(f, "name", f)}')
+    return _HEADER.unpack_from(header, len(MAGIC))[0]
+
+
+def read_start_time(path: str | Path) -> float:
+    with open(path, 'rb') as f:
+        return _read_header(f)
+
+
+def iter_records(path: str | Path) -> Iterator[tuple[float, bytes | dict]]:
+    """按写入顺序返回(时间, 原始帧或元数据dict)，程序崩溃时写了一半的最后一条记录会被忽略"""
+    with open(path, 'rb') as f:
+        _read_header(f)
+        while True:
+            head = f.read(_RECORD.size)
+            if len(head) < _RECORD.size:
+                return
+            timestamp, size = _RECORD.unpack(head)
+            data = f.read(size & ~_META_FLAG)
+            if len(data) < size & ~_META_FLAG:
+                return
+            yield timestamp, json.loads(data) if size & _META_FLAG else data
+
+
+def iter_frames(path: str | Path) -> Iterator[tuple[float, bytes]]:
+    """按写入顺序返回(接收时间, 原始帧)"""
+    for timestamp, data in iter_records(path):
+        if isinstance(data, bytes):
+            yield timestamp, data
+
+
+def decode_capture(path: str | Path, formats: tuple[str, ...] = DEFAULT_FORMATS,
+                   output_dir: str | Path | None = None) -> dict[str, Path]:
+    """把一个原始弹幕文件解码为formats中的格式(db为danmu_store数据库)，输出文件与原文件同名，返回各格式的输出路径"""
+    path = Path(path)
+    output_dir = Path(output_dir) if output_dir else path.parent
+    start_time = read_start_time(path)
+    outputs = {fmt: output_dir / f'{path.stem}.{fmt}' for fmt in formats}
+    if 'db' in outputs and outputs['db'].exists():
+        # 数据库以追加方式打开，重复解码时先删除旧的输出
+        outputs['db'].unlink()
+    # xml和db同时记录连接中断的时间段，ass只包含弹幕
+    writers = []
+    if 'xml' in outputs:
+        writers.append(DanmuXmlWriter(outputs['xml'], flush_count=1000))
+    if 'db' in outputs:
+        writers.append(DanmuStore(outputs['db']))
+    ass_writer = DanmuAssWriter(outputs['ass']) if 'ass' in outputs else None
+    jsonl_file = open(outputs['jsonl'], 'w', encoding='utf-8') if 'jsonl' in outputs else None
+    decoder = DanmuDecoder()
+    try:
+        for timestamp, frame in iter_records(path):
+            # 与实时录制相同，同一帧中的弹幕使用接收时间
+            second = timestamp - start_time
+            if isinstance(frame, dict):
+                if frame.get('type') == 'gap':
+                    for writer in writers:
+                        writer.write_gap(max(0.0, second), timestamp, frame['duration'], frame['attempts'],
+                                         frame.get('resumed', True))
+                    if jsonl_file:
+                        jsonl_file.write(json.dumps({'time': round(second, 3), 'timestamp': timestamp, **frame}) + '\n')
+                continue
+            decoded = decoder.decode(frame)
+            if not decoded:
+                continue
+            for user, content, server_time in decoded.chats:
+                for writer in writers:
+                    writer.write(second, timestamp, user, content)
+                if ass_writer:
+                    ass_writer.write(second, timestamp, user, content)
+                if jsonl_file:
+                    jsonl_file.write(json.dumps({'time': round(second, 3), 'timestamp': timestamp,
+                                                 'server_time': server_time, 'user': user, 'content': content},
+                                                ensure_ascii=False) + '\n')
+    finally:
+        for writer in (*writers, ass_writer, jsonl_file):
+            if writer:
+                writer.close()
+    return outputs
+
+
+def _decode_file(path: str, formats: tuple[str, ...], output_dir: str | None) -> tuple[str, str | None]:
+    try:
+        decode_capture(path, formats, output_dir)
+        return path, None
+    except (OSError, sqlite3.Error, CaptureFormatError) as e:
+        return path, str(e)
+
+
+def find_captures(paths: list[str]) -> list[str]:
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            files.extend(sorted(str(p) for p in Path(path).rglob(f'*{CAPTURE_SUFFIX}')))
+        else:
+            files.append(path)
+    return files
+
+
+def decode_files(files: list[str], formats: tuple[str, ...] = DEFAULT_FORMATS, output_dir: str | None = None,
+                 workers: int = 0) -> dict[str, str | None]:
+    """在进程池中批量解码，返回每个文件的错误信息(成功时为None)"""
+    workers = workers or min(len(files), os.cpu_count() or 1)
+    if workers <= 1:
+        return dict(_decode_file(path, formats, output_dir) for path in files)
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        return dict(pool.map(_decode_file, files, repeat(formats), repeat(output_dir)))
+
+
+def main(argv: list[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(description='把原始弹幕数据(.dmraw)解码为XML/ASS/JSONL')
+    parser.add_argument('paths', nargs='+', help='.dmraw文件或包含这些文件的目录')
+    parser.add_argument('-f', '--formats', default=','.join(DEFAULT_FORMATS),
+                        help=f'输出格式，逗号分隔，可选{",".join(FORMATS)}')
+    parser.add_argument('-o', '--output-dir', help='输出目录，默认与原文件相同')
+    parser.add_argument('-j', '--workers', type=int, default=0, help='进程数，默认为CPU核数')
+    args = parser.parse_args(argv)
+    formats = tuple(fmt.strip().lower() for fmt in args.formats.split(',') if fmt.strip())
+    unknown = set(formats) - set(FORMATS)
+    if unknown:
+        parser.error(f'不支持的格式: {", ".join(sorted(unknown))}')
+    files = find_captures(args.paths)
+    start = time.perf_counter()
+    results = decode_files(files, formats, args.output_dir, args.workers)
+    for path, error in results.items():
+        print(f'{path}: {error or "完成"}')
+    print(f'共{len(files)}个文件，耗时{time.perf_counter() - start:.2f}秒')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,238 @@
+# -*- encoding: utf-8 -*-
+
+"""
+Function: Shared event loop that multiplexes every danmu WebSocket connection.
+"""
+import asyncio
+import base64
+import hashlib
+import os
+import ssl
+import threading
+from typing import Any, Callable, Coroutine, Protocol
+from urllib.parse import urlparse
+
+from .logger import logger
+
+OPCODE_CONTINUATION = 0x0
+OPCODE_TEXT = 0x1
+OPCODE_BINARY = 0x2
+OPCODE_CLOSE = 0x8
+OPCODE_PING = 0x9
+OPCODE_PONG = 0xa
+
+_WS_GUID = b'258EAFA5-E914-47DA-95CA-C5AB0DC85B11'
+
+
+class WebSocketError(Exception):
+    """握手失败或收到不符合协议的帧"""
+
+
+def _mask(data: bytes, key: bytes) -> bytes:
+    n = len(data)
+    if not n:
+        return data
+    mask = (key * (n // 4 + 1))[:n]
+    return (int.from_bytes(data, 'big') ^ int.from_bytes(mask, 'big')).to_bytes(n, 'big')
+
+
+class WebSocketConnection:
+    """
+    基于asyncio流的WebSocket客户端连接
+
+    只实现弹幕需要的部分：握手、收发二进制/文本帧、分片重组、自动回复ping和关闭帧。
+    """
+
+    def __init__(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self.reader = reader
+        self.writer = writer
+        self.closed = False
+
+    @classmethod
+    async def connect(cls, url: str, headers: dict | None = None, timeout: float = 15.0) -> 'WebSocketConnection':
+        parsed = urlparse(url)
+        secure = parsed.scheme == 'wss'
+        host = parsed.hostname
+        port = parsed.port or (443 if secure else 80)
+        reader, writer = await asyncio.wait_for(
+            asyncio.open_connection(host, port, ssl=ssl.create_default_context() if secure else None,
+                                    server_hostname=host if secure else None, limit=2 ** 20), timeout)
+        key = base64.b64encode(os.urandom(16))
+        path = parsed.path or '/'
+        if parsed.query:
+            path += '?' + parsed.query
+        request_headers = {
+            'Host': parsed.netloc,
+            'Upgrade': 'websocket',
+            'Connection': 'Upgrade',
+            'Sec-WebSocket-Key': key.decode(),
+            'Sec-WebSocket-Version': '13',
+            **(headers or {}),
+        }
+        request = f'GET {path} HTTP/1.1\r\n' + ''.join(f'{k}: {v}\r\n' for k, v in request_headers.items()) + '\r\n'
+        writer.write(request.encode())
+        try:
+            response = await asyncio.wait_for(reader.readuntil(b'\r\n\r\n'), timeout)
+        except asyncio.IncompleteReadError as e:
+            writer.close()
+            raise ConnectionResetError('connection closed during handshake') from e
+        except asyncio.LimitOverrunError as e:
+            writer.close()
+            raise WebSocketError(f'handshake failed: {e}') from e
+        status_line, *lines = response.decode('latin-1').split('\r\n')
+        response_headers = {k.strip().lower(): v.strip() for k, _, v in (line.partition(':') for line in lines if line)}
+        accept = base64.b64encode(hashlib.sha1(key + _WS_GUID).digest()).decode()
+        if status_line.split(' ')[1:2] != ['101'] or response_headers.get('sec-websocket-accept') != accept:
+            writer.close()
+            raise WebSocketError(f'handshake failed: {status_line}')
+        return cls(reader, writer)
+
+    def send(self, data: bytes | str, opcode: int = OPCODE_BINARY) -> None:
+        """写入发送缓冲区，不等待发送完成"""
+        if self.closed or self.writer.is_closing():
+            return
+        if isinstance(data, str):
+            data = data.encode()
+        n = len(data)
+        if n < 126:
+            header = bytes([0x80 | opcode, 0x80 | n])
+        elif n < 65536:
+            header = bytes([0x80 | opcode, 0x80 | 126]) + n.to_bytes(2, 'big')
+        else:
+            header = bytes([0x80 | opcode, 0x80 | 127]) + n.to_bytes(8, 'big')
+        key = os.urandom(4)
+        self.writer.write(header + key + _mask(data, key))
+
+    async def _read_frame(self) -> tuple[bool, int, bytes]:
+        head = await self.reader.readexactly(2)
+        fin, opcode = head[0] & 0x80, head[0] & 0x0f
+        n = head[1] & 0x7f
+        if n == 126:
+            n = int.from_bytes(await self.reader.readexactly(2), 'big')
+        elif n == 127:
+            n = int.from_bytes(await self.reader.readexactly(8), 'big')
+        key = await self.reader.readexactly(4) if head[1] & 0x80 else None
+        data = await self.reader.readexactly(n) if n else b''
+        if key:
+            data = _mask(data, key)
+        return bool(fin), opcode, data
+
+    async def recv(self) -> bytes | str | None:
+        """返回下一条完整的消息，连接关闭后返回None"""
+        fragments = []
+        message_opcode = None
+        while not self.closed:
+            try:
+                fin, opcode, data = await self._read_frame()
+            except (asyncio.IncompleteReadError, ConnectionError, OSError):
+                self.abort()
+                return None
+            if opcode == OPCODE_PING:
+                self.send(data, OPCODE_PONG)
+                continue
+            if opcode == OPCODE_PONG:
+                continue
+            if opcode == OPCODE_CLOSE:
+                self.send(data[:2], OPCODE_CLOSE)
+                self.abort()
+                return None
+            if opcode != OPCODE_CONTINUATION:
+                message_opcode = opcode
+                fragments = []
+            fragments.append(data)
+            if fin:
+                message = b''.join(fragments)
+                return message.decode('utf-8', 'replace') if message_opcode == OPCODE_TEXT else message
+        return None
+
+    async def close(self) -> None:
+        if self.closed:
+            return
+        self.send((1000).to_bytes(2, 'big'), OPCODE_CLOSE)
+        try:
+            await asyncio.wait_for(self.writer.drain(), 5)
+        except (asyncio.TimeoutError, ConnectionError, OSError):
+            pass
+        self.abort()
+
+    def abort(self) -> None:
+        self.closed = True
+        self.writer.close()
+
+
+class HubClient(Protocol):
+    """注册到DanmuHub的弹幕录制器需要提供的接口"""
+
+    def on_heartbeat(self) -> None: ...
+
+    def on_tick(self) -> None: ...
+
+
+class DanmuHub:
+    """
+    弹幕连接中心
+
+    所有直播间的弹幕连接运行在同一个线程的事件循环中，每个直播间只占用一个套接字、一个接收任务和录制器本身的状态。
+    心跳和按时间写入缓存由一个共享的定时器统一处理：每秒调用一次所有录制器的on_tick，
+    每heartbeat_interval秒调用一次on_heartbeat。分段切换等定时操作通过call_later安排在同一个事件循环中。
+    """
+
+    def __init__(self, heartbeat_interval: int = 10):
+        self.heartbeat_interval = heartbeat_interval
+        self.loop = asyncio.new_event_loop()
+        self.clients: set[HubClient] = set()
+        self._ticks = 0
+        self._thread = threading.Thread(target=self._run, name='danmu-hub', daemon=True)
+        self._ready = threading.Event()
+        self._start_lock = threading.Lock()
+
+    def start(self) -> None:
+        with self._start_lock:
+            if not self._thread.is_alive():
+                self._thread.start()
+                self._ready.wait()
+
+    def _run(self) -> None:
+        asyncio.set_event_loop(self.loop)
+        self.loop.call_soon(self._ready.set)
+        self.loop.call_later(1, self._tick)
+        self.loop.run_forever()
+
+    def _tick(self) -> None:
+        self.loop.call_later(1, self._tick)
+        self._ticks += 1
+        heartbeat = self._ticks % self.heartbeat_interval == 0
+        for client in list(self.clients):
+            try:
+                if heartbeat:
+                    client.on_heartbeat()
+                client.on_tick()
+            except Exception as e:
+                logger.debug(f'弹幕定时任务出错: {e}')
+
+    def set_heartbeat_interval(self, seconds: int) -> None:
+        """设置心跳间隔(秒)，最小为1秒，下一次定时器触发时生效"""
+        self.heartbeat_interval = max(1, int(seconds))
+
+    def register(self, client: HubClient) -> None:
+        """在事件循环线程中调用，开始为client发送心跳"""
+        self.clients.add(client)
+
+    def unregister(self, client: HubClient) -> None:
+        self.clients.discard(client)
+
+    def submit(self, coro: Coroutine) -> Any:
+        """从其他线程向事件循环提交协程，返回concurrent.futures.Future"""
+        self.start()
+        return asyncio.run_coroutine_threadsafe(coro, self.loop)
+
+    def call_soon(self, callback: Callable, *args) -> None:
+        """从其他线程在事件循环中调用callback"""
+        self.start()
+        self.loop.call_soon_threadsafe(callback, *args)
+
+    def __len__(self) -> int:
+        return len(self.clients)
+
+
+hub = DanmuHub()
@@ -6,11 +6,10 @@ Date: 2025-08-23
 Function: 抖音直播弹幕录制模块
 """
 
-import _thread
+import asyncio
 import gzip
 import hashlib
 import json
-import os
 import random
 import time
 import traceback
@@ -20,20 +19,41 @@ from typing import Optional, Dict, Any
 from pathlib import Path
 
 import requests
-import websocket
-import jsengine
 from google.protobuf import json_format
 
+from . import js_signer
+from .danmu_capture import CAPTURE_SUFFIX, DanmuFrameWriter
+from .danmu_store import STORE_SUFFIX, DanmuStore
+from .danmu_hub import hub, WebSocketConnection, WebSocketError
+from .danmu_writer import DanmuXmlWriter
 from .utils import logger
 from .http_clients.async_http import async_req
-from .douyin_protobuf import parse_danmu_message, create_ack_frame, create_heartbeat_frame
+from .douyin_protobuf import DanmuDecoder, create_ack_frame, create_heartbeat_frame
+
+
+# 签名后的WebSocket地址在这段时间内重连时直接复用，超过后重新签名
+WS_URL_TTL = 600
+RECONNECT_BASE_DELAY = 1.0
+RECONNECT_MAX_DELAY = 60.0
 
 
 class DouyinDanmuRecorder:
-    """抖音弹幕录制器"""
+    """
+    抖音弹幕录制器
+
+    start需要在DanmuHub的事件循环中运行，连接建立后由DanmuHub统一发送心跳和定时写入弹幕缓存，
+    分段切换通过事件循环的call_later安排，不再为每个直播间创建线程。
+    file_format为xml时写入XML弹幕文件，为sqlite时写入按时间建立索引的数据库(danmu_store)，
+    为raw时不解析弹幕，把收到的原始帧写入.dmraw文件，之后用danmu_capture离线解码。
+    连接断开后按指数退避加随机抖动重连，连续失败max_retry次后放弃；重连时复用未过期的签名地址，
+    并带上最后收到的cursor和internal_ext从断开的位置继续，每次中断的时间段写入弹幕文件。
+    """
+    
+    FILE_SUFFIXES = {'xml': '.xml', 'sqlite': STORE_SUFFIX, 'raw': CAPTURE_SUFFIX}
     
     def __init__(self, room_id: str, room_name: str, output_dir: str, 
-                 video_filename: str = None, cookies: str = None):
+                 video_filename: str = None, cookies: str = None, file_format: str = 'xml',
+                 max_retry: int = 3):
         """
         初始化弹幕录制器
         
@@ -43,6 +63,8 @@ class DouyinDanmuRecorder:
             output_dir: 输出目录
             video_filename: 视频文件名（用于保持一致性）
             cookies: Cookie字符串
+            file_format: 弹幕文件格式(xml/sqlite/raw)
+            max_retry: 连续重连失败的最大次数
         """
         self.room_id = room_id
         self.room_name = room_name
@@ -53,18 +75,36 @@ class DouyinDanmuRecorder:
         
         self.start_time = None
         self.start_time_t = None
-        self.ws = None
+        self.ws: WebSocketConnection | None = None
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self._connected_at = 0.0
+        self._stop_event: asyncio.Event | None = None
         self.stop_signal = False
         self.danmu_amount = 0
         self.last_danmu_time = 0
         self.filename = None
         self.retry = 0
-        self.max_retry = 3
+        self.max_retry = max_retry
+        self.cursor = ''  # 最后收到的cursor和internal_ext，重连时从这里继续
+        self.internal_ext = ''
+        self.reconnects = 0
+        self.gaps: list[dict] = []  # 每次连接中断的开始时间、时长和重连次数
+        if file_format not in self.FILE_SUFFIXES:
+            logger.warning(f'不支持的弹幕文件格式: {file_format}，使用xml格式')
+            file_format = 'xml'
+        self.file_format = file_format
+        self.raw_capture = file_format == 'raw'
+        self.file_suffix = self.FILE_SUFFIXES[file_format]
+        # 只保存原始帧时不解析任何消息，只读取发送ACK需要的字段
+        self.decoder = DanmuDecoder(methods=()) if self.raw_capture else DanmuDecoder()
         
         # 分段相关
         self.segment_index = 0
         self.segment_start_time = None
         self.current_segment_file = None
+        self.segment_time = None
+        self._segment_timer: asyncio.TimerHandle | None = None
+        self.writer = None  # 当前弹幕文件的追加写入器
         
         # 线程锁
         self.file_lock = threading.Lock()
@@ -173,34 +213,16 @@ class DouyinDanmuRecorder:
         ))
         return new_url
     
-    def get_danmu_ws_url(self, live_room_real_id: str) -> str:
+    async def get_danmu_ws_url(self, live_room_real_id: str) -> str:
         """获取弹幕WebSocket URL - 使用原项目的完整实现"""
         user_unique_id = random.randint(7300000000000000000, 7999999999999999999)
         
-        # 使用原项目的JS引擎生成签名
+        # 使用进程内常驻的webmssdk签名上下文生成签名，脚本只在启动时加载一次；
+        # 签名在线程中进行，冷启动或较慢的签名不会阻塞共享事件循环上的其他弹幕连接
         try:
-            # 读取JS文件
-            js_file_path = os.path.join(os.path.dirname(__file__), 'javascript', 'webmssdk.js')
-            with open(js_file_path, 'r', encoding='utf-8') as f:
-                js_enc = f.read()
-            
             ua = self.get_random_ua()
-            
-            ctx = jsengine.jsengine()
-            js_dom = f"""
-document = {{}}
-window = {{}}
-navigator = {{
-  'userAgent': '{ua}'
-}}
-""".strip()
-            final_js = js_dom + js_enc
-            ctx.eval(final_js)
-            
-            # 生成签名参数
             ms_stub = self.get_ms_stub(live_room_real_id, user_unique_id)
-            function_caller = f"get_sign('{ms_stub}')"
-            signature = ctx.eval(function_caller)
+            signature = await js_signer.sign_async('webmssdk', ms_stub, ua, func='get_sign_with_ua')
             
             webcast5_params = {
                 "room_id": live_room_real_id,
@@ -265,7 +287,7 @@ navigator = {{
             # 直接使用视频文件名作为基础，替换扩展名为.xml
             # 这样可以确保弹幕文件名与视频文件名完全一致（除了扩展名）
             base_name = Path(self.video_filename).stem
-            return f"{base_name}.xml"
+            return f"{base_name}{self.file_suffix}"
         else:
             # 等待视频文件名设置，暂时返回None
             logger.warning('视频文件名尚未设置，弹幕文件将在视频开始录制后创建')
@@ -285,7 +307,7 @@ navigator = {{
                 # 否则直接添加分段索引
                 base_name = f"{base_name}_{segment_index:03d}"
             
-            return f"{base_name}.xml"
+            return f"{base_name}{self.file_suffix}"
         else:
             logger.warning('视频文件名尚未设置，无法生成分段弹幕文件名')
             return None
@@ -298,19 +320,30 @@ navigator = {{
         # 这样可以避免生成空的弹幕文件
     
     def create_danmu_file(self, filename: str) -> None:
-        """创建弹幕文件并写入完整的XML模板"""
+        """创建弹幕文件，XML文件写入完整的模板，之后的弹幕追加写入到结束标签前"""
         filepath = self.output_dir / filename
-        with open(filepath, 'w', encoding='UTF-8') as file:
-            file.write("<?xml version=\"1.0\" encoding=\"utf-8\"?>\n"
-                      "<?xml-stylesheet type=\"text/xsl\" href=\"#s\"?>\n"
-                      "<i>\n"
-                      "</i>\n")  # 立即写入结束标签，确保XML格式完整
+        with self.file_lock:
+            if self.writer:
+                self.writer.close()
+            if self.raw_capture:
+                # 记录文件对应的开始时间，离线解码时计算弹幕在视频中的位置
+                base_time = self.segment_start_time if self.current_segment_file else self.start_time_t
+                self.writer = DanmuFrameWriter(filepath, start_time=base_time)
+            elif self.file_format == 'sqlite':
+                self.writer = DanmuStore(filepath)
+            else:
+                # 写入器创建时立即写入结束标签，确保XML格式完整
+                self.writer = DanmuXmlWriter(filepath)
         logger.info(f'创建弹幕文件: {filepath}')
     
     def close_danmu_file(self, filename: str) -> None:
-        """关闭弹幕文件（XML文件已经完整，无需额外操作）"""
+        """关闭弹幕文件，写入缓存中剩余的弹幕"""
         if filename:
             filepath = self.output_dir / filename
+            with self.file_lock:
+                if self.writer and self.writer.file_path == filepath:
+                    self.writer.close()
+                    self.writer = None
             if filepath.exists():
                 logger.info(f'弹幕文件已完成: {filepath}')
     
@@ -327,49 +360,64 @@ navigator = {{
         filename = self.generate_segment_filename(self.segment_index)
         if filename:
             self.current_segment_file = filename
-            self.create_danmu_file(self.current_segment_file)
             self.segment_start_time = time.time()
+            self.create_danmu_file(self.current_segment_file)
+            self._schedule_segment()
             logger.info(f'开始新的弹幕分段: {self.current_segment_file} (分段索引: {self.segment_index})')
         else:
             logger.warning(f'无法创建分段文件，视频文件名尚未设置')
             self.current_segment_file = None
+
+    def _schedule_segment(self) -> None:
+        """在当前分段到达分段时间时切换到新的分段"""
+        if self._segment_timer:
+            self._segment_timer.cancel()
+        if self._loop and self.segment_time:
+            self._segment_timer = self._loop.call_later(self.segment_time, self.start_new_segment)
+    
+    def _prepare_file(self, timestamp: float) -> bool:
+        """按需切换分段或创建第一个弹幕文件，视频文件名尚未设置时返回False"""
+        # 检查是否需要创建新的分段（基于时间）
+        if (hasattr(self, 'segment_index') and self.segment_index is not None and
+            hasattr(self, 'segment_time') and self.segment_time and
+            self.segment_start_time and
+            (timestamp - self.segment_start_time) >= self.segment_time):
+            # 需要创建新的分段
+            logger.info(f'分段时间到达，创建新的弹幕分段 (当前分段时长: {timestamp - self.segment_start_time:.1f}秒)')
+            self.start_new_segment()
+        
+        # 如果文件还没创建，先创建文件
+        if not self.filename and not self.current_segment_file:
+            # 检查是否是分段模式
+            if hasattr(self, 'segment_index') and self.segment_index is not None:
+                # 分段模式，创建第一个分段文件
+                filename = self.generate_segment_filename(self.segment_index)
+                if filename:
+                    self.current_segment_file = filename
+                    self.segment_start_time = time.time()
+                    self.create_danmu_file(self.current_segment_file)
+                    self._schedule_segment()
+                    logger.info(f'创建弹幕分段文件: {self.current_segment_file} (分段索引: {self.segment_index})')
+                else:
+                    logger.warning('无法创建弹幕分段文件，视频文件名尚未设置')
+                    return False
+            else:
+                # 普通模式
+                filename = self.generate_filename()
+                if filename:
+                    self.filename = filename
+                    self.create_danmu_file(self.filename)
+                    logger.info(f'创建弹幕文件: {self.filename}')
+                else:
+                    logger.warning('无法创建弹幕文件，视频文件名尚未设置')
+                    return False
+        return True
     
     def write_danmu(self, user: str, content: str, timestamp: float) -> None:
-        """写入弹幕到文件 - 插入到XML结束标签前"""
+        """写入弹幕到文件 - 追加到XML结束标签前"""
         try:
-            # 检查是否需要创建新的分段（基于时间）
-            if (hasattr(self, 'segment_index') and self.segment_index is not None and
-                hasattr(self, 'segment_time') and self.segment_time and
-                self.segment_start_time and
-                (timestamp - self.segment_start_time) >= self.segment_time):
-                # 需要创建新的分段
-                logger.info(f'分段时间到达，创建新的弹幕分段 (当前分段时长: {timestamp - self.segment_start_time:.1f}秒)')
-                self.start_new_segment()
-            
-            # 如果文件还没创建，先创建文件
-            if not self.filename and not self.current_segment_file:
-                # 检查是否是分段模式
-                if hasattr(self, 'segment_index') and self.segment_index is not None:
-                    # 分段模式，创建第一个分段文件
-                    filename = self.generate_segment_filename(self.segment_index)
-                    if filename:
-                        self.current_segment_file = filename
-                        self.create_danmu_file(self.current_segment_file)
-                        self.segment_start_time = time.time()
-                        logger.info(f'创建弹幕分段文件: {self.current_segment_file} (分段索引: {self.segment_index})')
-                    else:
-                        logger.warning('无法创建弹幕分段文件，视频文件名尚未设置')
-                        return
-                else:
-                    # 普通模式
-                    filename = self.generate_filename()
-                    if filename:
-                        self.filename = filename
-                        self.create_danmu_file(self.filename)
-                        logger.info(f'创建弹幕文件: {self.filename}')
-                    else:
-                        logger.warning('无法创建弹幕文件，视频文件名尚未设置')
-                        return
+            if not self._prepare_file(timestamp):
+                return
             
             with self.file_lock:
                 # 计算弹幕时间戳
@@ -380,35 +428,11 @@ navigator = {{
                     # 普通模式：使用录制开始时间作为基准
                     second = timestamp - self.start_time_t
                 
-                if self.current_segment_file:
-                    # 分段模式
-                    filepath = self.output_dir / self.current_segment_file
-                elif self.filename:
-                    # 普通模式
-                    filepath = self.output_dir / self.filename
-                else:
+                if not self.writer:
                     logger.warning('无弹幕文件可写入')
                     return
                 
-                # 读取现有内容
-                if filepath.exists():
-                    with open(filepath, 'r', encoding='UTF-8') as file:
-                        content_lines = file.readlines()
-                    
-                    # 找到 </i> 标签的位置，在其前面插入弹幕
-                    danmu_line = f"  <d p=\"{round(second, 2)},1,25,16777215,{int(timestamp * 1000)},0,1602022773,0\" user=\"{user}\">{content}</d>\n"
-                    
-                    # 在最后一行（</i>）前插入弹幕
-                    if content_lines and content_lines[-1].strip() == '</i>':
-                        content_lines.insert(-1, danmu_line)
-                    else:
-                        # 如果没有找到结束标签，追加弹幕和结束标签
-                        content_lines.append(danmu_line)
-                        content_lines.append('</i>\n')
-                    
-                    # 写回文件
-                    with open(filepath, 'w', encoding='UTF-8') as file:
-                        file.writelines(content_lines)
+                self.writer.write(second, timestamp, user, content)
                 
                 self.danmu_amount += 1
                 self.last_danmu_time = timestamp
@@ -416,6 +440,19 @@ navigator = {{
         except Exception as e:
             logger.error(f'写入弹幕失败: {e}')
     
+    def write_frame(self, frame: bytes, timestamp: float) -> None:
+        """原样写入WebSocket收到的二进制消息"""
+        try:
+            if not self._prepare_file(timestamp):
+                return
+            with self.file_lock:
+                if not self.writer:
+                    return
+                self.writer.write_frame(timestamp, frame)
+                self.danmu_amount += 1
+        except Exception as e:
+            logger.error(f'写入原始弹幕失败: {e}')
+    
     async def start(self, enable_segment: bool = False, segment_time: int = 1800) -> None:
         """开始录制弹幕"""
         logger.info(f'开始录制 {self.room_name}({self.room_id}) 的弹幕')
@@ -452,87 +489,153 @@ navigator = {{
             self.segment_time = None
             logger.info('弹幕录制已启动，将在第一条弹幕到达时创建文件')
         
-        # 创建WebSocket连接
+        # 创建WebSocket连接，断开后重连
+        self._loop = asyncio.get_running_loop()
+        self._stop_event = asyncio.Event()
+        ws_url, signed_at = None, 0.0
+        gap_start = None
         try:
-            ws_url = self.get_danmu_ws_url(self.room_real_id)
-            logger.info('连接弹幕服务器...')
-            
-            self.ws = websocket.WebSocketApp(
-                url=ws_url,
-                header=self.get_request_headers(),
-                on_message=self._on_message,
-                on_error=self._on_error,
-                on_close=self._on_close,
-                on_open=self._on_open,
-            )
-            
-            # 在单独线程中运行WebSocket
-            def run_websocket():
-                self.ws.run_forever()
-            
-            ws_thread = threading.Thread(target=run_websocket, daemon=True)
-            ws_thread.start()
-            
-            # 如果启用分段，启动分段检查线程
-            if enable_segment:
-                def segment_checker():
-                    while not self.stop_signal:
-                        time.sleep(1)
-                        if (self.segment_start_time and
-                            time.time() - self.segment_start_time >= segment_time):
-                            self.start_new_segment()
+            while not self.stop_signal:
+                if ws_url is None or time.time() - signed_at > WS_URL_TTL:
+                    ws_url, signed_at = await self.get_danmu_ws_url(self.room_real_id), time.time()
+                received = False
+                try:
+                    logger.info('连接弹幕服务器...')
+                    self.ws = await WebSocketConnection.connect(self.resume_url(ws_url), self.get_request_headers())
+                except (OSError, asyncio.TimeoutError, WebSocketError) as e:
+                    logger.error(f'连接失败: {e}')
+                    if isinstance(e, WebSocketError):
+                        # 握手被拒绝时签名可能已经失效，下次重新签名
+                        ws_url = None
+                else:
+                    if gap_start is not None:
+                        self._record_gap(gap_start, time.time())
+                        gap_start = None
+                    received = await self._receive()
+                    if self.stop_signal:
+                        break
+                    logger.warning('弹幕连接已断开')
                 
-                segment_thread = threading.Thread(target=segment_checker, daemon=True)
-                segment_thread.start()
-            
-            return ws_thread
-            
+                if gap_start is None:
+                    gap_start = time.time()
+                if received:
+                    # 收到过数据说明连接是正常的，重新开始计算连续失败的次数
+                    self.retry = 0
+                if self.retry >= self.max_retry:
+                    logger.error(f'弹幕服务器连续{self.retry}次重连失败，停止录制弹幕')
+                    self._record_gap(gap_start, time.time(), resumed=False)
+                    break
+                self.retry += 1
+                delay = self.backoff_delay(self.retry)
+                logger.info(f'{delay:.1f}秒后尝试重连弹幕服务器 ({self.retry}/{self.max_retry})...')
+                try:
+                    await asyncio.wait_for(self._stop_event.wait(), delay)
+                except asyncio.TimeoutError:
+                    pass
+        finally:
+            self._on_close()
+    
+    async def _receive(self) -> bool:
+        """接收到连接断开或停止录制，返回是否收到过消息"""
+        self._on_open()
+        received = False
+        try:
+            # 连接建立期间已经调用stop时不再接收弹幕
+            while not self.stop_signal:
+                message = await self.ws.recv()
+                if message is None:
+                    break
+                if isinstance(message, bytes):
+                    received = True
+                    self._on_message(message)
+        finally:
+            self.ws.abort()
+            hub.unregister(self)
+            # 连接断开时先写入缓存中的弹幕
+            with self.file_lock:
+                if self.writer:
+                    self.writer.flush()
+        return received
+    
+    @staticmethod
+    def backoff_delay(attempt: int) -> float:
+        """第attempt次重连前等待的秒数，指数增长到上限，并在后一半范围内随机抖动，避免多个直播间同时重连"""
+        delay = min(RECONNECT_MAX_DELAY, RECONNECT_BASE_DELAY * 2 ** (attempt - 1))
+        return delay / 2 + random.uniform(0, delay / 2)
+    
+    def resume_url(self, url: str) -> str:
+        """带上最后收到的cursor和internal_ext，让服务器从断开的位置继续推送"""
+        if not self.cursor and not self.internal_ext:
+            return url
+        parsed_url = urlparse(url)
+        params = parse_qs(parsed_url.query, keep_blank_values=True)
+        if self.cursor:
+            params['cursor'] = [self.cursor]
+        if self.internal_ext:
+            params['internal_ext'] = [self.internal_ext]
+        return urlunparse(parsed_url._replace(query=urlencode(params, doseq=True)))
+    
+    def _record_gap(self, start: float, end: float, resumed: bool = True) -> None:
+        """把一次连接中断写入弹幕文件"""
+        duration = end - start
+        self.gaps.append({'start': start, 'duration': duration, 'attempts': self.retry, 'resumed': resumed})
+        if resumed:
+            self.reconnects += 1
+            logger.info(f'弹幕连接已恢复，中断{duration:.1f}秒，重连{self.retry}次')
+        try:
+            if not self._prepare_file(end):
+                return
+            with self.file_lock:
+                if self.writer:
+                    base_time = self.segment_start_time if self.current_segment_file else self.start_time_t
+                    self.writer.write_gap(max(0.0, start - base_time), start, duration, self.retry, resumed)
         except Exception as e:
-            logger.error(f'连接失败: {e}')
-            return None
+            logger.error(f'写入弹幕中断信息失败: {e}')
     
     def stop(self) -> None:
-        """停止录制"""
+        """停止录制，可以在任意线程中调用"""
         logger.info('停止弹幕录制...')
         self.stop_signal = True
-        if self.ws:
-            self.ws.close()
+        if self._loop:
+            if self._stop_event:
+                self._loop.call_soon_threadsafe(self._stop_event.set)
+            if self.ws:
+                asyncio.run_coroutine_threadsafe(self.ws.close(), self._loop)
         
         # 注意：文件关闭将在 _on_close 方法中处理，避免重复关闭
     
-    def _on_open(self, ws) -> None:
+    def _on_open(self) -> None:
         """WebSocket连接打开"""
         logger.info('弹幕连接已建立，开始接收弹幕...')
-        _thread.start_new_thread(self._heartbeat, (ws,))
+        self._connected_at = time.time()
+        hub.register(self)
     
-    def _on_message(self, ws, message) -> None:
+    def _on_message(self, message: bytes) -> None:
         """处理弹幕消息"""
         try:
             now = time.time()
             
-            # 解析弹幕消息
-            parsed_data = parse_danmu_message(message)
+            if self.raw_capture:
+                self.write_frame(message, now)
+            
+            # 解析帧中的所有弹幕，只保存原始帧时不会解析任何消息
+            frame = self.decoder.decode(message)
             
-            if parsed_data:
-                # 如果是弹幕消息
-                if 'user' in parsed_data and 'content' in parsed_data:
-                    user = parsed_data['user']['nickName']
-                    content = parsed_data['content']
-                    
-                    # 写入弹幕到文件
+            if frame:
+                # 同一帧中的弹幕按接收时间写入，与视频的时间轴保持一致
+                for user, content, _ in frame.chats:
                     self.write_danmu(user, content, now)
-                    self.last_danmu_time = now
-                    
                     logger.debug(f'[{time.strftime("%H:%M:%S")}] {user}: {content}')
                 
+                if frame.cursor:
+                    self.cursor = frame.cursor
+                if frame.internal_ext:
+                    self.internal_ext = frame.internal_ext
+                
                 # 如果需要发送ACK
-                elif 'needAck' in parsed_data and parsed_data['needAck']:
+                if frame.need_ack:
                     try:
-                        ack_data = create_ack_frame(
-                            parsed_data.get('logid', 0),
-                            parsed_data.get('internalExt', '')
-                        )
-                        ws.send(ack_data, websocket.ABNF.OPCODE_BINARY)
+                        self.ws.send(create_ack_frame(frame.logid, frame.internal_ext))
                     except Exception as e:
                         logger.debug(f'发送ACK失败: {e}')
             
@@ -543,53 +646,43 @@ navigator = {{
         except Exception as e:
             logger.error(f'处理弹幕消息失败: {e}')
     
-    def _on_error(self, ws, error) -> None:
-        """WebSocket错误处理"""
-        logger.error(f'弹幕连接错误: {error}')
-    
-    def _on_close(self, ws, close_status_code, close_msg) -> None:
-        """WebSocket连接关闭"""
+    def _on_close(self) -> None:
+        """停止录制或放弃重连后关闭弹幕文件"""
         logger.info('弹幕连接已关闭')
+        hub.unregister(self)
+        if self._segment_timer:
+            self._segment_timer.cancel()
+            self._segment_timer = None
         
-        # 如果是正常停止，关闭文件
-        if self.stop_signal:
-            if self.current_segment_file:
-                self.close_danmu_file(self.current_segment_file)
-            elif self.filename:
-                self.close_danmu_file(self.filename)
-            logger.info(f'弹幕录制结束，共录制 {self.danmu_amount} 条弹幕')
+        if self.current_segment_file:
+            self.close_danmu_file(self.current_segment_file)
+        elif self.filename:
+            self.close_danmu_file(self.filename)
+        logger.info(f'弹幕录制结束，共录制 {self.danmu_amount} 条弹幕，重连 {self.reconnects} 次')
+    
+    def on_heartbeat(self) -> None:
+        """由DanmuHub的共享定时器调用，发送心跳包"""
+        try:
+            self.ws.send(create_heartbeat_frame())
+        except Exception as e:
+            logger.debug(f'发送心跳包失败: {e}')
+            # 心跳包发送失败不中断连接
         
-        # 重连逻辑
-        elif self.retry < self.max_retry:
-            self.retry += 1
-            logger.info(f'尝试重连弹幕服务器 ({self.retry}/{self.max_retry})...')
-            time.sleep(2)
-            # 这里可以添加重连逻辑
+        # 检查是否长时间没有弹幕
+        now = time.time()
+        if now - self._connected_at > 30 and now - self.last_danmu_time > 60:
+            logger.warning('长时间无弹幕，检查主播是否下播...')
     
-    def _heartbeat(self, ws) -> None:
-        """心跳包"""
-        t = 9
-        while not self.stop_signal and ws.keep_running:
-            if t % 10 == 0:
-                # 发送心跳包
-                try:
-                    heartbeat_data = create_heartbeat_frame()
-                    ws.send(heartbeat_data, websocket.ABNF.OPCODE_BINARY)
-                except Exception as e:
-                    logger.debug(f'发送心跳包失败: {e}')
-                    # 心跳包发送失败不中断连接
-                    
-                # 检查是否长时间没有弹幕
-                now = time.time()
-                if t > 30 and now - self.last_danmu_time > 60:
-                    logger.warning('长时间无弹幕，检查主播是否下播...')
-                    
-            t += 1
-            time.sleep(1)
+    def on_tick(self) -> None:
+        """由DanmuHub每秒调用，弹幕较少时也按时间把缓存写入文件"""
+        with self.file_lock:
+            if self.writer:
+                self.writer.flush_if_due()
 
 
 def create_douyin_danmu_recorder(room_id: str, room_name: str, output_dir: str,
-                                video_filename: str = None, cookies: str = None) -> DouyinDanmuRecorder:
+                                video_filename: str = None, cookies: str = None,
+                                file_format: str = 'xml', max_retry: int = 3) -> DouyinDanmuRecorder:
     """
     创建抖音弹幕录制器的工厂函数
     
@@ -599,8 +692,10 @@ def create_douyin_danmu_recorder(room_id: str, room_name: str, output_dir: str,
         output_dir: 输出目录
         video_filename: 视频文件名（用于保持一致性）
         cookies: Cookie字符串
+        file_format: 弹幕文件格式(xml/sqlite/raw)
+        max_retry: 连续重连失败的最大次数
         
     Returns:
         DouyinDanmuRecorder: 弹幕录制器实例
     """
-    return DouyinDanmuRecorder(room_id, room_name, output_dir, video_filename, cookies)
\ No newline at end of file
+    return DouyinDanmuRecorder(room_id, room_name, output_dir, video_filename, cookies, file_format, max_retry)
\ No newline at end of file
@@ -0,0 +1,251 @@
+# -*- encoding: utf-8 -*-
+
+"""
+Function: Indexed SQLite danmu store per recording with time-range queries and XML/ASS export.
+"""
+import argparse
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+import xml.etree.ElementTree as ET
+from pathlib import Path
+from typing import NamedTuple
+
+from .danmu_writer import DanmuAssWriter, DanmuXmlWriter, format_danmu_line
+
+STORE_SUFFIX = '.db'
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS danmu (
+    time_ms INTEGER NOT NULL,   -- 相对文件开始的毫秒数
+    timestamp_ms INTEGER NOT NULL,
+    user TEXT NOT NULL,
+    content TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS danmu_time ON danmu (time_ms);
+CREATE TABLE IF NOT EXISTS gap (
+    time_ms INTEGER NOT NULL,
+    timestamp_ms INTEGER NOT NULL,
+    duration REAL NOT NULL,
+    attempts INTEGER NOT NULL,
+    resumed INTEGER NOT NULL
+);
+"""
+
+
+class Danmu(NamedTuple):
+    second: float
+    timestamp: float
+    user: str
+    content: str
+
+
+class DanmuStore:
+    """
+    单个录制(或分段)的弹幕数据库
+
+    弹幕按相对时间(毫秒)建立索引，使用WAL模式，先缓存在内存中，满flush_count条或超过flush_interval秒时
+    在一个事务中批量写入。写入接口与DanmuXmlWriter相同，可以直接作为弹幕录制的写入器；
+    query按时间范围读取，export_xml/export_ass按需导出为原来的XML或ASS字幕。
+    """
+
+    def __init__(self, file_path: str | Path, flush_interval: float = 1.0, flush_count: int = 500):
+        self.file_path = Path(file_path)
+        self.flush_interval = flush_interval
+        self.flush_count = max(1, flush_count)
+        self.count = 0
+        self._buffer: list[tuple[int, int, str, str]] = []
+        self._last_flush = time.monotonic()
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(self.file_path, check_same_thread=False)
+        self._db.execute('PRAGMA journal_mode=WAL')
+        self._db.execute('PRAGMA synchronous=NORMAL')
+        self._db.executescript(_SCHEMA)
+        self._closed = False
+
+    @property
+    def closed(self) -> bool:
+        return self._closed
+
+    def write(self, second: float, timestamp: float, user: str, content: str) -> None:
+        with self._lock:
+            if self._closed:
+                return
+            self._buffer.append((round(second * 1000), int(timestamp * 1000), str(user), str(content)))
+            self.count += 1
+            if len(self._buffer) >= self.flush_count or time.monotonic() - self._last_flush >= self.flush_interval:
+                self._flush()
+
+    def write_gap(self, second: float, timestamp: float, duration: float, attempts: int,
+                  resumed: bool = True) -> None:
+        """记录弹幕连接断开的时间段，参数与DanmuXmlWriter.write_gap相同"""
+        with self._lock:
+            if self._closed:
+                return
+            self._flush()
+            with self._db:
+                self._db.execute('INSERT INTO gap VALUES (?, ?, ?, ?, ?)',
+                                 (round(second * 1000), int(timestamp * 1000), duration, attempts, int(resumed)))
+
+    def flush_if_due(self) -> None:
+        with self._lock:
+            if self._buffer and time.monotonic() - self._last_flush >= self.flush_interval:
+                self._flush()
+
+    def flush(self) -> None:
+        with self._lock:
+            self._flush()
+
+    def _flush(self) -> None:
+        self._last_flush = time.monotonic()
+        if not self._buffer or self._closed:
+            return
+        with self._db:
+            self._db.executemany('INSERT INTO danmu VALUES (?, ?, ?, ?)', self._buffer)
+        self._buffer.clear()
+
+    def query(self, start: float = 0.0, end: float | None = None) -> list[Danmu]:
+        """返回相对时间在[start, end)秒之间的弹幕，按时间排序"""
+        with self._lock:
+            self._flush()
+            rows = self._db.execute(
+                'SELECT time_ms, timestamp_ms, user, content FROM danmu WHERE time_ms >= ? AND time_ms < ? '
+                'ORDER BY time_ms, rowid',
+                (round(start * 1000), round(end * 1000) if end is not None else 2 ** 62)).fetchall()
+        return [Danmu(t / 1000, ts / 1000, user, content) for t, ts, user, content in rows]
+
+    def gaps(self) -> list[dict]:
+        with self._lock:
+            rows = self._db.execute('SELECT time_ms, timestamp_ms, duration, attempts, resumed FROM gap '
+                                    'ORDER BY time_ms').fetchall()
+        return [{'second': t / 1000, 'timestamp': ts / 1000, 'duration': duration, 'attempts': attempts,
+                 'resumed': bool(resumed)} for t, ts, duration, attempts, resumed in rows]
+
+    def total(self) -> int:
+        """数据库中的弹幕总数。不定义__len__，否则空数据库会被当作False"""
+        with self._lock:
+            self._flush()
+            return self._db.execute('SELECT COUNT(*) FROM danmu').fetchone()[0]
+
+    def export_xml(self, file_path: str | Path, start: float = 0.0, end: float | None = None) -> int:
+        """导出为与实时录制相同的XML，时间相对start重新计算，返回导出的弹幕数"""
+        writer = DanmuXmlWriter(file_path, flush_count=1000)
+        try:
+            gaps = [gap for gap in self.gaps() if start <= gap['second'] and (end is None or gap['second'] < end)]
+            for gap in gaps:
+                writer.write_gap(gap['second'] - start, gap['timestamp'], gap['duration'], gap['attempts'],
+                                 gap['resumed'])
+            danmu = self.query(start, end)
+            for second, timestamp, user, content in danmu:
+                writer.write(second - start, timestamp, user, content)
+        finally:
+            writer.close()
+        return len(danmu)
+
+    def export_ass(self, file_path: str | Path, start: float = 0.0, end: float | None = None, **kwargs) -> int:
+        """导出为滚动弹幕ASS字幕，kwargs传给DanmuAssWriter，返回导出的弹幕数"""
+        writer = DanmuAssWriter(file_path, **kwargs)
+        try:
+            danmu = self.query(start, end)
+            for second, timestamp, user, content in danmu:
+                writer.write(second - start, timestamp, user, content)
+        finally:
+            writer.close()
+        return len(danmu)
+
+    def close(self) -> None:
+        with self._lock:
+            if self._closed:
+                return
+            try:
+                self._flush()
+            finally:
+                self._closed = True
+                self._db.close()
+
+
+def _query_xml(file_path: Path, start: float, end: float) -> list[tuple[float, str, str]]:
+    """对照用：从XML弹幕文件中找出时间范围内的弹幕需要解析整个文件"""
+    result = []
+    for _, element in ET.iterparse(file_path):
+        if element.tag == 'd':
+            second = float(element.get('p').split(',', 1)[0])
+            if start <= second < end:
+                result.append((second, element.get('user'), element.text))
+        element.clear()
+    return result
+
+
+def benchmark(messages: int = 200000, hours: float = 6.0) -> dict[str, float]:
+    """比较XML写入器和DanmuStore的写入速度、文件大小和读取某一分钟弹幕的耗时"""
+    results = {}
+    interval = hours * 3600 / messages
+    start_t = time.time()
+    rows = [(i * interval, start_t + i * interval, f'用户{i % 5000}', f'弹幕内容{i} 哈哈哈哈')
+            for i in range(messages)]
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        xml_path = Path(tmp_dir) / 'danmu.xml'
+        store_path = Path(tmp_dir) / f'danmu{STORE_SUFFIX}'
+        for name, writer in (('xml', DanmuXmlWriter(xml_path)), ('sqlite', DanmuStore(store_path))):
+            start = time.perf_counter()
+            for row in rows:
+                writer.write(*row)
+            writer.close()
+            results[f'{name} write messages/s'] = messages / (time.perf_counter() - start)
+        results['xml size MB'] = xml_path.stat().st_size / 2 ** 20
+        results['sqlite size MB'] = sum(
+            p.stat().st_size for p in Path(tmp_dir).glob(f'danmu{STORE_SUFFIX}*')) / 2 ** 20
+
+        minute = 93 * 60
+        start = time.perf_counter()
+        xml_count = len(_query_xml(xml_path, minute, minute + 60))
+        results['xml query one minute ms'] = (time.perf_counter() - start) * 1000
+        store = DanmuStore(store_path)
+        start = time.perf_counter()
+        store_count = len(store.query(minute, minute + 60))
+        results['sqlite query one minute ms'] = (time.perf_counter() - start) * 1000
+        store.close()
+        assert xml_count == store_count
+        results['messages in that minute'] = store_count
+    return results
+
+
+def main(argv: list[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(description='弹幕数据库(.db)的查询和导出')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    export_parser = subparsers.add_parser('export', help='导出为XML或ASS')
+    export_parser.add_argument('path')
+    export_parser.add_argument('-f', '--format', choices=('xml', 'ass'), default='xml')
+    export_parser.add_argument('-o', '--output', help='输出文件，默认与数据库同名')
+    query_parser = subparsers.add_parser('query', help='打印时间范围内的弹幕')
+    query_parser.add_argument('path')
+    for sub_parser in (export_parser, query_parser):
+        sub_parser.add_argument('--start', type=float, default=0.0, help='开始时间(秒)')
+        sub_parser.add_argument('--end', type=float, help='结束时间(秒)')
+    benchmark_parser = subparsers.add_parser('benchmark', help='与XML写入器比较')
+    benchmark_parser.add_argument('-n', '--messages', type=int, default=200000)
+    args = parser.parse_args(argv)
+
+    if args.command == 'benchmark':
+        for name, value in benchmark(args.messages).items():
+            print(f'{name}: {value:.2f}')
+        return
+    if not os.path.exists(args.path):
+        parser.error(f'文件不存在: {args.path}')
+    store = DanmuStore(args.path)
+    try:
+        if args.command == 'query':
+            for danmu in store.query(args.start, args.end):
+                print(format_danmu_line(*danmu), end='')
+        else:
+            output = args.output or str(Path(args.path).with_suffix(f'.{args.format}'))
+            export = store.export_xml if args.format == 'xml' else store.export_ass
+            print(f'导出{export(output, args.start, args.end)}条弹幕到{output}')
+    finally:
+        store.close()
+
+
+if __name__ == '__main__':
+    main()
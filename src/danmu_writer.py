@@ -0,0 +1,225 @@
+# -*- encoding: utf-8 -*-
+
+"""
+Function: Append-only XML danmu writer that keeps the file a valid document after every flush.
+"""
+import os
+import re
+import tempfile
+import threading
+import time
+from pathlib import Path
+from xml.sax.saxutils import escape
+
+XML_HEADER = (b'<?xml version="1.0" encoding="utf-8"?>\n'
+              b'<?xml-stylesheet type="text/xsl" href="#s"?>\n'
+              b'<i>\n')
+XML_FOOTER = b'</i>\n'
+
+# XML 1.0不允许出现的控制字符
+_INVALID_XML_CHARS = re.compile('[\x00-\x08\x0b\x0c\x0e-\x1f\ufffe\uffff]')
+
+
+def format_danmu_line(second: float, timestamp: float, user: str, content: str) -> str:
+    user = escape(_INVALID_XML_CHARS.sub('', str(user)), {'"': '&quot;'})
+    content = escape(_INVALID_XML_CHARS.sub('', str(content)))
+    return (f"  <d p=\"{round(second, 2)},1,25,16777215,{int(timestamp * 1000)},0,1602022773,0\" "
+            f"user=\"{user}\">{content}</d>\n")
+
+
+class DanmuXmlWriter:
+    """
+    追加写入的XML弹幕文件
+
+    文件句柄一直保持打开，弹幕先缓存在内存中，满flush_count条或距上次写入超过flush_interval秒时，
+    从</i>结束标签所在的位置开始，一次写入缓存的弹幕和新的结束标签。每次写入后文件都以</i>结尾，
+    程序崩溃时最多丢失尚未写入的缓存，文件本身仍然是完整的XML。fsync为True时每次写入后同步到磁盘。
+    """
+
+    def __init__(self, file_path: str | Path, flush_interval: float = 1.0, flush_count: int = 100,
+                 fsync: bool = False):
+        self.file_path = Path(file_path)
+        self.flush_interval = flush_interval
+        self.flush_count = max(1, flush_count)
+        self.fsync = fsync
+        self.count = 0
+        self._buffer: list[bytes] = []
+        self._last_flush = time.monotonic()
+        self._lock = threading.Lock()
+        self._file = open(self.file_path, 'wb', buffering=0)
+        self._file.write(XML_HEADER + XML_FOOTER)
+        self._offset = len(XML_HEADER)  # 结束标签在文件中的位置
+
+    @property
+    def closed(self) -> bool:
+        return self._file.closed
+
+    def write(self, second: float, timestamp: float, user: str, content: str) -> None:
+        self.write_line(format_danmu_line(second, timestamp, user, content))
+
+    def write_gap(self, second: float, timestamp: float, duration: float, attempts: int,
+                  resumed: bool = True) -> None:
+        """记录弹幕连接断开的时间段，resumed为False表示之后没有重新连接"""
+        resumed_attribute = '' if resumed else ' resumed="0"'
+        self.write_line(f'  <gap start="{round(second, 2)}" duration="{round(duration, 2)}" '
+                        f'timestamp="{int(timestamp * 1000)}" attempts="{attempts}"{resumed_attribute}/>\n')
+
+    def write_line(self, line: str) -> None:
+        with self._lock:
+            if self._file.closed:
+                return
+            self._buffer.append(line.encode('utf-8'))
+            self.count += 1
+            if len(self._buffer) >= self.flush_count or time.monotonic() - self._last_flush >= self.flush_interval:
+                self._flush()
+
+    def flush_if_due(self) -> None:
+        """由定时任务调用，保证弹幕较少时缓存也能按时间写入"""
+        with self._lock:
+            if self._buffer and time.monotonic() - self._last_flush >= self.flush_interval:
+                self._flush()
+
+    def flush(self) -> None:
+        with self._lock:
+            self._flush()
+
+    def _flush(self) -> None:
+        self._last_flush = time.monotonic()
+        if not self._buffer or self._file.closed:
+            return
+        data = b''.join(self._buffer)
+        self._buffer.clear()
+        self._file.seek(self._offset)
+        try:
+            # 弹幕和结束标签在同一次write中覆盖旧的结束标签
+            self._file.write(data + XML_FOOTER)
+        except OSError:
+            # 写入不完整(如磁盘已满)时恢复到上一次的完整状态
+            self._file.seek(self._offset)
+            self._file.truncate()
+            self._file.write(XML_FOOTER)
+            raise
+        self._offset += len(data)
+        if self.fsync:
+            os.fsync(self._file.fileno())
+
+    def close(self) -> None:
+        with self._lock:
+            if self._file.closed:
+                return
+            try:
+                self._flush()
+            finally:
+                self._file.close()
+
+
+ASS_HEADER = """[Script Info]
+ScriptType: v4.00+
+PlayResX: {width}
+PlayResY: {height}
+WrapStyle: 2
+ScaledBorderAndShadow: yes
+
+[V4+ Styles]
+Format: Name, Fontname, Fontsize, PrimaryColour, SecondaryColour, OutlineColour, BackColour, Bold, Italic, \
+Underline, StrikeOut, ScaleX, ScaleY, Spacing, Angle, BorderStyle, Outline, Shadow, Alignment, MarginL, MarginR, \
+MarginV, Encoding
+Style: Danmu,{font},{font_size},&H33FFFFFF,&H33FFFFFF,&H33000000,&H00000000,0,0,0,0,100,100,0,0,1,1,0,7,0,0,0,1
+
+[Events]
+Format: Layer, Start, End, Style, Name, MarginL, MarginR, MarginV, Effect, Text
+"""
+
+
+def format_ass_time(second: float) -> str:
+    centiseconds = max(0, round(second * 100))
+    seconds, cs = divmod(centiseconds, 100)
+    minutes, s = divmod(seconds, 60)
+    h, m = divmod(minutes, 60)
+    return f'{h}:{m:02d}:{s:02d}.{cs:02d}'
+
+
+class DanmuAssWriter:
+    """
+    滚动弹幕ASS字幕写入
+
+    弹幕需按时间顺序写入，每条弹幕在duration秒内从右向左滚过画面，
+    按弹幕长度估算宽度，选择最早空出的一行，避免同一行的弹幕相互重叠。
+    """
+
+    def __init__(self, file_path: str | Path, width: int = 1920, height: int = 1080, font: str = 'Microsoft YaHei',
+                 font_size: int = 48, duration: float = 8.0, rows: int | None = None):
+        self.file_path = Path(file_path)
+        self.width = width
+        self.font_size = font_size
+        self.duration = duration
+        self.count = 0
+        rows = rows or max(1, height // 2 // font_size)  # 默认只使用画面上半部分
+        self._row_free = [0.0] * rows  # 每一行可以放入下一条弹幕的时间
+        self._file = open(self.file_path, 'w', encoding='utf-8-sig', newline='\n')
+        self._file.write(ASS_HEADER.format(width=width, height=height, font=font, font_size=font_size))
+
+    @property
+    def closed(self) -> bool:
+        return self._file.closed
+
+    def write(self, second: float, timestamp: float, user: str, content: str) -> None:
+        content = _INVALID_XML_CHARS.sub('', str(content)).replace('\n', ' ').replace('\\', '＼')
+        content = content.replace('{', '｛').replace('}', '｝')
+        text_width = len(content) * self.font_size
+        speed = (self.width + text_width) / self.duration
+        # 选择最早空出的一行，所有行都被占用时稍微推迟出现的时间
+        row = min(range(len(self._row_free)), key=lambda i: max(self._row_free[i], second))
+        start = max(second, self._row_free[row])
+        # 弹幕完全进入画面并留出一个字的间隔后，这一行才能放入下一条弹幕
+        self._row_free[row] = start + (text_width + self.font_size) / speed
+        y = row * self.font_size
+        self._file.write(f'Dialogue: 0,{format_ass_time(start)},{format_ass_time(start + self.duration)},Danmu,,0,0,0,,'
+                         f'{{\\move({self.width},{y},{-text_width},{y})}}{content}\n')
+        self.count += 1
+
+    def flush(self) -> None:
+        self._file.flush()
+
+    def close(self) -> None:
+        if not self._file.closed:
+            self._file.close()
+
+
+def _rewrite_per_message(file_path: Path, line: str) -> None:
+    """原来的写入方式：读取整个文件，在</i>前插入一行后重写整个文件"""
+    with open(file_path, 'r', encoding='UTF-8') as file:
+        content_lines = file.readlines()
+    content_lines.insert(-1, line)
+    with open(file_path, 'w', encoding='UTF-8') as file:
+        file.writelines(content_lines)
+
+
+def benchmark(messages: int = 5000) -> dict[str, float]:
+    """比较两种写入方式每秒可以写入的弹幕数"""
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        start_t = time.time()
+        lines = [format_danmu_line(i / 10, start_t + i / 10, f'user{i}', f'弹幕内容 <{i}> & test')
+                 for i in range(messages)]
+
+        file_path = Path(tmp_dir) / 'rewrite.xml'
+        file_path.write_bytes(XML_HEADER + XML_FOOTER)
+        start = time.perf_counter()
+        for line in lines:
+            _rewrite_per_message(file_path, line)
+        results['rewrite per message'] = messages / (time.perf_counter() - start)
+
+        for name, kwargs in (('append', {}), ('append (flush every message)', {'flush_count': 1})):
+            writer = DanmuXmlWriter(Path(tmp_dir) / 'append.xml', **kwargs)
+            start = time.perf_counter()
+            for line in lines:
+                writer.write_line(line)
+            writer.close()
+            results[name] = messages / (time.perf_counter() - start)
+    return results
+
+
+if __name__ == '__main__':
+    for method, rate in benchmark().items():
+        print(f'{method}: {rate:.0f} messages/s')
@@ -7,12 +7,166 @@
 
 import gzip
 import json
-from typing import Optional, Dict, Any
+import time
+import zlib
+from dataclasses import dataclass, field
+from typing import Optional, Dict, Any, Iterable, Iterator, NamedTuple
 from google.protobuf import json_format
+from google.protobuf.message import DecodeError
 
 # 导入真正的protobuf模块
 from .dy_pb2 import PushFrame, Response, ChatMessage
 
+CHAT_METHOD = 'WebcastChatMessage'
+_CHAT_METHOD = CHAT_METHOD.encode()
+
+
+class Chat(NamedTuple):
+    user: str
+    content: str
+    timestamp: float  # 服务器时间，秒
+
+
+@dataclass
+class DecodedFrame:
+    logid: int
+    need_ack: bool
+    internal_ext: str
+    cursor: str = ''
+    chats: list[Chat] = field(default_factory=list)
+    # 白名单中除弹幕以外的消息，保留未解析的payload由调用方按需解析
+    messages: list[tuple[str, bytes]] = field(default_factory=list)
+
+
+def _read_varint(data: bytes, pos: int) -> tuple[int, int]:
+    result = shift = 0
+    while True:
+        byte = data[pos]
+        pos += 1
+        result |= (byte & 0x7f) << shift
+        if byte < 0x80:
+            return result, pos
+        shift += 7
+
+
+def iter_fields(data: bytes) -> Iterator[tuple[int, int | bytes]]:
+    """
+    按wire格式遍历protobuf消息的顶层字段，返回(字段号, 值)
+
+    varint字段的值为int，其余字段的值为未解析的bytes，不需要的字段和子消息不会被解析
+    """
+    pos, end = 0, len(data)
+    try:
+        while pos < end:
+            key = data[pos]
+            if key < 0x80:
+                pos += 1
+            else:
+                key, pos = _read_varint(data, pos)
+            wire_type = key & 7
+            if wire_type == 2:
+                size = data[pos]
+                if size < 0x80:
+                    pos += 1
+                else:
+                    size, pos = _read_varint(data, pos)
+                if pos + size > end:
+                    raise DecodeError('truncated message')
+                yield key >> 3, data[pos:pos + size]
+                pos += size
+            elif wire_type == 0:
+                value, pos = _read_varint(data, pos)
+                yield key >> 3, value
+            elif wire_type == 1:
+                yield key >> 3, data[pos:pos + 8]
+                pos += 8
+            elif wire_type == 5:
+                yield key >> 3, data[pos:pos + 4]
+                pos += 4
+            else:
+                raise DecodeError(f'unsupported wire type {wire_type}')
+    except IndexError:
+        raise DecodeError('truncated message') from None
+
+
+def _first_field(data: bytes, number: int) -> int | bytes | None:
+    for field_number, value in iter_fields(data):
+        if field_number == number:
+            return value
+    return None
+
+
+class DanmuDecoder:
+    """
+    PushFrame解码器
+
+    返回帧中的所有弹幕，而不是只返回第一条。弹幕按wire格式直接从protobuf字段读取为(用户, 内容, 服务器时间)元组，
+    不创建PushFrame、Response和ChatMessage对象，也不经过MessageToDict，用户信息等不需要的子消息不会被解析。
+    methods为消息类型白名单，只读取白名单中消息的payload，为空时只读取ACK需要的字段。
+    """
+
+    def __init__(self, methods: Iterable[str] = (CHAT_METHOD,)):
+        self.methods = frozenset(methods)
+        self._methods = frozenset(method.encode() for method in self.methods)
+
+    def decode(self, message: bytes) -> DecodedFrame | None:
+        """解码一个WebSocket二进制消息，不是有效的PushFrame时返回None"""
+        try:
+            return self._decode(message)
+        except (OSError, EOFError, zlib.error, DecodeError, UnicodeDecodeError):
+            return None
+
+    def _decode(self, message: bytes) -> DecodedFrame | None:
+        # 字段号与dy_pb2中的定义一致
+        logid, payload = 0, None
+        for number, value in iter_fields(message):
+            if number == 2:  # PushFrame.logid
+                logid = value
+            elif number == 8:  # PushFrame.payload
+                payload = value
+        if payload is None:
+            return None
+        decoded = DecodedFrame(logid, False, '')
+        methods = self._methods
+        for number, value in iter_fields(gzip.decompress(payload)):
+            if number == 1:  # Response.messagesList
+                if not methods:
+                    continue
+                method = body = None
+                for message_number, message_value in iter_fields(value):
+                    if message_number == 1:  # Message.method
+                        method = message_value
+                    elif message_number == 2:  # Message.payload
+                        body = message_value
+                if method not in methods or body is None:
+                    continue
+                if method == _CHAT_METHOD:
+                    decoded.chats.append(self._decode_chat(body))
+                else:
+                    decoded.messages.append((method.decode(), body))
+            elif number == 9:  # Response.needAck
+                decoded.need_ack = bool(value)
+            elif number == 5:  # Response.internalExt
+                decoded.internal_ext = value.decode()
+            elif number == 2:  # Response.cursor
+                decoded.cursor = value.decode()
+        return decoded
+
+    @staticmethod
+    def _decode_chat(body: bytes) -> Chat:
+        user = content = ''
+        create_time = event_time = 0
+        for number, value in iter_fields(body):
+            if number == 3:  # ChatMessage.content
+                content = value.decode()
+            elif number == 2:  # ChatMessage.user.nickName
+                user = (_first_field(value, 3) or b'').decode()
+            elif number == 1:  # ChatMessage.common.createTime(毫秒)
+                create_time = _first_field(value, 4) or 0
+            elif number == 15:  # ChatMessage.eventTime(秒)
+                event_time = value
+        return Chat(user, content, create_time / 1000 if create_time else float(event_time))
+
 
 def parse_danmu_message(message: bytes) -> Optional[Dict[str, Any]]:
     """
@@ -66,6 +220,68 @@ def parse_danmu_message(message: bytes) -> Optional[Dict[str, Any]]:
         return None
 
 
+def build_chat_frame(chats: list[tuple[str, str]], logid: int = 0, need_ack: bool = False) -> bytes:
+    """生成包含多条弹幕的PushFrame，用于测试和基准测试"""
+    response = Response()
+    response.needAck = need_ack
+    now = int(time.time() * 1000)
+    for user, content in chats:
+        chat = ChatMessage()
+        chat.common.method = CHAT_METHOD
+        chat.common.createTime = now
+        chat.user.nickName = user
+        chat.content = content
+        msg = response.messagesList.add()
+        msg.method = CHAT_METHOD
+        msg.payload = chat.SerializeToString()
+        # 热门直播间中弹幕常与礼物、点赞等消息合并在同一帧中
+        other = response.messagesList.add()
+        other.method = 'WebcastLikeMessage'
+        other.payload = b'\x0a\x00' * 20
+    frame = PushFrame()
+    frame.logid = logid
+    frame.payloadType = 'msg'
+    frame.payloadEncoding = 'gzip'
+    frame.payload = gzip.compress(response.SerializeToString())
+    return frame.SerializeToString()
+
+
+def _parse_all_chats_dict(message: bytes) -> list[dict]:
+    """对照用：用parse_danmu_message的方式(每次新建对象并经过MessageToDict)解析帧中的所有弹幕"""
+    frame = PushFrame()
+    frame.ParseFromString(message)
+    response = Response()
+    response.ParseFromString(gzip.decompress(frame.payload))
+    chats = []
+    for msg in response.messagesList:
+        if msg.method == CHAT_METHOD:
+            chat = ChatMessage()
+            chat.ParseFromString(msg.payload)
+            chats.append(json_format.MessageToDict(chat, preserving_proto_field_name=True))
+    return chats
+
+
+def benchmark(frames: list[bytes] | None = None, seconds: float = 3.0) -> dict[str, float]:
+    """比较几种解码方式每秒可以解码的帧数，frames为空时使用生成的帧(每帧10条弹幕和10条其他消息)"""
+    if not frames:
+        frames = [build_chat_frame([(f'user{i}_{j}', f'弹幕内容{i}_{j}') for j in range(10)], logid=i)
+                  for i in range(200)]
+    decoder = DanmuDecoder()
+    results = {}
+    for name, decode in (('parse_danmu_message (first chat only)', parse_danmu_message),
+                         ('MessageToDict (all chats)', _parse_all_chats_dict),
+                         ('DanmuDecoder (all chats)', decoder.decode)):
+        count = 0
+        start = time.perf_counter()
+        while time.perf_counter() - start < seconds:
+            for frame in frames:
+                decode(frame)
+            count += len(frames)
+        results[name] = count / (time.perf_counter() - start)
+    results['chats per frame'] = sum(len(decoder.decode(frame).chats) for frame in frames) / len(frames)
+    return results
+
+
 def create_ack_frame(logid: int, internal_ext: str) -> bytes:
     """
     创建ACK确认帧
@@ -81,7 +297,7 @@ def create_ack_frame(logid: int, internal_ext: str) -> bytes:
         obj = PushFrame()
         obj.payloadType = 'ack'
         obj.logid = logid
-        obj.payloadType = internal_ext
+        obj.payload = internal_ext.encode()
         return obj.SerializeToString()
     except:
         return b'ack'
@@ -99,4 +315,9 @@ def create_heartbeat_frame() -> bytes:
         obj.payloadType = 'hb'
         return obj.SerializeToString()
     except:
-        return b'hb'
\ No newline at end of file
+        return b'hb'
+
+
+if __name__ == '__main__':
+    for method, rate in benchmark().items():
+        print(f'{method}: {rate:.1f}')
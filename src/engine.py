@@ -0,0 +1,112 @@
+# -*- encoding: utf-8 -*-
+
+"""
+Function: Single event loop monitoring engine.
+"""
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import TYPE_CHECKING, Any, Callable, Coroutine
+
+from .logger import logger
+
+if TYPE_CHECKING:
+    from .platforms import Platform
+
+_thread_local = threading.local()
+
+
+def run_coroutine(coro: Coroutine) -> Any:
+    """
+    在当前线程常驻的事件循环中运行协程
+
+    与asyncio.run不同，事件循环在多次调用之间保留，绑定在事件循环上的连接池等资源可以在多次检测之间复用
+    """
+    loop = getattr(_thread_local, 'loop', None)
+    if loop is None or loop.is_closed():
+        loop = asyncio.new_event_loop()
+        _thread_local.loop = loop
+    return loop.run_until_complete(coro)
+
+
+@dataclass
+class RoomState:
+    """单个直播间在多次检测之间需要保留的状态"""
+    url_data: tuple
+    count_variable: int = -1
+    record_quality_zh: str = ''
+    record_quality: str | None = None
+    record_url: str = ''
+    anchor_name: str = ''
+    proxy_address: str | None = None
+    live_domain: str = ''
+    run_once: bool = False
+    start_pushed: bool = False
+    record_finished: bool = False
+    count_time: float = field(default_factory=time.time)
+    next_delay: int | None = None
+    platform: 'Platform | None' = None
+
+
+class MonitorEngine:
+    """
+    在一个事件循环中以轻量任务的形式监测所有直播间
+
+    直播间的检测协程直接在该事件循环中运行，不再为每个直播间创建线程、为每次检测创建事件循环；
+    只有阻塞的录制过程（ffmpeg进程监督）会被放入线程池执行。
+    """
+
+    def __init__(self, max_blocking_workers: int = 1024):
+        self.loop = asyncio.new_event_loop()
+        self.tasks: dict[str, asyncio.Task] = {}
+        self._executor = ThreadPoolExecutor(max_workers=max_blocking_workers, thread_name_prefix='record')
+        self._thread = threading.Thread(target=self._run, name='monitor-engine', daemon=True)
+        self._ready = threading.Event()
+
+    def start(self) -> None:
+        if not self._thread.is_alive():
+            self._thread.start()
+            self._ready.wait()
+
+    def _run(self) -> None:
+        asyncio.set_event_loop(self.loop)
+        self.loop.call_soon(self._ready.set)
+        self.loop.run_forever()
+
+    @property
+    def room_count(self) -> int:
+        return len(self.tasks)
+
+    def add_room(self, key: str, coro_factory: Callable[[], Coroutine]) -> None:
+        """线程安全地为直播间创建监测任务"""
+        def _create() -> None:
+            if key in self.tasks and not self.tasks[key].done():
+                return
+            task = self.loop.create_task(coro_factory(), name=key)
+            task.add_done_callback(lambda t: self._on_task_done(key, t))
+            self.tasks[key] = task
+
+        self.loop.call_soon_threadsafe(_create)
+
+    def remove_room(self, key: str) -> None:
+        def _cancel() -> None:
+            task = self.tasks.pop(key, None)
+            if task:
+                task.cancel()
+
+        self.loop.call_soon_threadsafe(_cancel)
+
+    def _on_task_done(self, key: str, task: asyncio.Task) -> None:
+        if self.tasks.get(key) is task:
+            del self.tasks[key]
+        if not task.cancelled() and task.exception():
+            logger.error(f"监测任务 {key} 异常退出: {task.exception()}")
+
+    def submit(self, coro: Coroutine) -> Any:
+        """从其他线程向事件循环提交协程，返回concurrent.futures.Future"""
+        return asyncio.run_coroutine_threadsafe(coro, self.loop)
+
+    async def run_blocking(self, func: Callable, *args) -> Any:
+        return await self.loop.run_in_executor(self._executor, func, *args)
@@ -0,0 +1,356 @@
+# -*- encoding: utf-8 -*-
+
+"""
+Function: In-process HTTP-FLV recorder that writes the response body through a preallocated buffer.
+"""
+import http.client
+import os
+import socket
+import ssl
+import time
+import urllib.request
+from typing import Callable
+
+from . import utils
+from .segment_manifest import append_segment
+
+OptionalStr = str | None
+
+FLV_HEADER_SIZE = 9
+TAG_HEADER_SIZE = 11
+PREVIOUS_TAG_SIZE = 4
+TAG_AUDIO = 8
+TAG_VIDEO = 9
+TAG_SCRIPT = 18
+
+ssl_context = ssl.create_default_context()
+ssl_context.check_hostname = False
+ssl_context.verify_mode = ssl.CERT_NONE
+
+
+class FlvFormatError(Exception):
+    """响应内容不是FLV"""
+
+
+def write_all(fd: int, data: memoryview | bytes) -> None:
+    while data:
+        written = os.write(fd, data)
+        data = data[written:]
+
+
+def set_timestamp(tag: memoryview | bytearray, timestamp: int) -> None:
+    """修改tag头中的时间戳(低24位加扩展的高8位)"""
+    tag[4:7] = (timestamp & 0xffffff).to_bytes(3, 'big')
+    tag[7] = (timestamp >> 24) & 0xff
+
+
+class FlvRecorder:
+    """
+    内置FLV录制
+
+    在录制线程中用urllib读取直播流，响应内容每次chunk_size字节通过readinto直接读入预先分配的缓冲区，
+    再用os.write写入文件，中间不产生额外的拷贝。只解析tag头来记录时间戳、关键帧和停滞时间，
+    segment_time不为空时在关键帧处分段，每个分段以FLV头、onMetaData和音视频序列头开始，时间戳从0开始，
+    save_file_path需包含%03d，每个分段结束时把开始时间和时长追加到分段清单。连续timeout秒没有收到数据或新的tag时视为直播结束。
+    """
+
+    def __init__(self, url: str, save_file_path: str, headers: dict | None = None, proxy_addr: OptionalStr = None,
+                 segment_time: float | None = None, chunk_size: int = 64 * 1024, buffer_size: int = 256 * 1024,
+                 timeout: float = 15.0,
+                 should_stop: Callable[[], bool] | None = None):
+        self.url = url
+        self.save_file_path = save_file_path
+        self.headers = headers or {}
+        self.proxy_addr = proxy_addr
+        self.segment_time = segment_time * 1000 if segment_time else None  # 毫秒，与tag时间戳一致
+        self.chunk_size = chunk_size  # 每次读取的字节数，读满才返回，过大会增加写入和停止录制的延迟
+        self.buffer_size = max(buffer_size, chunk_size)
+        self.timeout = timeout
+        self.should_stop = should_stop
+        self.stopped = False
+        self.bytes_written = 0
+        self.tags = 0
+        self.keyframes = 0
+        self.file_paths: list[str] = []
+        self.last_timestamp = 0
+        self._fd = -1
+        self._flv_header = b''
+        self._script_tag: bytearray | None = None
+        self._sequence_headers: dict[int, bytearray] = {}  # tag类型 -> 序列头tag
+        self._file_start = None  # 当前文件第一个tag的原始时间戳
+        self._segment_offset = 0.0  # 当前分段相对录制开始的秒数
+        self._last_tag_time = 0.0
+        self._response = None
+
+    def stop(self) -> None:
+        """可在其他线程中调用，关闭连接使阻塞中的读取立即返回"""
+        self.stopped = True
+        response = self._response
+        sock = getattr(getattr(getattr(response, 'fp', None), 'raw', None), '_sock', None)
+        if sock is not None:
+            try:
+                sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+
+    def _check_stop(self) -> bool:
+        if not self.stopped and self.should_stop and self.should_stop():
+            self.stopped = True
+        return self.stopped
+
+    def _open(self):
+        if self.proxy_addr:
+            proxy = utils.handle_proxy_addr(self.proxy_addr)
+            proxy_handler = urllib.request.ProxyHandler({'http': proxy, 'https': proxy})
+        else:
+            proxy_handler = urllib.request.ProxyHandler({})
+        opener = urllib.request.build_opener(proxy_handler, urllib.request.HTTPSHandler(context=ssl_context))
+        request = urllib.request.Request(self.url, headers=self.headers)
+        return opener.open(request, timeout=self.timeout)
+
+    def _new_file(self) -> None:
+        self._close_file()
+        file_path = self.save_file_path
+        if self.segment_time:
+            file_path = file_path % len(self.file_paths)
+        self._fd = os.open(file_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC | getattr(os, 'O_BINARY', 0), 0o644)
+        self.file_paths.append(file_path)
+        head = bytearray(self._flv_header)
+        if self.file_paths[1:]:
+            # 后续分段需要重新写入onMetaData和序列头，解码器才能从分段开头开始播放
+            for tag in (self._script_tag, *self._sequence_headers.values()):
+                if tag is not None:
+                    set_timestamp(tag, 0)
+                    head += tag
+        write_all(self._fd, head)
+        self.bytes_written += len(head)
+
+    def _close_file(self, end_timestamp: int | None = None) -> None:
+        """关闭当前文件，分段在end_timestamp(默认为最后一个tag的时间戳)处结束"""
+        if self._fd != -1:
+            os.close(self._fd)
+            self._fd = -1
+            if self.segment_time:
+                end_timestamp = self.last_timestamp if end_timestamp is None else end_timestamp
+                duration = max(0, end_timestamp - (self._file_start or 0)) / 1000
+                append_segment(self.save_file_path, self.file_paths[-1], self._segment_offset,
+                               self._segment_offset + duration)
+                self._segment_offset += duration
+
+    def _write(self, view: memoryview) -> None:
+        if self._fd == -1:
+            self._new_file()
+        write_all(self._fd, view)
+        self.bytes_written += len(view)
+
+    def _process(self, view: memoryview, pos: int, end: int) -> int:
+        """写入view[pos:end]中完整的tag，返回第一个不完整tag的位置"""
+        start = pos
+        while end - pos >= TAG_HEADER_SIZE + 2:
+            tag_type = view[pos] & 0x1f
+            data_size = int.from_bytes(view[pos + 1:pos + 4], 'big')
+            tag_size = TAG_HEADER_SIZE + data_size + PREVIOUS_TAG_SIZE
+            if end - pos < tag_size:
+                break
+            timestamp = int.from_bytes(view[pos + 4:pos + 7], 'big') | view[pos + 7] << 24
+            keyframe = False
+            media = True  # 除onMetaData和序列头以外的音视频数据
+            if tag_type == TAG_VIDEO and data_size > 1:
+                keyframe = view[pos + 11] >> 4 == 1
+                # AVC/HEVC序列头
+                if view[pos + 11] & 0x0f in (7, 12) and view[pos + 12] == 0:
+                    self._sequence_headers[TAG_VIDEO] = bytearray(view[pos:pos + tag_size])
+                    keyframe = media = False
+            elif tag_type == TAG_AUDIO and data_size > 1:
+                # AAC序列头
+                if view[pos + 11] >> 4 == 10 and view[pos + 12] == 0:
+                    self._sequence_headers[TAG_AUDIO] = bytearray(view[pos:pos + tag_size])
+                    media = False
+            elif tag_type == TAG_SCRIPT:
+                media = False
+                if self._script_tag is None:
+                    self._script_tag = bytearray(view[pos:pos + tag_size])
+
+            if media and (self._file_start is None or timestamp + 5000 < self._file_start):
+                # 第一个音视频tag或推流重新开始后时间戳变小
+                self._file_start = timestamp
+            if keyframe:
+                self.keyframes += 1
+                if self.segment_time and timestamp - self._file_start >= self.segment_time:
+                    self._write(view[start:pos])
+                    self._close_file(timestamp)
+                    self._new_file()
+                    start = pos
+                    self._file_start = timestamp
+            if self.segment_time and self._file_start is not None:
+                set_timestamp(view[pos:pos + TAG_HEADER_SIZE], max(0, timestamp - self._file_start))
+            self.last_timestamp = timestamp
+            self.tags += 1
+            self._last_tag_time = time.monotonic()
+            pos += tag_size
+        if pos > start:
+            self._write(view[start:pos])
+        return pos
+
+    def run(self) -> int:
+        """在当前线程中录制到直播结束或被停止，写入过tag时返回0，否则返回1"""
+        buffer = bytearray(self.buffer_size)
+        view = memoryview(buffer)
+        filled = 0
+        pos = 0
+        self._last_tag_time = time.monotonic()
+        try:
+            with self._open() as response:
+                self._response = response
+                while not self._check_stop():
+                    if len(buffer) - filled < self.chunk_size:
+                        # 单个tag比缓冲区大(如高码率的关键帧)时扩大缓冲区
+                        view.release()
+                        buffer.extend(bytes(len(buffer)))
+                        view = memoryview(buffer)
+                    n = response.readinto(view[filled:filled + self.chunk_size])
+                    if not n:
+                        break
+                    filled += n
+                    if not self._flv_header:
+                        if filled < FLV_HEADER_SIZE + PREVIOUS_TAG_SIZE:
+                            continue
+                        if buffer[:3] != b'FLV':
+                            raise FlvFormatError(f'not a FLV stream: {bytes(buffer[:16])!r}')
+                        pos = int.from_bytes(buffer[5:9], 'big') + PREVIOUS_TAG_SIZE
+                        self._flv_header = bytes(buffer[:pos])
+                    pos = self._process(view, pos, filled)
+                    # 把不完整的tag移到缓冲区开头
+                    remain = filled - pos
+                    buffer[:remain] = buffer[pos:filled]
+                    filled, pos = remain, 0
+                    if time.monotonic() - self._last_tag_time > self.timeout:
+                        break
+        except TimeoutError:
+            pass
+        except (OSError, http.client.HTTPException):
+            # stop关闭连接后读取可能抛出异常
+            if not self.stopped:
+                raise
+        finally:
+            self._response = None
+            view.release()
+            self._close_file()
+        return 0 if self.tags else 1
+
+
+def _build_tag(tag_type: int, timestamp: int, data: bytes) -> bytes:
+    header = bytes([tag_type]) + len(data).to_bytes(3, 'big') + (timestamp & 0xffffff).to_bytes(3, 'big') \
+        + bytes([(timestamp >> 24) & 0xff]) + b'\x00\x00\x00'
+    return header + data + (TAG_HEADER_SIZE + len(data)).to_bytes(4, 'big')
+
+
+def _serve_live_flv(port_queue, bitrate_kbps: int) -> None:
+    """在子进程中运行的直播FLV源，按实际时间每40毫秒发送一帧视频和一帧音频"""
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    frame_size = max(64, bitrate_kbps * 1000 // 8 // 25)
+    head = b'FLV\x01\x05\x00\x00\x00\x09\x00\x00\x00\x00' + _build_tag(TAG_SCRIPT, 0, b'\x02\x00\x0aonMetaData') \
+        + _build_tag(TAG_VIDEO, 0, b'\x17\x00\x00\x00\x00' + b'\x01' * 32) \
+        + _build_tag(TAG_AUDIO, 0, b'\xaf\x00\x12\x10')
+
+    class LiveHandler(BaseHTTPRequestHandler):
+        def log_message(self, *args):
+            pass
+
+        def do_GET(self):
+            self.send_response(200)
+            self.send_header('Content-Type', 'video/x-flv')
+            self.end_headers()
+            start = time.monotonic()
+            try:
+                self.wfile.write(head)
+                for frame in range(1 << 31):
+                    timestamp = frame * 40
+                    # 每2秒一个关键帧，关键帧的大小是普通帧的5倍
+                    keyframe = frame % 50 == 0
+                    video = (b'\x17\x01' if keyframe else b'\x27\x01') + bytes(frame_size * (5 if keyframe else 1))
+                    self.wfile.write(_build_tag(TAG_VIDEO, timestamp, video)
+                                     + _build_tag(TAG_AUDIO, timestamp, b'\xaf\x01' + bytes(200)))
+                    delay = start + (frame + 1) * 0.04 - time.monotonic()
+                    if delay > 0:
+                        time.sleep(delay)
+            except OSError:
+                pass
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), LiveHandler)
+    server.daemon_threads = True
+    server.request_queue_size = 1024
+    port_queue.put(server.server_address[1])
+    server.serve_forever()
+
+
+def benchmark(recordings: int = 200, duration: float = 20.0, bitrate_kbps: int = 1000,
+              segment_time: float | None = None, ffmpeg: str = 'ffmpeg') -> dict[str, dict]:
+    """
+    在子进程中搭建直播FLV源，用内置录制在同一进程的recordings个线程中同时录制duration秒，
+    统计每路录制占用的CPU时间和常驻内存；安装了ffmpeg时再用ffmpeg(-c copy)录制同样路数比较。仅支持Linux
+    """
+    import multiprocessing
+    import shutil
+    import subprocess
+    import tempfile
+    import threading
+    from .hls_recorder import _process_usage
+
+    context = multiprocessing.get_context('fork')
+    port_queue = context.Queue()
+    origin = context.Process(target=_serve_live_flv, args=(port_queue, bitrate_kbps), daemon=True)
+    origin.start()
+    url = f'http://127.0.0.1:{port_queue.get(timeout=10)}/live.flv'
+    results = {}
+    try:
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            cpu_before, rss_before = _process_usage()
+            deadline = time.monotonic() + duration
+            recorders = [
+                FlvRecorder(url, os.path.join(tmp_dir, f'native{i}_%03d.flv' if segment_time else f'native{i}.flv'),
+                            segment_time=segment_time, should_stop=lambda: time.monotonic() > deadline)
+                for i in range(recordings)
+            ]
+            threads = [threading.Thread(target=recorder.run, daemon=True) for recorder in recorders]
+            for thread in threads:
+                thread.start()
+            peak_rss = rss_before
+            while any(thread.is_alive() for thread in threads):
+                peak_rss = max(peak_rss, _process_usage()[1])
+                time.sleep(0.5)
+            cpu_after, _ = _process_usage()
+            results['native'] = {
+                'cpu seconds per recording': (cpu_after - cpu_before) / recordings,
+                'peak rss KB per recording': (peak_rss - rss_before) / recordings,
+                'bytes per recording': sum(i.bytes_written for i in recorders) / recordings,
+            }
+
+            if shutil.which(ffmpeg):
+                processes = [subprocess.Popen([
+                    ffmpeg, '-y', '-v', 'error', '-rw_timeout', '15000000', '-i', url,
+                    '-c', 'copy', '-map', '0', '-f', 'flv', os.path.join(tmp_dir, f'ffmpeg{i}.flv')
+                ], stdin=subprocess.PIPE) for i in range(recordings)]
+                time.sleep(duration - 1)
+                usage = [_process_usage(process.pid) for process in processes if process.poll() is None]
+                for process in processes:
+                    if process.poll() is None:
+                        process.stdin.write(b'q')
+                        process.stdin.close()
+                    process.wait()
+                if usage:
+                    results['ffmpeg'] = {
+                        'cpu seconds per recording': sum(i[0] for i in usage) / len(usage),
+                        'peak rss KB per recording': sum(i[1] for i in usage) / len(usage),
+                        'bytes per recording': sum(os.path.getsize(os.path.join(tmp_dir, f'ffmpeg{i}.flv'))
+                                                   for i in range(recordings)) / recordings,
+                    }
+    finally:
+        origin.kill()
+    return results
+
+
+if __name__ == '__main__':
+    for method, usage in benchmark().items():
+        print(method, ', '.join(f'{key}: {value:.2f}' for key, value in usage.items()))
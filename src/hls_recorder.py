@@ -0,0 +1,426 @@
+# -*- encoding: utf-8 -*-
+
+"""
+Function: In-process HLS recorder that appends MPEG-TS segments to disk without spawning ffmpeg.
+"""
+import asyncio
+import os
+import re
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Callable
+from urllib.parse import urljoin
+
+import httpx
+
+from .http_clients.async_http import get_async_client
+from .segment_manifest import append_segment
+
+OptionalStr = str | None
+
+_ATTRIBUTE_RE = re.compile(r'([A-Z0-9-]+)=("[^"]*"|[^,]*)')
+
+
+class HLSUnsupportedError(Exception):
+    """播放列表无法直接拼接保存(加密、fMP4分片或不是m3u8)，需要交给ffmpeg录制"""
+
+
+@dataclass
+class Segment:
+    sequence: int
+    duration: float
+    url: str
+
+
+@dataclass
+class Playlist:
+    url: str
+    media_sequence: int = 0
+    target_duration: float = 6.0
+    end_list: bool = False
+    segments: list[Segment] = field(default_factory=list)
+    variants: list[tuple[int, str]] = field(default_factory=list)  # (带宽, 地址)
+
+
+def parse_attributes(text: str) -> dict[str, str]:
+    return {key: value.strip('"') for key, value in _ATTRIBUTE_RE.findall(text)}
+
+
+def parse_playlist(text: str, url: str) -> Playlist:
+    """解析m3u8文本，分片和子播放列表地址都转换为绝对地址"""
+    lines = [line.strip() for line in text.splitlines() if line.strip()]
+    if not lines or not lines[0].startswith('#EXTM3U'):
+        raise HLSUnsupportedError('not a m3u8 playlist')
+    playlist = Playlist(url=url)
+    duration = 0.0
+    bandwidth = None
+    sequence = None
+    for line in lines[1:]:
+        if line.startswith('#EXT-X-MEDIA-SEQUENCE:'):
+            playlist.media_sequence = int(line.split(':', 1)[1])
+        elif line.startswith('#EXT-X-TARGETDURATION:'):
+            playlist.target_duration = float(line.split(':', 1)[1])
+        elif line.startswith('#EXTINF:'):
+            duration = float(line.split(':', 1)[1].split(',', 1)[0] or 0)
+        elif line.startswith('#EXT-X-STREAM-INF:'):
+            bandwidth = int(parse_attributes(line.split(':', 1)[1]).get('BANDWIDTH', 0))
+        elif line.startswith('#EXT-X-ENDLIST'):
+            playlist.end_list = True
+        elif line.startswith('#EXT-X-KEY:'):
+            if parse_attributes(line.split(':', 1)[1]).get('METHOD', 'NONE') != 'NONE':
+                raise HLSUnsupportedError('encrypted segments')
+        elif line.startswith('#EXT-X-MAP:'):
+            raise HLSUnsupportedError('fragmented MP4 segments')
+        elif not line.startswith('#'):
+            if bandwidth is not None:
+                playlist.variants.append((bandwidth, urljoin(url, line)))
+                bandwidth = None
+                continue
+            sequence = playlist.media_sequence if sequence is None else sequence + 1
+            playlist.segments.append(Segment(sequence, duration, urljoin(url, line)))
+            duration = 0.0
+    return playlist
+
+
+def parse_headers(headers: OptionalStr) -> dict[str, str]:
+    """把ffmpeg -headers格式的请求头(key:value，多个以\\r\\n分隔)转换为字典"""
+    result = {}
+    for line in (headers or '').replace('\\r\\n', '\n').splitlines():
+        if ':' in line:
+            key, value = line.split(':', 1)
+            result[key.strip()] = value.strip()
+    return result
+
+
+class HLSRecorder:
+    """
+    内置HLS录制
+
+    在当前线程的事件循环中轮询媒体播放列表，按媒体序列号去重后通过连接池下载新分片，
+    最多同时预取prefetch个分片，按顺序直接追加写入TS文件，不需要为每个直播间启动ffmpeg进程。
+    segment_time不为空时按分片边界分段，save_file_path需包含%03d，每个分段结束时按EXTINF时长追加到分段清单。
+    播放列表加密、使用fMP4分片或首次获取失败时open/run抛出HLSUnsupportedError，由调用方改用ffmpeg录制。
+    """
+
+    def __init__(self, url: str, save_file_path: str, headers: dict | None = None, proxy_addr: OptionalStr = None,
+                 segment_time: float | None = None, prefetch: int = 3, timeout: float = 15.0,
+                 should_stop: Callable[[], bool] | None = None, http2: bool = False):
+        self.url = url
+        self.save_file_path = save_file_path
+        self.headers = headers or {}
+        self.proxy_addr = proxy_addr
+        self.segment_time = segment_time
+        self.prefetch = max(1, prefetch)
+        self.timeout = timeout  # 超过该时间没有新分片视为直播结束
+        self.should_stop = should_stop
+        self.http2 = http2
+        self.stopped = False
+        self.error: OSError | None = None
+        self.segments = 0
+        self.skipped = 0
+        self.bytes_written = 0
+        self.file_paths: list[str] = []
+        self._last_sequence = -1
+        self._recent_urls: deque = deque(maxlen=64)
+        self._file = None
+        self._file_duration = 0.0
+        self._segment_offset = 0.0  # 当前分段相对录制开始的秒数
+        self._playlist: Playlist | None = None
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self._wake: asyncio.Event | None = None
+        self._tasks: set[asyncio.Task] = set()  # 播放列表轮询和正在下载的分片
+
+    def stop(self) -> None:
+        """可在其他线程中调用，立即唤醒等待中的轮询并取消正在进行的请求"""
+        self.stopped = True
+        loop = self._loop
+        if loop is not None:
+            try:
+                loop.call_soon_threadsafe(self._interrupt)
+            except RuntimeError:
+                pass
+
+    def _interrupt(self) -> None:
+        if self._wake:
+            self._wake.set()
+        for task in list(self._tasks):
+            task.cancel()
+
+    def _create_task(self, coro) -> asyncio.Task:
+        task = asyncio.ensure_future(coro)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return task
+
+    def _check_stop(self) -> bool:
+        if not self.stopped and self.should_stop and self.should_stop():
+            self.stopped = True
+        return self.stopped
+
+    async def _sleep(self, delay: float) -> None:
+        end = time.monotonic() + delay
+        while not self._check_stop():
+            remaining = end - time.monotonic()
+            if remaining <= 0:
+                return
+            try:
+                await asyncio.wait_for(self._wake.wait(), min(remaining, 1.0))
+            except asyncio.TimeoutError:
+                pass
+
+    async def _fetch_playlist(self, client: httpx.AsyncClient) -> Playlist:
+        response = await client.get(self.url, headers=self.headers, follow_redirects=True, timeout=self.timeout)
+        response.raise_for_status()
+        playlist = parse_playlist(response.text, str(response.url))
+        if playlist.variants:
+            # 主播放列表，选择码率最高的子播放列表
+            self.url = max(playlist.variants)[1]
+            return await self._fetch_playlist(client)
+        return playlist
+
+    async def _fetch_segment(self, client: httpx.AsyncClient, segment: Segment) -> bytes | None:
+        for _ in range(3):
+            try:
+                response = await client.get(segment.url, headers=self.headers, follow_redirects=True,
+                                            timeout=self.timeout)
+                response.raise_for_status()
+                return response.content
+            except httpx.HTTPError:
+                if self._check_stop():
+                    break
+                await asyncio.sleep(0.5)
+        return None
+
+    def _new_segments(self, playlist: Playlist) -> list[Segment]:
+        segments = playlist.segments
+        if segments and segments[-1].sequence < self._last_sequence and segments[0].url not in self._recent_urls:
+            # 媒体序列号变小且分片地址都没有出现过，说明推流重新开始
+            self._last_sequence = segments[0].sequence - 1
+        new_segments = []
+        for segment in segments:
+            if segment.sequence <= self._last_sequence:
+                continue
+            self._last_sequence = segment.sequence
+            self._recent_urls.append(segment.url)
+            new_segments.append(segment)
+        return new_segments
+
+    def _close_file(self) -> None:
+        if self._file:
+            self._file.close()
+            self._file = None
+            if self.segment_time:
+                append_segment(self.save_file_path, self.file_paths[-1], self._segment_offset,
+                               self._segment_offset + self._file_duration)
+                self._segment_offset += self._file_duration
+
+    def _write(self, segment: Segment, data: bytes) -> None:
+        if self._file and self.segment_time and self._file_duration >= self.segment_time:
+            self._close_file()
+        if self._file is None:
+            file_path = self.save_file_path
+            if self.segment_time:
+                file_path = file_path % len(self.file_paths)
+            self._file = open(file_path, 'wb')
+            self._file_duration = 0.0
+            self.file_paths.append(file_path)
+        self._file.write(data)
+        self._file_duration += segment.duration
+        self.segments += 1
+        self.bytes_written += len(data)
+
+    async def _write_segments(self, queue: asyncio.Queue) -> None:
+        while True:
+            item = await queue.get()
+            if item is None:
+                return
+            segment, task = item
+            if self.stopped:
+                task.cancel()
+                continue
+            # 停止时正在下载的分片被取消，等待它不会让写入任务本身被取消
+            await asyncio.wait({task})
+            data = None if task.cancelled() else task.result()
+            if not data:
+                self.skipped += 1
+                continue
+            try:
+                self._write(segment, data)
+            except OSError as e:
+                # 写入失败(如磁盘已满)时停止录制，剩余的分片不再下载
+                self.error = e
+                self.stopped = True
+
+    async def open(self) -> None:
+        """获取第一次的播放列表，无法使用内置录制时抛出HLSUnsupportedError"""
+        client = get_async_client(self.proxy_addr, http2=self.http2)
+        try:
+            self._playlist = await self._fetch_playlist(client)
+        except (httpx.HTTPError, ValueError) as e:
+            raise HLSUnsupportedError(f'failed to load playlist: {e}') from e
+
+    async def _poll(self, client: httpx.AsyncClient, queue: asyncio.Queue, writer: asyncio.Task) -> None:
+        if self._playlist is None:
+            await self.open()
+        last_update = time.monotonic()
+        while not self._check_stop() and not writer.done():
+            playlist, self._playlist = self._playlist, None
+            if playlist is None:
+                try:
+                    playlist = await self._fetch_playlist(client)
+                except (httpx.HTTPError, ValueError, HLSUnsupportedError):
+                    # 开始录制后不再交给ffmpeg，避免覆盖已录制的文件
+                    if time.monotonic() - last_update > self.timeout:
+                        return
+                    await self._sleep(1)
+                    continue
+            new_segments = self._new_segments(playlist)
+            for segment in new_segments:
+                # 队列已满时等待写入，同时下载中的分片不超过prefetch个
+                await queue.put((segment, self._create_task(self._fetch_segment(client, segment))))
+            if new_segments:
+                last_update = time.monotonic()
+            if playlist.end_list or time.monotonic() - last_update > self.timeout:
+                return
+            # 播放列表没有变化时按目标时长的一半重新获取
+            await self._sleep(playlist.target_duration if new_segments else playlist.target_duration / 2)
+
+    async def run(self) -> int:
+        """录制到直播结束或被停止，写入过分片时返回0，否则返回1"""
+        client = get_async_client(self.proxy_addr, http2=self.http2)
+        queue = asyncio.Queue(maxsize=self.prefetch)
+        self._wake = asyncio.Event()
+        self._loop = asyncio.get_running_loop()
+        writer = asyncio.create_task(self._write_segments(queue))
+        poll = self._create_task(self._poll(client, queue, writer))
+        if self.stopped:
+            self._interrupt()
+        try:
+            await asyncio.wait({poll})
+            if not poll.cancelled():
+                poll.result()
+        finally:
+            poll.cancel()
+            self._loop = None
+            if not writer.done():
+                await queue.put(None)
+            try:
+                await writer
+            finally:
+                while not queue.empty():
+                    item = queue.get_nowait()
+                    if item:
+                        item[1].cancel()
+                self._close_file()
+        if self.error:
+            raise self.error
+        return 0 if self.bytes_written else 1
+
+
+def _process_usage(pid: int | str = 'self') -> tuple[float, int]:
+    """返回进程的CPU时间(秒)和常驻内存(KB)，仅支持Linux"""
+    with open(f'/proc/{pid}/stat') as f:
+        stat = f.read().rsplit(')', 1)[1].split()
+    with open(f'/proc/{pid}/status') as f:
+        rss = next(int(line.split()[1]) for line in f if line.startswith('VmRSS:'))
+    return (int(stat[11]) + int(stat[12])) / os.sysconf('SC_CLK_TCK'), rss
+
+
+def benchmark(recordings: int = 4, duration: float = 30.0, ffmpeg: str = 'ffmpeg') -> dict[str, dict]:
+    """
+    在本地搭建直播HLS源，分别用内置录制和ffmpeg(与main.py相同的参数)同时录制recordings路，
+    比较每路录制占用的CPU时间和常驻内存。需要ffmpeg生成测试分片，仅支持Linux
+    """
+    import shutil
+    import subprocess
+    import tempfile
+    import threading
+    from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+
+    segment_duration = 2
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        origin_dir = os.path.join(tmp_dir, 'origin')
+        os.makedirs(origin_dir)
+        subprocess.run([
+            ffmpeg, '-v', 'error', '-f', 'lavfi', '-i', 'testsrc2=size=1280x720:rate=30',
+            '-f', 'lavfi', '-i', 'sine=frequency=440', '-t', str(duration + 30),
+            '-c:v', 'libx264', '-preset', 'ultrafast', '-b:v', '3M', '-g', '60', '-c:a', 'aac',
+            '-f', 'hls', '-hls_time', str(segment_duration), '-hls_list_size', '0',
+            '-hls_segment_filename', os.path.join(origin_dir, 'seg%d.ts'), os.path.join(origin_dir, 'vod.m3u8')
+        ], check=True)
+        start = time.monotonic()
+
+        class OriginHandler(SimpleHTTPRequestHandler):
+            def __init__(self, *args, **kwargs):
+                super().__init__(*args, directory=origin_dir, **kwargs)
+
+            def log_message(self, *args):
+                pass
+
+            def do_GET(self):
+                if not self.path.startswith('/live.m3u8'):
+                    return super().do_GET()
+                # 按经过的时间滑动最近5个分片，模拟直播播放列表
+                last = int((time.monotonic() - start) / segment_duration)
+                first = max(0, last - 4)
+                body = f'#EXTM3U\n#EXT-X-VERSION:3\n#EXT-X-TARGETDURATION:{segment_duration}\n' \
+                       f'#EXT-X-MEDIA-SEQUENCE:{first}\n'
+                body += ''.join(f'#EXTINF:{segment_duration}.000,\nseg{i}.ts\n' for i in range(first, last + 1))
+                data = body.encode()
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/vnd.apple.mpegurl')
+                self.send_header('Content-Length', str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+        server = ThreadingHTTPServer(('127.0.0.1', 0), OriginHandler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        url = f'http://127.0.0.1:{server.server_address[1]}/live.m3u8'
+        results = {}
+        try:
+            cpu_before, rss_before = _process_usage()
+            recorders = [HLSRecorder(url, os.path.join(tmp_dir, f'native{i}.ts')) for i in range(recordings)]
+            deadline = time.monotonic() + duration
+            for recorder in recorders:
+                recorder.should_stop = lambda: time.monotonic() > deadline
+
+            async def run_all():
+                return await asyncio.gather(*(recorder.run() for recorder in recorders))
+
+            asyncio.run(run_all())
+            cpu_after, rss_after = _process_usage()
+            results['native'] = {
+                'cpu seconds per recording': (cpu_after - cpu_before) / recordings,
+                'rss KB per recording': (rss_after - rss_before) / recordings,
+                'bytes per recording': sum(i.bytes_written for i in recorders) / recordings,
+            }
+
+            processes = [subprocess.Popen([
+                ffmpeg, '-y', '-v', 'error', '-rw_timeout', '15000000', '-re', '-i', url,
+                '-c:v', 'copy', '-c:a', 'copy', '-map', '0', '-f', 'mpegts', os.path.join(tmp_dir, f'ffmpeg{i}.ts')
+            ], stdin=subprocess.PIPE) for i in range(recordings)]
+            time.sleep(duration - 1)
+            usage = [_process_usage(process.pid) for process in processes if process.poll() is None]
+            for process in processes:
+                if process.poll() is None:
+                    process.stdin.write(b'q')
+                    process.stdin.close()
+                process.wait()
+            if not usage:
+                raise RuntimeError(f'ffmpeg exited with {[process.returncode for process in processes]}')
+            results['ffmpeg'] = {
+                'cpu seconds per recording': sum(i[0] for i in usage) / len(usage),
+                'rss KB per recording': sum(i[1] for i in usage) / len(usage),
+                'bytes per recording': sum(os.path.getsize(os.path.join(tmp_dir, f'ffmpeg{i}.ts'))
+                                           for i in range(recordings)) / recordings,
+            }
+        finally:
+            server.shutdown()
+            shutil.rmtree(origin_dir, ignore_errors=True)
+    return results
+
+
+if __name__ == '__main__':
+    for method, usage in benchmark().items():
+        print(method, ', '.join(f'{key}: {value:.2f}' for key, value in usage.items()))
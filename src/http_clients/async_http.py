@@ -1,12 +1,151 @@
 # -*- coding: utf-8 -*-
+import asyncio
+import codecs
+import re
+import threading
+import time
+import weakref
+from http.cookiejar import CookieJar, DefaultCookiePolicy
 import httpx
-from typing import Dict, Any
+from typing import Dict, Any, Iterable
 from .. import utils
 
+try:
+    import re._parser as _re_parser
+except ImportError:  # Python < 3.11
+    import sre_parse as _re_parser
+
 OptionalStr = str | None
 OptionalDict = Dict[str, Any] | None
 
 
+class AsyncClientPool:
+    """
+    Share httpx.AsyncClient instances keyed by (proxy, http2, verify) so that probes reuse
+    keep-alive TCP/TLS/HTTP2 connections instead of handshaking on every request.
+
+    Clients are bound to the event loop that created them, so the pool is kept per loop.
+    Clients of closed loops are dropped and clients that stay idle are closed.
+    """
+
+    def __init__(self, max_connections: int = 100, max_keepalive_connections: int = 20,
+                 keepalive_expiry: float = 30, idle_timeout: float = 300):
+        self.limits = httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_keepalive_connections,
+            keepalive_expiry=keepalive_expiry
+        )
+        self.idle_timeout = idle_timeout
+        self._loops: weakref.WeakKeyDictionary = weakref.WeakKeyDictionary()
+        self._lock = threading.Lock()
+        self._last_sweep = time.monotonic()
+
+    def get_client(self, proxy_addr: OptionalStr = None, http2: bool = True, verify: bool = False) -> httpx.AsyncClient:
+        loop = asyncio.get_running_loop()
+        key = (proxy_addr, http2, verify)
+        now = time.monotonic()
+        with self._lock:
+            clients = self._loops.setdefault(loop, {})
+            entry = clients.get(key)
+            if entry is None or entry[0].is_closed:
+                # the pooled client must never persist cookies between requests of different rooms
+                client = httpx.AsyncClient(
+                    proxy=proxy_addr, verify=verify, http2=http2, limits=self.limits,
+                    cookies=CookieJar(policy=DefaultCookiePolicy(allowed_domains=[]))
+                )
+                entry = clients[key] = [client, now]
+            entry[1] = now
+            if now - self._last_sweep > 60:
+                self._last_sweep = now
+                self._sweep(loop, now)
+            return entry[0]
+
+    def _sweep(self, loop: asyncio.AbstractEventLoop, now: float) -> None:
+        for other_loop in [i for i in self._loops.keys() if i.is_closed()]:
+            del self._loops[other_loop]
+        clients = self._loops.get(loop, {})
+        for key, (client, last_used) in list(clients.items()):
+            if now - last_used > self.idle_timeout:
+                del clients[key]
+                loop.create_task(client.aclose())
+
+    async def aclose(self) -> None:
+        """Close all pooled clients of the running event loop."""
+        with self._lock:
+            clients = self._loops.pop(asyncio.get_running_loop(), {})
+        await _close_clients([client for client, _ in clients.values()])
+
+    def close_all(self, timeout: float = 5) -> None:
+        """
+        Close the pooled clients of every event loop, for use on shutdown from any thread.
+
+        Each client is closed on its own loop: submitted to loops running in another thread and run
+        directly on idle loops. A loop running in the calling thread cannot be waited on and is skipped.
+        """
+        with self._lock:
+            loops = list(self._loops.items())
+            self._loops.clear()
+        try:
+            current_loop = asyncio.get_running_loop()
+        except RuntimeError:
+            current_loop = None
+        for loop, clients in loops:
+            if loop.is_closed() or loop is current_loop or not clients:
+                continue
+            coro = asyncio.wait_for(_close_clients([client for client, _ in clients.values()]), timeout)
+            try:
+                if loop.is_running():
+                    asyncio.run_coroutine_threadsafe(coro, loop).result(timeout + 1)
+                else:
+                    loop.run_until_complete(coro)
+            except Exception as e:
+                coro.close()
+                utils.logger.debug(f'Failed to close pooled HTTP clients: {e}')
+
+
+async def _close_clients(clients: list[httpx.AsyncClient]) -> None:
+    await asyncio.gather(*(client.aclose() for client in clients), return_exceptions=True)
+
+
+client_pool = AsyncClientPool()
+
+
+def get_async_client(proxy_addr: OptionalStr = None, http2: bool = True, verify: bool = False) -> httpx.AsyncClient:
+    return client_pool.get_client(utils.handle_proxy_addr(proxy_addr), http2=http2, verify=verify)
+
+
+def close_client_pool() -> None:
+    """Close every pooled client; safe to call more than once."""
+    client_pool.close_all()
+
+
+async def send_request(client: httpx.AsyncClient, method: str, url: str, headers: OptionalDict = None,
+                       timeout: float = 20, follow_redirects: bool = True, stream: bool = False,
+                       cookies: httpx.Cookies | None = None, **kwargs) -> httpx.Response:
+    """
+    Send a request through a pooled client, following redirects with a cookie jar of its own.
+
+    The pooled clients never store cookies, so cookies set along a redirect chain (login and
+    anti-bot redirects) are collected here and sent on the following hops, as a client created
+    for the single call used to do. Pass the same cookies to several calls to share them between
+    requests; an explicit Cookie header always takes precedence over the jar.
+    """
+    request = client.build_request(method, url, headers=headers, timeout=timeout, **kwargs)
+    if cookies is None:
+        cookies = httpx.Cookies()
+    else:
+        cookies.set_cookie_header(request)
+    for _ in range(client.max_redirects + 1):
+        response = await client.send(request, stream=stream, follow_redirects=False)
+        cookies.extract_cookies(response)
+        if not follow_redirects or response.next_request is None:
+            return response
+        await response.aclose()
+        request = response.next_request
+        cookies.set_cookie_header(request)
+    raise httpx.TooManyRedirects('Exceeded maximum allowed redirects.', request=request)
+
+
 async def async_req(
         url: str,
         proxy_addr: OptionalStr = None,
@@ -25,13 +164,12 @@ async def async_req(
     if headers is None:
         headers = {}
     try:
-        proxy_addr = utils.handle_proxy_addr(proxy_addr)
+        client = get_async_client(proxy_addr, http2=http2, verify=verify)
         if data or json_data:
-            async with httpx.AsyncClient(proxy=proxy_addr, timeout=timeout, verify=verify, http2=http2) as client:
-                response = await client.post(url, data=data, json=json_data, headers=headers)
+            response = await send_request(client, 'POST', url, headers=headers, timeout=timeout,
+                                          follow_redirects=False, data=data, json=json_data)
         else:
-            async with httpx.AsyncClient(proxy=proxy_addr, timeout=timeout, verify=verify, http2=http2) as client:
-                response = await client.get(url, headers=headers, follow_redirects=True)
+            response = await send_request(client, 'GET', url, headers=headers, timeout=timeout)
 
         if redirect_url:
             return str(response.url)
@@ -46,14 +184,207 @@ async def async_req(
     return resp_str
 
 
-async def get_response_status(url: str, proxy_addr: OptionalStr = None, headers: OptionalDict = None,
-                              timeout: int = 10, abroad: bool = False, verify: bool = False, http2=False) -> bool:
+def _literal_suffixes(items: list) -> tuple[str, ...] | None:
+    """Literal texts one of which every match of the parsed pattern items ends with, None if unknown."""
+    chars = []
+    for op, av in reversed(items):
+        if op is _re_parser.LITERAL:
+            chars.append(chr(av))
+            continue
+        if not chars:
+            if op is _re_parser.SUBPATTERN:
+                return _literal_suffixes(list(av[-1]))
+            if op is _re_parser.BRANCH:
+                branches = [_literal_suffixes(list(branch)) for branch in av[1]]
+                if all(branches):
+                    return tuple(suffix for branch in branches for suffix in branch)
+        break
+    return (''.join(reversed(chars)),) if chars else None
+
 
+def _pattern_suffixes(pattern: re.Pattern) -> tuple[str, ...] | None:
+    if pattern.flags & re.IGNORECASE or not isinstance(pattern.pattern, str):
+        return None
     try:
-        proxy_addr = utils.handle_proxy_addr(proxy_addr)
-        async with httpx.AsyncClient(proxy=proxy_addr, timeout=timeout, verify=verify) as client:
-            response = await client.head(url, headers=headers, follow_redirects=True)
-            return response.status_code == 200
+        return _literal_suffixes(list(_re_parser.parse(pattern.pattern, pattern.flags)))
+    except Exception:
+        return None
+
+
+class _StopMatcher:
+    """
+    Track whether every stop marker has appeared in the text read so far.
+
+    Plain strings are searched only in the newly decoded text (plus an overlap of len(marker) - 1).
+    A compiled pattern is only searched again when the new text contains the literal its matches end with
+    (e.g. '</script>'), so chunks that cannot complete a match cost a plain substring scan. The search then
+    resumes from where the previous one ended minus regex_overlap characters, which keeps the total work
+    linear in the page size instead of rescanning the whole buffer for every chunk. A match longer than the
+    overlap is only missed for early termination: reading continues to max_bytes and the caller still
+    searches the full text.
+    """
+
+    regex_overlap = 256 * 1024
+
+    def __init__(self, stop_at: str | re.Pattern | Iterable[str | re.Pattern]):
+        if isinstance(stop_at, (str, re.Pattern)):
+            stop_at = [stop_at]
+        self.pending = list(stop_at)
+        self.suffixes = [_pattern_suffixes(marker) if isinstance(marker, re.Pattern) else None
+                         for marker in self.pending]
+        self.scanned: dict[int, int] = {}
+
+    def done(self, text: str) -> bool:
+        for index, marker in enumerate(self.pending):
+            if marker is None:
+                continue
+            scanned = self.scanned.get(index, 0)
+            if isinstance(marker, str):
+                found = text.find(marker, max(0, scanned - len(marker) + 1)) != -1
+            elif self.suffixes[index] and scanned and not any(
+                    text.find(suffix, max(0, scanned - len(suffix) + 1)) != -1 for suffix in self.suffixes[index]):
+                found = False
+            else:
+                found = marker.search(text, max(0, scanned - self.regex_overlap)) is not None
+            self.scanned[index] = len(text)
+            if found:
+                self.pending[index] = None
+        return all(marker is None for marker in self.pending)
+
+
+async def async_stream_req(
+        url: str,
+        stop_at: str | re.Pattern | Iterable[str | re.Pattern] | None = None,
+        max_bytes: int | None = 4 * 1024 * 1024,
+        proxy_addr: OptionalStr = None,
+        headers: OptionalDict = None,
+        timeout: int = 20,
+        abroad: bool = False,
+        content_conding: str = 'utf-8',
+        verify: bool = False,
+        http2: bool = True
+) -> str:
+    """
+    GET a page incrementally and stop reading once every marker in stop_at has been seen or max_bytes
+    have been received; the rest of the body is never downloaded and the stream is closed.
+    Returns the text read so far, or the error message like async_req.
+    """
+    if headers is None:
+        headers = {}
+    matcher = _StopMatcher(stop_at) if stop_at is not None else None
+    text = ''
+    try:
+        client = get_async_client(proxy_addr, http2=http2, verify=verify)
+        response = await send_request(client, 'GET', url, headers=headers, timeout=timeout, stream=True)
+        try:
+            decoder = codecs.getincrementaldecoder(response.charset_encoding or content_conding)(errors='replace')
+            received = 0
+            async for chunk in response.aiter_bytes():
+                received += len(chunk)
+                text += decoder.decode(chunk)
+                if max_bytes and received >= max_bytes:
+                    break
+                if matcher and matcher.done(text):
+                    break
+            else:
+                text += decoder.decode(b'', final=True)
+        finally:
+            await response.aclose()
+        resp_str = text
     except Exception as e:
-        print(e)
-    return False
+        resp_str = str(e)
+    return resp_str
+
+
+async def get_response_ttfb(url: str, proxy_addr: OptionalStr = None, headers: OptionalDict = None,
+                            timeout: float = 10, verify: bool = False, http2: bool = False) -> float | None:
+    """Return the seconds until the response headers of a successful HEAD request arrived, None on failure."""
+    try:
+        client = get_async_client(proxy_addr, http2=http2, verify=verify)
+        start = time.perf_counter()
+        response = await send_request(client, 'HEAD', url, headers=headers, timeout=timeout)
+        if response.status_code == 200:
+            return time.perf_counter() - start
+    except Exception:
+        pass
+    return None
+
+
+def benchmark(requests: int = 200, http2: bool = False, tls: bool = True) -> dict[str, dict[str, float]]:
+    """
+    Compare the latency of async_req through the client pool with the previous behaviour of creating and
+    closing an httpx.AsyncClient per request, against a local keep-alive server. With tls=True a throwaway
+    self-signed certificate is generated with the openssl command line tool, so every per-request call pays
+    for a TCP and TLS handshake as it would against a live platform API.
+    """
+    import shutil
+    import ssl
+    import statistics
+    import subprocess
+    import tempfile
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    class ApiHandler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+        wbufsize = -1
+        disable_nagle_algorithm = True
+
+        def log_message(self, *args):
+            pass
+
+        def do_GET(self):
+            body = b'{"status": 2}' * 50
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+    async def per_request(url: str) -> str:
+        async with httpx.AsyncClient(timeout=20, verify=False, http2=http2) as client:
+            return (await client.get(url, follow_redirects=True)).text
+
+    async def pooled(url: str) -> str:
+        return await async_req(url, http2=http2)
+
+    async def measure(url: str) -> dict[str, dict[str, float]]:
+        results = {}
+        for name, request in (('per-request client', per_request), ('pooled client', pooled)):
+            await request(url)
+            latencies = []
+            for _ in range(requests):
+                start = time.perf_counter()
+                await request(url)
+                latencies.append((time.perf_counter() - start) * 1000)
+            latencies.sort()
+            results[name] = {'median ms': statistics.median(latencies),
+                             'p95 ms': latencies[int(len(latencies) * 0.95)]}
+        return results
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), ApiHandler)
+    server.daemon_threads = True
+    scheme = 'http'
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        if tls and shutil.which('openssl'):
+            cert, key = f'{tmp_dir}/cert.pem', f'{tmp_dir}/key.pem'
+            subprocess.run(['openssl', 'req', '-x509', '-newkey', 'rsa:2048', '-nodes', '-days', '1',
+                            '-subj', '/CN=localhost', '-keyout', key, '-out', cert],
+                           check=True, capture_output=True)
+            context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+            context.load_cert_chain(cert, key)
+            server.socket = context.wrap_socket(server.socket, server_side=True)
+            scheme = 'https'
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        loop = asyncio.new_event_loop()
+        try:
+            return loop.run_until_complete(measure(f'{scheme}://localhost:{server.server_address[1]}/api'))
+        finally:
+            close_client_pool()
+            loop.close()
+            server.shutdown()
+            server.server_close()
+
+
+if __name__ == '__main__':
+    for method, latency in benchmark().items():
+        print(method, ', '.join(f'{key}: {value:.2f}' for key, value in latency.items()))
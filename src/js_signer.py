@@ -0,0 +1,429 @@
+# -*- encoding: utf-8 -*-
+
+"""
+Function: Load JS signing scripts once into long-lived engine contexts and call them through a bounded pool.
+"""
+import asyncio
+import json
+import os
+import queue
+import shutil
+import subprocess
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Any
+
+from . import JS_SCRIPT_PATH
+
+try:
+    import quickjs
+except ImportError:
+    quickjs = None
+
+# Node端常驻进程：脚本只编译一次，之后逐行读取JSON请求并返回结果
+NODE_WORKER_SOURCE = r"""
+const fs = require('fs');
+const path = require('path');
+const readline = require('readline');
+const vm = require('vm');
+const scriptPath = process.argv[1];
+const freshContext = process.argv[2] === '1';
+const prelude = process.argv[3] ? new vm.Script(process.argv[3], {filename: 'prelude.js'}) : null;
+const script = new vm.Script(fs.readFileSync(scriptPath, 'utf8'), {filename: scriptPath});
+const quiet = {log() {}, info() {}, warn() {}, error() {}, debug() {}};
+
+function createContext() {
+    const module = {exports: {}};
+    const context = vm.createContext({
+        require: p => require(path.resolve(p)), module, exports: module.exports, console: quiet,
+        atob, btoa, Buffer, TextEncoder, TextDecoder, URL, URLSearchParams,
+        setTimeout, clearTimeout, setInterval, clearInterval
+    });
+    if (prelude) prelude.runInContext(context);
+    script.runInContext(context);
+    return context;
+}
+
+let context = freshContext ? null : createContext();
+readline.createInterface({input: process.stdin}).on('line', line => {
+    const request = JSON.parse(line);
+    let response;
+    try {
+        const ctx = context || createContext();
+        response = {id: request.id, result: ctx[request.fn](...request.args)};
+    } catch (e) {
+        response = {id: request.id, error: String(e && e.stack || e)};
+    }
+    process.stdout.write(JSON.stringify(response) + '\n');
+});
+"""
+
+# QuickJS没有require、console和atob/btoa，提供最小实现，require按文件名返回预先加载的模块
+QUICKJS_PRELUDE = """
+var console = {log() {}, info() {}, warn() {}, error() {}, debug() {}};
+var __b64 = 'ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789+/';
+function btoa(s) {
+    var out = '';
+    for (var i = 0; i < s.length; i += 3) {
+        var a = s.charCodeAt(i), b = s.charCodeAt(i + 1), c = s.charCodeAt(i + 2);
+        out += __b64[a >> 2] + __b64[((a & 3) << 4) | (b >> 4 || 0)]
+            + (i + 1 < s.length ? __b64[((b & 15) << 2) | (c >> 6 || 0)] : '=')
+            + (i + 2 < s.length ? __b64[c & 63] : '=');
+    }
+    return out;
+}
+function atob(s) {
+    var out = '', buffer = 0, bits = 0;
+    s = String(s).replace(/[^A-Za-z0-9+/]/g, '');
+    for (var i = 0; i < s.length; i++) {
+        buffer = (buffer << 6) | __b64.indexOf(s[i]);
+        bits += 6;
+        if (bits >= 8) {
+            bits -= 8;
+            out += String.fromCharCode((buffer >> bits) & 255);
+        }
+    }
+    return out;
+}
+var module = {exports: {}};
+var exports = module.exports;
+var __modules = {};
+function require(p) {
+    return __modules[p] || __modules[String(p).split(/[\\\\/]/).pop()];
+}
+"""
+
+
+class JSSignerError(RuntimeError):
+    pass
+
+
+class QuickJSWorker:
+    """在专用线程中持有的QuickJS上下文，QuickJS上下文只能在创建它的线程中使用"""
+
+    backend = 'quickjs'
+
+    def __init__(self, source: str, fresh_context: bool = False, timeout: float | None = None):
+        self.source = source
+        self.fresh_context = fresh_context
+        self.timeout = timeout
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='quickjs')
+        self._context = None
+        self._executor.submit(self._create_context).result()
+
+    def _create_context(self):
+        context = quickjs.Context()
+        context.eval(self.source)
+        if self.timeout:
+            # 超时的调用被中断并抛出JSException，上下文可以继续使用
+            context.set_time_limit(self.timeout)
+        if not self.fresh_context:
+            self._context = context
+        return context
+
+    def _call(self, func: str, args: tuple) -> Any:
+        context = self._context or self._create_context()
+        converted = [
+            arg if isinstance(arg, (type(None), str, bool, int, float)) else context.parse_json(json.dumps(arg))
+            for arg in args
+        ]
+        try:
+            result = context.get(func)(*converted)
+        except quickjs.JSException as e:
+            raise JSSignerError(str(e)) from e
+        if isinstance(result, quickjs.Object):
+            result = json.loads(result.json())
+        return result
+
+    @property
+    def alive(self) -> bool:
+        return True
+
+    def call(self, func: str, *args) -> Any:
+        return self._executor.submit(self._call, func, args).result()
+
+    def close(self) -> None:
+        self._executor.shutdown(wait=False)
+
+
+class NodeWorker:
+    """常驻的Node进程，通过标准输入输出以JSON行通信，超过timeout秒没有返回结果时结束进程"""
+
+    backend = 'node'
+
+    def __init__(self, script_path: str, fresh_context: bool = False, prelude: str = '',
+                 timeout: float | None = None):
+        startupinfo = None
+        if os.name == 'nt':
+            startupinfo = subprocess.STARTUPINFO()
+            startupinfo.dwFlags |= subprocess.STARTF_USESHOWWINDOW
+        self.process = subprocess.Popen(
+            ['node', '-e', NODE_WORKER_SOURCE, str(script_path), '1' if fresh_context else '0', prelude],
+            stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL,
+            text=True, encoding='utf-8', bufsize=1, startupinfo=startupinfo
+        )
+        self.timeout = timeout
+        self._next_id = 0
+        self._responses: queue.Queue = queue.Queue()
+        threading.Thread(target=self._read_responses, name='node-signer-reader', daemon=True).start()
+
+    def _read_responses(self) -> None:
+        for line in self.process.stdout:
+            self._responses.put(line)
+        self._responses.put('')
+
+    @property
+    def alive(self) -> bool:
+        return self.process.poll() is None
+
+    def call(self, func: str, *args) -> Any:
+        self._next_id += 1
+        request = json.dumps({'id': self._next_id, 'fn': func, 'args': args}, ensure_ascii=False)
+        try:
+            self.process.stdin.write(request + '\n')
+            self.process.stdin.flush()
+        except (BrokenPipeError, OSError) as e:
+            raise JSSignerError(f'Node worker exited: {e}') from e
+        try:
+            line = self._responses.get(timeout=self.timeout)
+        except queue.Empty:
+            # 卡住的进程无法再使用，结束后由签名池重新创建
+            self.close()
+            raise JSSignerError(f'Node worker did not respond within {self.timeout} seconds') from None
+        if not line:
+            self.close()
+            raise JSSignerError('Node worker exited unexpectedly')
+        response = json.loads(line)
+        if 'error' in response:
+            raise JSSignerError(response['error'])
+        return response.get('result')
+
+    def close(self) -> None:
+        if self.alive:
+            self.process.kill()
+            self.process.wait()
+
+
+class JSSigner:
+    """
+    一个JS签名脚本的上下文池
+
+    脚本只在创建上下文时加载一次，池中最多pool_size个上下文，超出的调用排队等待。
+    backend为None时优先使用进程内的QuickJS，不可用或脚本无法在QuickJS中加载、调用失败时改用常驻Node进程。
+    fresh_context用于脚本在加载时就生成时间戳等一次性数据的情况，每次调用都在新的上下文中执行脚本。
+    prelude在脚本之前执行，用于补充脚本依赖的浏览器全局对象。
+    单次调用超过timeout秒时QuickJS中断执行，Node进程被结束并在下次调用时重新创建。
+    """
+
+    def __init__(self, script_path: str | Path, modules: tuple = (), backend: str | None = None,
+                 pool_size: int = 2, fresh_context: bool = False, prelude: str = '', timeout: float = 10.0):
+        self.script_path = Path(script_path)
+        self.modules = tuple(Path(i) for i in modules)
+        self.backend = backend
+        self.pool_size = max(1, pool_size)
+        self.fresh_context = fresh_context
+        self.prelude = prelude
+        self.timeout = timeout
+        self._idle: queue.Queue = queue.Queue()
+        self._created = 0
+        self._lock = threading.Lock()
+        self._quickjs_source: str | None = None
+
+    def _build_quickjs_source(self) -> str:
+        if self._quickjs_source is None:
+            parts = [QUICKJS_PRELUDE, self.prelude]
+            for module_path in self.modules:
+                parts.append(
+                    "(function () {var module = {exports: {}}; var exports = module.exports;\n"
+                    f"{module_path.read_text(encoding='utf-8')}\n"
+                    f"__modules[{json.dumps(module_path.name)}] = module.exports;}})();"
+                )
+            parts.append(self.script_path.read_text(encoding='utf-8'))
+            self._quickjs_source = '\n'.join(parts)
+        return self._quickjs_source
+
+    def _create_worker(self) -> QuickJSWorker | NodeWorker:
+        if self.backend in (None, 'quickjs') and quickjs is not None:
+            try:
+                return QuickJSWorker(self._build_quickjs_source(), self.fresh_context, self.timeout)
+            except Exception:
+                if self.backend == 'quickjs':
+                    raise
+                # 脚本依赖Node特有的功能时改用Node
+                self.backend = 'node'
+        if self.backend == 'quickjs':
+            raise JSSignerError('quickjs is not installed')
+        if not shutil.which('node'):
+            raise JSSignerError('Failed to execute JS code. Please check if the Node.js environment')
+        return NodeWorker(self.script_path, self.fresh_context, self.prelude, self.timeout)
+
+    def _acquire(self) -> QuickJSWorker | NodeWorker:
+        while True:
+            try:
+                worker = self._idle.get_nowait()
+            except queue.Empty:
+                with self._lock:
+                    if self._created < self.pool_size:
+                        self._created += 1
+                        try:
+                            return self._create_worker()
+                        except Exception:
+                            self._created -= 1
+                            raise
+                worker = self._idle.get()
+            if worker.backend == 'quickjs' and self.backend == 'node':
+                # 已改用Node，回收剩余的QuickJS上下文
+                self._discard(worker)
+                continue
+            return worker
+
+    def _fall_back_to_node(self, worker: QuickJSWorker | NodeWorker) -> bool:
+        """自动选择后端时，QuickJS中的调用失败后改用Node，返回是否已切换"""
+        if worker.backend != 'quickjs' or self.backend is not None:
+            return False
+        self.backend = 'node'
+        return True
+
+    def _discard(self, worker: QuickJSWorker | NodeWorker) -> None:
+        worker.close()
+        with self._lock:
+            self._created -= 1
+
+    def call(self, func: str, *args) -> Any:
+        worker = self._acquire()
+        try:
+            result = worker.call(func, *args)
+        except JSSignerError:
+            if self._fall_back_to_node(worker):
+                self._discard(worker)
+                return self.call(func, *args)
+            if not worker.alive:
+                self._discard(worker)
+            else:
+                self._idle.put(worker)
+            raise
+        except BaseException:
+            self._discard(worker)
+            raise
+        self._idle.put(worker)
+        return result
+
+    def warm_up(self, func: str | None = None, *args) -> None:
+        """预先创建池中所有上下文，func不为空时在每个上下文中调用一次，确保脚本已经编译完成"""
+        workers = []
+        switched = False
+        try:
+            for _ in range(self.pool_size):
+                workers.append(self._acquire())
+            if func:
+                for worker in workers:
+                    try:
+                        worker.call(func, *args)
+                    except JSSignerError:
+                        if not self._fall_back_to_node(worker):
+                            raise
+                        switched = True
+                        break
+        finally:
+            for worker in workers:
+                self._idle.put(worker)
+        if switched:
+            # 放回的QuickJS上下文在获取时被回收，重新预热Node进程
+            self.warm_up(func, *args)
+
+    def close(self) -> None:
+        while True:
+            try:
+                self._discard(self._idle.get_nowait())
+            except queue.Empty:
+                break
+
+
+# webmssdk.js依赖浏览器的document、window和navigator，签名时读取navigator.userAgent，
+# 因此同一个上下文可以为不同的User-Agent签名
+WEBMSSDK_PRELUDE = """
+var document = {};
+var window = {};
+var navigator = {userAgent: ''};
+function get_sign_with_ua(ms_stub, ua) {
+    navigator.userAgent = ua;
+    return get_sign(ms_stub);
+}
+"""
+
+SIGNER_SCRIPTS = {
+    'x-bogus': dict(script_path=JS_SCRIPT_PATH / 'x-bogus.js'),
+    'liveme': dict(script_path=JS_SCRIPT_PATH / 'liveme.js', modules=(JS_SCRIPT_PATH / 'crypto-js.min.js',),
+                   fresh_context=True),
+    'haixiu': dict(script_path=JS_SCRIPT_PATH / 'haixiu.js', modules=(JS_SCRIPT_PATH / 'crypto-js.min.js',)),
+    'taobao': dict(script_path=JS_SCRIPT_PATH / 'taobao-sign.js'),
+    'webmssdk': dict(script_path=JS_SCRIPT_PATH / 'webmssdk.js', prelude=WEBMSSDK_PRELUDE),
+}
+_signers: dict[str, JSSigner] = {}
+_signers_lock = threading.Lock()
+
+
+def get_signer(name: str) -> JSSigner:
+    signer = _signers.get(name)
+    if signer is None:
+        with _signers_lock:
+            signer = _signers.get(name)
+            if signer is None:
+                signer = _signers[name] = JSSigner(**SIGNER_SCRIPTS[name])
+    return signer
+
+
+def sign(name: str, *args, func: str = 'sign') -> Any:
+    return get_signer(name).call(func, *args)
+
+
+async def sign_async(name: str, *args, func: str = 'sign') -> Any:
+    """在线程中等待签名上下文并签名，不阻塞调用方的事件循环"""
+    return await asyncio.to_thread(sign, name, *args, func=func)
+
+
+def set_pool_size(name: str, pool_size: int) -> None:
+    """调整签名上下文池的大小，已创建的上下文不会被关闭"""
+    get_signer(name).pool_size = max(1, pool_size)
+
+
+def warm_up(name: str, *args, func: str = 'sign') -> None:
+    get_signer(name).warm_up(func, *args)
+
+
+def benchmark(name: str = 'x-bogus', args: tuple = (), seconds: float = 3.0) -> dict[str, float]:
+    """测试每种后端每秒可以生成的签名数"""
+    if not args:
+        args = ('device_platform=webapp&aid=6383&web_rid=123456',
+                'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) '
+                'Chrome/116.0.0.0 Safari/537.36')
+    results = {}
+    for backend in ('quickjs', 'node'):
+        if (backend == 'quickjs' and quickjs is None) or (backend == 'node' and not shutil.which('node')):
+            continue
+        signer = JSSigner(**{**SIGNER_SCRIPTS[name], 'backend': backend, 'pool_size': 1})
+        signer.call('sign', *args)
+        count, start = 0, time.perf_counter()
+        while time.perf_counter() - start < seconds:
+            signer.call('sign', *args)
+            count += 1
+        results[backend] = count / (time.perf_counter() - start)
+        signer.close()
+
+    if shutil.which('node'):
+        # 原来的方式：每次签名都重新读取脚本并启动一个Node进程
+        source = SIGNER_SCRIPTS[name]['script_path'].read_text(encoding='utf-8')
+        call = f"console.log(JSON.stringify(sign(...{json.dumps(args)})))"
+        count, start = 0, time.perf_counter()
+        while time.perf_counter() - start < seconds:
+            subprocess.run(['node', '-e', source + '\n' + call], capture_output=True, check=True)
+            count += 1
+        results['node (spawn per call)'] = count / (time.perf_counter() - start)
+    return results
+
+
+if __name__ == '__main__':
+    for backend_name, rate in benchmark().items():
+        print(f'{backend_name}: {rate:.1f} signatures/s')
@@ -0,0 +1,335 @@
+# -*- encoding: utf-8 -*-
+
+"""
+Function: Platform registry, map a live room host to the way its stream is resolved and recorded.
+"""
+import urllib.parse
+import uuid
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, Mapping
+
+from . import spider, stream
+
+
+@dataclass
+class ProbeContext:
+    """一次直播间检测的输入，以及检测过程中需要回写的内容"""
+    url: str
+    quality: str | None
+    proxy_addr: str | None = None
+    cookies: str = ''
+    accounts: Mapping[str, Any] = field(default_factory=dict)
+    new_record_url: str = ''
+    config_updates: list[tuple[str, str, str]] = field(default_factory=list)  # (section, key, value)
+
+
+Resolver = Callable[[ProbeContext], Awaitable[dict]]
+
+
+@dataclass(frozen=True)
+class Platform:
+    """直播平台描述"""
+    name: str
+    hosts: tuple[str, ...]
+    resolver: Resolver
+    cookie_key: str = ''  # config.ini中[Cookie]下的配置项
+    requires_proxy: bool = False  # 没有可用代理时不进行检测
+    overseas: bool = False  # 海外平台，ffmpeg使用更大的超时和缓冲
+    ffmpeg_headers: str = ''  # 可使用{live_domain}占位符
+    only_flv: bool = False
+    only_audio: bool = False
+    force_http: bool = False
+    clean_url_hosts: tuple[str, ...] = ()  # 这些域名下的地址会去掉查询参数
+
+    def get_ffmpeg_headers(self, live_domain: str) -> str:
+        return self.ffmpeg_headers.format(live_domain=live_domain)
+
+
+class PlatformRegistry:
+    """以规范化后的域名为键的平台表，解析地址和检测直播间都只需要一次字典查找"""
+
+    def __init__(self, custom_platform: Platform | None = None):
+        self.platforms: list[Platform] = []
+        self.hosts: dict[str, Platform] = {}
+        self.custom_platform = custom_platform
+
+    def register(self, platform: Platform) -> Platform:
+        for host in platform.hosts:
+            if host in self.hosts:
+                raise ValueError(f"host {host} is already registered by {self.hosts[host].name}")
+            self.hosts[host] = platform
+        self.platforms.append(platform)
+        return platform
+
+    @staticmethod
+    def normalize_host(host: str) -> str:
+        host = host.lower().split(':')[0]
+        if host.startswith('live.shopee.'):
+            return 'live.shopee.'
+        return host
+
+    def match_host(self, host: str) -> Platform | None:
+        host = self.normalize_host(host)
+        platform = self.hosts.get(host)
+        if platform is None:
+            # 允许以上级域名注册，如shp.ee匹配xx.shp.ee
+            labels = host.split('.')
+            for i in range(1, len(labels) - 1):
+                platform = self.hosts.get('.'.join(labels[i:]))
+                if platform:
+                    break
+        return platform
+
+    def match(self, url: str) -> Platform | None:
+        platform = self.match_host(urllib.parse.urlsplit(url).netloc)
+        if platform is None and self.custom_platform and any(ext in url for ext in (".flv", ".m3u8")):
+            platform = self.custom_platform
+        return platform
+
+
+def spider_resolver(spider_func: Callable[..., Awaitable[dict]]) -> Resolver:
+    """直接返回直播源数据的爬虫"""
+    async def resolve(ctx: ProbeContext) -> dict:
+        return await spider_func(url=ctx.url, proxy_addr=ctx.proxy_addr, cookies=ctx.cookies)
+
+    return resolve
+
+
+def stream_resolver(spider_func: Callable[..., Awaitable[dict]], **stream_kwargs) -> Resolver:
+    """先获取直播间数据，再通过stream.get_stream_url选择清晰度"""
+    async def resolve(ctx: ProbeContext) -> dict:
+        json_data = await spider_func(url=ctx.url, proxy_addr=ctx.proxy_addr, cookies=ctx.cookies)
+        return await stream.get_stream_url(json_data, ctx.quality, **stream_kwargs)
+
+    return resolve
+
+
+async def resolve_douyin(ctx: ProbeContext) -> dict:
+    if 'v.douyin.com' not in ctx.url and '/user/' not in ctx.url:
+        # 先用几KB的状态接口判断是否开播，只有开播时才下载并解析完整的直播间网页
+        status_data = await spider.get_douyin_live_status(
+            url=ctx.url, proxy_addr=ctx.proxy_addr, cookies=ctx.cookies)
+        if status_data and status_data['status'] != 2:
+            return {'anchor_name': status_data['anchor_name'], 'is_live': False}
+        json_data = await spider.get_douyin_stream_data(url=ctx.url, proxy_addr=ctx.proxy_addr, cookies=ctx.cookies)
+    else:
+        json_data = await spider.get_douyin_app_stream_data(
+            url=ctx.url, proxy_addr=ctx.proxy_addr, cookies=ctx.cookies)
+    return await stream.get_douyin_stream_url(json_data, ctx.quality, ctx.proxy_addr)
+
+
+async def resolve_tiktok(ctx: ProbeContext) -> dict:
+    json_data = await spider.get_tiktok_stream_data(url=ctx.url, proxy_addr=ctx.proxy_addr, cookies=ctx.cookies)
+    return await stream.get_tiktok_stream_url(json_data, ctx.quality, ctx.proxy_addr)
+
+
+async def resolve_kuaishou(ctx: ProbeContext) -> dict:
+    json_data = await spider.get_kuaishou_stream_data(url=ctx.url, proxy_addr=ctx.proxy_addr, cookies=ctx.cookies)
+    return await stream.get_kuaishou_stream_url(json_data, ctx.quality)
+
+
+async def resolve_huya(ctx: ProbeContext) -> dict:
+    if ctx.quality not in ['OD', 'BD', 'UHD']:
+        json_data = await spider.get_huya_stream_data(url=ctx.url, proxy_addr=ctx.proxy_addr, cookies=ctx.cookies)
+        return await stream.get_huya_stream_url(json_data, ctx.quality)
+    return await spider.get_huya_app_stream_url(url=ctx.url, proxy_addr=ctx.proxy_addr, cookies=ctx.cookies)
+
+
+async def resolve_douyu(ctx: ProbeContext) -> dict:
+    json_data = await spider.get_douyu_info_data(url=ctx.url, proxy_addr=ctx.proxy_addr, cookies=ctx.cookies)
+    return await stream.get_douyu_stream_url(
+        json_data, video_quality=ctx.quality, cookies=ctx.cookies, proxy_addr=ctx.proxy_addr)
+
+
+async def resolve_yy(ctx: ProbeContext) -> dict:
+    json_data = await spider.get_yy_stream_data(url=ctx.url, proxy_addr=ctx.proxy_addr, cookies=ctx.cookies)
+    return await stream.get_yy_stream_url(json_data)
+
+
+async def resolve_bilibili(ctx: ProbeContext) -> dict:
+    json_data = await spider.get_bilibili_room_info(url=ctx.url, proxy_addr=ctx.proxy_addr, cookies=ctx.cookies)
+    return await stream.get_bilibili_stream_url(
+        json_data, video_quality=ctx.quality, cookies=ctx.cookies, proxy_addr=ctx.proxy_addr)
+
+
+async def resolve_sooplive(ctx: ProbeContext) -> dict:
+    json_data = await spider.get_sooplive_stream_data(
+        url=ctx.url, proxy_addr=ctx.proxy_addr, cookies=ctx.cookies,
+        username=ctx.accounts.get('sooplive_username'),
+        password=ctx.accounts.get('sooplive_password')
+    )
+    if json_data and json_data.get('new_cookies'):
+        ctx.config_updates.append(('Cookie', 'sooplive_cookie', json_data['new_cookies']))
+    return await stream.get_stream_url(json_data, ctx.quality, spec=True)
+
+
+async def resolve_netease(ctx: ProbeContext) -> dict:
+    json_data = await spider.get_netease_stream_data(url=ctx.url, cookies=ctx.cookies)
+    return await stream.get_netease_stream_url(json_data, ctx.quality)
+
+
+async def resolve_flextv(ctx: ProbeContext) -> dict:
+    json_data = await spider.get_flextv_stream_data(
+        url=ctx.url, proxy_addr=ctx.proxy_addr, cookies=ctx.cookies,
+        username=ctx.accounts.get('flextv_username'),
+        password=ctx.accounts.get('flextv_password')
+    )
+    if json_data and json_data.get('new_cookies'):
+        ctx.config_updates.append(('Cookie', 'flextv_cookie', json_data['new_cookies']))
+    return await stream.get_stream_url(json_data, ctx.quality, spec=True)
+
+
+async def resolve_popkontv(ctx: ProbeContext) -> dict:
+    port_info = await spider.get_popkontv_stream_url(
+        url=ctx.url, proxy_addr=ctx.proxy_addr,
+        access_token=ctx.accounts.get('popkontv_access_token'),
+        username=ctx.accounts.get('popkontv_username'),
+        password=ctx.accounts.get('popkontv_password'),
+        partner_code=ctx.accounts.get('popkontv_partner_code')
+    )
+    if port_info and port_info.get('new_token'):
+        ctx.config_updates.append(('Authorization', 'popkontv_token', port_info['new_token']))
+    return port_info
+
+
+async def resolve_twitcasting(ctx: ProbeContext) -> dict:
+    json_data = await spider.get_twitcasting_stream_url(
+        url=ctx.url, proxy_addr=ctx.proxy_addr, cookies=ctx.cookies,
+        account_type=ctx.accounts.get('twitcasting_account_type'),
+        username=ctx.accounts.get('twitcasting_username'),
+        password=ctx.accounts.get('twitcasting_password')
+    )
+    port_info = await stream.get_stream_url(json_data, ctx.quality, spec=False)
+    if port_info and port_info.get('new_cookies'):
+        ctx.config_updates.append(('Cookie', 'twitcasting_cookie', port_info['new_cookies']))
+    return port_info
+
+
+async def resolve_shopee(ctx: ProbeContext) -> dict:
+    port_info = await spider.get_shopee_stream_url(url=ctx.url, proxy_addr=ctx.proxy_addr, cookies=ctx.cookies)
+    if port_info.get('uid'):
+        ctx.new_record_url = ctx.url.split('?')[0] + '?' + str(port_info['uid'])
+    return port_info
+
+
+async def resolve_custom(ctx: ProbeContext) -> dict:
+    port_info = {
+        "anchor_name": '自定义录制直播_' + str(uuid.uuid4())[:8],
+        "is_live": True,
+        "record_url": ctx.url,
+    }
+    if '.flv' in ctx.url:
+        port_info['flv_url'] = ctx.url
+    else:
+        port_info['m3u8_url'] = ctx.url
+    return port_info
+
+
+CUSTOM_PLATFORM = Platform('自定义录制直播', (), resolve_custom)
+
+registry = PlatformRegistry(custom_platform=CUSTOM_PLATFORM)
+
+for _platform in (
+    Platform('抖音直播', ('live.douyin.com', 'v.douyin.com', 'www.douyin.com'), resolve_douyin,
+             cookie_key='抖音cookie', clean_url_hosts=('live.douyin.com',)),
+    Platform('TikTok直播', ('www.tiktok.com',), resolve_tiktok,
+             cookie_key='tiktok_cookie', requires_proxy=True, overseas=True),
+    Platform('快手直播', ('live.kuaishou.com',), resolve_kuaishou, cookie_key='快手cookie'),
+    Platform('虎牙直播', ('www.huya.com',), resolve_huya, cookie_key='虎牙cookie', clean_url_hosts=('www.huya.com',)),
+    Platform('斗鱼直播', ('www.douyu.com',), resolve_douyu, cookie_key='斗鱼cookie'),
+    Platform('YY直播', ('www.yy.com',), resolve_yy, cookie_key='yy_cookie'),
+    Platform('B站直播', ('live.bilibili.com',), resolve_bilibili,
+             cookie_key='B站cookie', clean_url_hosts=('live.bilibili.com',)),
+    Platform('小红书直播', ('www.xiaohongshu.com', 'xhslink.com', 'www.redelight.cn'),
+             spider_resolver(spider.get_xhs_stream_url), cookie_key='小红书cookie'),
+    Platform('Bigo直播', ('www.bigo.tv', 'slink.bigovideo.tv'),
+             spider_resolver(spider.get_bigo_stream_url), cookie_key='bigo_cookie'),
+    Platform('Blued直播', ('app.blued.cn',), spider_resolver(spider.get_blued_stream_url),
+             cookie_key='blued_cookie', ffmpeg_headers='referer:https://app.blued.cn'),
+    Platform('SOOP', ('play.sooplive.co.kr', 'm.sooplive.co.kr'), resolve_sooplive,
+             cookie_key='sooplive_cookie', requires_proxy=True, overseas=True),
+    Platform('网易CC直播', ('cc.163.com',), resolve_netease, cookie_key='netease_cookie'),
+    Platform('千度热播', ('qiandurebo.com',), spider_resolver(spider.get_qiandurebo_stream_data),
+             cookie_key='千度热播_cookie', ffmpeg_headers='referer:https://qiandurebo.com'),
+    Platform('PandaTV', ('www.pandalive.co.kr',), stream_resolver(spider.get_pandatv_stream_data, spec=True),
+             cookie_key='pandatv_cookie', requires_proxy=True, overseas=True,
+             ffmpeg_headers='origin:https://www.pandalive.co.kr'),
+    Platform('猫耳FM直播', ('fm.missevan.com',), spider_resolver(spider.get_maoerfm_stream_url),
+             cookie_key='猫耳fm_cookie', only_audio=True),
+    Platform('WinkTV', ('www.winktv.co.kr',), stream_resolver(spider.get_winktv_stream_data, spec=True),
+             cookie_key='winktv_cookie', requires_proxy=True, overseas=True,
+             ffmpeg_headers='origin:https://www.winktv.co.kr'),
+    Platform('FlexTV', ('www.flextv.co.kr', 'www.ttinglive.com'), resolve_flextv,
+             cookie_key='flextv_cookie', requires_proxy=True, overseas=True,
+             ffmpeg_headers='origin:https://www.flextv.co.kr'),
+    Platform('Look直播', ('look.163.com',), spider_resolver(spider.get_looklive_stream_url),
+             cookie_key='look_cookie', only_audio=True),
+    Platform('PopkonTV', ('www.popkontv.com',), resolve_popkontv, requires_proxy=True, overseas=True,
+             ffmpeg_headers='origin:https://www.popkontv.com'),
+    Platform('TwitCasting', ('twitcasting.tv',), resolve_twitcasting, cookie_key='twitcasting_cookie'),
+    Platform('百度直播', ('live.baidu.com',), stream_resolver(spider.get_baidu_stream_data),
+             cookie_key='baidu_cookie'),
+    Platform('微博直播', ('weibo.com',), stream_resolver(spider.get_weibo_stream_data, hls_extra_key='m3u8_url'),
+             cookie_key='weibo_cookie'),
+    Platform('酷狗直播', ('fanxing.kugou.com', 'fanxing2.kugou.com', 'mfanxing.kugou.com'),
+             spider_resolver(spider.get_kugou_stream_url), cookie_key='kugou_cookie'),
+    Platform('TwitchTV', ('www.twitch.tv',), stream_resolver(spider.get_twitchtv_stream_data, spec=True),
+             cookie_key='twitch_cookie', requires_proxy=True, overseas=True),
+    Platform('LiveMe', ('www.liveme.com',), spider_resolver(spider.get_liveme_stream_url),
+             cookie_key='liveme_cookie', requires_proxy=True, overseas=True, clean_url_hosts=('www.liveme.com',)),
+    Platform('花椒直播', ('www.huajiao.com',), spider_resolver(spider.get_huajiao_stream_url),
+             cookie_key='huajiao_cookie', only_flv=True, clean_url_hosts=('www.huajiao.com',)),
+    Platform('流星直播', ('www.7u66.com', 'wap.7u66.com'), spider_resolver(spider.get_liuxing_stream_url),
+             cookie_key='liuxing_cookie'),
+    Platform('ShowRoom', ('www.showroom-live.com',), stream_resolver(spider.get_showroom_stream_data, spec=True),
+             cookie_key='showroom_cookie', overseas=True),
+    Platform('Acfun', ('live.acfun.cn', 'm.acfun.cn'),
+             stream_resolver(spider.get_acfun_stream_data, url_type='flv', flv_extra_key='url'),
+             cookie_key='acfun_cookie'),
+    Platform('畅聊直播', ('live.tlclw.com', 'wap.tlclw.com'), spider_resolver(spider.get_changliao_stream_url),
+             cookie_key='changliao_cookie'),
+    Platform('音播直播', ('live.ybw1666.com', 'wap.ybw1666.com'), spider_resolver(spider.get_yinbo_stream_url),
+             cookie_key='yinbo_cookie'),
+    Platform('映客直播', ('www.inke.cn',), spider_resolver(spider.get_yingke_stream_url), cookie_key='yingke_cookie'),
+    Platform('知乎直播', ('www.zhihu.com',), spider_resolver(spider.get_zhihu_stream_url),
+             cookie_key='zhihu_cookie', clean_url_hosts=('www.zhihu.com',)),
+    Platform('CHZZK', ('chzzk.naver.com', 'm.chzzk.naver.com'),
+             stream_resolver(spider.get_chzzk_stream_data, spec=True),
+             cookie_key='chzzk_cookie', overseas=True, clean_url_hosts=('chzzk.naver.com',)),
+    Platform('嗨秀直播', ('www.haixiutv.com',), spider_resolver(spider.get_haixiu_stream_url),
+             cookie_key='haixiu_cookie', clean_url_hosts=('www.haixiutv.com',)),
+    Platform('VV星球', ('h5webcdnp.vvxqiu.com',), spider_resolver(spider.get_vvxqiu_stream_url),
+             cookie_key='vvxqiu_cookie'),
+    Platform('17Live', ('17.live',), spider_resolver(spider.get_17live_stream_url),
+             cookie_key='17live_cookie', ffmpeg_headers='referer:https://17.live/en/live/6302408'),
+    Platform('浪Live', ('www.lang.live',), spider_resolver(spider.get_langlive_stream_url),
+             cookie_key='langlive_cookie', ffmpeg_headers='referer:https://www.lang.live'),
+    Platform('漂漂直播', ('m.pp.weimipopo.com',), spider_resolver(spider.get_pplive_stream_url),
+             cookie_key='pplive_cookie'),
+    Platform('六间房直播', ('v.6.cn', 'm.6.cn'), spider_resolver(spider.get_6room_stream_url),
+             cookie_key='6room_cookie', clean_url_hosts=('v.6.cn', 'm.6.cn')),
+    Platform('乐嗨直播', ('www.lehaitv.com',), spider_resolver(spider.get_haixiu_stream_url),
+             cookie_key='lehaitv_cookie', clean_url_hosts=('www.lehaitv.com',)),
+    Platform('花猫直播', ('h.catshow168.com',), spider_resolver(spider.get_pplive_stream_url),
+             cookie_key='huamao_cookie'),
+    Platform('shopee', ('live.shopee.', 'shp.ee'), resolve_shopee, cookie_key='shopee_cookie', overseas=True,
+             ffmpeg_headers='origin:{live_domain}', only_flv=True, force_http=True),
+    Platform('Youtube', ('www.youtube.com', 'youtu.be'), stream_resolver(spider.get_youtube_stream_url, spec=True),
+             cookie_key='youtube_cookie', overseas=True),
+    Platform('淘宝直播', ('e.tb.cn', 'huodong.m.taobao.com'),
+             stream_resolver(spider.get_taobao_stream_url, url_type='all', hls_extra_key='hlsUrl',
+                             flv_extra_key='flvUrl'),
+             cookie_key='taobao_cookie'),
+    Platform('京东直播', ('3.cn', 'eco.m.jd.com'), spider_resolver(spider.get_jd_stream_url), cookie_key='jd_cookie'),
+    Platform('faceit', ('www.faceit.com',), stream_resolver(spider.get_faceit_stream_data, spec=True),
+             cookie_key='faceit_cookie', requires_proxy=True, overseas=True),
+    Platform('咪咕直播', ('www.miguvideo.com', 'm.miguvideo.com'), spider_resolver(spider.get_migu_stream_url),
+             cookie_key='migu_cookie'),
+    Platform('连接直播', ('show.lailianjie.com',), spider_resolver(spider.get_lianjie_stream_url),
+             cookie_key='lianjie_cookie'),
+    Platform('来秀直播', ('www.imkktv.com',), spider_resolver(spider.get_laixiu_stream_url),
+             cookie_key='laixiu_cookie'),
+    Platform('Picarto', ('www.picarto.tv',), spider_resolver(spider.get_picarto_stream_url),
+             cookie_key='picarto_cookie'),
+):
+    registry.register(_platform)
@@ -0,0 +1,204 @@
+# -*- encoding: utf-8 -*-
+
+"""
+Function: Persistent post-processing job queue with a bounded low-priority worker pool.
+"""
+import heapq
+import itertools
+import json
+import os
+import shutil
+import subprocess
+import threading
+import time
+from collections import deque
+from pathlib import Path
+from typing import Callable
+
+from .logger import logger
+
+# 优先级数值越小越先执行
+PRIORITY_REMUX = 0
+PRIORITY_SCRIPT = 5
+PRIORITY_ENCODE = 10
+
+
+def lower_priority(command: list[str]) -> tuple[list[str], dict]:
+    """返回以较低CPU和磁盘IO优先级运行command所需的命令和Popen参数"""
+    if os.name == 'nt':
+        return command, {'creationflags': subprocess.BELOW_NORMAL_PRIORITY_CLASS}
+    prefix = []
+    if shutil.which('ionice'):
+        prefix += ['ionice', '-c', '2', '-n', '7']
+    if shutil.which('nice'):
+        prefix += ['nice', '-n', '10']
+    return prefix + command, {}
+
+
+class PostProcessQueue:
+    """
+    录制完成后的后处理队列
+
+    转码和自定义脚本作为任务加入队列，由固定数量的工作线程按优先级执行，不再为每个文件启动一个线程。
+    工作线程数默认取CPU核数的一半，系统负载超过CPU核数时暂缓开始新任务。
+    任务失败后按retry_delay递增的间隔重试，最多执行max_attempts次。
+    所有未完成的任务保存在state_file中，程序重启后继续执行，执行中被中断的任务重新开始。
+    after中的任务完成(或最终失败)后才会开始当前任务，用于让自定义脚本在转码之后执行。
+    """
+
+    def __init__(self, state_file: str | Path | None = None, workers: int = 0, max_attempts: int = 3,
+                 retry_delay: float = 60.0, max_load: float | None = None):
+        self.state_file = Path(state_file) if state_file else None
+        self.workers = workers or max(1, (os.cpu_count() or 2) // 2)
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+        self.max_load = max_load if max_load is not None else float(os.cpu_count() or 1)
+        self.handlers: dict[str, Callable] = {}
+        self.completed = 0
+        self.failed = 0
+        self._jobs: dict[int, dict] = {}
+        self._heap: list[tuple[int, float, int]] = []  # (优先级, 加入时间, 任务id)
+        self._running: set[int] = set()
+        self._finished_times: deque = deque(maxlen=1000)
+        self._ids = itertools.count(1)
+        self._condition = threading.Condition()
+        self._threads: list[threading.Thread] = []
+        self._load()
+
+    def register(self, kind: str, handler: Callable) -> None:
+        """注册任务类型，handler以任务的kwargs调用，抛出异常视为失败"""
+        self.handlers[kind] = handler
+
+    def start(self, workers: int = 0) -> None:
+        """启动工作线程，workers为0时使用默认的线程数"""
+        with self._condition:
+            if self._threads:
+                return
+            self.workers = workers or self.workers
+            for i in range(self.workers):
+                thread = threading.Thread(target=self._work, name=f'postprocess-{i}', daemon=True)
+                self._threads.append(thread)
+                thread.start()
+
+    def submit(self, kind: str, priority: int = PRIORITY_REMUX, after: list[int] | None = None,
+               **kwargs) -> int:
+        """加入一个任务并返回任务id"""
+        with self._condition:
+            job_id = next(self._ids)
+            job = self._jobs[job_id] = {
+                'id': job_id, 'kind': kind, 'kwargs': kwargs, 'priority': priority,
+                'after': [i for i in after or [] if i in self._jobs], 'attempts': 0, 'not_before': 0.0,
+                'created': time.time()
+            }
+            heapq.heappush(self._heap, (priority, job['created'], job_id))
+            self._save()
+            self._condition.notify()
+        return job_id
+
+    def _load(self) -> None:
+        if not self.state_file or not self.state_file.exists():
+            return
+        try:
+            jobs = json.loads(self.state_file.read_text(encoding='utf-8'))
+        except (OSError, ValueError) as e:
+            logger.error(f'读取后处理队列失败: {e}')
+            return
+        for job in jobs:
+            job['not_before'] = 0.0
+            self._jobs[job['id']] = job
+            heapq.heappush(self._heap, (job['priority'], job['created'], job['id']))
+        if jobs:
+            self._ids = itertools.count(max(self._jobs) + 1)
+            logger.info(f'恢复了{len(jobs)}个未完成的后处理任务')
+
+    def _save(self) -> None:
+        if not self.state_file:
+            return
+        temp_file = self.state_file.with_suffix('.tmp')
+        try:
+            temp_file.write_text(json.dumps(list(self._jobs.values()), ensure_ascii=False), encoding='utf-8')
+            os.replace(temp_file, self.state_file)
+        except OSError as e:
+            logger.error(f'保存后处理队列失败: {e}')
+
+    def _overloaded(self) -> bool:
+        try:
+            return os.getloadavg()[0] > self.max_load
+        except (AttributeError, OSError):
+            return False
+
+    def _next_job(self) -> tuple[dict | None, float]:
+        """返回可以开始的优先级最高的任务，没有时返回(None, 最多等待的秒数)"""
+        now = time.time()
+        skipped = []
+        job, wait = None, 60.0
+        while self._heap:
+            item = heapq.heappop(self._heap)
+            candidate = self._jobs.get(item[2])
+            if candidate is None:
+                continue
+            if candidate['not_before'] > now:
+                wait = min(wait, candidate['not_before'] - now)
+            elif not any(i in self._jobs for i in candidate['after']):
+                job = candidate
+                break
+            skipped.append(item)
+        for item in skipped:
+            heapq.heappush(self._heap, item)
+        return job, wait
+
+    def _work(self) -> None:
+        while True:
+            with self._condition:
+                job, wait = self._next_job()
+                if job is None:
+                    self._condition.wait(wait)
+                    continue
+                self._running.add(job['id'])
+            if self._overloaded():
+                # 负载过高时不开始新任务，避免影响正在进行的录制
+                with self._condition:
+                    self._running.discard(job['id'])
+                    heapq.heappush(self._heap, (job['priority'], job['created'], job['id']))
+                time.sleep(5)
+                continue
+            self._run(job)
+
+    def _run(self, job: dict) -> None:
+        job['attempts'] += 1
+        start = time.time()
+        try:
+            handler = self.handlers[job['kind']]
+            handler(**job['kwargs'])
+            ok = True
+        except Exception as e:
+            ok = False
+            logger.error(f"后处理任务{job['kind']}第{job['attempts']}次执行失败: {e}")
+        with self._condition:
+            self._running.discard(job['id'])
+            if ok or job['attempts'] >= self.max_attempts:
+                del self._jobs[job['id']]
+                if ok:
+                    self.completed += 1
+                    self._finished_times.append((time.time(), time.time() - start))
+                else:
+                    self.failed += 1
+            else:
+                job['not_before'] = time.time() + self.retry_delay * job['attempts']
+                heapq.heappush(self._heap, (job['priority'], job['created'], job['id']))
+            self._save()
+            self._condition.notify_all()
+
+    def status(self) -> dict:
+        """队列深度和最近一小时的吞吐量"""
+        with self._condition:
+            now = time.time()
+            recent = [duration for finished, duration in self._finished_times if now - finished < 3600]
+            return {
+                'pending': len(self._jobs) - len(self._running),
+                'running': len(self._running),
+                'completed': self.completed,
+                'failed': self.failed,
+                'last_hour': len(recent),
+                'average_seconds': sum(recent) / len(recent) if recent else 0.0,
+            }
@@ -0,0 +1,210 @@
+# -*- encoding: utf-8 -*-
+
+"""
+Function: Central supervisor that waits on all recording child processes and in-process recorders and stops them on request.
+"""
+import os
+import selectors
+import signal
+import subprocess
+import threading
+import time
+from typing import Callable, Iterable
+
+from .logger import logger
+
+
+class SupervisedProcess:
+    """由ProcessSupervisor管理的子进程，done在进程退出后被设置"""
+
+    def __init__(self, key: str, process: subprocess.Popen, on_exit: Callable[[int], None] | None = None):
+        self.key = key
+        self.process = process
+        self.on_exit = on_exit
+        self.returncode: int | None = None
+        self.stop_requested = False
+        self.done = threading.Event()
+
+    def wait(self, timeout: float | None = None) -> int | None:
+        self.done.wait(timeout)
+        return self.returncode
+
+    def stop(self) -> None:
+        """请求ffmpeg正常结束，Windows下发送q，其他系统发送SIGINT"""
+        if self.done.is_set() or self.process.poll() is not None:
+            return
+        self.stop_requested = True
+        try:
+            if os.name == 'nt':
+                if self.process.stdin:
+                    self.process.stdin.write(b'q')
+                    self.process.stdin.close()
+            else:
+                self.process.send_signal(signal.SIGINT)
+        except (OSError, ValueError):
+            pass
+
+    def kill(self) -> None:
+        self.process.kill()
+
+
+class SupervisedRecorder:
+    """
+    由ProcessSupervisor管理的进程内录制(内置HLS/FLV录制)
+
+    stop调用录制器的停止方法，录制线程在录制结束、文件已关闭后调用finish，之后done被设置。
+    """
+
+    def __init__(self, key: str, stop: Callable[[], None], release: Callable[['SupervisedRecorder'], None]):
+        self.key = key
+        self.returncode: int | None = None
+        self.stop_requested = False
+        self.done = threading.Event()
+        self._stop = stop
+        self._release = release
+
+    def wait(self, timeout: float | None = None) -> int | None:
+        self.done.wait(timeout)
+        return self.returncode
+
+    def stop(self) -> None:
+        if self.done.is_set():
+            return
+        self.stop_requested = True
+        try:
+            self._stop()
+        except Exception as e:
+            logger.error(f'停止录制出错: {e}')
+
+    def kill(self) -> None:
+        """进程内的录制无法强制结束，只能等待其自行退出"""
+
+    def finish(self, returncode: int) -> None:
+        self.returncode = returncode
+        self._release(self)
+        self.done.set()
+
+
+class ProcessSupervisor:
+    """
+    子进程监督
+
+    所有录制用的ffmpeg进程注册到同一个监督线程，Linux下通过pidfd和selector在进程退出时立即被唤醒，
+    不支持pidfd时每个进程使用一个阻塞在wait上的线程，两种方式都不需要定时轮询。
+    内置HLS/FLV录制通过track登记停止方法，由录制线程在结束时调用finish。
+    停止请求直接发送信号或调用停止方法，stop_all同时停止所有录制后再统一等待。
+    """
+
+    def __init__(self):
+        self._processes: dict[str, SupervisedProcess | SupervisedRecorder] = {}
+        self._lock = threading.Lock()
+        self._selector: selectors.BaseSelector | None = None
+        self._pending: list[tuple[int, SupervisedProcess]] = []
+        self._wake_r = self._wake_w = -1
+
+    def _start(self) -> None:
+        self._selector = selectors.DefaultSelector()
+        self._wake_r, self._wake_w = os.pipe()
+        os.set_blocking(self._wake_r, False)
+        self._selector.register(self._wake_r, selectors.EVENT_READ)
+        threading.Thread(target=self._run, name='process-supervisor', daemon=True).start()
+
+    def _run(self) -> None:
+        while True:
+            for key, _ in self._selector.select():
+                if key.fd == self._wake_r:
+                    try:
+                        os.read(self._wake_r, 4096)
+                    except BlockingIOError:
+                        pass
+                    with self._lock:
+                        pending, self._pending = self._pending, []
+                    for pidfd, item in pending:
+                        self._selector.register(pidfd, selectors.EVENT_READ, item)
+                else:
+                    self._selector.unregister(key.fd)
+                    os.close(key.fd)
+                    self._finish(key.data)
+
+    def _wait_thread(self, item: SupervisedProcess) -> None:
+        item.process.wait()
+        self._finish(item)
+
+    def _release(self, item: SupervisedProcess | SupervisedRecorder) -> None:
+        with self._lock:
+            if self._processes.get(item.key) is item:
+                del self._processes[item.key]
+
+    def _finish(self, item: SupervisedProcess) -> None:
+        item.returncode = item.process.wait()
+        self._release(item)
+        item.done.set()
+        if item.on_exit:
+            try:
+                item.on_exit(item.returncode)
+            except Exception as e:
+                logger.error(f'进程退出回调出错: {e}')
+
+    def register(self, key: str, process: subprocess.Popen,
+                 on_exit: Callable[[int], None] | None = None) -> SupervisedProcess:
+        """开始监督子进程，进程退出后设置done并调用on_exit(返回码)"""
+        item = SupervisedProcess(key, process, on_exit)
+        pidfd = None
+        if hasattr(os, 'pidfd_open'):
+            try:
+                pidfd = os.pidfd_open(process.pid)
+            except OSError:
+                pass
+        with self._lock:
+            self._processes[key] = item
+            if pidfd is not None:
+                if self._selector is None:
+                    self._start()
+                self._pending.append((pidfd, item))
+        if pidfd is not None:
+            os.write(self._wake_w, b'\0')
+        else:
+            threading.Thread(target=self._wait_thread, args=(item,), daemon=True).start()
+        return item
+
+    def track(self, key: str, stop: Callable[[], None]) -> SupervisedRecorder:
+        """登记进程内的录制，stop可在任意线程中调用；录制结束后须调用返回值的finish(返回码)"""
+        item = SupervisedRecorder(key, stop, self._release)
+        with self._lock:
+            self._processes[key] = item
+        return item
+
+    def stop(self, key: str) -> bool:
+        with self._lock:
+            item = self._processes.get(key)
+        if item is None:
+            return False
+        item.stop()
+        return True
+
+    def stop_keys(self, keys: Iterable[str]) -> None:
+        """停止key在keys中的所有进程，用于直播间被注释后立即结束录制"""
+        keys = set(keys)
+        with self._lock:
+            items = [item for key, item in self._processes.items() if key in keys]
+        for item in items:
+            item.stop()
+
+    def stop_all(self, timeout: float | None = None) -> None:
+        """同时停止所有录制，timeout不为空时最多等待timeout秒，仍未退出的进程被强制结束"""
+        with self._lock:
+            items = list(self._processes.values())
+        for item in items:
+            item.stop()
+        if timeout is None:
+            return
+        deadline = time.monotonic() + timeout
+        for item in items:
+            if not item.done.wait(max(0.0, deadline - time.monotonic())):
+                item.kill()
+
+    def __len__(self) -> int:
+        return len(self._processes)
+
+
+supervisor = ProcessSupervisor()
@@ -0,0 +1,194 @@
+# -*- encoding: utf-8 -*-
+
+"""
+Function: Per-host token bucket and AIMD concurrency limiter for live room probes.
+"""
+import asyncio
+import threading
+import time
+from contextlib import asynccontextmanager, contextmanager
+from dataclasses import dataclass
+
+
+@dataclass
+class Probe:
+    """一次检测的结果，由调用方在检测结束前标记是否成功"""
+    ok: bool = True
+
+
+class HostLimiter:
+    """
+    单个平台(域名)的限流器
+
+    令牌桶限制每秒发起的检测数；并发上限按AIMD调整：检测成功时缓慢增加，
+    检测失败或延迟明显变大时减半，每个平台只受自己的错误和延迟影响。
+    """
+
+    def __init__(self, host: str, max_concurrency: int = 3, rate: float = 0, burst: int = 5):
+        self.host = host
+        self.max_concurrency = max(1, max_concurrency)
+        self.limit = float(self.max_concurrency)
+        self.rate = rate
+        self.burst = max(1, burst)
+        self.tokens = float(self.burst)
+        self.active = 0
+        self.waiting = 0
+        self.errors = 0
+        self.latency: float | None = None  # 检测耗时的指数加权平均
+        self.min_latency: float | None = None
+        self._last_refill = time.monotonic()
+        self._last_decrease = 0.0
+        self._cond = threading.Condition()
+        self._async_waiters: list[tuple[asyncio.AbstractEventLoop, asyncio.Future]] = []
+
+    def configure(self, max_concurrency: int, rate: float, burst: int) -> None:
+        with self._cond:
+            self.max_concurrency = max(1, max_concurrency)
+            self.limit = min(self.limit, self.max_concurrency)
+            self.rate = rate
+            self.burst = max(1, burst)
+            self._notify()
+
+    def _refill(self, now: float) -> None:
+        if self.rate > 0:
+            self.tokens = min(self.burst, self.tokens + (now - self._last_refill) * self.rate)
+        else:
+            self.tokens = self.burst
+        self._last_refill = now
+
+    def _try_acquire(self, now: float) -> float | None:
+        """获取成功返回0，否则返回需要等待的秒数，None表示等待其他检测结束"""
+        self._refill(now)
+        if self.active >= int(self.limit):
+            return None
+        if self.tokens < 1:
+            return (1 - self.tokens) / self.rate
+        self.tokens -= 1
+        self.active += 1
+        return 0
+
+    def _notify(self) -> None:
+        self._cond.notify_all()
+        for loop, future in self._async_waiters:
+            if not loop.is_closed():
+                loop.call_soon_threadsafe(_wake_future, future)
+        self._async_waiters.clear()
+
+    def acquire(self) -> None:
+        with self._cond:
+            self.waiting += 1
+            try:
+                while True:
+                    wait = self._try_acquire(time.monotonic())
+                    if wait == 0:
+                        return
+                    self._cond.wait(wait)
+            finally:
+                self.waiting -= 1
+
+    async def acquire_async(self) -> None:
+        loop = asyncio.get_running_loop()
+        with self._cond:
+            self.waiting += 1
+        try:
+            while True:
+                with self._cond:
+                    wait = self._try_acquire(time.monotonic())
+                    if wait == 0:
+                        return
+                    future = loop.create_future()
+                    self._async_waiters.append((loop, future))
+                try:
+                    await asyncio.wait_for(future, wait)
+                except asyncio.TimeoutError:
+                    pass
+        finally:
+            with self._cond:
+                self.waiting -= 1
+
+    def release(self, ok: bool, latency: float) -> None:
+        now = time.monotonic()
+        with self._cond:
+            self.active -= 1
+            self.latency = latency if self.latency is None else self.latency * 0.8 + latency * 0.2
+            self.min_latency = latency if self.min_latency is None else min(self.min_latency, latency)
+            congested = latency > max(2.0, self.min_latency * 4)
+            if not ok or congested:
+                self.errors += not ok
+                # 同一批并发检测的失败只减半一次
+                if now - self._last_decrease > max(1.0, self.latency):
+                    self.limit = max(1.0, self.limit / 2)
+                    self._last_decrease = now
+            else:
+                self.limit = min(float(self.max_concurrency), self.limit + 1 / self.limit)
+            self._notify()
+
+    def status(self) -> str:
+        return f"{self.host} 并发{self.active}/{int(self.limit)} 排队{self.waiting}"
+
+
+def _wake_future(future: asyncio.Future) -> None:
+    if not future.done():
+        future.set_result(None)
+
+
+class RateLimiter:
+    """按平台(域名)划分的限流器集合"""
+
+    def __init__(self, max_concurrency: int = 3, rate: float = 0, burst: int = 5):
+        self.max_concurrency = max_concurrency
+        self.rate = rate
+        self.burst = burst
+        self.hosts: dict[str, HostLimiter] = {}
+        self._lock = threading.Lock()
+
+    def configure(self, max_concurrency: int, rate: float = 0, burst: int = 5) -> None:
+        if (max_concurrency, rate, burst) == (self.max_concurrency, self.rate, self.burst):
+            return
+        self.max_concurrency, self.rate, self.burst = max_concurrency, rate, burst
+        with self._lock:
+            limiters = list(self.hosts.values())
+        for limiter in limiters:
+            limiter.configure(max_concurrency, rate, burst)
+
+    def get(self, host: str) -> HostLimiter:
+        limiter = self.hosts.get(host)
+        if limiter is None:
+            with self._lock:
+                limiter = self.hosts.get(host)
+                if limiter is None:
+                    limiter = self.hosts[host] = HostLimiter(host, self.max_concurrency, self.rate, self.burst)
+        return limiter
+
+    @contextmanager
+    def slot(self, host: str):
+        limiter = self.get(host)
+        limiter.acquire()
+        probe = Probe()
+        start = time.monotonic()
+        try:
+            yield probe
+        except Exception:
+            probe.ok = False
+            raise
+        finally:
+            limiter.release(probe.ok, time.monotonic() - start)
+
+    @asynccontextmanager
+    async def slot_async(self, host: str):
+        limiter = self.get(host)
+        await limiter.acquire_async()
+        probe = Probe()
+        start = time.monotonic()
+        try:
+            yield probe
+        except Exception:
+            probe.ok = False
+            raise
+        finally:
+            limiter.release(probe.ok, time.monotonic() - start)
+
+    def status(self) -> list[str]:
+        with self._lock:
+            limiters = list(self.hosts.values())
+        return [limiter.status() for limiter in limiters]
@@ -0,0 +1,170 @@
+# -*- encoding: utf-8 -*-
+
+"""
+Function: Central poll scheduler, wake each room from a timer heap with an interval derived from its history.
+"""
+import asyncio
+import heapq
+import itertools
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Callable
+
+
+@dataclass
+class RoomHistory:
+    """单个直播间最近的开播记录"""
+    first_seen: float = field(default_factory=time.time)
+    last_live: float | None = None
+    is_live: bool = False
+    start_minutes: deque = field(default_factory=lambda: deque(maxlen=14))  # 最近几次开播时间(一天中的第几分钟)
+
+    def record(self, is_live: bool, now: float) -> None:
+        if is_live:
+            if not self.is_live:
+                local = time.localtime(now)
+                self.start_minutes.append(local.tm_hour * 60 + local.tm_min)
+            self.last_live = now
+        self.is_live = is_live
+
+    def near_usual_start(self, now: float, window: int = 30) -> bool:
+        local = time.localtime(now)
+        minute = local.tm_hour * 60 + local.tm_min
+        for start in self.start_minutes:
+            diff = abs(minute - start)
+            if min(diff, 1440 - diff) <= window:
+                return True
+        return False
+
+
+class PollScheduler:
+    """
+    直播间检测调度器
+
+    所有直播间的下一次检测时间保存在一个最小堆中，由一个调度线程按时间顺序唤醒，
+    并按每秒最多检测数限制整体的检测速率。adaptive开启后检测间隔根据开播历史计算：
+    最近开过播或接近常规开播时间的直播间检测得更频繁，长期未开播的直播间间隔逐渐拉长。
+    """
+
+    def __init__(self, base_interval: float = 120, min_interval: float = 30, max_interval: float = 1800,
+                 probes_per_second: float = 0, adaptive: bool = False):
+        self.base_interval = base_interval
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.probes_per_second = probes_per_second
+        self.adaptive = adaptive
+        self.history: dict[str, RoomHistory] = {}
+        self.labels: dict[str, str] = {}
+        self._heap: list[tuple[float, int, str]] = []
+        self._due: dict[str, float] = {}
+        self._waiters: dict[str, Callable[[], None]] = {}
+        self._seq = itertools.count()
+        self._cond = threading.Condition()
+        self._thread: threading.Thread | None = None
+
+    def record(self, key: str, is_live: bool) -> None:
+        """记录一次检测结果"""
+        history = self.history.get(key)
+        if history is None:
+            history = self.history[key] = RoomHistory()
+        history.record(bool(is_live), time.time())
+
+    def next_interval(self, key: str) -> float:
+        """根据直播间的开播历史计算下一次检测间隔"""
+        if not self.adaptive:
+            return self.base_interval
+        history = self.history.get(key)
+        if history is None:
+            return self.base_interval
+
+        now = time.time()
+        if history.is_live or history.near_usual_start(now):
+            return max(self.min_interval, self.base_interval / 2)
+        idle_hours = (now - (history.last_live or history.first_seen)) / 3600
+        if idle_hours < 6:
+            return self.base_interval
+        # 未开播的时间越长检测间隔越大，每多一天增加一倍基础间隔
+        return min(self.max_interval, self.base_interval * (1 + idle_hours / 24))
+
+    def eta(self, key: str) -> float | None:
+        """距离直播间下一次检测的秒数，没有排队时返回None"""
+        due = self._due.get(key)
+        if due is None:
+            return None
+        return max(0.0, due - time.monotonic())
+
+    def upcoming(self, limit: int = 10) -> list[tuple[str, float]]:
+        """即将检测的直播间及其剩余秒数"""
+        now = time.monotonic()
+        with self._cond:
+            items = heapq.nsmallest(limit, self._due.items(), key=lambda i: i[1])
+        return [(self.labels.get(key) or key, max(0.0, due - now)) for key, due in items]
+
+    @property
+    def queued(self) -> int:
+        return len(self._due)
+
+    def _schedule(self, key: str, delay: float, wake: Callable[[], None], label: str = '') -> None:
+        due = time.monotonic() + max(0.0, delay)
+        with self._cond:
+            if label:
+                self.labels[key] = label
+            self._due[key] = due
+            self._waiters[key] = wake
+            heapq.heappush(self._heap, (due, next(self._seq), key))
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='poll-scheduler', daemon=True)
+                self._thread.start()
+            self._cond.notify()
+
+    def remove(self, key: str) -> None:
+        with self._cond:
+            self._due.pop(key, None)
+            self._waiters.pop(key, None)
+
+    def wait(self, key: str, delay: float, label: str = '') -> None:
+        """阻塞当前线程，直到调度器唤醒该直播间"""
+        event = threading.Event()
+        self._schedule(key, delay, event.set, label)
+        event.wait()
+
+    async def wait_async(self, key: str, delay: float, label: str = '') -> None:
+        """在事件循环中等待调度器唤醒该直播间"""
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+
+        def _set_result() -> None:
+            if not future.done():
+                future.set_result(None)
+
+        self._schedule(key, delay, lambda: loop.call_soon_threadsafe(_set_result), label)
+        try:
+            await future
+        except asyncio.CancelledError:
+            self.remove(key)
+            raise
+
+    def _run(self) -> None:
+        next_slot = 0.0
+        while True:
+            with self._cond:
+                while True:
+                    # 重新排队或已移除的直播间在堆中留下的旧条目直接丢弃
+                    while self._heap and self._due.get(self._heap[0][2]) != self._heap[0][0]:
+                        heapq.heappop(self._heap)
+                    now = time.monotonic()
+                    if not self._heap:
+                        self._cond.wait()
+                        continue
+                    due = max(self._heap[0][0], next_slot)
+                    if due <= now:
+                        break
+                    self._cond.wait(due - now)
+                _, _, key = heapq.heappop(self._heap)
+                del self._due[key]
+                wake = self._waiters.pop(key)
+                if self.probes_per_second > 0:
+                    next_slot = max(now, next_slot) + 1 / self.probes_per_second
+            wake()
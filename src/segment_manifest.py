@@ -0,0 +1,67 @@
+# -*- encoding: utf-8 -*-
+
+"""
+Function: Per-recording segment manifest in the ffmpeg -segment_list csv format.
+"""
+import csv
+import glob
+import os
+import re
+from dataclasses import dataclass
+
+
+@dataclass
+class SegmentInfo:
+    path: str
+    start: float  # 相对录制开始的秒数
+    duration: float
+    size: int
+
+
+def manifest_path(save_file_path: str) -> str:
+    """分段文件名(含%03d)对应的清单文件路径"""
+    prefix = re.sub(r'_%03d$', '', os.path.splitext(save_file_path)[0])
+    return f'{prefix}.segments.csv'
+
+
+def segment_list_args(save_file_path: str) -> list[str]:
+    """让ffmpeg segment muxer在每个分段结束时把文件名、开始和结束时间写入清单"""
+    return ['-segment_list', manifest_path(save_file_path), '-segment_list_type', 'csv']
+
+
+def append_segment(save_file_path: str, segment_path: str, start: float, end: float) -> None:
+    """内置录制引擎在分段结束时追加一行，格式与ffmpeg相同"""
+    with open(manifest_path(save_file_path), 'a', encoding='utf-8', newline='') as f:
+        csv.writer(f).writerow([os.path.basename(segment_path), f'{start:.6f}', f'{end:.6f}'])
+
+
+def read_manifest(save_file_path: str) -> list[SegmentInfo] | None:
+    """读取清单中的所有分段，清单不存在时返回None"""
+    path = manifest_path(save_file_path)
+    if not os.path.exists(path):
+        return None
+    directory = os.path.dirname(path)
+    segments = []
+    with open(path, encoding='utf-8', newline='') as f:
+        for row in csv.reader(f):
+            if len(row) < 3:
+                continue
+            segment_path = os.path.join(directory, row[0])
+            start, end = float(row[1]), float(row[2])
+            size = os.path.getsize(segment_path) if os.path.exists(segment_path) else 0
+            segments.append(SegmentInfo(segment_path, start, end - start, size))
+    return segments
+
+
+def segment_files(save_file_path: str) -> list[str]:
+    """
+    返回一次分段录制产生的所有文件
+
+    优先使用清单，清单不存在(如录制被强制结束)时只匹配同一目录下该录制的编号文件，不再遍历整个保存目录
+    """
+    segments = read_manifest(save_file_path)
+    if segments is not None:
+        return [segment.path for segment in segments if segment.size]
+    prefix, extension = os.path.splitext(save_file_path)
+    pattern = glob.escape(re.sub(r'_%03d$', '', prefix)) + '_[0-9][0-9][0-9]' + glob.escape(extension)
+    return sorted(glob.glob(pattern))
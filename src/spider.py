@@ -9,6 +9,7 @@ Copyright (c) 2023-2025 by Hmily, All Rights Reserved.
 Function: Get live stream data.
 """
 
+import asyncio
 import hashlib
 import random
 import subprocess
@@ -24,11 +25,13 @@ import re
 import json
 import execjs
 import urllib.request
-from . import JS_SCRIPT_PATH, utils
+from . import JS_SCRIPT_PATH, utils, js_signer
 from .utils import trace_error_decorator, generate_random_string
 from .logger import script_path
+from .bilibili_status import status_cache as bilibili_status_cache
+from .twitch_status import status_cache as twitch_status_cache, channel_shell_operation, parse_channel_shell
 from .room import get_sec_user_id, get_unique_id, UnsupportedUrlError
-from .http_clients.async_http import async_req
+from .http_clients.async_http import async_req, async_stream_req, get_async_client
 
 
 ssl_context = ssl.create_default_context()
@@ -64,6 +67,52 @@ async def get_play_url_list(m3u8: str, proxy: OptionalStr = None, header: Option
     return play_url_list
 
 
+async def get_douyin_web_enter_data(web_rid: str, headers: dict, proxy_addr: OptionalStr = None) -> dict:
+    params = {
+        "aid": "6383",
+        "app_name": "douyin_web",
+        "live_id": "1",
+        "device_platform": "web",
+        "language": "zh-CN",
+        "browser_language": "zh-CN",
+        "browser_platform": "Win32",
+        "browser_name": "Chrome",
+        "browser_version": "116.0.0.0",
+        "web_rid": web_rid
+
+    }
+    api = f'https://live.douyin.com/webcast/room/web/enter/?{urllib.parse.urlencode(params)}'
+    json_str = await async_req(url=api, proxy_addr=proxy_addr, headers=headers)
+    json_data = json.loads(json_str)['data']
+    room_data = json_data['data'][0]
+    room_data['anchor_name'] = json_data['user']['nickname']
+    return room_data
+
+
+async def get_douyin_live_status(url: str, proxy_addr: OptionalStr = None, cookies: OptionalStr = None) -> dict | None:
+    """
+    只请求webcast/room/web/enter接口获取直播状态，返回的JSON只有几KB，
+    不是live.douyin.com直播间地址或请求失败时返回None，由调用方使用完整的网页解析
+    """
+    web_rid = url.split('?')[0].split('live.douyin.com/')
+    if len(web_rid) < 2 or not web_rid[1]:
+        return None
+    headers = {
+        'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64; rv:109.0) Gecko/20100101 Firefox/115.0',
+        'Accept-Language': 'zh-CN,zh;q=0.8,zh-TW;q=0.7,zh-HK;q=0.5,en-US;q=0.3,en;q=0.2',
+        'Referer': 'https://live.douyin.com/',
+        'Cookie': cookies or 'ttwid=1%7CB1qls3GdnZhUov9o2NxOMxxYS2ff6OSvEWbv0ytbES4%7C1680522049%7C280d802d6d478e3e'
+                            '78d0c807f7c487e7ffec0ae4e5fdd6a0fe74c3c6af149511',
+    }
+    try:
+        room_data = await get_douyin_web_enter_data(web_rid[1], headers, proxy_addr)
+    except Exception:
+        return None
+    if 'status' not in room_data:
+        return None
+    return {'anchor_name': room_data.get('anchor_name', ''), 'status': room_data['status']}
+
+
 @trace_error_decorator
 async def get_douyin_app_stream_data(url: str, proxy_addr: OptionalStr = None, cookies: OptionalStr = None) -> dict:
     headers = {
@@ -96,24 +145,7 @@ async def get_douyin_app_stream_data(url: str, proxy_addr: OptionalStr = None, c
         web_rid = url.split('?')[0].split('live.douyin.com/')
         if len(web_rid) > 1:
             web_rid = web_rid[1]
-            params = {
-                "aid": "6383",
-                "app_name": "douyin_web",
-                "live_id": "1",
-                "device_platform": "web",
-                "language": "zh-CN",
-                "browser_language": "zh-CN",
-                "browser_platform": "Win32",
-                "browser_name": "Chrome",
-                "browser_version": "116.0.0.0",
-                "web_rid": web_rid
-
-            }
-            api = f'https://live.douyin.com/webcast/room/web/enter/?{urllib.parse.urlencode(params)}'
-            json_str = await async_req(url=api, proxy_addr=proxy_addr, headers=headers)
-            json_data = json.loads(json_str)['data']
-            room_data = json_data['data'][0]
-            room_data['anchor_name'] = json_data['user']['nickname']
+            room_data = await get_douyin_web_enter_data(web_rid, headers, proxy_addr)
         else:
             try:
                 data = await get_sec_user_id(url, proxy_addr=proxy_addr)
@@ -170,7 +202,11 @@ async def get_douyin_stream_data(url: str, proxy_addr: OptionalStr = None, cooki
 
     try:
         origin_url_list = None
-        html_str = await async_req(url=url, proxy_addr=proxy_addr, headers=headers)
+        # 直播间数据和两段推流数据都出现后就停止下载网页的剩余部分
+        html_str = await async_stream_req(url=url, proxy_addr=proxy_addr, headers=headers, stop_at=[
+            re.compile(r'\{\\"state\\":.*?]\\n"]\)|\{\\"common\\":.*?]\\n"]\)</script><div hidden'),
+            re.compile(r'"\{\\"common\\":.*?"]\)</script><script nonce=.*?"\{\\"common\\":.*?"]\)</script><script nonce=')
+        ])
         match_json_str = re.search(r'(\{\\"state\\":.*?)]\\n"]\)', html_str)
         if not match_json_str:
             match_json_str = re.search(r'(\{\\"common\\":.*?)]\\n"]\)</script><div hidden', html_str)
@@ -223,7 +259,7 @@ async def get_tiktok_stream_data(url: str, proxy_addr: OptionalStr = None, cooki
         headers['Cookie'] = cookies
     for i in range(3):
         html_str = await async_req(url=url, proxy_addr=proxy_addr, headers=headers, abroad=True, http2=False)
-        time.sleep(1)
+        await asyncio.sleep(1)
         if "We regret to inform you that we have discontinued operating TikTok" in html_str:
             msg = re.search('<p>\n\\s+(We regret to inform you that we have discontinu.*?)\\.\n\\s+</p>', html_str)
             raise ConnectionError(
@@ -249,14 +285,16 @@ async def get_kuaishou_stream_data(url: str, proxy_addr: OptionalStr = None, coo
     }
     if cookies:
         headers['Cookie'] = cookies
+    initial_state_pattern = re.compile('<script>window.__INITIAL_STATE__=(.*?);\\(function\\(\\)\\{var s;')
     try:
-        html_str = await async_req(url=url, proxy_addr=proxy_addr, headers=headers)
+        html_str = await async_stream_req(url=url, proxy_addr=proxy_addr, headers=headers,
+                                          stop_at=initial_state_pattern)
     except Exception as e:
         print(f"Failed to fetch data from {url}.{e}")
         return {"type": 1, "is_live": False}
 
     try:
-        json_str = re.search('<script>window.__INITIAL_STATE__=(.*?);\\(function\\(\\)\\{var s;', html_str).group(1)
+        json_str = initial_state_pattern.search(html_str).group(1)
         play_list = re.findall('(\\{"liveStream".*?),"gameInfo', json_str)[0] + "}"
         play_list = json.loads(play_list)
     except (AttributeError, IndexError, json.JSONDecodeError) as e:
@@ -344,8 +382,9 @@ async def get_huya_stream_data(url: str, proxy_addr: OptionalStr = None, cookies
     if cookies:
         headers['Cookie'] = cookies
 
-    html_str = await async_req(url=url, proxy_addr=proxy_addr, headers=headers)
-    json_str = re.findall('stream: (\\{"data".*?),"iWebDefaultBitRate"', html_str)[0]
+    stream_pattern = re.compile('stream: (\\{"data".*?),"iWebDefaultBitRate"')
+    html_str = await async_stream_req(url=url, proxy_addr=proxy_addr, headers=headers, stop_at=stream_pattern)
+    json_str = stream_pattern.findall(html_str)[0]
     json_data = json.loads(json_str + '}')
     return json_data
 
@@ -450,11 +489,7 @@ def md5(data) -> str:
     return hashlib.md5(data.encode('utf-8')).hexdigest()
 
 
-async def get_token_js(rid: str, did: str, proxy_addr: OptionalStr = None) -> List[str]:
-
-    url = f'https://www.douyu.com/{rid}'
-    html_str = await async_req(url=url, proxy_addr=proxy_addr)
-    result = re.search(r'(vdwdae325w_64we[\s\S]*function ub98484234[\s\S]*?)function', html_str).group(1)
+def _run_douyu_token_js(result: str, rid: str, did: str) -> List[str]:
     func_ub9 = re.sub(r'eval.*?;}', 'strc;}', result)
     js = execjs.compile(func_ub9)
     res = js.call('ub98484234')
@@ -473,6 +508,15 @@ async def get_token_js(rid: str, did: str, proxy_addr: OptionalStr = None) -> Li
     return params_list
 
 
+async def get_token_js(rid: str, did: str, proxy_addr: OptionalStr = None) -> List[str]:
+
+    url = f'https://www.douyu.com/{rid}'
+    html_str = await async_req(url=url, proxy_addr=proxy_addr)
+    result = re.search(r'(vdwdae325w_64we[\s\S]*function ub98484234[\s\S]*?)function', html_str).group(1)
+    # 斗鱼的签名脚本随页面变化，无法放入签名上下文池，在线程中执行以免阻塞事件循环
+    return await asyncio.to_thread(_run_douyu_token_js, result, rid, did)
+
+
 @trace_error_decorator
 async def get_douyu_info_data(url: str, proxy_addr: OptionalStr = None, cookies: OptionalStr = None) -> dict:
     headers = {
@@ -549,9 +593,12 @@ async def get_yy_stream_data(url: str, proxy_addr: OptionalStr = None, cookies:
     if cookies:
         headers['Cookie'] = cookies
 
-    html_str = await async_req(url=url, proxy_addr=proxy_addr, headers=headers)
-    anchor_name = re.search('nick: "(.*?)",\n\\s+logo', html_str).group(1)
-    cid = re.search('sid : "(.*?)",\n\\s+ssid', html_str, re.DOTALL).group(1)
+    nick_pattern = re.compile('nick: "(.*?)",\n\\s+logo')
+    sid_pattern = re.compile('sid : "(.*?)",\n\\s+ssid', re.DOTALL)
+    html_str = await async_stream_req(url=url, proxy_addr=proxy_addr, headers=headers,
+                                      stop_at=[nick_pattern, sid_pattern])
+    anchor_name = nick_pattern.search(html_str).group(1)
+    cid = sid_pattern.search(html_str).group(1)
 
     data = '{"head":{"seq":1701869217590,"appidstr":"0","bidstr":"121","cidstr":"' + cid + '","sidstr":"' + cid + '","uid64":0,"client_type":108,"client_ver":"5.17.0","stream_sys_ver":1,"app":"yylive_web","playersdk_ver":"5.17.0","thundersdk_ver":"0","streamsdk_ver":"5.17.0"},"client_attribute":{"client":"web","model":"web0","cpu":"","graphics_card":"","os":"chrome","osversion":"0","vsdk_version":"","app_identify":"","app_version":"","business":"","width":"1920","height":"1080","scale":"","client_type":8,"h265":0},"avp_parameter":{"version":1,"client_type":8,"service_type":0,"imsi":0,"send_time":1701869217,"line_seq":-1,"gear":4,"ssl":1,"stream_format":0}}'
     data_bytes = data.encode('utf-8')
@@ -614,18 +661,19 @@ async def get_bilibili_room_info(url: str, proxy_addr: OptionalStr = None, cooki
 
     try:
         room_id = url.split('?')[0].rsplit('/', maxsplit=1)[1]
-        json_str = await async_req(f'https://api.live.bilibili.com/room/v1/Room/room_init?id={room_id}',
-                           proxy_addr=proxy_addr, headers=headers)
-        room_info = json.loads(json_str)
-        uid = room_info['data']['uid']
-        live_status = True if room_info['data']['live_status'] == 1 else False
-
-        api = f'https://api.live.bilibili.com/live_user/v1/Master/info?uid={uid}'
-        json_str2 = await async_req(url=api, proxy_addr=proxy_addr, headers=headers)
-        anchor_info = json.loads(json_str2)
-        anchor_name = anchor_info['data']['info']['uname']
-
-        title = await get_bilibili_room_info_h5(url, proxy_addr, cookies)
+        # 优先使用批量状态接口，标题和主播名随状态一起返回
+        status = await bilibili_status_cache.get_status(room_id, proxy_addr, headers)
+        if status is not None:
+            return {"anchor_name": status.get('uname', ''), "live_status": status.get('live_status') == 1,
+                    "room_url": url, "title": status.get('title', '')}
+
+        # 批量接口不可用时逐个查询，主播名和标题只在开播时重新获取
+        room_info = await bilibili_status_cache.room_init(room_id, proxy_addr, headers)
+        uid = room_info['uid']
+        live_status = True if room_info['live_status'] == 1 else False
+        went_live = bilibili_status_cache.went_live(uid, live_status)
+        anchor_name = await bilibili_status_cache.get_anchor_name(uid, proxy_addr, headers, refresh=went_live)
+        title = await get_bilibili_room_info_h5(url, proxy_addr, cookies) if live_status else ''
         return {"anchor_name": anchor_name, "live_status": live_status, "room_url": url, "title": title}
     except Exception as e:
         print(e)
@@ -711,8 +759,9 @@ async def get_xhs_stream_url(url: str, proxy_addr: OptionalStr = None, cookies:
     user_id = re.search("/user/profile/(.*?)(?=/|\\?|$)", url)
     user_id = user_id.group(1) if user_id else host_id
     result = {"anchor_name": '', "is_live": False}
-    html_str = await async_req(url, proxy_addr=proxy_addr, headers=headers)
-    match_data = re.search("<script>window.__INITIAL_STATE__=(.*?)</script>", html_str)
+    initial_state_pattern = re.compile("<script>window.__INITIAL_STATE__=(.*?)</script>")
+    html_str = await async_stream_req(url, proxy_addr=proxy_addr, headers=headers, stop_at=initial_state_pattern)
+    match_data = initial_state_pattern.search(html_str)
 
     if match_data:
         json_str = match_data.group(1).replace("undefined", "null")
@@ -741,7 +790,7 @@ async def get_xhs_stream_url(url: str, proxy_addr: OptionalStr = None, cookies:
                     return result
 
     profile_url = f"https://www.xiaohongshu.com/user/profile/{user_id}"
-    html_str = await async_req(profile_url, proxy_addr=proxy_addr, headers=headers)
+    html_str = await async_stream_req(profile_url, proxy_addr=proxy_addr, headers=headers, stop_at='</title>')
     anchor_name = re.search("<title>@(.*?) 的个人主页</title>", html_str)
     if anchor_name:
         result["anchor_name"] = anchor_name.group(1)
@@ -1491,22 +1540,21 @@ async def login_popkontv(
     url = 'https://www.popkontv.com/api/proxy/member/v1/login'
 
     try:
-        proxy_addr = utils.handle_proxy_addr(proxy_addr)
-        async with httpx.AsyncClient(proxy=proxy_addr, timeout=20, verify=False) as client:
-            response = await client.post(url, json=data, headers=headers)
-            response.raise_for_status()
-
-            json_data = response.json()
-            login_status_code = json_data.get("statusCd")
-
-            if login_status_code == 'E4010':
-                raise Exception("popkontv login failed, please reconfigure the correct login account or password!")
-            elif login_status_code == 'S2000':
-                token = json_data['data'].get("token")
-                partner_code = json_data['data'].get("partnerCode")
-                return token, partner_code
-            else:
-                raise Exception(f"popkontv login failed, {json_data.get('statusMsg', 'unknown error')}")
+        client = get_async_client(proxy_addr, http2=False)
+        response = await client.post(url, json=data, headers=headers, timeout=20)
+        response.raise_for_status()
+
+        json_data = response.json()
+        login_status_code = json_data.get("statusCd")
+
+        if login_status_code == 'E4010':
+            raise Exception("popkontv login failed, please reconfigure the correct login account or password!")
+        elif login_status_code == 'S2000':
+            token = json_data['data'].get("token")
+            partner_code = json_data['data'].get("partnerCode")
+            return token, partner_code
+        else:
+            raise Exception(f"popkontv login failed, {json_data.get('statusMsg', 'unknown error')}")
     except httpx.HTTPStatusError as e:
         print(f"HTTP status error occurred during login: {e.response.status_code}")
         raise
@@ -1956,45 +2004,15 @@ async def get_twitchtv_room_info(url: str, token: str, proxy_addr: OptionalStr =
         headers['Cookie'] = cookies
     uid = url.split('?')[0].rsplit('/', maxsplit=1)[-1]
 
-    data = [
-        {
-            "operationName": "ChannelShell",
-            "variables": {
-                "login": uid
-            },
-            "extensions": {
-                "persistedQuery": {
-                    "version": 1,
-                    "sha256Hash": "580ab410bcd0c1ad194224957ae2241e5d252b2c5173d8e0cce9d32d5bb14efe"
-                }
-            }
-        },
-    ]
-
-    json_str = await async_req('https://gql.twitch.tv/gql', proxy_addr=proxy_addr, headers=headers,
+    data = [channel_shell_operation(uid)]
+    json_str = await async_req(twitch_status_cache.gql_api, proxy_addr=proxy_addr, headers=headers,
                                json_data=data, abroad=True)
     json_data = json.loads(json_str)
-    user_data = json_data[0]['data']['userOrError']
-    login_name = user_data["login"]
-    nickname = f"{user_data['displayName']}-{login_name}"
-    status = True if user_data['stream'] else False
+    nickname, status = parse_channel_shell(json_data[0])
     return nickname, status
 
 
-@trace_error_decorator
-async def get_twitchtv_stream_data(url: str, proxy_addr: OptionalStr = None, cookies: OptionalStr = None) -> dict:
-    headers = {
-        'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64; rv:109.0) Gecko/20100101 Firefox/115.0',
-        'Accept-Language': 'en-US',
-        'Referer': 'https://www.twitch.tv/',
-        'Client-ID': 'kimne78kx3ncx6brgo4mv6wki5h1ko',
-        'device-id': generate_random_string(16).lower(),
-    }
-
-    if cookies:
-        headers['Cookie'] = cookies
-    uid = url.split('?')[0].rsplit('/', maxsplit=1)[-1]
-
+async def get_twitchtv_playback_token(uid: str, headers: dict, proxy_addr: OptionalStr = None) -> tuple[str, str]:
     data = {
         "operationName": "PlaybackAccessToken_Template",
         "query": "query PlaybackAccessToken_Template($login: String!, $isLive: Boolean!, $vodID: ID!, "
@@ -2012,13 +2030,38 @@ async def get_twitchtv_stream_data(url: str, proxy_addr: OptionalStr = None, coo
         }
     }
 
-    json_str = await async_req('https://gql.twitch.tv/gql', proxy_addr=proxy_addr, headers=headers,
+    json_str = await async_req(twitch_status_cache.gql_api, proxy_addr=proxy_addr, headers=headers,
                                json_data=data, abroad=True)
     json_data = json.loads(json_str)
     token = json_data['data']['streamPlaybackAccessToken']['value']
     sign = json_data['data']['streamPlaybackAccessToken']['signature']
+    return token, sign
 
-    anchor_name, live_status = await get_twitchtv_room_info(url=url, token=token, proxy_addr=proxy_addr, cookies=cookies)
+
+@trace_error_decorator
+async def get_twitchtv_stream_data(url: str, proxy_addr: OptionalStr = None, cookies: OptionalStr = None) -> dict:
+    headers = {
+        'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64; rv:109.0) Gecko/20100101 Firefox/115.0',
+        'Accept-Language': 'en-US',
+        'Referer': 'https://www.twitch.tv/',
+        'Client-ID': 'kimne78kx3ncx6brgo4mv6wki5h1ko',
+        'device-id': generate_random_string(16).lower(),
+    }
+
+    if cookies:
+        headers['Cookie'] = cookies
+    uid = url.split('?')[0].rsplit('/', maxsplit=1)[-1]
+
+    # 所有Twitch频道的状态合并为一次GQL批量查询，只有开播的频道才获取播放令牌
+    status = await twitch_status_cache.get(uid.lower(), proxy_addr, headers)
+    if status is not None:
+        anchor_name, live_status = status
+        if live_status:
+            token, sign = await get_twitchtv_playback_token(uid, headers, proxy_addr)
+    else:
+        token, sign = await get_twitchtv_playback_token(uid, headers, proxy_addr)
+        anchor_name, live_status = await get_twitchtv_room_info(
+            url=url, token=token, proxy_addr=proxy_addr, cookies=cookies)
     result = {"anchor_name": anchor_name, "is_live": live_status}
     if live_status:
         play_session_id = random.choice(["bdd22331a986c7f1073628f2fc5b19da", "064bc3ff1722b6f53b0b5b8c01e46ca5"])
@@ -2060,8 +2103,7 @@ async def get_liveme_stream_url(url: str, proxy_addr: OptionalStr = None, cookie
         headers['Cookie'] = cookies
 
     room_id = url.split("/index.html")[0].rsplit('/', maxsplit=1)[-1]
-    sign_data = execjs.compile(open(f'{JS_SCRIPT_PATH}/liveme.js').read()).call('sign', room_id,
-                                                                                f'{JS_SCRIPT_PATH}/crypto-js.min.js')
+    sign_data = await js_signer.sign_async('liveme', room_id, f'{JS_SCRIPT_PATH}/crypto-js.min.js')
     lm_s_sign = sign_data.pop("lm_s_sign")
     tongdun_black_box = sign_data.pop("tongdun_black_box")
     platform = sign_data.pop("os")
@@ -2583,8 +2625,7 @@ async def get_haixiu_stream_url(url: str, proxy_addr: OptionalStr = None, cookie
         "c": "10138100100000",
         "_st1": int(time.time() * 1000)
     }
-    ajax_data = execjs.compile(open(f'{JS_SCRIPT_PATH}/haixiu.js').read()).call('sign', params,
-                                                                                f'{JS_SCRIPT_PATH}/crypto-js.min.js')
+    ajax_data = await js_signer.sign_async('haixiu', params, f'{JS_SCRIPT_PATH}/crypto-js.min.js')
 
     params["accessToken"] = urllib.parse.unquote(urllib.parse.unquote(access_token))
     params['_ajaxData1'] = ajax_data
@@ -2904,7 +2945,7 @@ async def get_taobao_stream_url(url: str, proxy_addr: OptionalStr = None, cookie
         _m_h5_tk = re.findall('_m_h5_tk=(.*?);', headers['Cookie'])[0]
         t13 = int(time.time() * 1000)
         pre_sign_str = f'{_m_h5_tk.split("_")[0]}&{t13}&{app_key}&' + params['data']
-        sign = execjs.compile(open(f'{JS_SCRIPT_PATH}/taobao-sign.js').read()).call('sign', pre_sign_str)
+        sign = await js_signer.sign_async('taobao', pre_sign_str)
         params |= {'sign': sign, 't': t13}
         api = f'https://h5api.m.taobao.com/h5/mtop.mediaplatform.live.livedetail/4.0/?{urllib.parse.urlencode(params)}'
         jsonp_str, new_cookie = await async_req(url=api, proxy_addr=proxy_addr, headers=headers, timeout=20,
@@ -3088,7 +3129,8 @@ async def get_migu_stream_url(url: str, proxy_addr: OptionalStr = None, cookies:
 
         async def _get_dd_calcu(url):
             try:
-                result = subprocess.run(
+                result = await asyncio.to_thread(
+                    subprocess.run,
                     ["node", f"{JS_SCRIPT_PATH}/migu.js", url],
                     capture_output=True,
                     text=True,
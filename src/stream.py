@@ -8,6 +8,7 @@ Update: 2025-02-06 02:28:00
 Copyright (c) 2023-2025 by Hmily, All Rights Reserved.
 Function: Get live stream data.
 """
+import asyncio
 import base64
 import hashlib
 import json
@@ -21,7 +22,7 @@ from .utils import trace_error_decorator
 from .spider import (
     get_douyu_stream_data, get_bilibili_stream_data
 )
-from .http_clients.async_http import get_response_status
+from .http_clients.async_http import get_response_ttfb
 
 QUALITY_MAPPING = {"OD": 0, "BD": 0, "UHD": 1, "HD": 2, "SD": 3, "LD": 4}
 
@@ -37,6 +38,55 @@ def get_quality_index(quality) -> tuple:
     return quality_str, QUALITY_MAPPING.get(quality_str, 0)
 
 
+def get_quality_preference(quality_index: int, count: int = 5) -> list[int]:
+    """画质的尝试顺序：先选择的画质，再依次降低，最后才提高"""
+    return list(range(quality_index, count)) + list(range(quality_index - 1, -1, -1))
+
+
+async def race_stream_urls(candidates: list[tuple[int, str]], proxy_addr: str | None = None,
+                           timeout: float = 10, http2: bool = False) -> int | None:
+    """
+    同时检测所有候选推流地址，返回选中的候选下标，全部不可用时返回None
+
+    candidates为(优先级, 地址)，优先级数值越小越好，相同优先级的多个地址选响应最快的。
+    只有更高优先级的候选都已失败时才会选用低优先级，因此最多等待单个请求的超时时间timeout秒；
+    仍可能成功的最高优先级一旦返回就立即取消其余请求。
+    """
+    urls = list(dict.fromkeys(url for _, url in candidates if url))
+    if not urls:
+        return None
+    tasks = {asyncio.ensure_future(
+        get_response_ttfb(url, proxy_addr=proxy_addr, timeout=timeout, http2=http2)): url for url in urls}
+    results: dict[str, float | None] = {}
+    loop = asyncio.get_running_loop()
+    end = loop.time() + timeout
+    pending = set(tasks)
+    try:
+        while pending:
+            remaining = end - loop.time()
+            if remaining <= 0:
+                break
+            done, pending = await asyncio.wait(pending, timeout=remaining, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                results[tasks[task]] = task.result()
+            # 仍可能成功的最高优先级已有可用地址时，同优先级中先返回的就是最快的
+            open_ranks = [rank for rank, url in candidates if url and results.get(url, 0.0) is not None]
+            if not open_ranks:
+                break
+            best_rank = min(open_ranks)
+            if any(rank == best_rank and results.get(url) is not None for rank, url in candidates):
+                break
+    finally:
+        for task in pending:
+            task.cancel()
+
+    available = [(rank, results[url], index) for index, (rank, url) in enumerate(candidates)
+                 if url and results.get(url) is not None]
+    if not available:
+        return None
+    return min(available)[2]
+
+
 @trace_error_decorator
 async def get_douyin_stream_url(json_data: dict, video_quality: str, proxy_addr: str) -> dict:
     anchor_name = json_data.get('anchor_name')
@@ -60,13 +110,15 @@ async def get_douyin_stream_url(json_data: dict, video_quality: str, proxy_addr:
             m3u8_url_list.append(m3u8_url_list[-1])
 
         video_quality, quality_index = get_quality_index(video_quality)
-        m3u8_url = m3u8_url_list[quality_index]
-        flv_url = flv_url_list[quality_index]
-        ok = await get_response_status(url=m3u8_url, proxy_addr=proxy_addr)
-        if not ok:
+        order = get_quality_preference(quality_index, len(m3u8_url_list))
+        selected = await race_stream_urls(
+            [(rank, m3u8_url_list[i]) for rank, i in enumerate(order)], proxy_addr=proxy_addr)
+        if selected is not None:
+            index = order[selected]
+        else:
             index = quality_index + 1 if quality_index < 4 else quality_index - 1
-            m3u8_url = m3u8_url_list[index]
-            flv_url = flv_url_list[index]
+        m3u8_url = m3u8_url_list[index]
+        flv_url = flv_url_list[index]
         result |= {
             'is_live': True,
             'title': json_data['title'],
@@ -129,16 +181,16 @@ async def get_tiktok_stream_url(json_data: dict, video_quality: str, proxy_addr:
         while len(m3u8_url_list) < 5:
             m3u8_url_list.append(m3u8_url_list[-1])
         video_quality, quality_index = get_quality_index(video_quality)
-        flv_dict: dict = flv_url_list[quality_index]
-        m3u8_dict: dict = m3u8_url_list[quality_index]
-
-        check_url = m3u8_dict.get('url') or flv_dict.get('url')
-        ok = await get_response_status(url=check_url, proxy_addr=proxy_addr, http2=False)
-
-        if not ok:
+        order = get_quality_preference(quality_index, min(len(flv_url_list), len(m3u8_url_list)))
+        selected = await race_stream_urls(
+            [(rank, m3u8_url_list[i].get('url') or flv_url_list[i].get('url')) for rank, i in enumerate(order)],
+            proxy_addr=proxy_addr, http2=False)
+        if selected is not None:
+            index = order[selected]
+        else:
             index = quality_index + 1 if quality_index < 4 else quality_index - 1
-            flv_dict: dict = flv_url_list[index]
-            m3u8_dict: dict = m3u8_url_list[index]
+        flv_dict: dict = flv_url_list[index]
+        m3u8_dict: dict = m3u8_url_list[index]
 
         flv_url = flv_dict['url']
         m3u8_url = m3u8_dict['url']
@@ -0,0 +1,70 @@
+# -*- encoding: utf-8 -*-
+
+"""
+Function: Batched Twitch channel status lookup through an array of GQL operations.
+"""
+import json
+
+from .batch_status import BatchStatusCache
+from .http_clients.async_http import async_req
+
+OptionalStr = str | None
+
+GQL_API = 'https://gql.twitch.tv/gql'
+CHANNEL_SHELL_HASH = '580ab410bcd0c1ad194224957ae2241e5d252b2c5173d8e0cce9d32d5bb14efe'
+
+
+def channel_shell_operation(login: str) -> dict:
+    return {
+        "operationName": "ChannelShell",
+        "variables": {
+            "login": login
+        },
+        "extensions": {
+            "persistedQuery": {
+                "version": 1,
+                "sha256Hash": CHANNEL_SHELL_HASH
+            }
+        }
+    }
+
+
+def parse_channel_shell(response: dict) -> tuple[str, bool] | None:
+    """从ChannelShell的返回中取出(主播名, 是否在直播)，频道不存在时返回None"""
+    user_data = (response.get('data') or {}).get('userOrError') or {}
+    login_name = user_data.get('login')
+    if not login_name:
+        return None
+    return f"{user_data['displayName']}-{login_name}", bool(user_data.get('stream'))
+
+
+class TwitchStatusCache(BatchStatusCache):
+    """
+    Twitch频道状态批量查询
+
+    GQL接口接受操作数组，所有监测中的频道按batch_size分组，每组只发送一次ChannelShell查询，
+    返回结果与操作的顺序一致。播放令牌只在频道开播时才单独获取。
+    """
+
+    def __init__(self, gql_api: str = GQL_API, batch_size: int = 30, **kwargs):
+        super().__init__(batch_size=batch_size, **kwargs)
+        self.gql_api = gql_api
+
+    async def fetch_batch(self, keys: list, proxy_addr: OptionalStr, headers: dict) -> dict | None:
+        json_str = await async_req(self.gql_api, proxy_addr=proxy_addr, headers=headers,
+                                   json_data=[channel_shell_operation(login) for login in keys], abroad=True)
+        try:
+            responses = json.loads(json_str)
+        except (TypeError, ValueError):
+            return None
+        if not isinstance(responses, list) or len(responses) != len(keys):
+            return None
+        results = {}
+        for login, response in zip(keys, responses):
+            status = parse_channel_shell(response) if isinstance(response, dict) else None
+            if status:
+                results[login] = status
+        return results
+
+
+status_cache = TwitchStatusCache()
@@ -0,0 +1,157 @@
+# -*- encoding: utf-8 -*-
+
+"""
+Function: Watch URL_config.ini and turn file changes into room add/remove/comment events.
+"""
+import os
+import shutil
+import tempfile
+import threading
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Iterable
+
+
+@dataclass(frozen=True)
+class UrlConfigDiff:
+    """两次解析URL_config.ini之间的差异"""
+    added: tuple = ()  # 新增或取消注释的直播间，元素为(quality, url, name)
+    removed: frozenset = field(default_factory=frozenset)  # 从文件中删除的直播间地址
+    commented: frozenset = field(default_factory=frozenset)  # 新被注释的直播间地址
+
+    def __bool__(self) -> bool:
+        return bool(self.added or self.removed or self.commented)
+
+
+def replace_in_lines(lines: list[str], old_str: str, new_str: str, start_str: str | None = None) -> list[str]:
+    """在内存中替换包含old_str的行，行为与逐行重写文件的update_file一致"""
+    new_lines = []
+    seen = set()
+    for line in lines:
+        if old_str in line:
+            line = line.replace(old_str, new_str)
+            if start_str:
+                line = f'{start_str}{line}'
+        if line not in seen:
+            seen.add(line)
+            new_lines.append(line)
+    return new_lines
+
+
+class UrlConfigWatcher:
+    """
+    URL_config.ini监视器
+
+    只有文件的修改时间、大小或inode发生变化时才需要重新解析；解析结果与上一次按直播间地址做集合比较，
+    得到新增、删除和注释三类事件，文件内容没有变化时每轮检查只需一次stat。
+    程序自己改写的地址(如Shopee补充uid)通过rename登记，旧地址不算删除，其停止与否跟随新地址。
+    新增的直播间进入pending，启动后由主循环移出，因此每轮只处理待启动的直播间，没有变化的直播间没有开销。
+    """
+
+    def __init__(self, file_path: str | Path, encoding: str = 'utf-8-sig'):
+        self.file_path = str(file_path)
+        self.encoding = encoding
+        self.signature: tuple | None = None
+        self.entries: dict[str, tuple] = {}
+        self.comments: frozenset = frozenset()
+        self.removed: set[str] = set()
+        self.renamed: dict[str, str] = {}  # 旧地址 -> 改写后的新地址
+        self.pending: dict[str, None] = {}  # 等待启动监测的直播间地址，按文件中的顺序排列
+        self.lock = threading.Lock()
+
+    def _stat(self) -> tuple | None:
+        try:
+            st = os.stat(self.file_path)
+            return st.st_mtime_ns, st.st_size, st.st_ino
+        except FileNotFoundError:
+            return None
+
+    def changed(self) -> bool:
+        return self._stat() != self.signature
+
+    def invalidate(self) -> None:
+        """下一轮无论文件是否变化都重新解析，用于本轮解析中途出错的情况"""
+        self.signature = None
+
+    def rename(self, old_url: str, new_url: str) -> None:
+        """登记程序把old_url改写为new_url，使用old_url的监测继续运行"""
+        with self.lock:
+            self.renamed[old_url] = new_url
+
+    def pending_entries(self) -> list[tuple]:
+        """返回所有等待启动监测的直播间(quality, url, name)"""
+        with self.lock:
+            return [self.entries[url] for url in self.pending if url in self.entries]
+
+    def mark_started(self, url: str) -> None:
+        """直播间已启动监测或不需要启动，之后不再出现在pending_entries中"""
+        with self.lock:
+            self.pending.pop(url, None)
+
+    def requeue(self, url: str) -> None:
+        """监测已退出的直播间如果仍在文件中，重新放入pending等待启动"""
+        with self.lock:
+            if url in self.entries:
+                self.pending[url] = None
+
+    def poll(self) -> list[str] | None:
+        """文件有变化时返回文件内容，否则返回None"""
+        # 先记录文件状态再读取，读取期间发生的修改会在下一轮被发现
+        signature = self._stat()
+        if signature == self.signature:
+            return None
+        self.signature = signature
+        return self.read_lines()
+
+    def read_lines(self) -> list[str]:
+        if not os.path.isfile(self.file_path):
+            return []
+        with open(self.file_path, 'r', encoding=self.encoding, errors='ignore') as f:
+            return f.readlines()
+
+    def write_lines(self, lines: list[str]) -> None:
+        """将所有改动一次性以原子替换的方式写回文件"""
+        with self.lock:
+            directory = os.path.dirname(os.path.abspath(self.file_path))
+            fd, tmp_path = tempfile.mkstemp(prefix='.URL_config_', suffix='.tmp', dir=directory)
+            try:
+                with os.fdopen(fd, 'w', encoding=self.encoding) as f:
+                    f.write(''.join(lines))
+                if os.path.exists(self.file_path):
+                    shutil.copymode(self.file_path, tmp_path)
+                os.replace(tmp_path, self.file_path)
+            except Exception:
+                if os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+                raise
+
+    def diff(self, entries: Iterable[tuple], comments: Iterable[str]) -> UrlConfigDiff:
+        """与上一次的解析结果比较，entries为(quality, url, name)，comments为被注释的地址"""
+        new_entries = {}
+        for entry in entries:
+            new_entries.setdefault(entry[1], entry)
+        new_urls = set(new_entries)
+        new_comments = frozenset(set(comments) - new_urls)
+
+        with self.lock:
+            renamed = {old for old, new in self.renamed.items() if new in new_urls or new in new_comments}
+
+        added = tuple(entry for url, entry in new_entries.items() if url not in self.entries)
+        commented = new_comments - self.comments
+        removed = frozenset(set(self.entries) - new_urls - new_comments - renamed)
+
+        # 被注释后又被删除的地址同样需要保持停止状态，直到重新出现在文件中
+        self.removed = (self.removed | removed | (self.comments - new_comments)) - new_urls - new_comments
+        with self.lock:
+            self.entries = new_entries
+            self.comments = new_comments
+            self.pending = {url: None for url in (*self.pending, *(entry[1] for entry in added)) if url in new_urls}
+        return UrlConfigDiff(added=added, removed=removed, commented=commented)
+
+    @property
+    def stopped_urls(self) -> frozenset:
+        """被注释或已从文件中删除、需要停止监测的直播间地址，已改名且不在文件中的旧地址跟随新地址"""
+        stopped = self.comments | frozenset(self.removed)
+        with self.lock:
+            return stopped | frozenset(
+                old for old, new in self.renamed.items() if new in stopped and old not in self.entries)
@@ -0,0 +1,167 @@
+# -*- encoding: utf-8 -*-
+
+"""
+Function: Offline tests of the early-terminating streaming reader in async_http.
+"""
+import re
+import threading
+import time
+import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest import mock
+
+from src.http_clients.async_http import _StopMatcher, _pattern_suffixes, async_stream_req
+
+CHUNK = b'<div>' + b'x' * 16379 + b'</div>\n'  # 16 KB
+TOTAL_CHUNKS = 512  # 8 MB
+
+
+class StubPageHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, *args) -> None:
+        pass
+
+    def do_GET(self) -> None:
+        server = self.server
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/html; charset=utf-8')
+        self.send_header('Content-Length', str(len(CHUNK) * TOTAL_CHUNKS + 64))
+        self.end_headers()
+        # 标记被拆成两次发送，客户端需要跨块匹配
+        head = b'<html><script>window.__DATA__={"live":1};'
+        tail = b'ript>'
+        head = head.ljust(64 - len(tail) - 4) + b'</sc'
+        sent = 0
+        try:
+            self.wfile.write(head)
+            self.wfile.flush()
+            time.sleep(0.05)
+            self.wfile.write(tail)
+            self.wfile.flush()
+            sent = len(head) + len(tail)
+            for _ in range(TOTAL_CHUNKS):
+                self.wfile.write(CHUNK)
+                sent += len(CHUNK)
+                time.sleep(0.001)
+        except (BrokenPipeError, ConnectionResetError):
+            server.disconnected.set()
+        finally:
+            server.sent.append(sent)
+
+
+class AsyncStreamReqTest(unittest.IsolatedAsyncioTestCase):
+
+    @classmethod
+    def setUpClass(cls) -> None:
+        cls.server = ThreadingHTTPServer(('127.0.0.1', 0), StubPageHandler)
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+        cls.url = f'http://127.0.0.1:{cls.server.server_address[1]}/room'
+
+    @classmethod
+    def tearDownClass(cls) -> None:
+        cls.server.shutdown()
+        cls.server.server_close()
+
+    def setUp(self) -> None:
+        self.server.sent = []
+        self.server.disconnected = threading.Event()
+
+    def assert_closed_early(self) -> None:
+        self.assertTrue(self.server.disconnected.wait(10), 'server kept sending after the client stopped')
+        self.assertLess(self.server.sent[0], len(CHUNK) * TOTAL_CHUNKS)
+
+    async def test_stops_after_marker_split_across_chunks(self) -> None:
+        text = await async_stream_req(self.url, stop_at='</script>', http2=False)
+        self.assertIn('window.__DATA__={"live":1};', text)
+        self.assertTrue(text[:64].endswith('</script>'))
+        self.assertLess(len(text), 1024 * 1024)
+        self.assert_closed_early()
+
+    async def test_stops_after_every_marker_and_regex(self) -> None:
+        text = await async_stream_req(self.url, stop_at=['__DATA__', re.compile(r'(<div>x+</div>\n){3}')],
+                                      http2=False)
+        self.assertIn('__DATA__', text)
+        self.assertGreaterEqual(text.count('</div>'), 3)
+        self.assertLess(len(text), 1024 * 1024)
+        self.assert_closed_early()
+
+    async def test_byte_cap_without_marker(self) -> None:
+        max_bytes = 256 * 1024
+        text = await async_stream_req(self.url, stop_at='never-present', max_bytes=max_bytes, http2=False)
+        self.assertGreaterEqual(len(text), max_bytes)
+        # 最多多读一个网络块
+        self.assertLess(len(text), max_bytes + 128 * 1024)
+        self.assert_closed_early()
+
+    async def test_reads_whole_body_without_limits(self) -> None:
+        text = await async_stream_req(self.url, max_bytes=None, http2=False)
+        self.assertEqual(len(text), len(CHUNK) * TOTAL_CHUNKS + 64)
+        self.assertFalse(self.server.disconnected.is_set())
+
+
+class StopMatcherTest(unittest.TestCase):
+
+    def test_regex_search_resumes_from_bounded_overlap(self) -> None:
+        starts = []
+
+        class RecordingPattern:
+            def search(self, text, pos=0):
+                starts.append(pos)
+                return None
+
+        matcher = _StopMatcher([RecordingPattern()])
+        matcher.regex_overlap = 10
+        text = ''
+        for _ in range(5):
+            text += 'x' * 100
+            self.assertFalse(matcher.done(text))
+        self.assertEqual(starts, [0, 90, 190, 290, 390])
+
+    def test_literal_suffixes(self) -> None:
+        self.assertEqual(_pattern_suffixes(re.compile(r'__DATA__=(.*?)</script>')), ('</script>',))
+        self.assertEqual(_pattern_suffixes(re.compile(r'a.*?(b|cd)')), ('b', 'cd'))
+        self.assertEqual(_pattern_suffixes(re.compile(r'(x.*?end)')), ('end',))
+        self.assertIsNone(_pattern_suffixes(re.compile(r'a.*?\d')))
+        self.assertIsNone(_pattern_suffixes(re.compile(r'a.*?END', re.IGNORECASE)))
+
+    def test_regex_only_searched_after_suffix_arrives(self) -> None:
+        pattern = re.compile(r'__DATA__=(.*?)</script>')
+        matcher = _StopMatcher(pattern)
+        with mock.patch.object(matcher, 'pending', [mock.Mock(wraps=pattern, spec=re.Pattern)]):
+            marker = matcher.pending[0]
+            text = '__DATA__={'
+            self.assertFalse(matcher.done(text))
+            for _ in range(3):
+                text += 'x' * 100
+                self.assertFalse(matcher.done(text))
+            self.assertEqual(marker.search.call_count, 1)
+            text += '}</scr'
+            self.assertFalse(matcher.done(text))
+            text += 'ipt>'
+            self.assertTrue(matcher.done(text))
+            self.assertEqual(marker.search.call_count, 2)
+
+    def test_regex_match_spanning_chunks(self) -> None:
+        matcher = _StopMatcher(re.compile(r'__DATA__=(\{.*?\});</script>'))
+        text = '<html>' + 'a' * 1000 + '__DATA__={"live":'
+        self.assertFalse(matcher.done(text))
+        text += '1};</scr'
+        self.assertFalse(matcher.done(text))
+        text += 'ipt>'
+        self.assertTrue(matcher.done(text))
+
+    def test_douyin_pattern_without_match_is_linear(self) -> None:
+        pattern = re.compile(r'"\{\\"common\\":.*?"]\)</script><script nonce=.*?"\{\\"common\\":.*?"]\)</script>')
+        matcher = _StopMatcher(pattern)
+        chunk = '"{\\"common\\":' + 'y' * 16368
+        text = ''
+        start = time.perf_counter()
+        for _ in range(256):  # 4 MiB
+            text += chunk
+            self.assertFalse(matcher.done(text))
+        self.assertLess(time.perf_counter() - start, 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
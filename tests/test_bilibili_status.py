@@ -0,0 +1,170 @@
+# -*- encoding: utf-8 -*-
+
+"""
+Function: Offline tests of the batched Bilibili status lookup against a stub live API server.
+"""
+import asyncio
+import json
+import threading
+import unittest
+import urllib.parse
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest import mock
+
+from src import spider
+from src.bilibili_status import BilibiliStatusCache
+
+# 直播间号 -> (uid, 主播名, 是否在直播)
+ROOMS = {
+    '1001': (101, 'Alpha', True),
+    '1002': (102, 'Bravo', False),
+    '1003': (103, 'Charlie', True),
+    '1004': (104, 'Delta', False),
+    '1005': (105, 'Echo', False),
+}
+UNLISTED_ROOM = '1006'  # room_init能查到，但批量状态接口不返回该主播
+UNLISTED_UID = 106
+
+
+class StubLiveApiHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, *args) -> None:
+        pass
+
+    def do_GET(self) -> None:
+        server = self.server
+        parsed = urllib.parse.urlparse(self.path)
+        query = urllib.parse.parse_qs(parsed.query)
+        if server.fail and parsed.path == '/status':
+            self._reply(500, {'code': -1})
+        elif parsed.path == '/status':
+            uids = [int(uid) for uid in query['uids[]']]
+            server.batches.append(uids)
+            data = {str(uid): {'uid': uid, 'uname': name, 'title': f'{name}的直播间', 'live_status': 1 if live else 0}
+                    for uid, name, live in ROOMS.values() if uid in uids}
+            self._reply(200, {'code': 0, 'data': data})
+        elif parsed.path == '/room_init':
+            room_id = query['id'][0]
+            server.room_inits.append(room_id)
+            if room_id == UNLISTED_ROOM:
+                self._reply(200, {'code': 0, 'data': {'uid': UNLISTED_UID, 'live_status': 1}})
+            else:
+                uid, _, live = ROOMS[room_id]
+                self._reply(200, {'code': 0, 'data': {'uid': uid, 'live_status': 1 if live else 0}})
+        elif parsed.path == '/master':
+            uid = int(query['uid'][0])
+            server.master_infos.append(uid)
+            self._reply(200, {'code': 0, 'data': {'info': {'uname': f'uid-{uid}'}}})
+
+    def _reply(self, status: int, body: dict) -> None:
+        data = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+
+class BilibiliStatusTest(unittest.IsolatedAsyncioTestCase):
+
+    @classmethod
+    def setUpClass(cls) -> None:
+        cls.server = ThreadingHTTPServer(('127.0.0.1', 0), StubLiveApiHandler)
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+        cls.api = f'http://127.0.0.1:{cls.server.server_address[1]}'
+
+    @classmethod
+    def tearDownClass(cls) -> None:
+        cls.server.shutdown()
+        cls.server.server_close()
+
+    def setUp(self) -> None:
+        self.server.batches = []
+        self.server.room_inits = []
+        self.server.master_infos = []
+        self.server.fail = False
+        self.cache = BilibiliStatusCache(max_age=0.2)
+        self.cache.ROOM_INIT_API = self.api + '/room_init?id={room_id}'
+        self.cache.STATUS_API = self.api + '/status'
+        self.cache.MASTER_INFO_API = self.api + '/master?uid={uid}'
+
+    async def probe_all(self, room_ids: list[str]) -> list:
+        return await asyncio.gather(*(self.cache.get_status(room_id, None, {}) for room_id in room_ids))
+
+    async def test_one_request_per_cycle_for_all_watched_rooms(self) -> None:
+        room_ids = list(ROOMS) + [UNLISTED_ROOM]
+        await self.probe_all(room_ids)  # 第一轮登记所有直播间并缓存uid
+        self.assertCountEqual(self.server.room_inits, room_ids)
+        await asyncio.sleep(0.2)
+        self.server.batches.clear()
+
+        statuses = await self.probe_all(room_ids)
+        self.assertEqual(len(self.server.batches), 1)
+        self.assertCountEqual(self.server.batches[0], [uid for uid, _, _ in ROOMS.values()] + [UNLISTED_UID])
+        self.assertEqual((statuses[0]['uname'], statuses[0]['live_status']), ('Alpha', 1))
+        self.assertEqual((statuses[1]['uname'], statuses[1]['live_status']), ('Bravo', 0))
+        self.assertIsNone(statuses[-1])
+        # uid在uid_ttl内不再通过room_init查询
+        self.assertEqual(len(self.server.room_inits), len(room_ids))
+
+        # max_age内的检测直接使用缓存
+        await self.probe_all(room_ids)
+        self.assertEqual(len(self.server.batches), 1)
+
+    async def test_batch_size_splits_requests(self) -> None:
+        self.cache.batch_size = 2
+        room_ids = list(ROOMS)
+        await self.probe_all(room_ids)
+        await asyncio.sleep(0.2)
+        self.server.batches.clear()
+
+        await self.probe_all(room_ids)
+        self.assertEqual(len(self.server.batches), 3)
+        self.assertTrue(all(len(batch) <= 2 for batch in self.server.batches))
+        self.assertCountEqual(sum(self.server.batches, []), [uid for uid, _, _ in ROOMS.values()])
+
+    async def test_missing_uid_is_cached_as_none(self) -> None:
+        self.assertIsNone(await self.cache.get_status(UNLISTED_ROOM, None, {}))
+        self.assertEqual(self.server.batches, [[UNLISTED_UID]])
+        # 不在结果中的主播同样被缓存，max_age内再次检测不会单独发出请求
+        self.assertIsNone(await self.cache.get_status(UNLISTED_ROOM, None, {}))
+        self.assertEqual(len(self.server.batches), 1)
+        await asyncio.sleep(0.2)
+        self.assertIsNone(await self.cache.get_status(UNLISTED_ROOM, None, {}))
+        self.assertEqual(len(self.server.batches), 2)
+
+    async def test_failed_batch_disables_batching(self) -> None:
+        self.server.fail = True
+        self.assertIsNone(await self.cache.get_status('1001', None, {}))
+        self.server.fail = False
+        self.assertIsNone(await self.cache.get_status('1001', None, {}))
+        self.assertEqual(self.server.batches, [])
+        self.assertEqual(self.server.room_inits, ['1001'])
+
+    async def test_room_info_uses_batch_and_falls_back_per_room(self) -> None:
+        title_h5 = mock.AsyncMock(return_value='h5 title')
+        with mock.patch.object(spider, 'bilibili_status_cache', self.cache), \
+                mock.patch.object(spider, 'get_bilibili_room_info_h5', title_h5):
+            results = await asyncio.gather(*(
+                spider.get_bilibili_room_info(f'https://live.bilibili.com/{room_id}')
+                for room_id in ['1001', '1002', UNLISTED_ROOM]))
+            self.assertEqual(results[0], {'anchor_name': 'Alpha', 'live_status': True,
+                                          'room_url': 'https://live.bilibili.com/1001', 'title': 'Alpha的直播间'})
+            self.assertEqual(results[1]['anchor_name'], 'Bravo')
+            self.assertFalse(results[1]['live_status'])
+            # 批量接口没有返回的主播逐个查询，主播名和标题只为它获取
+            self.assertEqual(results[2], {'anchor_name': f'uid-{UNLISTED_UID}', 'live_status': True,
+                                          'room_url': f'https://live.bilibili.com/{UNLISTED_ROOM}',
+                                          'title': 'h5 title'})
+            self.assertEqual(self.server.master_infos, [UNLISTED_UID])
+            self.assertEqual(title_h5.await_count, 1)
+
+            # 仍在直播时主播名使用缓存，不重新获取
+            await asyncio.sleep(0.2)
+            await spider.get_bilibili_room_info(f'https://live.bilibili.com/{UNLISTED_ROOM}')
+            self.assertEqual(self.server.master_infos, [UNLISTED_UID])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,247 @@
+# -*- encoding: utf-8 -*-
+
+"""
+Function: Offline tests of danmu reconnection against a local WebSocket stand-in server.
+"""
+import asyncio
+import base64
+import gzip
+import hashlib
+import tempfile
+import time
+import unittest
+from pathlib import Path
+from unittest import mock
+from urllib.parse import parse_qs, urlparse
+
+from src import danmu_recorder
+from src.danmu_hub import _mask
+from src.dy_pb2 import ChatMessage, PushFrame, Response
+
+WS_GUID = b'258EAFA5-E914-47DA-95CA-C5AB0DC85B11'
+FRAMES_PER_CONNECTION = 10
+
+
+def push_frame(index: int) -> bytes:
+    """一条需要ACK的弹幕帧，cursor和internal_ext随序号变化"""
+    chat = ChatMessage()
+    chat.content = f'弹幕{index}'
+    chat.user.nickName = 'u'
+    response = Response()
+    response.cursor = f'c-{index}'
+    response.internalExt = f'ext-{index}|seq:{index}'
+    response.needAck = True
+    message = response.messagesList.add()
+    message.method = 'WebcastChatMessage'
+    message.payload = chat.SerializeToString()
+    frame = PushFrame()
+    frame.payload = gzip.compress(response.SerializeToString())
+    frame.logid = index
+    return frame.SerializeToString()
+
+
+class StubPushServer:
+    """
+    按script中的动作依次处理每个连接，脚本用完后重复最后一个动作：
+    drop_handshake 读到握手请求后直接断开；reject 返回403；
+    drop 发送一批弹幕后异常断开；keep 发送一批弹幕后保持连接直到客户端关闭。
+    """
+
+    def __init__(self, script: list[str]):
+        self.script = script
+        self.connections: list[tuple[float, dict]] = []
+        self.acks: list[tuple[int, str]] = []
+        self.sent = 0
+        self.server: asyncio.AbstractServer | None = None
+        self.port = 0
+
+    async def start(self) -> None:
+        self.server = await asyncio.start_server(self.handle, '127.0.0.1', 0)
+        self.port = self.server.sockets[0].getsockname()[1]
+
+    async def close(self) -> None:
+        self.server.close()
+        await self.server.wait_closed()
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        action = self.script[min(len(self.connections), len(self.script) - 1)]
+        request = await reader.readuntil(b'\r\n\r\n')
+        path = request.split(b' ')[1].decode()
+        self.connections.append((time.monotonic(), parse_qs(urlparse(path).query)))
+        if action == 'drop_handshake':
+            writer.transport.abort()
+            return
+        if action == 'reject':
+            writer.write(b'HTTP/1.1 403 Forbidden\r\nContent-Length: 0\r\n\r\n')
+            writer.close()
+            return
+        key = next(line.split(b':', 1)[1].strip() for line in request.split(b'\r\n')
+                   if line.lower().startswith(b'sec-websocket-key'))
+        accept = base64.b64encode(hashlib.sha1(key + WS_GUID).digest())
+        writer.write(b'HTTP/1.1 101 Switching Protocols\r\nUpgrade: websocket\r\nConnection: Upgrade\r\n'
+                     b'Sec-WebSocket-Accept: ' + accept + b'\r\n\r\n')
+        reading = asyncio.create_task(self.read_acks(reader, writer))
+        for _ in range(FRAMES_PER_CONNECTION):
+            data = push_frame(self.sent)
+            self.sent += 1
+            header = bytes([0x82, 126]) + len(data).to_bytes(2, 'big') if len(data) >= 126 else bytes([0x82, len(data)])
+            writer.write(header + data)
+            await asyncio.sleep(0.01)
+        await asyncio.sleep(0.05)
+        if action == 'drop':
+            writer.transport.abort()
+            reading.cancel()
+            return
+        await reading
+
+    async def read_acks(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        while True:
+            try:
+                head = await reader.readexactly(2)
+                n = head[1] & 0x7f
+                if n == 126:
+                    n = int.from_bytes(await reader.readexactly(2), 'big')
+                key = await reader.readexactly(4)
+                data = _mask(await reader.readexactly(n), key)
+            except (asyncio.IncompleteReadError, ConnectionError):
+                return
+            if head[0] & 0x0f == 8:
+                writer.close()
+                return
+            frame = PushFrame()
+            frame.ParseFromString(data)
+            if frame.payloadType == 'ack':
+                self.acks.append((frame.logid, frame.payload.decode()))
+
+
+class DanmuReconnectTest(unittest.IsolatedAsyncioTestCase):
+
+    async def asyncSetUp(self) -> None:
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp_dir.cleanup)
+        patcher = mock.patch.object(danmu_recorder, 'RECONNECT_BASE_DELAY', 0.1)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    async def start_recording(self, script: list[str], max_retry: int = 3) -> tuple:
+        server = StubPushServer(script)
+        await server.start()
+        self.addAsyncCleanup(server.close)
+        recorder = danmu_recorder.create_douyin_danmu_recorder(
+            '1', 'anchor', self.tmp_dir.name, video_filename=f'{self.tmp_dir.name}/live.ts', max_retry=max_retry)
+        signatures = []
+
+        async def signed_url(room_id: str) -> str:
+            signatures.append(room_id)
+            return f'ws://127.0.0.1:{server.port}/push?room_id={room_id}&signature=s{len(signatures)}'
+
+        recorder.get_live_state_json = mock.AsyncMock(return_value={'id_str': '1', 'status': 2})
+        recorder.get_danmu_ws_url = signed_url
+        task = asyncio.create_task(recorder.start())
+        self.addAsyncCleanup(self.stop_recording, recorder, task)
+        return server, recorder, task, signatures
+
+    @staticmethod
+    async def stop_recording(recorder, task: asyncio.Task) -> float:
+        start = time.monotonic()
+        recorder.stop()
+        await asyncio.wait_for(task, 5)
+        return time.monotonic() - start
+
+    async def wait_for(self, condition, timeout: float = 5) -> None:
+        deadline = time.monotonic() + timeout
+        while not condition():
+            self.assertLess(time.monotonic(), deadline, 'condition not reached')
+            await asyncio.sleep(0.01)
+
+    def read_danmu_file(self) -> str:
+        paths = list(Path(self.tmp_dir.name).glob('*.xml'))
+        self.assertEqual(len(paths), 1)
+        return paths[0].read_text(encoding='utf-8')
+
+    async def test_resumes_from_cursor_after_drops(self) -> None:
+        # 第一次连接收到弹幕后被断开，第二次在握手时断开，第三次恢复
+        server, recorder, task, signatures = await self.start_recording(['drop', 'drop_handshake', 'keep'])
+        await self.wait_for(lambda: server.sent == 2 * FRAMES_PER_CONNECTION and recorder.reconnects == 1)
+        await self.wait_for(lambda: len(server.acks) == 2 * FRAMES_PER_CONNECTION)
+
+        self.assertEqual(len(server.connections), 3)
+        last = FRAMES_PER_CONNECTION - 1
+        for _, query in server.connections[1:]:
+            # 握手中断不会重新签名，重连带上断开前最后一条消息的cursor和internal_ext
+            self.assertEqual(query['signature'], ['s1'])
+            self.assertEqual(query['cursor'], [f'c-{last}'])
+            self.assertEqual(query['internal_ext'], [f'ext-{last}|seq:{last}'])
+        self.assertNotIn('cursor', server.connections[0][1])
+        self.assertEqual(signatures, ['1'])
+
+        self.assertEqual(len(recorder.gaps), 1)
+        gap = recorder.gaps[0]
+        self.assertEqual((gap['attempts'], gap['resumed']), (2, True))
+        self.assertGreater(gap['duration'], 0)
+
+        await self.stop_recording(recorder, task)
+        self.assertEqual(recorder.danmu_amount, 2 * FRAMES_PER_CONNECTION)
+        content = self.read_danmu_file()
+        # 中断记录在两段弹幕之间
+        self.assertLess(content.index(f'>弹幕{last}<'), content.index('<gap '))
+        self.assertLess(content.index('<gap '), content.index(f'>弹幕{last + 1}<'))
+        self.assertIn('attempts="2"', content)
+
+    async def test_backoff_between_attempts(self) -> None:
+        server, recorder, task, _ = await self.start_recording(['drop', 'drop_handshake'], max_retry=4)
+        await asyncio.wait_for(task, 10)
+        times = [timestamp for timestamp, _ in server.connections]
+        waits = [later - earlier for earlier, later in zip(times[1:], times[2:])]
+        # 每次等待在[delay/2, delay]之间，delay从0.1秒开始翻倍
+        for attempt, wait in enumerate(waits, start=2):
+            delay = 0.1 * 2 ** (attempt - 1)
+            self.assertGreaterEqual(wait, delay / 2 - 0.01)
+            self.assertLess(wait, delay + 0.2)
+
+        with mock.patch.object(danmu_recorder, 'RECONNECT_BASE_DELAY', 1.0):
+            for attempt in range(1, 12):
+                delay = min(danmu_recorder.RECONNECT_MAX_DELAY, 2 ** (attempt - 1))
+                for _ in range(20):
+                    self.assertTrue(delay / 2 <= recorder.backoff_delay(attempt) <= delay)
+
+    async def test_gives_up_after_max_retry(self) -> None:
+        server, recorder, task, _ = await self.start_recording(['drop', 'drop_handshake'], max_retry=3)
+        await asyncio.wait_for(task, 10)
+
+        # 一次正常连接加上max_retry次失败的重连
+        self.assertEqual(len(server.connections), 1 + 3)
+        self.assertEqual(recorder.reconnects, 0)
+        self.assertEqual(len(recorder.gaps), 1)
+        self.assertEqual((recorder.gaps[0]['attempts'], recorder.gaps[0]['resumed']), (3, False))
+        self.assertEqual(recorder.danmu_amount, FRAMES_PER_CONNECTION)
+        content = self.read_danmu_file()
+        self.assertIn('resumed="0"', content)
+        self.assertTrue(content.rstrip().endswith('</i>'))
+
+    async def test_rejected_handshake_signs_again(self) -> None:
+        server, recorder, task, signatures = await self.start_recording(['drop', 'reject', 'keep'])
+        await self.wait_for(lambda: recorder.reconnects == 1)
+        self.assertEqual(len(signatures), 2)
+        self.assertEqual([query['signature'] for _, query in server.connections], [['s1'], ['s1'], ['s2']])
+        # 重新签名的地址仍然从断开的位置继续
+        self.assertEqual(server.connections[2][1]['cursor'], [f'c-{FRAMES_PER_CONNECTION - 1}'])
+
+    async def test_stop_while_connected(self) -> None:
+        server, recorder, task, _ = await self.start_recording(['keep'])
+        await self.wait_for(lambda: recorder.danmu_amount == FRAMES_PER_CONNECTION)
+        self.assertLess(await self.stop_recording(recorder, task), 0.5)
+        self.assertEqual(len(server.connections), 1)
+        self.assertEqual(recorder.gaps, [])
+
+    async def test_stop_during_backoff(self) -> None:
+        with mock.patch.object(danmu_recorder, 'RECONNECT_BASE_DELAY', 60.0):
+            server, recorder, task, _ = await self.start_recording(['drop'])
+            # 连接断开后等待30到60秒再重连，stop应该立即唤醒等待
+            await self.wait_for(lambda: recorder.retry == 1)
+            self.assertLess(await self.stop_recording(recorder, task), 0.5)
+        self.assertEqual(len(server.connections), 1)
+        self.assertFalse(recorder.gaps)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,210 @@
+# -*- encoding: utf-8 -*-
+
+"""
+Function: Offline tests of FLV tag parsing, keyframe splitting and stall detection with synthetic FLV bodies.
+"""
+import csv
+import os
+import tempfile
+import time
+import unittest
+from unittest import mock
+
+from src.flv_recorder import FlvFormatError, FlvRecorder
+
+FLV_HEADER = b'FLV\x01\x05\x00\x00\x00\x09' + b'\x00' * 4
+SCRIPT = (18, b'\x02\x00\x0aonMetaData' + b'\x08' * 20)
+VIDEO_SEQUENCE = (9, b'\x17\x00\x00\x00\x00' + b'\x01' * 30)
+AUDIO_SEQUENCE = (8, b'\xaf\x00\x12\x10')
+
+
+def tag(tag_type: int, timestamp: int, data: bytes) -> bytes:
+    header = bytes([tag_type]) + len(data).to_bytes(3, 'big') + (timestamp & 0xffffff).to_bytes(3, 'big') \
+        + bytes([timestamp >> 24]) + b'\x00\x00\x00'
+    return header + data + (11 + len(data)).to_bytes(4, 'big')
+
+
+def start_tag(kind: tuple[int, bytes]) -> bytes:
+    return tag(kind[0], 0, kind[1])
+
+
+def keyframe(timestamp: int, size: int = 300) -> bytes:
+    return tag(9, timestamp, b'\x17\x01' + bytes(size))
+
+
+def interframe(timestamp: int, size: int = 100) -> bytes:
+    return tag(9, timestamp, b'\x27\x01' + bytes(size))
+
+
+def audio(timestamp: int) -> bytes:
+    return tag(8, timestamp, b'\xaf\x01' + bytes(20))
+
+
+def live_stream(start: int, seconds: int, gop: int = 1000) -> bytes:
+    """从start毫秒开始的音视频，每40毫秒一帧，每gop毫秒一个关键帧"""
+    body = b''
+    for timestamp in range(start, start + seconds * 1000, 40):
+        frame = keyframe if (timestamp - start) % gop == 0 else interframe
+        body += frame(timestamp) + audio(timestamp)
+    return body
+
+
+def parse_tags(data: bytes) -> list[tuple[int, int, bytes]]:
+    """解析FLV文件并检查每个PreviousTagSize，返回(类型, 时间戳, 数据)"""
+    assert data[:3] == b'FLV', data[:16]
+    pos = int.from_bytes(data[5:9], 'big')
+    assert data[pos:pos + 4] == b'\x00\x00\x00\x00'
+    pos += 4
+    tags = []
+    while pos < len(data):
+        size = int.from_bytes(data[pos + 1:pos + 4], 'big')
+        timestamp = int.from_bytes(data[pos + 4:pos + 7], 'big') | data[pos + 7] << 24
+        tags.append((data[pos], timestamp, data[pos + 11:pos + 11 + size]))
+        assert int.from_bytes(data[pos + 11 + size:pos + 15 + size], 'big') == 11 + size
+        pos += 15 + size
+    assert pos == len(data)
+    return tags
+
+
+class FakeResponse:
+    """按pieces给出的字节数依次返回数据的响应，模拟网络读取被切成任意大小"""
+
+    def __init__(self, data: bytes, pieces: list[int] | None = None):
+        self.data = data
+        self.pos = 0
+        self.pieces = list(pieces or [])
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args) -> None:
+        pass
+
+    def readinto(self, view: memoryview) -> int:
+        if self.pos >= len(self.data):
+            return 0
+        size = min(len(view), len(self.data) - self.pos, self.pieces.pop(0) if self.pieces else len(view))
+        view[:size] = self.data[self.pos:self.pos + size]
+        self.pos += size
+        return size
+
+
+class FlvRecorderTest(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp_dir.cleanup)
+
+    def record(self, body: bytes, name: str = 'live.flv', pieces: list[int] | None = None, **kwargs) -> FlvRecorder:
+        response = kwargs.pop('response', None) or FakeResponse(body, pieces)
+        recorder = FlvRecorder('http://127.0.0.1/live.flv', os.path.join(self.tmp_dir.name, name), **kwargs)
+        with mock.patch.object(recorder, '_open', return_value=response):
+            recorder.run()
+        return recorder
+
+    @staticmethod
+    def read(path: str) -> bytes:
+        with open(path, 'rb') as f:
+            return f.read()
+
+    def test_tags_split_across_reads_are_copied_unchanged(self) -> None:
+        body = FLV_HEADER + start_tag(SCRIPT) + start_tag(VIDEO_SEQUENCE) + start_tag(AUDIO_SEQUENCE) \
+            + live_stream(0, 2)
+        # 每次读取的字节数都不是tag边界，包括只读到tag头的一部分
+        pieces = [3, 7, 5, 11, 1, 200, 13, 64] * 200
+        recorder = self.record(body, pieces=pieces, chunk_size=256, buffer_size=512)
+        self.assertEqual(self.read(recorder.file_paths[0]), body)
+        self.assertEqual(recorder.tags, 3 + 50 * 2)
+        self.assertEqual(recorder.keyframes, 2)
+        self.assertEqual(recorder.last_timestamp, 1960)
+
+    def test_tag_larger_than_buffer(self) -> None:
+        body = FLV_HEADER + start_tag(VIDEO_SEQUENCE) + keyframe(0, size=5000) + interframe(40)
+        recorder = self.record(body, chunk_size=64, buffer_size=128)
+        self.assertEqual(self.read(recorder.file_paths[0]), body)
+
+    def test_split_at_keyframes_with_sequence_headers_replayed(self) -> None:
+        start = 7_000_000  # 推流的时间戳不从0开始
+        body = FLV_HEADER + start_tag(SCRIPT) + start_tag(VIDEO_SEQUENCE) + start_tag(AUDIO_SEQUENCE) \
+            + live_stream(start, 5)
+        recorder = self.record(body, name='live_%03d.flv', pieces=[37, 101, 4096] * 100, chunk_size=512,
+                               buffer_size=1024, segment_time=2)
+
+        # 2秒分段，1秒一个关键帧：在2秒和4秒处的关键帧分段
+        self.assertEqual([os.path.basename(path) for path in recorder.file_paths],
+                         ['live_000.flv', 'live_001.flv', 'live_002.flv'])
+        for index, path in enumerate(recorder.file_paths):
+            tags = parse_tags(self.read(path))
+            # 每个分段以onMetaData和音视频序列头开始
+            self.assertEqual([(t[0], t[2]) for t in tags[:3]], [SCRIPT, VIDEO_SEQUENCE, AUDIO_SEQUENCE])
+            self.assertTrue(all(t[1] == 0 for t in tags[:3]))
+            media = tags[3:]
+            # 第一个音视频tag是时间戳为0的关键帧
+            self.assertEqual((media[0][0], media[0][1], media[0][2][:2]), (9, 0, b'\x17\x01'))
+            self.assertEqual(media[-1][1], 960 if index == 2 else 1960)
+
+        with open(os.path.join(self.tmp_dir.name, 'live.segments.csv'), encoding='utf-8') as f:
+            rows = [(name, float(begin), float(end)) for name, begin, end in csv.reader(f)]
+        self.assertEqual(rows, [('live_000.flv', 0.0, 2.0), ('live_001.flv', 2.0, 4.0),
+                                ('live_002.flv', 4.0, 4.96)])
+
+    def test_keyframe_split_across_reads(self) -> None:
+        body = FLV_HEADER + start_tag(VIDEO_SEQUENCE) + live_stream(0, 3, gop=2000)
+        boundary = body.index(keyframe(2000))
+        # 分段位置的关键帧被切在两次读取之间
+        pieces = [boundary + 5, 10, 1 << 20]
+        recorder = self.record(body, name='live_%03d.flv', pieces=pieces, chunk_size=1 << 16, segment_time=2)
+        self.assertEqual(len(recorder.file_paths), 2)
+        second = parse_tags(self.read(recorder.file_paths[1]))
+        self.assertEqual(second[0][2], VIDEO_SEQUENCE[1])
+        self.assertEqual((second[1][1], second[1][2][:2]), (0, b'\x17\x01'))
+        self.assertEqual(len(second[1][2]), 302)
+
+    def test_timestamp_reset_after_stream_restart(self) -> None:
+        body = FLV_HEADER + start_tag(VIDEO_SEQUENCE) + live_stream(60_000, 2) + live_stream(0, 3)
+        recorder = self.record(body, name='live_%03d.flv', segment_time=2)
+        # 推流重新开始后时间戳重新以0为基准，下一个满2秒的关键帧处分段
+        self.assertEqual(len(recorder.file_paths), 2)
+        for path in recorder.file_paths:
+            tags = parse_tags(self.read(path))
+            self.assertEqual((tags[1][1], tags[1][2][:2]), (0, b'\x17\x01'))
+            self.assertTrue(all(0 <= t[1] < 2000 for t in tags))
+
+    def test_stall_without_new_tags_ends_recording(self) -> None:
+        body = FLV_HEADER + start_tag(VIDEO_SEQUENCE) + keyframe(0)
+        # 之后只收到一个永远不完整的大tag的开头，每次读取都有数据但没有新的tag
+        partial = tag(9, 40, b'\x27\x01' + bytes(1 << 20))[:2000]
+
+        class Trickle(FakeResponse):
+            def readinto(self, view):
+                if self.pos >= len(self.data):
+                    time.sleep(0.05)
+                    self.data += partial[self.pos - len(body):self.pos - len(body) + 10]
+                return super().readinto(view)
+
+        response = Trickle(body + partial[:10])
+        start = time.monotonic()
+        recorder = self.record(b'', chunk_size=8, timeout=0.3, response=response)
+        self.assertLess(time.monotonic() - start, 2)
+        self.assertEqual(self.read(recorder.file_paths[0]), body)
+
+    def test_read_timeout_ends_recording(self) -> None:
+        body = FLV_HEADER + start_tag(VIDEO_SEQUENCE) + keyframe(0)
+
+        class TimingOut(FakeResponse):
+            def readinto(self, view):
+                if self.pos >= len(self.data):
+                    raise TimeoutError('timed out')
+                return super().readinto(view)
+
+        recorder = self.record(b'', response=TimingOut(body))
+        self.assertEqual(self.read(recorder.file_paths[0]), body)
+        self.assertEqual(recorder.tags, 2)
+
+    def test_not_flv(self) -> None:
+        with self.assertRaises(FlvFormatError):
+            self.record(b'<html>' + bytes(100))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,155 @@
+# -*- encoding: utf-8 -*-
+
+"""
+Function: Offline tests of stopping ffmpeg processes and in-process recorders through the supervisor.
+"""
+import asyncio
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from src.flv_recorder import FlvRecorder
+from src.hls_recorder import HLSRecorder
+from src.process_supervisor import ProcessSupervisor
+
+SEGMENT = b'\x47' + b'\x00' * 187  # 一个TS包
+FLV_HEADER = b'FLV\x01\x05\x00\x00\x00\x09' + b'\x00' * 4
+AUDIO_TAG = b'\x08\x00\x00\x02\x00\x00\x00\x00\x00\x00\x00\xaf\x01' + (13).to_bytes(4, 'big')
+
+
+class StubOriginHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, *args) -> None:
+        pass
+
+    def do_GET(self) -> None:
+        if self.path.startswith('/live.m3u8'):
+            # 目标时长很长，录制器在两次刷新之间长时间等待
+            body = b'#EXTM3U\n#EXT-X-TARGETDURATION:30\n#EXT-X-MEDIA-SEQUENCE:0\n#EXTINF:30.0,\nseg0.ts\n'
+            self._reply(body)
+        elif self.path.startswith('/seg0.ts'):
+            self._reply(SEGMENT)
+        elif self.path.startswith('/live.flv'):
+            # 发送几个tag后停滞，录制器阻塞在读取上
+            self.send_response(200)
+            self.send_header('Content-Type', 'video/x-flv')
+            self.end_headers()
+            try:
+                self.wfile.write(FLV_HEADER + AUDIO_TAG * 3)
+                self.wfile.flush()
+                time.sleep(20)
+            except OSError:
+                pass
+
+    def _reply(self, body: bytes) -> None:
+        self.send_response(200)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+class ProcessSupervisorTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls) -> None:
+        cls.server = ThreadingHTTPServer(('127.0.0.1', 0), StubOriginHandler)
+        cls.server.daemon_threads = True
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+        cls.origin = f'http://127.0.0.1:{cls.server.server_address[1]}'
+
+    @classmethod
+    def tearDownClass(cls) -> None:
+        cls.server.shutdown()
+        cls.server.server_close()
+
+    def setUp(self) -> None:
+        self.supervisor = ProcessSupervisor()
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp_dir.cleanup)
+
+    def start_recording(self, key: str, recorder, run) -> tuple:
+        """像main.py一样在录制线程中运行录制器，结束后调用finish"""
+        supervised = self.supervisor.track(key, recorder.stop)
+        result = {}
+
+        def target() -> None:
+            return_code = 1
+            try:
+                return_code = result['code'] = run()
+            finally:
+                supervised.finish(return_code)
+
+        thread = threading.Thread(target=target, daemon=True)
+        thread.start()
+        return supervised, thread, result
+
+    def wait_for(self, condition, timeout: float = 5) -> None:
+        deadline = time.monotonic() + timeout
+        while not condition():
+            self.assertLess(time.monotonic(), deadline, 'condition not reached')
+            time.sleep(0.02)
+
+    @unittest.skipIf(os.name == 'nt', 'SIGINT is not used on Windows')
+    def test_stop_keys_stops_child_process(self) -> None:
+        process = subprocess.Popen([sys.executable, '-c', 'import time; time.sleep(30)'])
+        exited = threading.Event()
+        item = self.supervisor.register('https://live.example.com/1', process, on_exit=lambda code: exited.set())
+        self.supervisor.stop_keys({'https://live.example.com/1'})
+        self.assertIsNotNone(item.wait(5))
+        self.assertTrue(item.stop_requested)
+        self.assertTrue(exited.wait(1))
+        self.assertEqual(len(self.supervisor), 0)
+
+    def test_hls_recorder_stops_while_waiting_for_playlist(self) -> None:
+        recorder = HLSRecorder(f'{self.origin}/live.m3u8', os.path.join(self.tmp_dir.name, 'hls.ts'), timeout=60)
+        supervised, thread, result = self.start_recording('hls', recorder, lambda: asyncio.run(recorder.run()))
+        self.wait_for(lambda: recorder.segments == 1)
+
+        start = time.monotonic()
+        self.supervisor.stop_keys({'hls'})
+        self.assertIsNotNone(supervised.wait(5))
+        self.assertLess(time.monotonic() - start, 0.5)
+        thread.join(1)
+        self.assertEqual(result['code'], 0)
+        self.assertTrue(recorder.stopped)
+        self.assertEqual(os.path.getsize(recorder.file_paths[0]), len(SEGMENT))
+
+    def test_flv_recorder_stops_while_blocked_on_read(self) -> None:
+        recorder = FlvRecorder(f'{self.origin}/live.flv', os.path.join(self.tmp_dir.name, 'live.flv'), timeout=60)
+        supervised, thread, result = self.start_recording('flv', recorder, recorder.run)
+        self.wait_for(lambda: recorder._response is not None)
+        time.sleep(0.2)
+
+        start = time.monotonic()
+        self.supervisor.stop('flv')
+        self.assertIsNotNone(supervised.wait(5))
+        self.assertLess(time.monotonic() - start, 0.5)
+        thread.join(1)
+        self.assertTrue(recorder.stopped)
+        with open(recorder.file_paths[0], 'rb') as f:
+            self.assertEqual(f.read(), FLV_HEADER + AUDIO_TAG * 3)
+
+    def test_stop_all_waits_for_in_process_recorders(self) -> None:
+        finished = threading.Event()
+
+        def slow_stop() -> None:
+            # 录制器收到停止请求后还需要一点时间关闭文件
+            threading.Timer(0.3, lambda: (finished.set(), item.finish(0))).start()
+
+        item = self.supervisor.track('slow', slow_stop)
+        start = time.monotonic()
+        self.supervisor.stop_all(timeout=5)
+        self.assertTrue(finished.is_set())
+        self.assertGreaterEqual(time.monotonic() - start, 0.25)
+        self.assertEqual(item.returncode, 0)
+        self.assertEqual(len(self.supervisor), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
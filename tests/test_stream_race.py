@@ -0,0 +1,58 @@
+# -*- encoding: utf-8 -*-
+
+"""
+Function: Offline tests of the rank-aware stream candidate race.
+"""
+import asyncio
+import time
+import unittest
+from unittest import mock
+
+from src import stream
+
+
+def fake_ttfb(delays: dict[str, float | None]):
+    """delays为地址到响应耗时的映射，None表示请求失败"""
+    async def ttfb(url, proxy_addr=None, timeout=10, http2=False):
+        delay = delays[url]
+        await asyncio.sleep(abs(delay) if delay is not None else 0.01)
+        return delay
+    return ttfb
+
+
+class RaceStreamUrlsTest(unittest.IsolatedAsyncioTestCase):
+
+    async def race(self, delays: dict, candidates: list, **kwargs) -> tuple[int | None, float]:
+        start = time.perf_counter()
+        with mock.patch.object(stream, 'get_response_ttfb', fake_ttfb(delays)):
+            selected = await stream.race_stream_urls(candidates, **kwargs)
+        return selected, time.perf_counter() - start
+
+    async def test_slow_requested_quality_beats_fast_lower_quality(self) -> None:
+        selected, elapsed = await self.race({'or4': 0.5, 'hd': 0.01, 'sd': 0.01},
+                                            [(0, 'or4'), (1, 'hd'), (2, 'sd')])
+        self.assertEqual(selected, 0)
+        self.assertLess(elapsed, 0.5 + 0.3)
+
+    async def test_failed_quality_falls_back_without_waiting(self) -> None:
+        selected, elapsed = await self.race({'or4': None, 'hd': 0.05, 'sd': 0.01},
+                                            [(0, 'or4'), (1, 'hd'), (2, 'sd')])
+        self.assertEqual(selected, 1)
+        self.assertLess(elapsed, 0.3)
+
+    async def test_same_rank_picks_fastest(self) -> None:
+        selected, _ = await self.race({'a': 0.2, 'b': 0.05}, [(0, 'a'), (0, 'b')])
+        self.assertEqual(selected, 1)
+
+    async def test_gives_up_at_timeout(self) -> None:
+        selected, elapsed = await self.race({'or4': 5.0, 'hd': 0.01}, [(0, 'or4'), (1, 'hd')], timeout=0.3)
+        self.assertEqual(selected, 1)
+        self.assertLess(elapsed, 1.0)
+
+    async def test_all_failed(self) -> None:
+        selected, _ = await self.race({'or4': None, 'hd': None}, [(0, 'or4'), (1, 'hd'), (2, '')])
+        self.assertIsNone(selected)
+
+
+if __name__ == '__main__':
+    unittest.main()
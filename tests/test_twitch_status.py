@@ -0,0 +1,141 @@
+# -*- encoding: utf-8 -*-
+
+"""
+Function: Offline tests of the batched Twitch status lookup against a stub GQL server.
+"""
+import asyncio
+import json
+import threading
+import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest import mock
+
+from src import spider
+from src.twitch_status import CHANNEL_SHELL_HASH, TwitchStatusCache
+
+CHANNELS = {
+    'alpha': ('Alpha', True),
+    'bravo': ('Bravo', False),
+    'charlie': ('Charlie', True),
+    'delta': ('Delta', False),
+    'echo': ('Echo', False),
+}
+
+
+class StubGQLHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, *args) -> None:
+        pass
+
+    def do_POST(self) -> None:
+        server = self.server
+        payload = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+        if server.fail:
+            self._reply(500, {'error': 'unavailable'})
+            return
+        if isinstance(payload, list):
+            logins = [operation['variables']['login'] for operation in payload]
+            assert all(i['extensions']['persistedQuery']['sha256Hash'] == CHANNEL_SHELL_HASH for i in payload)
+            server.batches.append(logins)
+            self._reply(200, [self._channel_shell(login) for login in logins])
+        else:
+            login = payload['variables']['login']
+            server.token_requests.append(login)
+            self._reply(200, {'data': {'streamPlaybackAccessToken': {'value': f'token-{login}',
+                                                                     'signature': f'sig-{login}'}}})
+
+    @staticmethod
+    def _channel_shell(login: str) -> dict:
+        if login not in CHANNELS:
+            return {'data': {'userOrError': {'userDoesNotExist': login}}}
+        display_name, live = CHANNELS[login]
+        return {'data': {'userOrError': {'login': login, 'displayName': display_name,
+                                         'stream': {'id': '1'} if live else None}}}
+
+    def _reply(self, status: int, body: dict | list) -> None:
+        data = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+
+class TwitchStatusTest(unittest.IsolatedAsyncioTestCase):
+
+    @classmethod
+    def setUpClass(cls) -> None:
+        cls.server = ThreadingHTTPServer(('127.0.0.1', 0), StubGQLHandler)
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+        cls.gql_api = f'http://127.0.0.1:{cls.server.server_address[1]}/gql'
+
+    @classmethod
+    def tearDownClass(cls) -> None:
+        cls.server.shutdown()
+        cls.server.server_close()
+
+    def setUp(self) -> None:
+        self.server.batches = []
+        self.server.token_requests = []
+        self.server.fail = False
+        self.cache = TwitchStatusCache(gql_api=self.gql_api, max_age=0.2)
+
+    async def probe_all(self, logins: list[str]) -> list:
+        return await asyncio.gather(*(self.cache.get(login, None, {}) for login in logins))
+
+    async def test_one_request_per_cycle_for_all_watched_channels(self) -> None:
+        logins = list(CHANNELS) + ['missing']
+        await self.probe_all(logins)  # 第一轮登记所有频道
+        await asyncio.sleep(0.2)
+        self.server.batches.clear()
+
+        statuses = await self.probe_all(logins)
+        self.assertEqual(len(self.server.batches), 1)
+        self.assertCountEqual(self.server.batches[0], logins)
+        self.assertEqual(statuses[0], ('Alpha-alpha', True))
+        self.assertEqual(statuses[1], ('Bravo-bravo', False))
+        self.assertIsNone(statuses[-1])
+
+        # max_age内的检测直接使用缓存
+        await self.probe_all(logins)
+        self.assertEqual(len(self.server.batches), 1)
+
+    async def test_batch_size_splits_requests(self) -> None:
+        self.cache.batch_size = 2
+        logins = list(CHANNELS)
+        await self.probe_all(logins)
+        await asyncio.sleep(0.2)
+        self.server.batches.clear()
+
+        await self.probe_all(logins)
+        self.assertEqual(len(self.server.batches), 3)
+        self.assertTrue(all(len(batch) <= 2 for batch in self.server.batches))
+        self.assertCountEqual(sum(self.server.batches, []), logins)
+
+    async def test_failed_batch_disables_batching(self) -> None:
+        self.server.fail = True
+        self.assertIsNone(await self.cache.get('alpha', None, {}))
+        self.server.fail = False
+        self.assertIsNone(await self.cache.get('alpha', None, {}))
+        self.assertEqual(self.server.batches, [])
+
+    async def test_playback_token_only_for_live_channels(self) -> None:
+        play_urls = mock.AsyncMock(return_value=['https://example.com/source.m3u8'])
+        with mock.patch.object(spider, 'twitch_status_cache', self.cache), \
+                mock.patch.object(spider, 'get_play_url_list', play_urls):
+            results = await asyncio.gather(*(
+                spider.get_twitchtv_stream_data(f'https://www.twitch.tv/{login}') for login in CHANNELS))
+
+        self.assertEqual(sorted(self.server.token_requests), ['alpha', 'charlie'])
+        by_name = {result['anchor_name']: result for result in results}
+        self.assertTrue(by_name['Alpha-alpha']['is_live'])
+        self.assertIn('token=token-alpha', by_name['Alpha-alpha']['m3u8_url'])
+        self.assertIn('sig=sig-alpha', by_name['Alpha-alpha']['m3u8_url'])
+        self.assertFalse(by_name['Bravo-bravo']['is_live'])
+        self.assertNotIn('m3u8_url', by_name['Bravo-bravo'])
+        self.assertEqual(play_urls.await_count, 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
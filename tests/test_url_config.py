@@ -0,0 +1,70 @@
+# -*- encoding: utf-8 -*-
+
+"""
+Function: Offline tests of the URL_config.ini watcher's diff and pending-start bookkeeping.
+"""
+import unittest
+
+from src.url_config import UrlConfigWatcher
+
+ROOM_A = ('原画', 'https://live.douyin.com/1', '')
+ROOM_B = ('原画', 'https://live.douyin.com/2', '')
+SHOPEE = ('原画', 'https://live.shopee.sg/share?session=1', '')
+SHOPEE_UID = ('原画', 'https://live.shopee.sg/share?session=1&uid=9', '')
+
+
+class UrlConfigWatcherTest(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.watcher = UrlConfigWatcher('/nonexistent/URL_config.ini')
+
+    def start_pending(self) -> list[str]:
+        started = [entry[1] for entry in self.watcher.pending_entries()]
+        for url in started:
+            self.watcher.mark_started(url)
+        return started
+
+    def test_unchanged_rooms_are_not_pending(self) -> None:
+        self.watcher.diff([ROOM_A, ROOM_B], [])
+        self.assertEqual(self.start_pending(), [ROOM_A[1], ROOM_B[1]])
+        self.watcher.diff([ROOM_A, ROOM_B], [])
+        self.assertEqual(self.watcher.pending_entries(), [])
+
+    def test_unstarted_room_stays_pending(self) -> None:
+        self.watcher.diff([ROOM_A, ROOM_B], [])
+        self.watcher.mark_started(ROOM_A[1])
+        self.watcher.diff([ROOM_A, ROOM_B], [])
+        self.assertEqual(self.watcher.pending_entries(), [ROOM_B])
+
+    def test_commented_room_leaves_pending_and_returns_when_uncommented(self) -> None:
+        self.watcher.diff([ROOM_A, ROOM_B], [])
+        diff = self.watcher.diff([ROOM_A], [ROOM_B[1]])
+        self.assertEqual(diff.commented, {ROOM_B[1]})
+        self.assertIn(ROOM_B[1], self.watcher.stopped_urls)
+        self.assertEqual(self.start_pending(), [ROOM_A[1]])
+
+        self.watcher.diff([ROOM_A, ROOM_B], [])
+        self.assertNotIn(ROOM_B[1], self.watcher.stopped_urls)
+        self.assertEqual(self.start_pending(), [ROOM_B[1]])
+
+    def test_requeue_only_rooms_still_in_file(self) -> None:
+        self.watcher.diff([ROOM_A], [ROOM_B[1]])
+        self.start_pending()
+        self.watcher.requeue(ROOM_A[1])
+        self.watcher.requeue(ROOM_B[1])
+        self.assertEqual(self.watcher.pending_entries(), [ROOM_A])
+
+    def test_rewritten_url_is_a_rename(self) -> None:
+        self.watcher.diff([SHOPEE], [])
+        self.start_pending()
+        self.watcher.rename(SHOPEE[1], SHOPEE_UID[1])
+        diff = self.watcher.diff([SHOPEE_UID], [])
+        self.assertEqual(diff.removed, frozenset())
+        self.assertNotIn(SHOPEE[1], self.watcher.stopped_urls)
+
+        self.watcher.diff([], [SHOPEE_UID[1]])
+        self.assertIn(SHOPEE[1], self.watcher.stopped_urls)
+
+
+if __name__ == '__main__':
+    unittest.main()
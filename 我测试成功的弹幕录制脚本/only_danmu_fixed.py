@@ -5,7 +5,7 @@
 基于DouyinLiveRecorder项目完整实现
 
 使用方法:
-1. 安装依赖: pip install requests websocket-client protobuf jsengine
+1. 安装依赖: pip install requests websocket-client protobuf quickjs (或安装Node.js)
 2. 修改下面的配置参数
 3. 运行: python only_danmu_fixed.py
 
@@ -18,15 +18,19 @@ import hashlib
 import json
 import os
 import random
+import sys
 import time
 import traceback
 from urllib.parse import urlparse, parse_qs, urlunparse, urlencode
 
-import jsengine
 import requests
 import websocket
 from google.protobuf import json_format
 
+# 签名使用本项目的webmssdk签名上下文池(src/js_signer.py)，与正式录制流程一致
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from src import js_signer
+
 # 导入原项目的模块
 from dylr.core.dy_pb2 import PushFrame, Response, ChatMessage
 from dylr.util import cookie_utils
@@ -135,27 +139,13 @@ def get_danmu_ws_url(room_id, live_room_real_id):
     """获取弹幕WebSocket URL - 使用原项目的完整实现"""
     user_unique_id = random.randint(7300000000000000000, 7999999999999999999)
     
-    # 使用原项目的JS引擎生成签名
+    # 使用项目的webmssdk签名上下文生成签名，脚本只加载一次
     try:
-        with open(r'dylr/util/webmssdk.js', 'r', encoding='utf-8') as f:
-            js_enc = f.read()
-        
         ua = get_request_headers()['user-agent']
         
-        ctx = jsengine.jsengine()
-        js_dom = f"""
-document = {{}}
-window = {{}}
-navigator = {{
-  'userAgent': '{ua}'
-}}
-""".strip()
-        final_js = js_dom + js_enc
-        ctx.eval(final_js)
-        
         from dylr.util.url_utils import get_ms_stub
-        function_caller = f"get_sign('{get_ms_stub(live_room_real_id, user_unique_id)}')"
-        signature = ctx.eval(function_caller)
+        signature = js_signer.sign('webmssdk', get_ms_stub(live_room_real_id, user_unique_id), ua,
+                                   func='get_sign_with_ua')
         
         webcast5_params = {
             "room_id": live_room_real_id,